@@ -343,8 +343,21 @@ stdout_logfile_maxbytes=50MB
 stdout_logfile_backups=5
 environment=PATH="$VENV_PATH/bin"
 
+[program:noctis-jobs]
+command=$VENV_PATH/bin/python manage.py run_job_worker
+directory=$APP_PATH
+user=$NOCTIS_USER
+autostart=true
+autorestart=true
+stopwaitsecs=3600
+redirect_stderr=true
+stdout_logfile=/var/log/noctis/jobs.log
+stdout_logfile_maxbytes=50MB
+stdout_logfile_backups=5
+environment=PATH="$VENV_PATH/bin"
+
 [group:noctis]
-programs=noctis-web,noctis-dicom-scp
+programs=noctis-web,noctis-dicom-scp,noctis-jobs
 priority=999
 EOF
     
@@ -0,0 +1,75 @@
+"""
+Benchmark: colour presets via 256-entry LUT gather vs the legacy per-pixel loops.
+
+Run from the project root:
+    python benchmarks/bench_color_presets.py [size]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from viewer.color_presets import color_presets, to_uint8  # noqa: E402
+
+
+def legacy_bone_colormap(bone_mip_normalized):
+    """Previous generate_bone_reconstruction colouring: one Python iteration per pixel"""
+    bone_colored = np.zeros((*bone_mip_normalized.shape, 3), dtype=np.uint8)
+    for i in range(bone_mip_normalized.shape[0]):
+        for j in range(bone_mip_normalized.shape[1]):
+            intensity = bone_mip_normalized[i, j]
+            if intensity > 128:
+                bone_colored[i, j] = [intensity, intensity, intensity]
+            elif intensity > 64:
+                bone_colored[i, j] = [intensity, intensity // 2, 0]
+            else:
+                bone_colored[i, j] = [intensity // 4, intensity // 4, intensity // 2]
+    return bone_colored
+
+
+def legacy_vessels_preset(volume_data):
+    """Previous apply_color_preset('vessels'): float64 RGB allocation per call"""
+    colored = np.zeros((*volume_data.shape, 3))
+    colored[:, :, 0] = volume_data * 1.5
+    colored[:, :, 1] = volume_data * 0.5
+    colored[:, :, 2] = volume_data * 0.2
+    return (np.clip(colored, 0, 1) * 255).astype(np.uint8)
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, 256, size=(size, size), dtype=np.uint8)
+    normalized = indices.astype(np.float32) / 255.0
+
+    bone = color_presets.get('bone')
+    vessels = color_presets.get('vessels')
+    assert np.array_equal(legacy_bone_colormap(indices), bone.apply(indices))
+
+    rows = [
+        ('bone colormap', timed(legacy_bone_colormap, indices, repeat=1), timed(bone.apply, indices)),
+        ('vessels preset', timed(legacy_vessels_preset, normalized),
+         timed(lambda d: vessels.apply(to_uint8(d, 0.0, 1.0)), normalized)),
+    ]
+
+    print(f'Colour preset benchmark ({size}x{size})')
+    print(f"{'operation':<16} {'legacy ms':>12} {'lut ms':>10} {'speedup':>9}")
+    for name, legacy, lut in rows:
+        print(f'{name:<16} {legacy * 1000:>12.2f} {lut * 1000:>10.2f} {legacy / lut:>8.0f}x')
+
+
+if __name__ == '__main__':
+    main()
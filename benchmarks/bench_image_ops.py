@@ -0,0 +1,61 @@
+"""
+Benchmark: per-operation timings of the reference (skimage/scipy/PIL) and OpenCV image-ops backends.
+
+Run from the project root:
+    python benchmarks/bench_image_ops.py [size]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from viewer.image_ops import get_backend  # noqa: E402
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[:size, :size]
+    image = np.clip(0.5 + 0.3 * np.sin(x / 20.0) * np.cos(y / 30.0) + 0.05 * rng.normal(size=(size, size)),
+                    0, 1).astype(np.float32)
+    uint8 = (image * 255).astype(np.uint8)
+
+    reference = get_backend('reference')
+    opencv = get_backend('opencv')
+    operations = [
+        ('clahe float', lambda ops: ops.clahe(image, clip_limit=0.01)),
+        ('clahe uint8', lambda ops: ops.clahe(uint8, clip_limit=0.03)),
+        ('resize 2x', lambda ops: ops.resize(uint8, (2 * size, 2 * size))),
+        ('resize 0.5x', lambda ops: ops.resize(uint8, (size // 2, size // 2))),
+        ('gaussian s=2', lambda ops: ops.gaussian(image, 2.0)),
+        ('unsharp s=1', lambda ops: ops.unsharp(image, 1.0, 0.5)),
+        ('bilateral s=3', lambda ops: ops.bilateral(image, 0.05, 3)),
+        ('sharpness', lambda ops: ops.sharpness(uint8, 1.2)),
+    ]
+
+    print(f'Image ops benchmark ({size}x{size})')
+    print(f"{'operation':<16} {'reference ms':>13} {'opencv ms':>10} {'speedup':>9} {'mean |diff|':>12}")
+    for name, operation in operations:
+        reference_time = timed(operation, reference, repeat=1 if name.startswith('bilateral') else 3)
+        opencv_time = timed(operation, opencv)
+        difference = np.abs(np.asarray(operation(reference), dtype=np.float64) -
+                            np.asarray(operation(opencv), dtype=np.float64)).mean()
+        print(f'{name:<16} {reference_time * 1000:>13.2f} {opencv_time * 1000:>10.2f} '
+              f'{reference_time / opencv_time:>8.1f}x {difference:>12.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -105,7 +105,7 @@ class CORSMiddleware(MiddlewareMixin):
         if request.path.startswith('/api/') or request.path.startswith('/viewer/api/'):
             response['Access-Control-Allow-Origin'] = '*'
             response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-            response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-CSRFToken'
+            response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-CSRFToken, X-Chunk-Checksum'
             response['Access-Control-Allow-Credentials'] = 'true'
         
         return response
@@ -116,7 +116,7 @@ class CORSMiddleware(MiddlewareMixin):
             response = JsonResponse({})
             response['Access-Control-Allow-Origin'] = '*'
             response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-            response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-CSRFToken'
+            response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-CSRFToken, X-Chunk-Checksum'
             response['Access-Control-Allow-Credentials'] = 'true'
             return response
         return None
@@ -152,9 +152,64 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
         return response
 
 
+class CountingStream:
+    """
+    Read-through wrapper around a request's input stream that counts the bytes
+    actually consumed, so body sizes can be logged without buffering the body.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes_read = 0
+
+    def read(self, *args, **kwargs):
+        data = self._stream.read(*args, **kwargs)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, *args, **kwargs):
+        line = self._stream.readline(*args, **kwargs)
+        self.bytes_read += len(line)
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def request_content_length(request):
+    """Declared request body size from the Content-Length header, or None"""
+    try:
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def count_streaming_content(response, on_complete):
+    """Wrap a streaming response so on_complete(total_bytes) runs once the body has been sent"""
+    content = response.streaming_content
+
+    def counted():
+        total = 0
+        try:
+            for chunk in content:
+                total += len(chunk)
+                yield chunk
+        finally:
+            on_complete(total)
+
+    response.streaming_content = counted()
+    return response
+
+
 class RequestLoggingMiddleware(MiddlewareMixin):
     """
     Middleware to log API requests and responses for debugging and monitoring.
+    Never reads request or response bodies: sizes come from Content-Length
+    headers and from byte counters on the streams as they are consumed, so
+    multi-GB uploads reach the upload handlers unbuffered.
     """
     
     def process_request(self, request):
@@ -162,15 +217,28 @@ class RequestLoggingMiddleware(MiddlewareMixin):
         if request.path.startswith('/api/') or request.path.startswith('/viewer/api/'):
             logger.info(f"API Request: {request.method} {request.path}")
             if request.method in ['POST', 'PUT', 'PATCH']:
-                logger.debug(f"Request body size: {len(request.body) if request.body else 0} bytes")
+                logger.debug(f"Request body size: {request_content_length(request)} bytes (Content-Length)")
+                if hasattr(request, '_stream') and not isinstance(request._stream, CountingStream):
+                    request._stream = CountingStream(request._stream)
         return None
     
     def process_response(self, request, response):
         # Log API responses
         if request.path.startswith('/api/') or request.path.startswith('/viewer/api/'):
             logger.info(f"API Response: {request.method} {request.path} - Status: {response.status_code}")
-            if hasattr(response, 'content'):
-                logger.debug(f"Response size: {len(response.content)} bytes")
+            stream = getattr(request, '_stream', None)
+            if isinstance(stream, CountingStream):
+                logger.debug(f"Request body read: {stream.bytes_read} bytes")
+            if response.has_header('Content-Length'):
+                logger.debug(f"Response size: {response['Content-Length']} bytes")
+            elif response.streaming:
+                if not getattr(response, 'is_async', False):
+                    path, method = request.path, request.method
+                    count_streaming_content(response, lambda total: logger.debug(
+                        f"Response size: {total} bytes streamed for {method} {path}"))
+            elif logger.isEnabledFor(logging.DEBUG):
+                # Already fully in memory; CommonMiddleware sets Content-Length from the same chunks later
+                logger.debug(f"Response size: {sum(len(chunk) for chunk in response._container)} bytes")
         return response
 
 
@@ -111,9 +111,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # DICOM specific settings
 DICOM_UPLOAD_PATH = 'dicom_files/'
 MAX_DICOM_FILE_SIZE = 5 * 1024 * 1024 * 1024  # 5GB
+IMAGE_OPS_BACKEND = 'opencv'  # 'opencv' or 'reference' (skimage/scipy/PIL) image kernels
+TILED_EXECUTOR_WORKERS = None  # Worker threads for tiled enhancement filters (None = one per core)
+TILED_EXECUTOR_TILE_SIZE = 512  # Core tile edge in pixels; smaller images are filtered whole
+ENHANCEMENT_STORE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Disk budget for stored X-ray/MRI enhancement results
 
 # File upload settings - optimized for large files
 FILE_UPLOAD_HANDLERS = [
+    'viewer.upload_handlers.DicomStreamingUploadHandler',  # DICOM upload views: stream straight to dicom_files/
     'django.core.files.uploadhandler.TemporaryFileUploadHandler',  # Use temp files for large uploads
     'django.core.files.uploadhandler.MemoryFileUploadHandler',     # Fallback for small files
 ]
@@ -131,7 +136,23 @@ FILE_UPLOAD_PERMISSIONS = 0o644
 # Upload processing settings for large files
 BULK_UPLOAD_TIMEOUT = 3600  # 1 hour timeout for bulk uploads
 UPLOAD_PROGRESS_CACHE_TIMEOUT = 7200  # 2 hours cache timeout for upload progress
+UPLOAD_PROGRESS_INTERVAL_MS = 500  # Publish upload progress to the cache at most this often...
+UPLOAD_PROGRESS_EVERY_FILES = 50  # ...unless this many more files were processed since the last publish
+UPLOAD_PROGRESS_MAX_ERRORS = 100  # Latest errors/warnings kept in the progress payload (totals are counted)
 LARGE_FILE_CHUNK_SIZE = 1024 * 1024  # 1MB chunks for processing large files
+BULK_UPLOAD_MAX_IN_FLIGHT = 1000  # Files a bulk upload may have parsed but not yet written to the database
+BULK_UPLOAD_PARSE_WORKERS = None  # Header-parsing processes for bulk uploads (None = one per available core)
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Chunk size offered to resumable upload clients
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024  # Largest chunk size a client may ask for
+CHUNKED_UPLOAD_SESSION_TTL_HOURS = 24  # Unfinished upload sessions idle this long are discarded
+
+# Background job queue, served by `python manage.py run_job_worker`
+JOB_QUEUE_CONCURRENCY = {'uploads': 2, 'reconstruction': 1, 'default': 2}  # Jobs running at once per queue, across workers
+JOB_WORKER_PROCESSES = 4  # Jobs one worker runs at once, each in its own process
+JOB_LEASE_SECONDS = 60  # A running job not heard from for this long is handed to another worker
+JOB_HEARTBEAT_SECONDS = 10  # How often a running job renews its lease and saves its progress
+JOB_MAX_ATTEMPTS = 3  # Attempts before a job is marked failed
+JOB_RETRY_DELAY_SECONDS = 30  # Delay before the first retry; doubles with every further attempt
 
 # Ensure media directories are created
 import os
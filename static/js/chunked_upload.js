@@ -0,0 +1,287 @@
+// Resumable chunked uploads - files go out as checksummed chunks over several parallel streams
+// Copyright 2024 - Noctis DICOM Viewer Enhanced
+
+class ChunkedUploader {
+    constructor(options = {}) {
+        this.baseUrl = options.baseUrl || '/viewer/api/upload-sessions/';
+        this.preflightUrl = options.preflightUrl || '/viewer/api/upload-preflight/';
+        this.concurrency = options.concurrency || 4;
+        this.maxRetries = options.maxRetries || 5;
+        this.maxRounds = options.maxRounds || 3;
+        this.csrfToken = options.csrfToken || '';
+        this.onProgress = options.onProgress || (() => {});
+        this.storageKey = 'noctisUploadSessions';
+    }
+
+    // Sessions are remembered per file selection, so selecting the same files again resumes the upload
+    fingerprint(files) {
+        return files.map(file => `${file.webkitRelativePath || file.name}:${file.size}:${file.lastModified}`).join('|');
+    }
+
+    rememberedSessions() {
+        try {
+            return JSON.parse(localStorage.getItem(this.storageKey)) || {};
+        } catch (error) {
+            return {};
+        }
+    }
+
+    remember(fingerprint, sessionId) {
+        const sessions = this.rememberedSessions();
+        if (sessionId) {
+            sessions[fingerprint] = sessionId;
+        } else {
+            delete sessions[fingerprint];
+        }
+        try {
+            localStorage.setItem(this.storageKey, JSON.stringify(sessions));
+        } catch (error) {
+            console.warn('Could not remember upload session:', error);
+        }
+    }
+
+    async request(url, options = {}) {
+        const response = await fetch(url, {
+            credentials: 'same-origin',
+            ...options,
+            headers: { 'X-CSRFToken': this.csrfToken, ...(options.headers || {}) }
+        });
+        let data = {};
+        try {
+            data = await response.json();
+        } catch (error) {
+            data = {};
+        }
+        if (!response.ok) {
+            const error = new Error(data.error || `HTTP ${response.status}: ${response.statusText}`);
+            error.status = response.status;
+            error.data = data;
+            throw error;
+        }
+        return data;
+    }
+
+    async openSession(files) {
+        const fingerprint = this.fingerprint(files);
+        const remembered = this.rememberedSessions()[fingerprint];
+        if (remembered) {
+            try {
+                const status = await this.request(`${this.baseUrl}${remembered}/`);
+                if (status.status === 'open') {
+                    console.log('Resuming upload session', remembered);
+                    return status;
+                }
+            } catch (error) {
+                console.log('Upload session no longer available, starting a new one:', error.message);
+            }
+        }
+        const status = await this.request(this.baseUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                files: files.map(file => ({
+                    name: file.name,
+                    size: file.size,
+                    relative_path: file.webkitRelativePath || file.name
+                }))
+            })
+        });
+        this.remember(fingerprint, status.session_id);
+        return status;
+    }
+
+    async checksum(buffer) {
+        if (window.crypto && window.crypto.subtle) {
+            const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+            return 'sha256:' + Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+        }
+        // WebCrypto only exists in secure contexts; plain-HTTP deployments send CRC-32 instead
+        return 'crc32:' + ChunkedUploader.crc32(new Uint8Array(buffer)).toString(16).padStart(8, '0');
+    }
+
+    static crc32(bytes) {
+        if (!ChunkedUploader.crcTable) {
+            ChunkedUploader.crcTable = new Uint32Array(256);
+            for (let n = 0; n < 256; n++) {
+                let c = n;
+                for (let k = 0; k < 8; k++) {
+                    c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+                }
+                ChunkedUploader.crcTable[n] = c >>> 0;
+            }
+        }
+        let crc = 0xFFFFFFFF;
+        for (let i = 0; i < bytes.length; i++) {
+            crc = ChunkedUploader.crcTable[(crc ^ bytes[i]) & 0xFF] ^ (crc >>> 8);
+        }
+        return (crc ^ 0xFFFFFFFF) >>> 0;
+    }
+
+    // MediaStorageSOPInstanceUID (0002,0003) from a Part 10 file's explicit VR little endian file meta, or null
+    static sopInstanceUid(buffer) {
+        const bytes = new Uint8Array(buffer);
+        const view = new DataView(buffer);
+        if (bytes.length < 132 || String.fromCharCode(...bytes.subarray(128, 132)) !== 'DICM') {
+            return null;
+        }
+        let offset = 132;
+        while (offset + 8 <= bytes.length && view.getUint16(offset, true) === 0x0002) {
+            const element = view.getUint16(offset + 2, true);
+            const vr = String.fromCharCode(bytes[offset + 4], bytes[offset + 5]);
+            let length = view.getUint16(offset + 6, true);
+            let valueOffset = offset + 8;
+            if (ChunkedUploader.longVRs.has(vr)) {
+                if (offset + 12 > bytes.length) {
+                    return null;
+                }
+                length = view.getUint32(offset + 8, true);
+                valueOffset = offset + 12;
+            }
+            if (element === 0x0003) {
+                if (valueOffset + length > bytes.length) {
+                    return null;
+                }
+                return String.fromCharCode(...bytes.subarray(valueOffset, valueOffset + length)).replace(/[\0\s]+$/, '') || null;
+            }
+            offset = valueOffset + length;
+        }
+        return null;
+    }
+
+    // Files whose instances the archive already holds are left out; anything without a readable UID is sent
+    async preflight(files) {
+        this.onProgress({ phase: 'checking' });
+        const uids = [];
+        for (let start = 0; start < files.length; start += 64) {
+            uids.push(...await Promise.all(files.slice(start, start + 64).map(async file => {
+                try {
+                    return ChunkedUploader.sopInstanceUid(await file.slice(0, 8192).arrayBuffer());
+                } catch (error) {
+                    return null;
+                }
+            })));
+        }
+        const offered = [...new Set(uids.filter(uid => uid))];
+        const missing = new Set();
+        const studyIds = new Set();
+        let stored = 0;
+        try {
+            for (let start = 0; start < offered.length; start += 5000) {
+                const data = await this.request(this.preflightUrl, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ sop_instance_uids: offered.slice(start, start + 5000) })
+                });
+                data.missing_sop_instance_uids.forEach(uid => missing.add(uid));
+                data.study_ids.forEach(id => studyIds.add(id));
+                stored += data.stored;
+            }
+        } catch (error) {
+            // Servers without the pre-flight check simply receive everything
+            console.warn('Upload pre-flight check failed, sending every file:', error.message);
+            return { files, stored: 0, studyIds: [] };
+        }
+        return {
+            files: files.filter((file, index) => !uids[index] || missing.has(uids[index])),
+            stored,
+            studyIds: [...studyIds]
+        };
+    }
+
+    async putChunk(sessionId, file, fileIndex, chunkIndex, chunkSize) {
+        const start = chunkIndex * chunkSize;
+        const buffer = await file.slice(start, Math.min(file.size, start + chunkSize)).arrayBuffer();
+        const checksum = await this.checksum(buffer);
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await this.request(`${this.baseUrl}${sessionId}/files/${fileIndex}/chunks/${chunkIndex}/`, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-Checksum': checksum },
+                    body: buffer
+                });
+            } catch (error) {
+                // Dropped connections, server errors and corrupted transfers are retried; other client errors are not
+                const retryable = !error.status || error.status >= 500 || [408, 422, 429].includes(error.status);
+                if (!retryable || attempt >= this.maxRetries) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, Math.min(30000, 500 * 2 ** attempt)));
+            }
+        }
+    }
+
+    async sendMissing(status, files) {
+        const queue = [];
+        let sentBytes = 0;
+        let totalBytes = 0;
+        status.files.forEach(entry => {
+            const missing = new Set(entry.missing);
+            totalBytes += entry.size;
+            for (let chunkIndex = 0; chunkIndex < entry.chunks; chunkIndex++) {
+                const bytes = Math.max(0, Math.min(status.chunk_size, entry.size - chunkIndex * status.chunk_size));
+                if (missing.has(chunkIndex)) {
+                    queue.push([entry.index, chunkIndex, bytes]);
+                } else {
+                    sentBytes += bytes;
+                }
+            }
+        });
+        this.onProgress({ phase: 'uploading', sentBytes, totalBytes });
+
+        // Several streams take chunks off one queue, so large files and many small files both go out in parallel
+        let next = 0;
+        const stream = async () => {
+            while (next < queue.length) {
+                const [fileIndex, chunkIndex, bytes] = queue[next++];
+                await this.putChunk(status.session_id, files[fileIndex], fileIndex, chunkIndex, status.chunk_size);
+                sentBytes += bytes;
+                this.onProgress({ phase: 'uploading', sentBytes, totalBytes });
+            }
+        };
+        await Promise.all(Array.from({ length: Math.min(this.concurrency, queue.length) }, stream));
+    }
+
+    async upload(fileList) {
+        const { files, stored, studyIds } = await this.preflight(Array.from(fileList));
+        if (!files.length) {
+            return { status: 'completed', result: { success: true, images_processed: 0, already_stored: stored, study_ids: studyIds } };
+        }
+        let status = await this.openSession(files);
+        for (let round = 1; ; round++) {
+            await this.sendMissing(status, files);
+            try {
+                await this.request(`${this.baseUrl}${status.session_id}/complete/`, { method: 'POST' });
+                break;
+            } catch (error) {
+                // The server still misses chunks (or a whole file failed its check): send those again
+                if (!error.data || !error.data.missing || round >= this.maxRounds) {
+                    throw error;
+                }
+                status = await this.request(`${this.baseUrl}${status.session_id}/`);
+            }
+        }
+        this.remember(this.fingerprint(files), null);
+        const final = await this.waitForIngest(status.session_id);
+        if (final.result && stored) {
+            final.result.already_stored = stored;
+            final.result.study_ids = [...new Set([...(final.result.study_ids || []), ...studyIds])];
+        }
+        return final;
+    }
+
+    async waitForIngest(sessionId, interval = 1000) {
+        for (;;) {
+            const status = await this.request(`${this.baseUrl}${sessionId}/`);
+            this.onProgress({ phase: 'processing', progress: status.progress || {} });
+            if (status.status === 'completed' || status.status === 'failed') {
+                return status;
+            }
+            await new Promise(resolve => setTimeout(resolve, interval));
+        }
+    }
+}
+
+// Explicit VRs whose element header has a 4-byte length
+ChunkedUploader.longVRs = new Set(['OB', 'OD', 'OF', 'OL', 'OV', 'OW', 'SQ', 'SV', 'UC', 'UN', 'UR', 'UT', 'UV']);
+
+window.ChunkedUploader = ChunkedUploader;
@@ -2292,6 +2292,113 @@ class AdvancedDicomViewer {
         
         // Add volume rendering controls
         this.addVolumeControls(parameters);
+        this.setupVolumeRotation(parameters);
+    }
+    
+    setupVolumeRotation(parameters) {
+        const canvas = document.getElementById('dicom-canvas-advanced');
+        this.volumeCamera = {
+            azimuth: parameters.azimuth || 0,
+            elevation: parameters.elevation || 0,
+            preset: parameters.color_preset || 'grayscale'
+        };
+        if (!canvas || this.volumeRotationBound) {
+            return;
+        }
+        this.volumeRotationBound = true;
+        
+        let dragging = false;
+        let lastX = 0;
+        let lastY = 0;
+        
+        canvas.addEventListener('mousedown', (e) => {
+            if (!document.getElementById('volume-overlay')) {
+                return;
+            }
+            dragging = true;
+            lastX = e.clientX;
+            lastY = e.clientY;
+        });
+        
+        canvas.addEventListener('mousemove', (e) => {
+            if (!dragging) {
+                return;
+            }
+            this.volumeCamera.azimuth = (this.volumeCamera.azimuth + (e.clientX - lastX) * 0.5) % 360;
+            this.volumeCamera.elevation = Math.max(-90, Math.min(90, this.volumeCamera.elevation + (e.clientY - lastY) * 0.5));
+            lastX = e.clientX;
+            lastY = e.clientY;
+            // Low-resolution frames while the camera moves
+            this.requestVolumeFrame('interactive');
+        });
+        
+        const stopRotation = () => {
+            if (!dragging) {
+                return;
+            }
+            dragging = false;
+            // Full-resolution refine once the camera stops
+            this.requestVolumeFrame('full');
+        };
+        canvas.addEventListener('mouseup', stopRotation);
+        canvas.addEventListener('mouseleave', stopRotation);
+    }
+    
+    async requestVolumeFrame(quality) {
+        // Keep a single request in flight and coalesce the frames queued behind it
+        if (this.volumeFrameInFlight) {
+            this.volumeFramePending = quality === 'full' ? 'full' : (this.volumeFramePending || quality);
+            return;
+        }
+        this.volumeFrameInFlight = true;
+        
+        try {
+            const response = await fetch(`/viewer/api/series/${this.currentSeries}/volume-rendering/`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': this.getCSRFToken()
+                },
+                body: JSON.stringify({
+                    mode: 'composite',
+                    color_preset: this.volumeCamera.preset,
+                    azimuth: this.volumeCamera.azimuth,
+                    elevation: this.volumeCamera.elevation,
+                    quality: quality
+                })
+            });
+            
+            const data = await response.json();
+            if (data.success) {
+                this.drawVolumeFrame(data.volume_rendering, data.parameters);
+            }
+        } catch (error) {
+            console.error('Error rendering volume frame:', error);
+        } finally {
+            this.volumeFrameInFlight = false;
+            const pending = this.volumeFramePending;
+            this.volumeFramePending = null;
+            if (pending) {
+                this.requestVolumeFrame(pending);
+            }
+        }
+    }
+    
+    drawVolumeFrame(imageData, parameters) {
+        const canvas = document.getElementById('dicom-canvas-advanced');
+        const ctx = canvas.getContext('2d');
+        
+        const img = new Image();
+        img.onload = () => {
+            // Interactive frames are low resolution and are scaled up to the canvas
+            ctx.imageSmoothingEnabled = true;
+            ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
+            
+            ctx.fillStyle = 'white';
+            ctx.font = '12px Arial';
+            ctx.fillText(`Azimuth: ${Math.round(parameters.azimuth)}°  Elevation: ${Math.round(parameters.elevation)}°  (${parameters.quality})`, 10, 30);
+        };
+        img.src = imageData;
     }
     
     addVolumeControls(parameters) {
@@ -2923,7 +3030,9 @@ class AdvancedDicomViewer {
                 body: JSON.stringify({
                     mode: mode,
                     color_preset: preset,
-                    opacity_threshold: opacity
+                    opacity_threshold: opacity,
+                    azimuth: this.volumeCamera ? this.volumeCamera.azimuth : 0,
+                    elevation: this.volumeCamera ? this.volumeCamera.elevation : 0
                 })
             });
 
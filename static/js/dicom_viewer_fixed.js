@@ -69,6 +69,13 @@ class FixedDicomViewer {
         this.measurementUnit = 'mm';
         this.calibrationFactor = 1;
         
+        // Live HU readout (summed-area table probes, batched while a request is in flight)
+        this.displayRect = null;
+        this.huProbeQueue = [];
+        this.huProbeInFlight = false;
+        this.huProbeCache = new Map();
+        this.huReadoutEl = null;
+        
         // Magnification tool
         this.magnificationActive = false;
         this.magnificationLevel = 2;
@@ -1155,6 +1162,13 @@ class FixedDicomViewer {
                     this.ctx.drawImage(img, -displayWidth / 2, -displayHeight / 2, displayWidth, displayHeight);
                     this.ctx.restore();
                     
+                    // Remember where the image was drawn for cursor -> pixel mapping
+                    this.displayRect = {
+                        x, y, width: displayWidth, height: displayHeight,
+                        columns: this.currentImage?.columns || img.width,
+                        rows: this.currentImage?.rows || img.height
+                    };
+                    
                     // Store image data
                     this.imageData = this.ctx.getImageData(0, 0, this.canvas.width, this.canvas.height);
                     
@@ -1466,10 +1480,8 @@ class FixedDicomViewer {
         }
         
         if (!this.isDragging) {
-            // Update cursor position for HU measurement
-            if (this.activeTool === 'hu') {
-                this.updateHUMeasurement(x, y);
-            }
+            // Live HU readout under the cursor
+            this.updateHUMeasurement(x, y);
             return;
         }
 
@@ -1502,6 +1514,124 @@ class FixedDicomViewer {
         this.lastMousePos = { x: e.clientX, y: e.clientY };
     }
 
+    canvasToImagePixel(x, y) {
+        const r = this.displayRect;
+        if (!r) return null;
+        
+        // Undo pan/zoom, rotation and flips about the image centre
+        let dx = x - (r.x + r.width / 2);
+        let dy = y - (r.y + r.height / 2);
+        const angle = -this.rotation * Math.PI / 180;
+        const rx = dx * Math.cos(angle) - dy * Math.sin(angle);
+        const ry = dx * Math.sin(angle) + dy * Math.cos(angle);
+        dx = this.flipHorizontal ? -rx : rx;
+        dy = this.flipVertical ? -ry : ry;
+        
+        const col = Math.floor((dx / r.width + 0.5) * r.columns);
+        const row = Math.floor((dy / r.height + 0.5) * r.rows);
+        if (col < 0 || row < 0 || col >= r.columns || row >= r.rows) return null;
+        return { x: col, y: row };
+    }
+
+    updateHUMeasurement(x, y) {
+        const pixelInfo = document.getElementById('pixel-info');
+        const coordsInfo = document.getElementById('coords-info');
+        const pixel = this.currentImage ? this.canvasToImagePixel(x, y) : null;
+        
+        if (!pixel) {
+            if (pixelInfo) pixelInfo.textContent = 'Pixel: - HU: -';
+            if (coordsInfo) coordsInfo.textContent = 'X: - Y: -';
+            this.hideHUReadout();
+            return;
+        }
+        
+        if (coordsInfo) coordsInfo.textContent = `X: ${pixel.x} Y: ${pixel.y}`;
+        this.huCursor = { x, y, pixel };
+        
+        const radius = this.activeTool === 'hu' ? 2 : 0;
+        const cached = this.huProbeCache.get(`${this.currentImage.id}:${radius}:${pixel.x}:${pixel.y}`);
+        if (cached) {
+            this.showHUReadout(cached);
+            return;
+        }
+        
+        this.huProbeQueue.push([pixel.x, pixel.y]);
+        this.flushHUProbes();
+    }
+
+    async flushHUProbes() {
+        if (this.huProbeInFlight || !this.huProbeQueue.length || !this.currentImage) return;
+        
+        // Every position collected while the previous request was in flight goes in one call
+        const imageId = this.currentImage.id;
+        const radius = this.activeTool === 'hu' ? 2 : 0;
+        const points = this.huProbeQueue.splice(0, this.huProbeQueue.length).slice(-256);
+        this.huProbeInFlight = true;
+        
+        try {
+            const response = await fetch(`/viewer/api/images/${imageId}/hu-probe/`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': this.getCSRFToken()
+                },
+                body: JSON.stringify({ points, radius })
+            });
+            if (response.ok) {
+                const data = await response.json();
+                if (this.huProbeCache.size > 20000) this.huProbeCache.clear();
+                data.points.forEach(point => {
+                    this.huProbeCache.set(`${imageId}:${data.radius}:${point.x}:${point.y}`, point);
+                });
+                const cursor = this.huCursor?.pixel;
+                const latest = cursor && this.currentImage?.id === imageId &&
+                    this.huProbeCache.get(`${imageId}:${data.radius}:${cursor.x}:${cursor.y}`);
+                if (latest) this.showHUReadout(latest);
+            }
+        } catch (error) {
+            console.warn('HU probe failed:', error);
+        } finally {
+            this.huProbeInFlight = false;
+            this.flushHUProbes();
+        }
+    }
+
+    showHUReadout(point) {
+        const pixelInfo = document.getElementById('pixel-info');
+        const hu = point.hu === null ? '-' : point.hu.toFixed(0);
+        let text = `Pixel: (${point.x}, ${point.y}) HU: ${hu}`;
+        if (point.mean !== undefined && point.mean !== null) {
+            text += ` | Mean: ${point.mean.toFixed(1)} SD: ${point.std.toFixed(1)}`;
+        }
+        if (pixelInfo) pixelInfo.textContent = text;
+        
+        // Floating readout next to the cursor while the HU tool is active
+        if (this.activeTool !== 'hu' || !this.huCursor) {
+            this.hideHUReadout();
+            return;
+        }
+        if (!this.huReadoutEl) {
+            this.huReadoutEl = document.createElement('div');
+            this.huReadoutEl.className = 'hu-live-readout';
+            Object.assign(this.huReadoutEl.style, {
+                position: 'absolute', pointerEvents: 'none', padding: '2px 6px',
+                background: 'rgba(0, 0, 0, 0.75)', color: '#00ff88', font: '12px monospace',
+                borderRadius: '3px', whiteSpace: 'nowrap', zIndex: 20
+            });
+            this.canvas.parentElement.appendChild(this.huReadoutEl);
+        }
+        this.huReadoutEl.textContent = point.mean !== undefined && point.mean !== null
+            ? `${hu} HU (${point.mean.toFixed(1)} ± ${point.std.toFixed(1)})`
+            : `${hu} HU`;
+        this.huReadoutEl.style.left = `${this.canvas.offsetLeft + this.huCursor.x + 14}px`;
+        this.huReadoutEl.style.top = `${this.canvas.offsetTop + this.huCursor.y + 14}px`;
+        this.huReadoutEl.style.display = 'block';
+    }
+
+    hideHUReadout() {
+        if (this.huReadoutEl) this.huReadoutEl.style.display = 'none';
+    }
+
     handleMouseUp(e) {
         this.isDragging = false;
         this.dragStart = null;
@@ -1730,7 +1860,7 @@ class FixedDicomViewer {
         // Filter for DICOM files and common medical image formats
         const validFiles = files.filter(file => {
             const name = file.name.toLowerCase();
-            const validExtensions = ['.dcm', '.dicom', '.dic', '.img', '.ima'];
+            const validExtensions = ['.dcm', '.dicom', '.dic', '.img', '.ima', '.zip', '.tar', '.tar.gz', '.tgz'];
             const hasDicomExtension = validExtensions.some(ext => name.endsWith(ext));
             
             // Also accept files without extension (common in DICOM folders)
@@ -1782,40 +1912,45 @@ class FixedDicomViewer {
             uploadStatus.textContent = 'Uploading files...';
             startUploadBtn.disabled = true;
             
-            // Create FormData
-            const formData = new FormData();
-            this.selectedFiles.forEach(file => {
-                formData.append('files', file);
-            });
-            
-            // Get CSRF token
-            const csrfToken = this.getCSRFToken();
-            
-            // Upload files
-            const response = await fetch('/viewer/api/upload/', {
-                method: 'POST',
-                body: formData,
-                headers: {
-                    'X-CSRFToken': csrfToken
+            // Files go out as resumable, checksummed chunks over several parallel streams
+            const progressBar = uploadProgress.querySelector('.progress-bar');
+            const uploader = new ChunkedUploader({
+                csrfToken: this.getCSRFToken(),
+                concurrency: 4,
+                onProgress: (state) => {
+                    if (state.phase === 'checking') {
+                        uploadStatus.textContent = 'Checking which files are already stored...';
+                    } else if (state.phase === 'uploading') {
+                        const percent = state.totalBytes ? Math.round(100 * state.sentBytes / state.totalBytes) : 100;
+                        if (progressBar) progressBar.style.width = `${percent}%`;
+                        uploadStatus.textContent = `Uploading files... ${percent}%`;
+                    } else {
+                        const progress = state.progress;
+                        uploadStatus.textContent = `Processing... ${progress.processed_files || 0} of ${progress.total_files || 0} files`;
+                    }
                 }
             });
             
-            if (!response.ok) {
-                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-            }
-            
-            const result = await response.json();
-            
-            if (result.error) {
-                throw new Error(result.error);
+            const session = await uploader.upload(this.selectedFiles);
+            const result = session.result || {};
+            if (session.status !== 'completed') {
+                throw new Error((result.errors || [])[0] || result.error || 'No DICOM files could be processed');
             }
             
             // Success
-            this.notyf.success(`Successfully uploaded ${result.uploaded_files ? result.uploaded_files.length : 0} files`);
+            let message = `Successfully uploaded ${result.images_processed || 0} images`;
+            if (result.skipped_files) {
+                message += ` (${result.skipped_files} non-DICOM files skipped)`;
+            }
+            if (result.already_stored) {
+                message += `; ${result.already_stored} already stored, not re-sent`;
+            }
+            this.notyf.success(message);
             
-            // Reload studies if we have a study ID
-            if (result.study_id) {
-                await this.loadStudy(result.study_id);
+            // Load the first study the upload contained
+            const studyId = (result.study_ids || [])[0];
+            if (studyId) {
+                await this.loadStudy(studyId);
             } else {
                 // Refresh the current view
                 await this.refreshCurrentImage();
@@ -0,0 +1,102 @@
+"""
+Tests for the streaming archive reader.
+"""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, override_settings
+
+from viewer.archive_reader import is_archive, iter_dicom_members, store_member
+from viewer.services import UploadService
+
+from test_upload_handlers import dicom_bytes
+
+
+def zip_archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('scans/', '')
+        for name, data in members:
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def tar_archive(members, mode='w'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+class ArchiveReaderTestCase(SimpleTestCase):
+    """Archive members are sniffed from their streams and only DICOM candidates are stored"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.first, _ = dicom_bytes(16, 16)
+        self.second, _ = dicom_bytes(32, 32)
+        self.members = [
+            ('scans/IM0001', self.first),
+            ('scans/README.txt', b'not a dicom file ' * 20),
+            ('scans/series/IM0002.dcm', self.second),
+            ('scans/empty.dcm', b''),
+        ]
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_recognises_archive_names(self):
+        self.assertTrue(all(map(is_archive, ['a.zip', 'b.TAR', 'c.tar.gz', 'd.tgz'])))
+        self.assertFalse(is_archive('image.dcm'))
+
+    def test_members_are_sniffed_and_stored_in_archive_order(self):
+        archives = {
+            'upload.zip': zip_archive(self.members),
+            'upload.tar': tar_archive(self.members),
+            'upload.tar.gz': tar_archive(self.members, 'w:gz'),
+        }
+        for name, fileobj in archives.items():
+            with self.subTest(name):
+                skipped = []
+                stored = []
+                for member in iter_dicom_members(fileobj, name, on_skip=lambda *args: skipped.append(args)):
+                    stored.append((member.name, store_member(member)))
+                self.assertEqual([member_name for member_name, _ in stored],
+                                 ['scans/IM0001', 'scans/series/IM0002.dcm'])
+                self.assertEqual([args[0] for args in skipped], ['scans/README.txt', 'scans/empty.dcm'])
+                self.assertTrue(stored[1][1].startswith('dicom_files/') and stored[1][1].endswith('_IM0002.dcm'))
+                with default_storage.open(stored[0][1]) as f:
+                    self.assertEqual(f.read(), self.first)
+                with default_storage.open(stored[1][1]) as f:
+                    self.assertEqual(f.read(), self.second)
+
+    def test_upload_service_stores_members_directly(self):
+        archive_path = os.path.join(self.media_root, 'upload.tgz')
+        with open(archive_path, 'wb') as f:
+            f.write(tar_archive(self.members, 'w:gz').getvalue())
+
+        service = UploadService(None)
+        with mock.patch('tempfile.mkdtemp') as mkdtemp:
+            stored = service.extract_archive(archive_path)
+        mkdtemp.assert_not_called()
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'dicom_files'))),
+                         sorted(os.path.basename(name) for name in stored))
+        self.assertEqual(len(stored), 2)
+        self.assertTrue(stored[1].startswith('dicom_files/') and stored[1].endswith('_IM0002.dcm'))
+        with default_storage.open(stored[1]) as f:
+            self.assertEqual(f.read(), self.second)
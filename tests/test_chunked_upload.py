@@ -0,0 +1,136 @@
+"""
+Tests for resumable chunked upload sessions.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from viewer.chunked_upload import MIN_CHUNK_SIZE, UploadSessionError, chunked_uploads
+from viewer.jobs import job_queue
+from viewer.models import DicomImage, Job, UploadChunk, UploadSession
+
+from test_upload_handlers import dicom_bytes
+
+
+def sha256(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def chunks(data, size=MIN_CHUNK_SIZE):
+    return [data[i:i + size] for i in range(0, len(data), size)] or [b'']
+
+
+@override_settings(BULK_UPLOAD_PARSE_WORKERS=1)
+class ChunkedUploadTestCase(TestCase):
+    """Chunks arrive in any order, are verified and resumable, and completed sessions are ingested"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = User.objects.create_user('uploader', password='pw')
+        self.client.force_login(self.user)
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for i in range(4):
+                archive.writestr(f'series/IM{i:04d}', dicom_bytes()[0])
+            archive.writestr('series/README.txt', 'not dicom ' * 50)
+        self.archive = buffer.getvalue()
+        self.single = dicom_bytes()[0]
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def put_chunk(self, session_id, file_index, index, data, checksum=None):
+        return self.client.put(
+            f'/viewer/api/upload-sessions/{session_id}/files/{file_index}/chunks/{index}/',
+            data=data, content_type='application/octet-stream',
+            HTTP_X_CHUNK_CHECKSUM=checksum or sha256(data),
+        )
+
+    def test_out_of_order_chunks_resume_and_ingest(self):
+        response = self.client.post('/viewer/api/upload-sessions/', {
+            'chunk_size': MIN_CHUNK_SIZE,
+            'files': [
+                {'name': 'study.zip', 'size': len(self.archive), 'sha256': hashlib.sha256(self.archive).hexdigest()},
+                {'name': 'slice.dcm', 'size': len(self.single)},
+            ],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        session_id = response.json()['session_id']
+        parts = chunks(self.archive)
+        self.assertEqual([f['chunks'] for f in response.json()['files']], [len(parts), 1])
+        self.assertGreater(len(parts), 1)
+
+        # Last chunk first; a corrupted chunk is refused and stays missing
+        self.assertEqual(self.put_chunk(session_id, 0, len(parts) - 1, parts[-1]).status_code, 200)
+        bad = self.put_chunk(session_id, 0, 0, parts[0], checksum=sha256(b'other bytes'))
+        self.assertEqual(bad.status_code, 422)
+        incomplete = self.client.post(f'/viewer/api/upload-sessions/{session_id}/complete/')
+        self.assertEqual(incomplete.status_code, 409)
+        self.assertEqual(incomplete.json()['missing']['0'], list(range(len(parts) - 1)))
+
+        # A reconnecting client sends only what the status lists as missing
+        status = self.client.get(f'/viewer/api/upload-sessions/{session_id}/').json()
+        for entry in status['files']:
+            for index in entry['missing']:
+                data = (parts if entry['index'] == 0 else chunks(self.single))[index]
+                checksum = f'crc32:{zlib.crc32(data):08x}' if entry['index'] == 1 else None
+                self.assertEqual(self.put_chunk(session_id, entry['index'], index, data, checksum).status_code, 200)
+        self.assertTrue(self.client.get(f'/viewer/api/upload-sessions/{session_id}/').json()['complete'])
+
+        response = self.client.post(f'/viewer/api/upload-sessions/{session_id}/complete/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get(f'/viewer/api/upload-sessions/{session_id}/').json()['progress']['status'],
+                         'queued')
+        self.assertEqual(job_queue.run_pending(['uploads']), 1)
+        self.assertEqual(Job.objects.get(reference=session_id).status, 'succeeded')
+
+        payload = self.client.get(f'/viewer/api/upload-sessions/{session_id}/').json()
+        self.assertEqual(payload['status'], 'completed')
+        self.assertEqual((payload['result']['images_processed'], payload['result']['skipped_files']), (5, 1))
+        self.assertEqual(len(payload['result']['study_ids']), 5)
+        self.assertEqual(payload['progress']['status'], 'completed')
+        self.assertEqual(DicomImage.objects.count(), 5)
+        self.assertFalse(os.path.exists(chunked_uploads.session_dir(UploadSession.objects.get(pk=session_id))))
+        self.assertEqual(self.put_chunk(session_id, 1, 0, self.single).status_code, 409)
+
+    def test_chunks_are_checked_against_their_extent(self):
+        session = chunked_uploads.create([{'name': 'slice.dcm', 'size': len(self.single)}], chunk_size=MIN_CHUNK_SIZE)
+        with self.assertRaises(UploadSessionError):
+            chunked_uploads.write_chunk(session, 0, 0, io.BytesIO(self.single + b'extra'), sha256(self.single + b'extra'))
+        with self.assertRaises(UploadSessionError):
+            chunked_uploads.write_chunk(session, 0, 0, io.BytesIO(self.single[:-2]), sha256(self.single[:-2]))
+        with self.assertRaises(UploadSessionError):
+            chunked_uploads.write_chunk(session, 0, 0, io.BytesIO(self.single), 'md5:abc')
+        self.assertEqual(chunked_uploads.status(session)['files'][0]['missing'], [0])
+        self.assertEqual(chunked_uploads.write_chunk(session, 0, 0, io.BytesIO(self.single), sha256(self.single)), 1)
+
+    def test_whole_file_checksum_mismatch_resets_the_file(self):
+        declared = hashlib.sha256(b'something else').hexdigest()
+        session = chunked_uploads.create([{'name': 'slice.dcm', 'size': len(self.single), 'sha256': declared}])
+        chunked_uploads.write_chunk(session, 0, 0, io.BytesIO(self.single), sha256(self.single))
+        with self.assertRaises(UploadSessionError) as raised:
+            chunked_uploads.complete(session)
+        self.assertEqual((raised.exception.status, raised.exception.details['missing']), (422, {0: [0]}))
+        self.assertFalse(UploadChunk.objects.filter(session=session).exists())
+        self.assertEqual(UploadSession.objects.get(pk=session.pk).status, 'open')
+
+    def test_idle_sessions_expire(self):
+        idle = chunked_uploads.create([{'name': 'a.dcm', 'size': 10}])
+        UploadSession.objects.filter(pk=idle.pk).update(updated_at=timezone.now() - timedelta(hours=48))
+        chunked_uploads.create([{'name': 'b.dcm', 'size': 10}])
+        self.assertFalse(UploadSession.objects.filter(pk=idle.pk).exists())
+        self.assertFalse(os.path.exists(chunked_uploads.session_dir(idle)))
@@ -0,0 +1,107 @@
+"""
+Tests for LUT-based colour presets.
+"""
+
+import base64
+import io
+import shutil
+import tempfile
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from pydicom.uid import generate_uid
+
+from viewer.color_presets import ColorPresetRegistry, build_lut, to_uint8
+from viewer.ingest import IngestWriter
+from viewer.models import DicomSeries
+from viewer.views import apply_color_preset
+
+from test_ingest import dataset
+
+
+class ColorPresetTestCase(SimpleTestCase):
+    """Colour transfer functions and their use in apply_color_preset"""
+
+    def setUp(self):
+        self.presets = ColorPresetRegistry()
+        self.indices = np.arange(256, dtype=np.uint8).reshape(16, 16)
+
+    def test_builtin_presets_are_rgba_luts(self):
+        for name in ['bone', 'soft_tissue', 'vessels', 'grayscale']:
+            lut = self.presets.get(name).lut
+            self.assertEqual(lut.shape, (256, 4))
+            self.assertEqual(lut.dtype, np.uint8)
+
+    def test_bone_lut_matches_legacy_colormap(self):
+        """Bone LUT reproduces the former per-pixel bone colouring"""
+        colored = self.presets.get('bone').apply(self.indices)
+        for intensity in [10, 64, 65, 128, 129, 255]:
+            expected = (
+                [intensity, intensity, intensity] if intensity > 128 else
+                [intensity, intensity // 2, 0] if intensity > 64 else
+                [intensity // 4, intensity // 4, intensity // 2]
+            )
+            np.testing.assert_array_equal(colored.reshape(-1, 3)[intensity], expected)
+
+    def test_vessels_preset_matches_legacy_scaling(self):
+        data = np.linspace(0, 1, 101, dtype=np.float32).reshape(1, -1)
+        colored = apply_color_preset(data, 'vessels').astype(np.int32)
+        legacy = (np.clip(data[..., None] * np.array([1.5, 0.5, 0.2]), 0, 1) * 255).astype(np.int32)
+        self.assertLessEqual(np.abs(colored - legacy).max(), 2)
+
+    def test_grayscale_stays_single_channel(self):
+        data = np.random.default_rng(0).random((8, 8)).astype(np.float32)
+        result = apply_color_preset(data, 'grayscale')
+        self.assertEqual(result.shape, (8, 8))
+        np.testing.assert_array_equal(result, to_uint8(data, 0.0, 1.0))
+
+    def test_user_defined_preset(self):
+        points = [(0, 0, 0, 255, 0), (255, 255, 0, 0, 255)]
+        custom = self.presets.resolve({'name': 'heat', 'points': points})
+        np.testing.assert_array_equal(custom.lut[0], [0, 0, 255, 0])
+        np.testing.assert_array_equal(custom.lut[255], [255, 0, 0, 255])
+        registered = self.presets.register('heat', points)
+        self.assertIs(self.presets.get('heat'), registered)
+
+    def test_invalid_control_points(self):
+        with self.assertRaises(ValueError):
+            build_lut([(0, 0, 0, 0)])
+
+
+class BoneReconstructionViewTestCase(TestCase):
+    """The bone reconstruction endpoint colours the cached volume's MIP with the bone LUT"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        study_uid, series_uid = generate_uid()[:40].rstrip('.'), generate_uid()[:40].rstrip('.')
+        writer = IngestWriter()
+        for i in range(5):
+            ds = dataset(study_uid, series_uid, i)
+            buffer = io.BytesIO()
+            ds.save_as(buffer, write_like_original=False)
+            writer.add(ds, default_storage.save(f'dicom_files/{i}.dcm', ContentFile(buffer.getvalue())))
+        writer.flush()
+        self.series = DicomSeries.objects.get(series_instance_uid=series_uid)
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_endpoint_returns_bone_coloured_png(self):
+        response = self.client.post(f'/viewer/api/series/{self.series.id}/bone-reconstruction/',
+                                    {'bone_threshold': 200}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['parameters'], {'bone_threshold': 200.0, 'enhancement_factor': 2.0})
+        self.assertEqual((data['dimensions']['width'], data['dimensions']['height']), (8, 8))
+        prefix = 'data:image/png;base64,'
+        self.assertTrue(data['bone_reconstruction'].startswith(prefix))
+        image = Image.open(io.BytesIO(base64.b64decode(data['bone_reconstruction'][len(prefix):])))
+        self.assertEqual((image.size, image.mode), ((8, 8), 'RGB'))
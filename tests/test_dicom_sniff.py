@@ -0,0 +1,73 @@
+"""
+Tests for DICOM content sniffing.
+"""
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+
+from django.test import SimpleTestCase
+from pydicom.dataset import Dataset
+from pydicom.filewriter import dcmwrite
+
+from viewer.dicom_sniff import PART10, RAW, classify, sniff
+from viewer.upload_handlers import read_header
+
+from test_upload_handlers import dicom_bytes
+
+
+def raw_bytes(implicit=True):
+    ds = Dataset()
+    ds.SOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    ds.SOPInstanceUID = '1.2.3.4'
+    ds.StudyInstanceUID = '1.2.3'
+    ds.Modality = 'CT'
+    ds.is_implicit_VR, ds.is_little_endian = implicit, True
+    buffer = io.BytesIO()
+    # No preamble and no file meta: the dataset's first element comes first
+    dcmwrite(buffer, ds, write_like_original=True)
+    return buffer.getvalue()
+
+
+class DicomSniffTestCase(SimpleTestCase):
+    """Files are classified from their first 132 bytes, before any parsing"""
+
+    def test_part10_and_raw_datasets_are_recognised(self):
+        self.assertEqual(classify(dicom_bytes(4, 4)[0][:132]), PART10)
+        self.assertEqual(classify(raw_bytes()), RAW)
+        self.assertEqual(classify(raw_bytes(implicit=False)), RAW)
+        self.assertEqual(read_header(io.BytesIO(raw_bytes()))['SOPInstanceUID'].value, '1.2.3.4')
+
+    def test_other_content_is_rejected(self):
+        rejected = [
+            b'',
+            b'DICM',
+            b'%PDF-1.7\n' + b'x' * 600,
+            b'\x89PNG\r\n\x1a\n' + b'\0' * 600,
+            b'PK\x03\x04' + b'\0' * 600,
+            # Group 0008 with an odd implicit VR length, and an implausibly long first value
+            struct.pack('<HHI', 0x0008, 0x0016, 27) + b'x' * 600,
+            struct.pack('<HHI', 0x0008, 0x0016, 64 * 1024 * 1024) + b'x' * 600,
+            # Group 0002 is only ever written with explicit VR
+            struct.pack('<HHI', 0x0002, 0x0010, 20) + b'x' * 600,
+        ]
+        for prefix in rejected:
+            with self.subTest(prefix=prefix[:12]):
+                self.assertIsNone(classify(prefix))
+        self.assertIsNone(read_header(io.BytesIO(b'text ' * 200)))
+
+    def test_sniff_reads_paths_and_restores_file_position(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'IM0001')
+        with open(path, 'wb') as f:
+            f.write(raw_bytes())
+        self.assertEqual(sniff(path), RAW)
+        self.assertIsNone(sniff(os.path.join(directory, 'missing')))
+
+        upload = io.BytesIO(dicom_bytes(4, 4)[0])
+        upload.seek(10)
+        self.assertEqual(sniff(upload), PART10)
+        self.assertEqual(upload.tell(), 10)
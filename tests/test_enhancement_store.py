@@ -0,0 +1,50 @@
+"""
+Tests for the on-disk enhancement result store.
+"""
+
+import os
+import tempfile
+import shutil
+
+from django.test import SimpleTestCase
+
+from viewer.enhancement_store import EnhancementStore
+
+
+class EnhancementStoreTestCase(SimpleTestCase):
+    """Keyed lookups, replacement of outdated results and the LRU size bound"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = EnhancementStore(root=self.root, max_bytes=350)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_round_trip_and_key_parts(self):
+        self.store.put(3, 'enhance_xray', 'comprehensive', 'v1', 'sig', b'png-bytes')
+        self.assertEqual(self.store.get(3, 'enhance_xray', 'comprehensive', 'v1', 'sig'), b'png-bytes')
+        self.assertIsNone(self.store.get(3, 'enhance_xray', 'bone_enhancement', 'v1', 'sig'))
+        self.assertIsNone(self.store.get(3, 'enhance_mri', 'comprehensive', 'v1', 'sig'))
+        self.assertIsNone(self.store.get(4, 'enhance_xray', 'comprehensive', 'v1', 'sig'))
+
+    def test_new_version_or_source_replaces_old_result(self):
+        self.store.put(3, 'enhance_xray', 'comprehensive', 'v1', 'sig', b'old')
+        self.store.put(3, 'enhance_xray', 'edge_enhancement', 'v1', 'sig', b'other')
+        self.store.put(3, 'enhance_xray', 'comprehensive', 'v2', 'sig2', b'new')
+        self.assertIsNone(self.store.get(3, 'enhance_xray', 'comprehensive', 'v1', 'sig'))
+        self.assertEqual(self.store.get(3, 'enhance_xray', 'comprehensive', 'v2', 'sig2'), b'new')
+        self.assertEqual(self.store.get(3, 'enhance_xray', 'edge_enhancement', 'v1', 'sig'), b'other')
+        self.assertEqual(len(self.store.entries()), 2)
+
+    def test_least_recently_used_results_are_evicted(self):
+        for image_id in range(3):
+            path = self.store.put(image_id, 'enhance_mri', 'comprehensive', 'v1', 'sig', b'x' * 100)
+            os.utime(path, (1000 + image_id, 1000 + image_id))
+        # Reading image 0 makes image 1 the oldest
+        self.store.get(0, 'enhance_mri', 'comprehensive', 'v1', 'sig')
+        self.store.put(3, 'enhance_mri', 'comprehensive', 'v1', 'sig', b'x' * 100)
+
+        remaining = {image_id for image_id in range(4)
+                     if self.store.get(image_id, 'enhance_mri', 'comprehensive', 'v1', 'sig') is not None}
+        self.assertEqual(remaining, {0, 2, 3})
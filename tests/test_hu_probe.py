@@ -0,0 +1,95 @@
+"""
+Tests for the summed-area table HU probe.
+"""
+
+import io
+import shutil
+import tempfile
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from pydicom.uid import generate_uid
+
+from viewer.hu_probe import SummedAreaTable
+from viewer.ingest import IngestWriter
+from viewer.models import Facility
+
+from test_ingest import dataset
+
+
+class SummedAreaTableTestCase(SimpleTestCase):
+    """Point and rectangle queries against brute-force statistics"""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.integer_hu = rng.integers(-1024, 3000, (48, 64)).astype(np.float32)
+        self.float_hu = (rng.normal(2000, 5, (48, 64))).astype(np.float32)
+
+    def test_rectangles_match_brute_force(self):
+        for hu in (self.integer_hu, self.float_hu):
+            table = SummedAreaTable(hu)
+            boxes = np.array([[0, 0, 63, 47], [5, 7, 5, 7], [10, 20, 3, 2], [30, 10, 40, 30]])
+            count, mean, std = table.rectangles(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+            for i, (x0, y0, x1, y1) in enumerate(boxes):
+                region = hu[min(y0, y1):max(y0, y1) + 1, min(x0, x1):max(x0, x1) + 1].astype(np.float64)
+                self.assertEqual(count[i], region.size)
+                self.assertAlmostEqual(mean[i], region.mean(), places=3)
+                self.assertAlmostEqual(std[i], region.std(), places=3)
+
+    def test_integer_images_are_exact(self):
+        table = SummedAreaTable(self.integer_hu)
+        self.assertEqual(table.sum.dtype, np.int64)
+        _, _, std = table.rectangles(np.array([5]), np.array([5]), np.array([5]), np.array([5]))
+        self.assertEqual(std[0], 0.0)
+
+    def test_points_and_clipping(self):
+        table = SummedAreaTable(self.integer_hu)
+        values = table.points([0, 63, 64, -1], [0, 47, 0, 0])
+        self.assertEqual(values[0], self.integer_hu[0, 0])
+        self.assertEqual(values[1], self.integer_hu[47, 63])
+        self.assertTrue(np.isnan(values[2]) and np.isnan(values[3]))
+
+        count, mean, _ = table.rectangles(np.array([-5, 100]), np.array([-5, 100]), np.array([1, 120]), np.array([1, 120]))
+        self.assertEqual(count[0], 4)
+        self.assertAlmostEqual(mean[0], self.integer_hu[:2, :2].mean(), places=4)
+        self.assertEqual(count[1], 0)
+        self.assertTrue(np.isnan(mean[1]))
+
+
+class ProbeHUViewTestCase(TestCase):
+    """Only users who can access the image's study may probe it"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.facility_user = User.objects.create_user('facility', password='pw')
+        facility = Facility.objects.create(name='North', address='-', phone='-', email='north@example.com',
+                                           user=self.facility_user)
+        ds = dataset(generate_uid()[:40].rstrip('.'), generate_uid()[:40].rstrip('.'), 0)
+        buffer = io.BytesIO()
+        ds.save_as(buffer, write_like_original=False)
+        writer = IngestWriter(facility=facility)
+        pending = writer.add(ds, default_storage.save('dicom_files/0.dcm', ContentFile(buffer.getvalue())))
+        writer.flush()
+        self.image_id = pending.image_id
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def probe(self):
+        return self.client.get(f'/viewer/api/images/{self.image_id}/hu-probe/', {'x': 2, 'y': 3})
+
+    def test_access_is_checked(self):
+        self.assertEqual(self.probe().status_code, 401)
+        self.client.force_login(User.objects.create_user('outsider', password='pw'))
+        self.assertEqual(self.probe().status_code, 403)
+
+        self.client.force_login(self.facility_user)
+        response = self.probe()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['image_id'], self.image_id)
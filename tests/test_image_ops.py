@@ -0,0 +1,64 @@
+"""
+Tests that the OpenCV image-ops backend matches the reference backend.
+"""
+
+import numpy as np
+from django.test import SimpleTestCase
+from PIL import Image, ImageEnhance
+from skimage import exposure
+
+from viewer.image_ops import get_backend
+
+
+class ImageOpsEquivalenceTestCase(SimpleTestCase):
+    """Each cv2 kernel against its skimage / scipy / PIL counterpart"""
+
+    def setUp(self):
+        self.reference = get_backend('reference')
+        self.opencv = get_backend('opencv')
+        rng = np.random.default_rng(0)
+        y, x = np.mgrid[:256, :240]
+        self.image = np.clip(0.5 + 0.3 * np.sin(x / 9.0) * np.cos(y / 13.0) + 0.05 * rng.normal(size=(256, 240)),
+                             0, 1).astype(np.float32)
+        self.uint8 = (self.image * 255).astype(np.uint8)
+
+    def assertClose(self, a, b, mean_tolerance, max_tolerance):
+        difference = np.abs(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64))
+        self.assertEqual(np.shape(a), np.shape(b))
+        self.assertLess(difference.mean(), mean_tolerance)
+        self.assertLessEqual(difference.max(), max_tolerance)
+
+    def test_reference_backend_wraps_existing_calls(self):
+        np.testing.assert_array_equal(self.reference.clahe(self.image, clip_limit=0.02),
+                                      exposure.equalize_adapthist(self.image, clip_limit=0.02))
+        expected = np.asarray(ImageEnhance.Sharpness(Image.fromarray(self.uint8, mode='L')).enhance(1.2))
+        np.testing.assert_array_equal(self.reference.sharpness(self.uint8, 1.2), expected)
+
+    def test_clahe(self):
+        for image in (self.image, self.uint8, self.image * 0.5 + 0.2):
+            for clip_limit in (0.01, 0.03):
+                self.assertClose(self.opencv.clahe(image, clip_limit=clip_limit),
+                                 self.reference.clahe(image, clip_limit=clip_limit), 0.015, 0.1)
+        # Sizes that do not split into 8 tiles are padded, which shifts the tile grid slightly
+        self.assertClose(self.opencv.clahe(self.image[:, :237]), self.reference.clahe(self.image[:, :237]), 0.03, 0.25)
+
+    def test_resize(self):
+        self.assertClose(self.opencv.resize(self.uint8, (480, 512)), self.reference.resize(self.uint8, (480, 512)), 1.5, 12)
+        self.assertClose(self.opencv.resize(self.image, (480, 512)), self.reference.resize(self.image, (480, 512)), 0.005, 0.05)
+        self.assertClose(self.opencv.resize(self.uint8, (120, 128)), self.reference.resize(self.uint8, (120, 128)), 3.0, 20)
+
+    def test_gaussian_and_unsharp(self):
+        for sigma in (0.5, 1.0, 3.0):
+            self.assertClose(self.opencv.gaussian(self.image, sigma), self.reference.gaussian(self.image, sigma), 1e-5, 1e-4)
+        self.assertClose(self.opencv.unsharp(self.image, 2.0, 0.5), self.reference.unsharp(self.image, 2.0, 0.5), 1e-5, 1e-4)
+
+    def test_bilateral(self):
+        self.assertClose(self.opencv.bilateral(self.image, 0.05, 3), self.reference.bilateral(self.image, 0.05, 3), 0.02, 0.15)
+
+    def test_sharpness(self):
+        for factor in (1.1, 2.0):
+            self.assertClose(self.opencv.sharpness(self.uint8, factor), self.reference.sharpness(self.uint8, factor), 0.6, 1)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_backend('cuda')
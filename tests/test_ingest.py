@@ -0,0 +1,198 @@
+"""
+Tests for the batched DICOM ingest writer.
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from viewer.ingest import IngestWriter, describe, parse_headers
+from viewer.intensity_stats import intensity_index
+from viewer.models import DicomImage, DicomSeries, DicomStudy, ImageIntensityStats
+from viewer.views import EnhancedBulkUploadManager
+
+
+def dataset(study_uid, series_uid, index, pixels=True):
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.StudyInstanceUID, ds.SeriesInstanceUID = study_uid, series_uid
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID = f'{series_uid}.{index + 1}'
+    ds.PatientName, ds.PatientID = 'Test^Patient', 'P1'
+    ds.StudyDate, ds.StudyTime = '20240102', '101500.25'
+    ds.Modality, ds.SeriesNumber, ds.InstanceNumber = 'CT', 3, index + 1
+    ds.Rows, ds.Columns = 8, 8
+    ds.SamplesPerPixel, ds.PhotometricInterpretation = 1, 'MONOCHROME2'
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation = 16, 16, 15, 0
+    ds.PixelSpacing = [0.5, 0.75]
+    ds.WindowCenter, ds.WindowWidth = ['50', '60'], '350'
+    ds.RescaleSlope, ds.RescaleIntercept = 1, -1024
+    if pixels:
+        ds.PixelData = np.full((8, 8), 1000 + index, dtype=np.uint16).tobytes()
+    return ds
+
+
+class IngestWriterTestCase(TestCase):
+    """Studies, series and images are written per batch, skipping instances already stored"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.study_uid, self.series_uid = generate_uid()[:40].rstrip('.'), generate_uid()[:40].rstrip('.')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_batch_is_written_with_constant_queries(self):
+        writer = IngestWriter(batch_size=100)
+        items = [writer.add(dataset(self.study_uid, self.series_uid, i), f'dicom_files/{i}.dcm') for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            writer.flush()
+        self.assertLess(len(queries), 15)
+
+        study = DicomStudy.objects.get(study_instance_uid=self.study_uid)
+        self.assertEqual((study.patient_name, str(study.study_date), str(study.study_time)),
+                         ('Test^Patient', '2024-01-02', '10:15:00'))
+        series = DicomSeries.objects.get(study=study)
+        self.assertEqual(series.series_number, 3)
+        images = DicomImage.objects.filter(series=series).order_by('instance_number')
+        self.assertEqual(images.count(), 20)
+        first = images[0]
+        self.assertEqual((first.image_number, first.window_center, first.window_width), (1, 50.0, 350.0))
+        self.assertEqual((first.pixel_spacing_x, first.pixel_spacing_y), (0.5, 0.75))
+        self.assertTrue(all(item.created and item.image_id for item in items))
+        self.assertEqual(ImageIntensityStats.objects.filter(image__series=series).count(), 20)
+        self.assertEqual(ImageIntensityStats.objects.get(image=first).min_value, 1000 - 1024)
+        self.assertEqual((writer.created_study_ids, writer.created_series_ids), ([study.id], [series.id]))
+
+    def test_duplicates_are_reported_not_rewritten(self):
+        first_writer = IngestWriter()
+        first_writer.add(dataset(self.study_uid, self.series_uid, 0), 'dicom_files/a.dcm')
+        first_writer.flush()
+
+        writer = IngestWriter()
+        repeated = writer.add(dataset(self.study_uid, self.series_uid, 0), 'dicom_files/b.dcm')
+        twice = writer.add(dataset(self.study_uid, self.series_uid, 1), 'dicom_files/c.dcm')
+        again = writer.add(dataset(self.study_uid, self.series_uid, 1), 'dicom_files/d.dcm')
+        writer.flush()
+
+        self.assertFalse(repeated.created)
+        self.assertTrue(twice.created)
+        self.assertFalse(again.created)
+        self.assertEqual(again.image_id, twice.image_id)
+        self.assertEqual(str(DicomImage.objects.get(id=repeated.image_id).file_path), 'dicom_files/a.dcm')
+        self.assertEqual((writer.images_created, writer.duplicates, writer.created_study_ids), (1, 2, []))
+        self.assertEqual(DicomImage.objects.count(), 2)
+
+    def test_header_only_datasets_read_pixels_from_storage(self):
+        full = dataset(self.study_uid, self.series_uid, 4)
+        name = default_storage.save('dicom_files/full.dcm', ContentFile(b''))
+        full.save_as(default_storage.path(name), write_like_original=False)
+
+        writer = IngestWriter()
+        item = writer.add(dataset(self.study_uid, self.series_uid, 4, pixels=False), name)
+        writer.flush()
+        self.assertEqual(ImageIntensityStats.objects.get(image_id=item.image_id).max_value, 1004 - 1024)
+
+    def test_queued_items_hold_descriptors_not_pixels(self):
+        writer = IngestWriter()
+        item = writer.add(dataset(self.study_uid, self.series_uid, 2), 'dicom_files/missing.dcm')
+        self.assertIsInstance(item.header, dict)
+        self.assertNotIn('PixelData', item.header)
+        self.assertEqual(item.statistics['min_value'], 1002 - 1024)
+        self.assertFalse(item.needs_statistics)
+
+        header = describe(dataset(self.study_uid, self.series_uid, 3, pixels=False))
+        self.assertEqual(describe(header), header)
+        deferred = writer.add(header, 'dicom_files/also-missing.dcm')
+        self.assertTrue(deferred.needs_statistics)
+        writer.flush()
+        self.assertTrue(item.created and deferred.created)
+        self.assertEqual(ImageIntensityStats.objects.filter(image_id__in=[item.image_id, deferred.image_id]).count(), 1)
+
+    def test_failed_batch_rolls_back(self):
+        writer = IngestWriter()
+        item = writer.add(dataset(self.study_uid, self.series_uid, 0), 'dicom_files/a.dcm')
+        with mock.patch.object(intensity_index, 'record_images', side_effect=RuntimeError('disk full')):
+            writer.flush()
+        self.assertEqual((item.error, item.image_id, item.created), ('disk full', None, False))
+        self.assertFalse(DicomStudy.objects.filter(study_instance_uid=self.study_uid).exists())
+        self.assertEqual((writer.study_pks, writer.images_created), ({}, 0))
+
+        retry = writer.add(dataset(self.study_uid, self.series_uid, 0), 'dicom_files/a.dcm')
+        writer.flush()
+        self.assertTrue(retry.created)
+        self.assertEqual(DicomImage.objects.get(id=retry.image_id).series.study.study_instance_uid, self.study_uid)
+
+    def test_headers_parse_in_worker_processes(self):
+        paths = []
+        for i in range(3):
+            paths.append(os.path.join(self.media_root, f'{i}.dcm'))
+            dataset(self.study_uid, self.series_uid, i).save_as(paths[-1], write_like_original=False)
+        paths.append(os.path.join(self.media_root, 'notes.txt'))
+        with open(paths[-1], 'w') as f:
+            f.write('not dicom ' * 100)
+
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            descriptors, seconds = pool.submit(parse_headers, paths).result()
+        self.assertIsNone(descriptors[3])
+        self.assertGreater(seconds, 0)
+        self.assertEqual([d['InstanceNumber'] for d in descriptors[:3]], [1, 2, 3])
+        self.assertEqual(descriptors[0]['PixelSpacing'], [0.5, 0.75])
+        self.assertNotIn('PixelData', descriptors[0])
+        self.assertEqual(descriptors[0], describe(dataset(self.study_uid, self.series_uid, 0, pixels=False)))
+
+    def test_parse_pool_is_capped_by_the_number_of_chunks(self):
+        files = []
+        for i in range(3):
+            path = os.path.join(self.media_root, f'{i}.dcm')
+            dataset(self.study_uid, self.series_uid, i).save_as(path, write_like_original=False)
+            files.append({'path': path, 'name': f'{i}.dcm', 'size': os.path.getsize(path)})
+        manager = EnhancedBulkUploadManager(None)
+        with mock.patch.object(manager, 'available_workers', return_value=8):
+            self.assertEqual(manager.ingest_files(files), 3)
+        # Three files are one chunk, so no process pool is started for them
+        self.assertEqual(manager.parse_workers, 1)
+        manager.writer.flush()
+        self.assertEqual(DicomImage.objects.filter(series__series_instance_uid=self.series_uid).count(), 3)
+
+
+class IngestWriterCachedKeysTestCase(TransactionTestCase):
+    """A long-lived writer recovers when a study it has cached is deleted"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_deleted_study_is_created_again(self):
+        study_uid, series_uid = generate_uid()[:40].rstrip('.'), generate_uid()[:40].rstrip('.')
+        writer = IngestWriter(record_statistics=False)
+        writer.add(dataset(study_uid, series_uid, 0), 'dicom_files/a.dcm')
+        writer.flush()
+        DicomStudy.objects.all().delete()
+
+        # Committed outside a surrounding transaction, so the stale foreign key fails the first attempt
+        item = writer.add(dataset(study_uid, series_uid, 1), 'dicom_files/b.dcm')
+        writer.flush()
+        self.assertIsNone(item.error)
+        self.assertTrue(item.created)
+        self.assertEqual(DicomImage.objects.get(id=item.image_id).series.study.study_instance_uid, study_uid)
@@ -0,0 +1,109 @@
+"""
+Tests for the ingest-time intensity statistics and histogram index.
+"""
+
+import io
+import shutil
+import tempfile
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from pydicom.uid import generate_uid
+
+from viewer.ingest import IngestWriter
+from viewer.intensity_stats import (
+    PERCENTILES, compute_statistics, histogram_percentiles, merge_statistics, modality_values, suggest_windows,
+)
+from viewer.models import Facility
+
+from test_ingest import dataset
+
+
+class IntensityStatisticsTestCase(SimpleTestCase):
+    """Histogram statistics, series merging and window suggestions"""
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.slices = [rng.integers(-1024, 1500, (32, 32)), rng.integers(-200, 3000, (32, 32)), rng.integers(0, 40, (32, 32))]
+
+    def test_exact_statistics_from_bincount(self):
+        values = self.slices[0].ravel()
+        statistics = compute_statistics(values)
+        np.testing.assert_allclose([statistics.percentiles[f'p{p:g}'] for p in PERCENTILES],
+                                   np.percentile(values, PERCENTILES))
+        self.assertEqual((statistics.min_value, statistics.max_value), (values.min(), values.max()))
+        self.assertAlmostEqual(statistics.mean, values.mean(), places=6)
+        self.assertAlmostEqual(statistics.std, values.std(), places=6)
+
+        histogram = statistics.histogram
+        self.assertLessEqual(len(histogram['counts']), 512)
+        self.assertEqual(histogram['start'] % histogram['bin_width'], 0)
+        self.assertEqual(sum(histogram['counts']), values.size)
+
+    def test_series_merge_matches_concatenated_values(self):
+        merged = merge_statistics([compute_statistics(s.ravel()) for s in self.slices])
+        values = np.concatenate([s.ravel() for s in self.slices])
+        direct = compute_statistics(values)
+        self.assertEqual(merged.histogram, direct.histogram)
+        self.assertEqual(merged.pixel_count, values.size)
+        self.assertAlmostEqual(merged.mean, values.mean(), places=6)
+        self.assertAlmostEqual(merged.std, values.std(), places=6)
+        width = merged.histogram['bin_width']
+        self.assertLessEqual(abs(merged.percentiles['p50'] - np.median(values)), width)
+
+    def test_unit_width_histogram_percentiles_are_exact(self):
+        values = self.slices[2].ravel()
+        histogram = {'start': 0, 'bin_width': 1, 'counts': np.bincount(values)}
+        np.testing.assert_allclose(histogram_percentiles(histogram, [10, 50, 90]), np.percentile(values, [10, 50, 90]))
+
+    def test_modality_values(self):
+        stored = np.array([[0, 1000], [2000, 4095]], dtype=np.uint16)
+        np.testing.assert_array_equal(modality_values(stored, 1, -1024), [-1024, -24, 976, 3071])
+        np.testing.assert_array_equal(modality_values(stored, 0.5, 0.25), [0, 500, 1000, 2048])
+
+    def test_window_suggestions(self):
+        chest = np.concatenate([np.full(4000, -1000), np.full(3000, -800), np.full(5000, 40), np.full(500, 700)])
+        presets = suggest_windows(compute_statistics(chest), 'CT')
+        self.assertEqual([p['name'] for p in presets], ['soft_tissue', 'lung', 'bone'])
+
+        head = np.concatenate([np.full(6000, 30), np.full(1000, 1000)])
+        self.assertEqual(suggest_windows(compute_statistics(head), 'CT', 'HEAD')[0]['name'], 'brain')
+
+        mr = suggest_windows(compute_statistics(np.arange(1000)), 'MR')
+        self.assertEqual(mr[0]['name'], 'auto')
+        self.assertAlmostEqual(mr[0]['window_center'], 499.5, places=6)
+        self.assertAlmostEqual(mr[0]['window_width'], np.percentile(np.arange(1000), 99) - np.percentile(np.arange(1000), 1))
+
+
+class SeriesIntensityStatisticsViewTestCase(TestCase):
+    """Series statistics are only served to users who can view the series"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.facility_user = User.objects.create_user('facility', password='pw')
+        facility = Facility.objects.create(name='North', address='-', phone='-', email='north@example.com',
+                                           user=self.facility_user)
+        ds = dataset(generate_uid()[:40].rstrip('.'), generate_uid()[:40].rstrip('.'), 0)
+        buffer = io.BytesIO()
+        ds.save_as(buffer, write_like_original=False)
+        writer = IngestWriter(facility=facility)
+        pending = writer.add(ds, default_storage.save('dicom_files/0.dcm', ContentFile(buffer.getvalue())))
+        writer.flush()
+        self.url = f'/viewer/api/series/{pending.series_id}/intensity-statistics/'
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_access_is_checked(self):
+        self.client.force_login(User.objects.create_user('outsider', password='pw'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(self.facility_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['image_count'], 1)
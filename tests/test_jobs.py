@@ -0,0 +1,148 @@
+"""
+Tests for the database-backed job queue.
+"""
+
+import io
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from viewer.jobs import JobWorker, job_queue
+from viewer.models import DicomImage, Job
+
+from test_upload_handlers import dicom_bytes
+
+FAILED_JOBS = []
+
+
+def add(job, a, b):
+    return {'sum': a + b}
+
+
+def explode(job):
+    raise RuntimeError('boom')
+
+
+explode.on_failure = FAILED_JOBS.append
+
+
+@override_settings(JOB_QUEUE_CONCURRENCY={'default': 1, 'uploads': 1}, JOB_RETRY_DELAY_SECONDS=30)
+class JobQueueTestCase(TestCase):
+    """Jobs are leased, retried with backoff, capped per queue and recovered from dead workers"""
+
+    def setUp(self):
+        FAILED_JOBS.clear()
+
+    def test_job_runs_and_stores_its_result(self):
+        job = job_queue.enqueue(add, {'a': 2, 'b': 3}, reference='sum')
+        self.assertEqual(job.task, f'{__name__}.add')
+        claimed = job_queue.claim(['default'], 'w1')
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts, claimed.worker), (job.pk, 'running', 1, 'w1'))
+        self.assertEqual(job_queue.run(claimed), 'succeeded')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('succeeded', {'sum': 5}))
+        self.assertEqual(job_queue.latest('sum'), job)
+        with self.assertRaises(ImportError):
+            job_queue.enqueue(f'{__name__}.missing')
+
+    def test_failures_back_off_then_fail_with_hook(self):
+        job = job_queue.enqueue(explode, max_attempts=2)
+        self.assertEqual(job_queue.run(job_queue.claim(['default'], 'w1')), 'queued')
+        job.refresh_from_db()
+        self.assertIn('boom', job.error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=25))
+        # Not due before the backoff has passed
+        self.assertIsNone(job_queue.claim(['default'], 'w1'))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(job_queue.run(job_queue.claim(['default'], 'w1')), 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual([failed.pk for failed in FAILED_JOBS], [job.pk])
+        self.assertEqual(job_queue.retry_delay(3), 120)
+
+    def test_concurrency_is_capped_per_queue(self):
+        first = job_queue.enqueue(add, {'a': 1, 'b': 1})
+        job_queue.enqueue(add, {'a': 1, 'b': 2})
+        other = job_queue.enqueue(add, {'a': 1, 'b': 3}, queue='uploads')
+        self.assertEqual(job_queue.claim(['default'], 'w1').pk, first.pk)
+        self.assertIsNone(job_queue.claim(['default'], 'w2'))
+        self.assertEqual(job_queue.claim(['default', 'uploads'], 'w2').pk, other.pk)
+
+    def test_expired_lease_is_claimed_again(self):
+        job = job_queue.enqueue(add, {'a': 1, 'b': 1}, max_attempts=2)
+        lost = job_queue.claim(['default'], 'dead-worker')
+        self.assertTrue(job_queue.heartbeat(lost, {'status': 'processing'}))
+        Job.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1),
+                                             run_after=timezone.now())
+        job_queue.expire_leases()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.progress), ('queued', '', {'status': 'processing'}))
+        # The dead worker's late heartbeat no longer counts
+        self.assertFalse(job_queue.heartbeat(lost))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        second = job_queue.claim(['default'], 'w2')
+        self.assertEqual(second.attempts, 2)
+        Job.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(job_queue.claim(['default'], 'w3'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_worker_fails_jobs_whose_process_died(self):
+        job = job_queue.enqueue(add, {'a': 1, 'b': 1})
+        worker = JobWorker(['default'], name='w1')
+        claimed = job_queue.claim(['default'], worker.name)
+        worker.children[job.pk] = (SimpleNamespace(is_alive=lambda: False, join=lambda: None, exitcode=-9), claimed)
+        worker.reap()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('-9', job.error)
+        self.assertEqual(worker.children, {})
+
+
+@override_settings(BULK_UPLOAD_PARSE_WORKERS=1)
+class BulkUploadJobTestCase(TestCase):
+    """The bulk upload endpoint spools the upload and a job ingests it"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.client.force_login(User.objects.create_user('uploader', password='pw'))
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_upload_is_queued_and_ingested(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for i in range(3):
+                archive.writestr(f'IM{i:04d}', dicom_bytes(8, 8)[0])
+        buffer.name = 'study.zip'
+        buffer.seek(0)
+        response = self.client.post('/viewer/api/enhanced-bulk-upload/', {'file': buffer})
+        self.assertEqual(response.status_code, 200)
+        upload_id = response.json()['upload_id']
+        self.assertEqual(response.json()['status'], 'queued')
+        self.assertEqual(self.client.get(f'/viewer/api/enhanced-upload-progress/{upload_id}/').json()['status'],
+                         'queued')
+
+        self.assertEqual(job_queue.run_pending(['uploads']), 1)
+        self.assertEqual(DicomImage.objects.count(), 3)
+        job = Job.objects.get(reference=upload_id)
+        self.assertEqual((job.status, job.result['images_processed']), ('succeeded', 3))
+        self.assertEqual(job.progress['status'], 'completed')
+
+        # Served from the job row when the cache (e.g. another process's) does not have it
+        cache.delete(f'upload_result_{upload_id}')
+        result = self.client.get(f'/viewer/api/enhanced-upload-result/{upload_id}/').json()
+        self.assertEqual((result['status'], result['images_processed']), ('completed', 3))
@@ -0,0 +1,123 @@
+"""
+Tests that the middleware stack never buffers request or response bodies.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from noctisview.middleware import CountingStream, RequestLoggingMiddleware
+
+UPLOAD_BYTES = 160 * 1024 * 1024
+RSS_GROWTH_LIMIT = 48 * 1024 * 1024
+
+
+def resident_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakSampler(threading.Thread):
+    """Polls the process RSS until stopped and keeps the maximum"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = resident_bytes()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.is_set():
+            self.peak = max(self.peak, resident_bytes())
+            time.sleep(0.002)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        return self.peak
+
+
+def write_multipart(path, boundary, field, file_name, size, chunk=1024 * 1024):
+    """Write a multipart/form-data body with one file of `size` zero bytes, chunk by chunk"""
+    with open(path, 'wb') as body:
+        body.write((f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{file_name}"\r\n'
+                    f'Content-Type: application/octet-stream\r\n\r\n').encode())
+        zeros = b'\0' * chunk
+        for _ in range(size // chunk):
+            body.write(zeros)
+        body.write(f'\r\n--{boundary}--\r\n'.encode())
+    return os.path.getsize(path)
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/statm'), 'needs /proc to sample resident memory')
+class LargeUploadMemoryTestCase(TestCase):
+    """A large multipart upload must not be held in memory by any middleware"""
+
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=os.path.join(self.scratch, 'media'))
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def test_peak_rss_stays_flat_during_large_upload(self):
+        boundary = 'rssregressionboundary'
+        body_path = os.path.join(self.scratch, 'body.bin')
+        length = write_multipart(body_path, boundary, 'files', 'large.dcm', UPLOAD_BYTES)
+        statuses = []
+
+        with open(body_path, 'rb') as body:
+            environ = RequestFactory()._base_environ(
+                PATH_INFO='/viewer/api/upload-dicom-files/',
+                REQUEST_METHOD='POST',
+                CONTENT_TYPE=f'multipart/form-data; boundary={boundary}',
+                CONTENT_LENGTH=str(length),
+            )
+            environ['wsgi.input'] = body
+            before = resident_bytes()
+            sampler = PeakSampler()
+            sampler.start()
+            response = WSGIHandler()(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            peak = sampler.stop()
+
+        self.assertTrue(statuses)
+        self.assertLess(peak - before, RSS_GROWTH_LIMIT,
+                        f'RSS grew by {(peak - before) / 2 ** 20:.0f} MiB for a {UPLOAD_BYTES / 2 ** 20:.0f} MiB upload')
+
+
+class RequestLoggingMiddlewareTestCase(TestCase):
+    """Sizes come from headers and stream counters, not from the bodies"""
+
+    def test_request_stream_is_counted_not_read(self):
+        request = RequestFactory().post('/viewer/api/upload/', data=b'x' * 1000, content_type='application/octet-stream')
+        middleware = RequestLoggingMiddleware(lambda r: None)
+        middleware.process_request(request)
+        self.assertIsInstance(request._stream, CountingStream)
+        self.assertEqual(request._stream.bytes_read, 0)
+        self.assertEqual(len(request.read()), 1000)
+        self.assertEqual(request._stream.bytes_read, 1000)
+
+    def test_streaming_response_is_counted_as_sent(self):
+        request = RequestFactory().get('/viewer/api/stream/')
+        consumed = []
+
+        def chunks():
+            for _ in range(3):
+                consumed.append(1)
+                yield b'a' * 10
+
+        response = StreamingHttpResponse(chunks())
+        RequestLoggingMiddleware(lambda r: response).process_response(request, response)
+        self.assertEqual(consumed, [])
+        with self.assertLogs('noctisview.middleware', level='DEBUG') as logs:
+            self.assertEqual(b''.join(response.streaming_content), b'a' * 30)
+        self.assertIn('Response size: 30 bytes streamed', logs.output[-1])
@@ -0,0 +1,75 @@
+"""
+Tests for the staged enhanced render pipeline.
+"""
+
+import numpy as np
+from django.test import SimpleTestCase
+from PIL import Image, ImageEnhance
+from skimage import exposure
+
+from viewer.image_ops import get_backend
+from viewer.render_pipeline import RenderPipeline, StageCache
+
+
+class FakeDataset:
+    RescaleSlope = 1
+    RescaleIntercept = -1024
+    WindowCenter = [40, 400]
+    WindowWidth = [400, 1800]
+
+
+def reference_render(pixel_array, window_width, window_level, inverted, contrast_boost):
+    """The single-pass pipeline the stages replace"""
+    pixels = pixel_array.astype(np.float32) * 1.0 - 1024.0
+    low, high = window_level - window_width / 2, window_level + window_width / 2
+    pixels = (np.clip(pixels, low, high) - low) / (high - low) * 255
+    pixels = exposure.equalize_adapthist(pixels / 255.0, clip_limit=0.01) * 255
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+    if inverted:
+        pixels = 255 - pixels
+    image = Image.fromarray(pixels, mode='L')
+    if contrast_boost != 1.0:
+        image = ImageEnhance.Contrast(image).enhance(contrast_boost)
+    return np.asarray(image)
+
+
+class RenderPipelineTestCase(SimpleTestCase):
+    """Stage outputs, float32 intermediates and downstream-only recomputation"""
+
+    def setUp(self):
+        self.pixels = np.random.default_rng(2).integers(0, 2500, (64, 64)).astype(np.uint16)
+        self.loads = 0
+        self.pipeline = RenderPipeline(StageCache(), ops=get_backend('reference'))
+
+    def loader(self):
+        self.loads += 1
+        return self.pixels, FakeDataset()
+
+    def test_matches_single_pass_render(self):
+        for inverted, boost in [(False, 1.0), (True, 1.4)]:
+            result = self.pipeline.render_array('img', self.loader, inverted=inverted, contrast_boost=boost)
+            expected = reference_render(self.pixels, 400, 40, inverted, boost)
+            self.assertLessEqual(np.abs(result.astype(int) - expected.astype(int)).max(), 1)
+
+    def test_parameter_changes_recompute_only_downstream_stages(self):
+        cache = self.pipeline.cache
+        self.pipeline.render_array('img', self.loader)
+        self.pipeline.render_array('img', self.loader, inverted=True)
+        self.pipeline.render_array('img', self.loader, contrast_boost=1.5)
+        self.assertEqual((self.loads, cache.misses['equalized'], cache.misses['final']), (1, 1, 3))
+
+        self.pipeline.render_array('img', self.loader, window_width=1500, window_level=-600)
+        self.assertEqual((self.loads, cache.misses['windowed'], cache.misses['equalized']), (1, 2, 2))
+
+        self.pipeline.render_array('img', self.loader, inverted=True)
+        self.assertEqual(cache.hits['final'], 1)
+
+        self.pipeline.invalidate('img')
+        self.pipeline.render_array('img', self.loader)
+        self.assertEqual(self.loads, 2)
+
+    def test_intermediates_are_float32(self):
+        self.pipeline.render_array('img', self.loader)
+        for (stage, _), value in self.pipeline.cache._entries.items():
+            array = value.hu if stage == 'source' else value
+            self.assertEqual(array.dtype, np.uint8 if stage == 'final' else np.float32, stage)
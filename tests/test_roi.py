@@ -0,0 +1,172 @@
+"""
+Tests for polygon ROI rasterisation and multi-slice ROI measurements.
+"""
+
+import io
+import shutil
+import tempfile
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from pydicom.uid import generate_uid
+from scipy import stats
+
+from viewer.ingest import IngestWriter
+from viewer.models import Facility, Measurement
+from viewer.roi import (
+    ROIEngine, hu_statistics_batch, integrate_areas, polygon_area, rasterize_polygon, roi_values, shape_mask,
+)
+from viewer.volume_cache import SeriesVolume
+
+from test_ingest import dataset
+
+
+def brute_force_mask(points, shape):
+    """Reference even-odd point-in-polygon test, one pixel centre at a time"""
+    mask = np.zeros(shape, dtype=bool)
+    n = len(points)
+    for row in range(shape[0]):
+        for col in range(shape[1]):
+            inside = False
+            for i in range(n):
+                (x0, y0), (x1, y1) = points[i], points[(i + 1) % n]
+                if (y0 <= row) != (y1 <= row) and col > x0 + (row - y0) * (x1 - x0) / (y1 - y0):
+                    inside = not inside
+            mask[row, col] = inside
+    return mask
+
+
+class ROITestCase(SimpleTestCase):
+    """Rasterisation, areas, slice-position volumes and HU statistics"""
+
+    def test_polygon_area(self):
+        self.assertEqual(polygon_area([[0, 0], [10, 0], [10, 10], [0, 10]]), 100.0)
+        self.assertEqual(polygon_area([[0, 0], [10, 0]]), 0.0)
+
+    def test_rasterize_matches_point_in_polygon(self):
+        polygons = [
+            [[2.5, 2.5], [12.2, 3.1], [9.7, 14.8]],
+            [[1, 1], [15, 1], [15, 15], [8, 6], [1, 15]],  # concave
+            [[-3, 4], [20, 4.5], [5, 30]],                 # clipped by the image
+        ]
+        for points in polygons:
+            np.testing.assert_array_equal(rasterize_polygon(points, (16, 16)), brute_force_mask(points, (16, 16)))
+
+    def test_rasterized_area_approximates_polygon_area(self):
+        theta = np.linspace(0, 2 * np.pi, 200, endpoint=False)
+        circle = np.column_stack([50 + 30 * np.cos(theta), 50 + 30 * np.sin(theta)])
+        mask = rasterize_polygon(circle, (100, 100))
+        self.assertLess(abs(mask.sum() / polygon_area(circle) - 1.0), 0.01)
+
+    def test_integrate_uses_true_positions(self):
+        self.assertEqual(integrate_areas([100.0, 100.0, 100.0], [0.0, 5.0, 7.0], 5.0), 700.0)
+        self.assertEqual(integrate_areas([100.0], [3.0], 2.5), 250.0)
+
+    def test_measure_multi_slice_statistics(self):
+        data = np.zeros((4, 20, 20), dtype=np.float32)
+        data[:, :, :10] = 100.0
+        data[:, :, 10:] = 300.0
+        volume = SeriesVolume(1, 'sig', data, (2.0, 0.5, 0.5), [11, 12, 13, 14], [0.0, 2.0, 4.0, 6.0])
+        square = [[4.5, 4.5], [14.5, 4.5], [14.5, 14.5], [4.5, 14.5]]  # 10x10 pixels, half in each band
+
+        result = ROIEngine().measure(volume, [
+            {'slice_index': 0, 'points': square},
+            {'image_id': 13, 'points': square},
+            {'slice_index': 1, 'points': [[0, 0], [1, 0]]},  # degenerate, ignored
+        ])
+        self.assertEqual([s['slice_index'] for s in result['slices']], [0, 2])
+        self.assertEqual(result['slices'][0]['area_mm2'], 25.0)
+        self.assertEqual(result['slices'][1]['image_id'], 13)
+        self.assertEqual(result['volume_mm3'], 25.0 * 4.0)
+        self.assertEqual(result['statistics']['pixel_count'], 200)
+        self.assertEqual(result['statistics']['mean'], 200.0)
+        self.assertEqual(result['statistics']['std'], 100.0)
+        self.assertEqual(result['statistics']['percentiles']['p50'], 200.0)
+
+        with self.assertRaises(ValueError):
+            ROIEngine().measure(volume, [{'image_id': 99, 'points': square}])
+
+
+class BoundingBoxROITestCase(SimpleTestCase):
+    """Bounding-box ROI masks and batched HU statistics"""
+
+    def setUp(self):
+        self.image = np.random.default_rng(1).normal(40, 20, (64, 80)).astype(np.float32)
+
+    def test_ellipse_matches_full_image_mask(self):
+        for x0, y0, x1, y1 in [(10, 12, 30, 20), (70, 50, 90, 70), (-5, -5, 6, 9)]:
+            y, x = np.ogrid[:64, :80]
+            a, b = abs(x1 - x0) / 2, abs(y1 - y0) / 2
+            full = ((x - (x0 + x1) / 2) / a) ** 2 + ((y - (y0 + y1) / 2) / b) ** 2 <= 1
+            roi = {'type': 'ellipse', 'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1}
+            np.testing.assert_array_equal(roi_values(self.image, roi), self.image[full])
+
+    def test_rectangle_and_polygon(self):
+        rectangle = roi_values(self.image, {'type': 'rectangle', 'x0': 12, 'y0': 8, 'x1': 3, 'y1': 2})
+        np.testing.assert_array_equal(rectangle, self.image[2:9, 3:13].ravel())
+
+        points = [[10.5, 10.5], [40.2, 12.0], [25.0, 50.7]]
+        rows, cols, mask = shape_mask({'type': 'polygon', 'points': points}, self.image.shape)
+        self.assertEqual(mask.shape, (rows.stop - rows.start, cols.stop - cols.start))
+        np.testing.assert_array_equal(roi_values(self.image, {'type': 'polygon', 'points': points}),
+                                      self.image[rasterize_polygon(points, self.image.shape)])
+
+        outside = roi_values(self.image, {'type': 'rectangle', 'x0': 100, 'y0': 100, 'x1': 120, 'y1': 120})
+        self.assertEqual(outside.size, 0)
+        with self.assertRaises(ValueError):
+            shape_mask({'type': 'star', 'x0': 0, 'y0': 0, 'x1': 1, 'y1': 1}, self.image.shape)
+
+    def test_batch_statistics_match_t_interval(self):
+        samples = [self.image[:5, :5].ravel(), self.image[10:40, 10:40].ravel(), np.array([7.0]), np.empty(0)]
+        results = hu_statistics_batch(samples)
+        for values, result in zip(samples[:2], results[:2]):
+            mean, std = values.mean(), values.std()
+            lower, upper = stats.t.interval(0.95, len(values) - 1, loc=mean, scale=std / np.sqrt(len(values)))
+            self.assertAlmostEqual(result['ci_lower'], lower, places=4)
+            self.assertAlmostEqual(result['ci_upper'], upper, places=4)
+            self.assertEqual(result['pixel_count'], len(values))
+        self.assertEqual(results[2]['ci_lower'], 7.0)
+        self.assertIsNone(results[3])
+
+
+class MeasureHUBatchViewTestCase(TestCase):
+    """Batched HU measurements only read and record images the caller can access"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.facility_user = User.objects.create_user('facility', password='pw')
+        facility = Facility.objects.create(name='North', address='-', phone='-', email='north@example.com',
+                                           user=self.facility_user)
+        ds = dataset(generate_uid()[:40].rstrip('.'), generate_uid()[:40].rstrip('.'), 0)
+        buffer = io.BytesIO()
+        ds.save_as(buffer, write_like_original=False)
+        writer = IngestWriter(facility=facility)
+        pending = writer.add(ds, default_storage.save('dicom_files/0.dcm', ContentFile(buffer.getvalue())))
+        writer.flush()
+        self.image_id = pending.image_id
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def measure(self):
+        roi = {'image_id': self.image_id, 'type': 'rectangle', 'x0': 1, 'y0': 1, 'x1': 4, 'y1': 4}
+        return self.client.post('/viewer/api/measurements/hu/batch/', {'rois': [roi]},
+                                content_type='application/json')
+
+    def test_access_is_checked(self):
+        self.assertEqual(self.measure().status_code, 401)
+        self.client.force_login(User.objects.create_user('outsider', password='pw'))
+        self.assertEqual(self.measure().json()['results'][0]['error'], 'Image not found')
+        self.assertFalse(Measurement.objects.exists())
+
+        self.client.force_login(self.facility_user)
+        data = self.measure().json()
+        self.assertEqual(data['measured'], 1)
+        self.assertEqual(Measurement.objects.get(id=data['results'][0]['measurement_id']).created_by,
+                         self.facility_user)
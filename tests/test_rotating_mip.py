@@ -0,0 +1,114 @@
+"""
+Tests for the reconstruction store and the precomputed rotating MIP.
+"""
+
+import io
+import tempfile
+import shutil
+
+import numpy as np
+from PIL import Image
+from django.contrib.auth.models import Group, User
+from django.test import SimpleTestCase, TestCase
+
+from viewer.models import DicomSeries, DicomStudy, Facility
+from viewer.reconstruction_store import ReconstructionStore
+from viewer.rotating_mip import frame_key, project_angle, render_frames
+from viewer.volume_cache import SeriesVolume
+
+
+class ReconstructionStoreTestCase(SimpleTestCase):
+    """Packed frame entries, signature invalidation and atomic replacement"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ReconstructionStore(root=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_frames_round_trip(self):
+        frames = [b'first', b'second frame', b'', b'4']
+        manifest = self.store.write_frames(7, 'rotating_mip', 'k', 'sig', frames, metadata={'angles': [0, 1, 2, 3]})
+        self.assertEqual(manifest['frame_count'], 4)
+        self.assertEqual(manifest['total_bytes'], sum(len(f) for f in frames))
+
+        stored = self.store.read_manifest(7, 'rotating_mip', 'k', 'sig')
+        self.assertEqual(stored['metadata']['angles'], [0, 1, 2, 3])
+        self.assertEqual(self.store.read_frame(stored, 1), b'second frame')
+        self.assertEqual(list(self.store.iter_frames(stored)), frames)
+        with self.assertRaises(IndexError):
+            self.store.read_frame(stored, 4)
+
+    def test_stale_signature_removes_entry(self):
+        self.store.write_frames(7, 'rotating_mip', 'k', 'old', [b'a'])
+        self.assertIsNone(self.store.read_manifest(7, 'rotating_mip', 'k', 'new'))
+        self.assertIsNone(self.store.read_manifest(7, 'rotating_mip', 'k'))
+
+    def test_rewrite_replaces_entry(self):
+        self.store.write_frames(7, 'rotating_mip', 'k', 'sig', [b'a', b'b'])
+        self.store.write_frames(7, 'rotating_mip', 'k', 'sig', [b'c'])
+        manifest = self.store.read_manifest(7, 'rotating_mip', 'k', 'sig')
+        self.assertEqual(list(self.store.iter_frames(manifest)), [b'c'])
+        self.store.invalidate(7)
+        self.assertIsNone(self.store.read_manifest(7, 'rotating_mip', 'k'))
+
+
+class RotatingMIPTestCase(SimpleTestCase):
+    """Projection geometry of the rotating MIP frames"""
+
+    def setUp(self):
+        data = np.full((16, 32, 32), -1000.0, dtype=np.float32)
+        data[4:12, 14:18, 2:10] = 400.0  # vessel segment left of centre
+        self.volume = SeriesVolume(1, 'sig', data, (2.0, 1.0, 1.0), range(16), np.arange(16))
+
+    def decode(self, frame):
+        return np.asarray(Image.open(io.BytesIO(frame)).convert('L'), dtype=np.int32)
+
+    def test_frame_aspect_follows_spacing(self):
+        frame = self.decode(project_angle(self.volume.data, 0, self.volume.spacing, 150, 700, 64))
+        # 16 slices at 2 mm by 32 columns at 1 mm is square
+        self.assertEqual(frame.shape, (64, 64))
+
+    def test_rotation_moves_vessel(self):
+        front = self.decode(project_angle(self.volume.data, 0, self.volume.spacing, 150, 700, 32))
+        side = self.decode(project_angle(self.volume.data, 90, self.volume.spacing, 150, 700, 32))
+        front_columns = np.nonzero(front.max(axis=0) > 128)[0]
+        side_columns = np.nonzero(side.max(axis=0) > 128)[0]
+        self.assertLess(front_columns.mean(), 16)
+        # Seen from the side the 8 mm segment collapses to its 4 mm depth
+        self.assertLess(len(side_columns), len(front_columns))
+
+    def test_render_frames_in_order(self):
+        angles = np.arange(4) * 45.0
+        done = []
+        frames = render_frames(self.volume, angles, 150, 700, 32, max_workers=1, progress=done.append)
+        self.assertEqual(done, [1, 2, 3, 4])
+        self.assertEqual(frames[0], project_angle(self.volume.data, 0, self.volume.spacing, 150, 700, 32))
+        self.assertEqual(frame_key(36, 150, 700, 512), '36f_c150_w700_s512')
+
+
+class RotatingMIPPermissionTestCase(TestCase):
+    """Status, frames and stream of a rotating MIP need the same access as starting one"""
+
+    def setUp(self):
+        facility = Facility.objects.create(name='North', address='-', phone='-', email='north@example.com')
+        study = DicomStudy.objects.create(study_instance_uid='1.2.3', patient_name='Test^Patient', patient_id='P1',
+                                          modality='CT', facility=facility)
+        self.series = DicomSeries.objects.create(study=study, series_instance_uid='1.2.3.1', modality='CT')
+        self.base_url = f'/viewer/api/series/{self.series.id}/rotating-mip/abc'
+
+    def get_all(self):
+        return [self.client.get(url).status_code for url in
+                (f'{self.base_url}/', f'{self.base_url}/frames/0/', f'{self.base_url}/stream/')]
+
+    def test_other_facilities_are_refused(self):
+        self.client.force_login(User.objects.create_user('outsider', password='pw'))
+        self.assertEqual(self.get_all(), [403, 403, 403])
+
+    def test_radiologists_are_served(self):
+        radiologist = User.objects.create_user('radiologist', password='pw')
+        radiologist.groups.add(Group.objects.create(name='Radiologists'))
+        self.client.force_login(radiologist)
+        # Nothing has been rendered yet
+        self.assertEqual(self.get_all(), [200, 404, 404])
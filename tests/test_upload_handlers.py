@@ -0,0 +1,148 @@
+"""
+Tests for the streaming DICOM upload handler.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from viewer.models import DicomImage
+from viewer.upload_handlers import DicomStreamingUploadHandler, StreamedDicomFile, move_into_storage
+
+
+def dicom_bytes(rows=128, cols=128):
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset('upload.dcm', {}, file_meta=meta, preamble=b'\0' * 128)
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.Modality = 'CT'
+    ds.Rows, ds.Columns = rows, cols
+    ds.SamplesPerPixel, ds.PhotometricInterpretation = 1, 'MONOCHROME2'
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation = 16, 16, 15, 0
+    ds.PixelData = np.arange(rows * cols, dtype=np.uint16).tobytes()
+    buffer = io.BytesIO()
+    ds.save_as(buffer, write_like_original=False)
+    return buffer.getvalue(), ds.SOPInstanceUID
+
+
+class StreamingUploadHandlerTestCase(SimpleTestCase):
+    """Chunks go straight to storage, hashed and header-parsed as they arrive"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def handler(self, path='/viewer/api/upload-dicom-files/'):
+        return DicomStreamingUploadHandler(RequestFactory().post(path))
+
+    def test_streams_to_final_location_with_hash_and_header(self):
+        data, sop_uid = dicom_bytes()
+        handler = self.handler()
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('files', 'slice.dcm', 'application/dicom', len(data))
+        header_seen_at = None
+        for start in range(0, len(data), 4096):
+            self.assertIsNone(handler.receive_data_chunk(data[start:start + 4096], start))
+            if header_seen_at is None and handler.dicom_header is not None:
+                header_seen_at = start
+        uploaded = handler.file_complete(len(data))
+
+        self.assertIsInstance(uploaded, StreamedDicomFile)
+        self.assertLess(header_seen_at, len(data) // 2)
+        self.assertEqual(uploaded.dicom_header.SOPInstanceUID, sop_uid)
+        self.assertNotIn('PixelData', uploaded.dicom_header)
+        self.assertEqual(uploaded.sha256, hashlib.sha256(data).hexdigest())
+        self.assertTrue(uploaded.storage_name.startswith('dicom_files/'))
+        with open(os.path.join(self.media_root, uploaded.storage_name), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        uploaded.discard()
+        self.assertFalse(os.path.exists(uploaded.path))
+
+    def test_non_dicom_upload_has_no_header(self):
+        handler = self.handler()
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('files', 'notes.txt', 'text/plain', 10)
+        handler.receive_data_chunk(b'plain text', 0)
+        self.assertIsNone(handler.file_complete(10).dicom_header)
+
+    def test_other_views_are_passed_through(self):
+        handler = self.handler('/viewer/api/images/1/enhance-xray/')
+        handler.new_file('files', 'slice.dcm', 'application/dicom', 4)
+        self.assertEqual(handler.receive_data_chunk(b'abcd', 0), b'abcd')
+        self.assertIsNone(handler.file_complete(4))
+
+    def test_interrupted_upload_is_removed(self):
+        handler = self.handler()
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('files', 'slice.dcm', 'application/dicom', 100)
+        handler.receive_data_chunk(b'\0' * 50, 0)
+        handler.upload_interrupted()
+        self.assertFalse(os.path.exists(handler.path))
+
+    def test_move_into_storage(self):
+        data, _ = dicom_bytes(16, 16)
+        source = os.path.join(self.media_root, 'extracted.dcm')
+        with open(source, 'wb') as f:
+            f.write(data)
+        name = move_into_storage(source, 'a' * 150 + '.dcm')
+        self.assertFalse(os.path.exists(source))
+        self.assertTrue(name.startswith('dicom_files/'))
+        self.assertLessEqual(len(name), 100)
+        with open(os.path.join(self.media_root, name), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+class UnclaimedUploadTestCase(TestCase):
+    """Streamed files the upload views do not ingest are removed when the view returns"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def stored_files(self):
+        directory = os.path.join(self.media_root, 'dicom_files')
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def upload(self, field, *files):
+        uploads = []
+        for name, data in files:
+            upload = io.BytesIO(data)
+            upload.name = name
+            uploads.append(upload)
+        return self.client.post('/viewer/api/upload-dicom-files/', {field: uploads})
+
+    def test_early_return_leaves_no_files(self):
+        data, _ = dicom_bytes(8, 8)
+        response = self.upload('file', ('slice.dcm', data), ('notes.txt', b'plain text'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_only_ingested_files_are_kept(self):
+        data, uid = dicom_bytes(8, 8)
+        response = self.upload('files', ('slice.dcm', data), ('notes.txt', b'plain text'), ('copy.dcm', data))
+        self.assertEqual(response.status_code, 200)
+        image = DicomImage.objects.get(sop_instance_uid=uid)
+        self.assertEqual(self.stored_files(), [os.path.basename(image.file_path.name)])
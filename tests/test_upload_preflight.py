@@ -0,0 +1,79 @@
+"""
+Tests for the upload pre-flight check.
+"""
+
+import hashlib
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth.models import Group, User
+from django.test import TestCase, override_settings
+
+from viewer.chunked_upload import chunked_uploads
+from viewer.models import DicomImage
+from viewer.views import EnhancedBulkUploadManager
+
+from test_upload_handlers import dicom_bytes
+
+
+@override_settings(BULK_UPLOAD_PARSE_WORKERS=1)
+class UploadPreflightTestCase(TestCase):
+    """Instances already ingested are reported by SOP Instance UID and by content hash"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = User.objects.create_user('uploader', password='pw')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def preflight(self, **body):
+        return self.client.post('/viewer/api/upload-preflight/', body, content_type='application/json')
+
+    def test_only_missing_instances_are_requested(self):
+        data, uid = dicom_bytes(8, 8)
+        upload = io.BytesIO(data)
+        upload.name = 'slice.dcm'
+        self.assertEqual(self.client.post('/viewer/api/upload-dicom-files/', {'files': [upload]}).status_code, 200)
+        image = DicomImage.objects.get(sop_instance_uid=uid)
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(image.content_sha256, digest)
+
+        response = self.preflight(sop_instance_uids=[uid, '1.2.3.4'], sha256s=[digest.upper(), '0' * 64])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'missing_sop_instance_uids': ['1.2.3.4'],
+            'missing_sha256s': ['0' * 64],
+            'stored': 2,
+            'study_ids': [],
+        })
+
+        # Only studies the caller may open are named
+        self.user.groups.add(Group.objects.create(name='Radiologists'))
+        self.assertEqual(self.preflight(sop_instance_uids=[uid]).json()['study_ids'], [image.series.study_id])
+
+    def test_verified_session_files_record_their_hash(self):
+        data, uid = dicom_bytes(8, 8)
+        digest = hashlib.sha256(data).hexdigest()
+        session = chunked_uploads.create([{'name': 'slice.dcm', 'size': len(data), 'sha256': digest}])
+        chunked_uploads.write_chunk(session, 0, 0, io.BytesIO(data), f'sha256:{digest}')
+        manager = EnhancedBulkUploadManager(self.user)
+        manager.process_received_files(chunked_uploads.complete(session))
+        self.assertEqual(DicomImage.objects.get(sop_instance_uid=uid).content_sha256, digest)
+        self.assertEqual(self.preflight(sha256s=[digest]).json()['missing_sha256s'], [])
+
+    def test_malformed_requests_are_rejected(self):
+        self.assertEqual(self.preflight(sop_instance_uids='1.2.3').status_code, 400)
+        self.assertEqual(self.preflight(sha256s=[1, 2]).status_code, 400)
+        self.assertEqual(self.preflight(sop_instance_uids=['1'] * 10001).status_code, 400)
+        self.assertEqual(self.client.post('/viewer/api/upload-preflight/', 'not json',
+                                          content_type='application/json').status_code, 400)
+
+    def test_anonymous_callers_are_refused(self):
+        self.client.logout()
+        self.assertEqual(self.preflight(sop_instance_uids=['1.2.3']).status_code, 401)
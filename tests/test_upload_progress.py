@@ -0,0 +1,58 @@
+"""
+Tests for the coalesced bulk upload progress reporter.
+"""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from viewer.upload_progress import ProgressReporter, progress_key
+
+
+class ProgressReporterTestCase(SimpleTestCase):
+    """Counters aggregate in memory and reach the cache in throttled snapshots"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_publishes_are_throttled_by_time_and_file_count(self):
+        reporter = ProgressReporter('u1', interval_ms=60000, every_files=100)
+        reporter.set(status='processing', total_files=1000)
+        published = reporter.publish_count
+        for _ in range(250):
+            reporter.increment(processed_files=1, successful_files=1)
+        self.assertEqual(reporter.publish_count - published, 2)
+        self.assertEqual(cache.get(progress_key('u1'))['processed_files'], 200)
+
+        reporter.set(status='completed')
+        payload = cache.get(progress_key('u1'))
+        self.assertEqual((payload['status'], payload['processed_files']), ('completed', 250))
+
+    def test_interval_elapsing_publishes(self):
+        reporter = ProgressReporter('u2', interval_ms=500, every_files=10 ** 6)
+        with mock.patch('viewer.upload_progress.time.monotonic', return_value=1000.0):
+            reporter.set(status='processing')
+            reporter.increment(processed_files=1)
+        self.assertEqual(cache.get(progress_key('u2'))['processed_files'], 0)
+        with mock.patch('viewer.upload_progress.time.monotonic', return_value=1000.6):
+            reporter.increment(processed_files=1)
+        self.assertEqual(cache.get(progress_key('u2'))['processed_files'], 2)
+
+    def test_errors_are_capped_and_counted(self):
+        reporter = ProgressReporter('u3', max_errors=5)
+        reporter.error(*[f'bad {i}' for i in range(12)])
+        reporter.warning('duplicate')
+        payload = reporter.snapshot()
+        self.assertEqual(payload['errors'], [f'bad {i}' for i in range(7, 12)])
+        self.assertEqual((payload['error_count'], payload['warning_count']), (12, 1))
+
+    def test_stage_throughput_and_eta(self):
+        reporter = ProgressReporter('u4', total_files=1000)
+        reporter.increment(processed_files=200)
+        reporter.stage('parse', 200, 2.0, workers=4)
+        reporter.stage('write', 200, 4.0)
+        rates = reporter.snapshot()['stage_rates']
+        self.assertEqual((rates['parse']['files_per_sec'], rates['parse']['eta_seconds']), (400.0, 2.0))
+        self.assertEqual((rates['write']['files_per_sec'], rates['write']['eta_seconds']), (50.0, 16.0))
+        self.assertGreater(reporter.snapshot()['estimated_time_remaining'], 0)
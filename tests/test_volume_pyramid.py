@@ -0,0 +1,55 @@
+"""
+Tests for isotropic resampling and the downsampled volume pyramid.
+"""
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from viewer.volume_pyramid import VolumePyramid, downsample, isotropic_spacing, resample_isotropic
+
+
+class VolumePyramidTestCase(SimpleTestCase):
+    """Resampling, downsampling and level selection"""
+
+    def test_isotropic_spacing(self):
+        self.assertEqual(isotropic_spacing((40, 512, 512), (5.0, 0.5, 0.5)), 0.5)
+        capped = isotropic_spacing((40, 512, 512), (5.0, 0.5, 0.5), max_voxels=512 * 512 * 100)
+        self.assertAlmostEqual(capped, 0.5 * 4.0 ** (1.0 / 3.0), places=6)
+
+    def test_resample_interpolates_between_thick_slices(self):
+        # Values equal the z position in mm, so linear interpolation is exact
+        data = np.repeat(np.arange(4, dtype=np.float32)[:, None, None] * 5.0, 4, axis=1).repeat(4, axis=2)
+        out = np.empty((20, 4, 4), dtype=np.float32)
+        resample_isotropic(data, (5.0, 1.0, 1.0), 1.0, out)
+        np.testing.assert_allclose(out[:16, 0, 0], np.arange(16, dtype=np.float32), atol=1e-5)
+        # Beyond the last slice the edge value is held
+        np.testing.assert_allclose(out[16:, 0, 0], 15.0)
+
+    def test_resample_in_plane(self):
+        data = np.zeros((2, 4, 4), dtype=np.float32)
+        data[:, :, 2:] = 100.0
+        out = np.empty((2, 8, 8), dtype=np.float32)
+        resample_isotropic(data, (0.5, 1.0, 1.0), 0.5, out)
+        self.assertEqual(out[0, 0, 0], 0.0)
+        self.assertEqual(out[0, 0, -1], 100.0)
+
+    def test_downsample_block_mean(self):
+        data = np.arange(4 * 4 * 5, dtype=np.float32).reshape(4, 4, 5)
+        out = np.empty((2, 2, 2), dtype=np.float32)
+        downsample(data, out)
+        self.assertAlmostEqual(out[0, 0, 0], data[:2, :2, :2].mean())
+        self.assertAlmostEqual(out[1, 1, 1], data[2:4, 2:4, 2:4].mean())
+
+    def test_level_selection_picks_coarsest_sufficient_level(self):
+        levels = [np.zeros((200, 512, 512), np.float32), np.zeros((100, 256, 256), np.float32),
+                  np.zeros((50, 128, 128), np.float32)]
+        pyramid = VolumePyramid(3, 'sig', levels, [0.5, 1.0, 2.0], origin=10.0)
+        self.assertEqual(pyramid.level_index_for_size(100), 2)
+        self.assertEqual(pyramid.level_index_for_size(256), 1)
+        self.assertEqual(pyramid.level_index_for_size(400), 0)
+        self.assertEqual(pyramid.level_index_for_size(2048), 0)
+
+        volume = pyramid.level_for_size(256)
+        self.assertEqual(volume.spacing, (1.0, 1.0, 1.0))
+        self.assertEqual(volume.signature, 'sig:L1')
+        self.assertEqual(volume.slice_positions[1], 11.0)
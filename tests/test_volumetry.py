@@ -0,0 +1,63 @@
+"""
+Tests for threshold volumetry with connected-component labelling.
+"""
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from viewer.volume_cache import SeriesVolume
+from viewer.volumetry import VolumetryEngine, label_volume
+
+
+class VolumetryTestCase(SimpleTestCase):
+    """Labelling, component statistics, seed selection and caching"""
+
+    def setUp(self):
+        data = np.full((10, 20, 20), -1000.0, dtype=np.float32)
+        data[2:6, 2:6, 2:6] = 500.0      # 64 voxels
+        data[1:9, 10:18, 12:14] = 500.0  # 128 voxels
+        data[8, 2, 2] = 500.0            # single voxel
+        self.volume = SeriesVolume(4, 'sig', data, (2.0, 0.5, 0.5), range(10), np.arange(10))
+        self.engine = VolumetryEngine()
+
+    def test_component_statistics(self):
+        label_map = label_volume(self.volume.data, self.volume.spacing, 100, 3000)
+        self.assertEqual(label_map.count, 3)
+        components = label_map.components()
+        self.assertEqual([c['voxel_count'] for c in components], [128, 64, 1])
+        largest = components[0]
+        self.assertEqual(largest['bounding_box'], {'min': [12, 10, 1], 'max': [13, 17, 8]})
+        self.assertEqual(largest['centroid'], [12.5, 13.5, 4.5])
+        self.assertEqual(largest['volume_mm3'], 128 * 0.5)
+
+    def test_seed_selects_component(self):
+        result = self.engine.measure(self.volume, 100, 3000, seed=[3, 3, 3])
+        self.assertEqual(result['voxel_count'], 64)
+        self.assertEqual(result['selected_component']['voxel_count'], 64)
+        with self.assertRaises(ValueError):
+            self.engine.measure(self.volume, 100, 3000, seed=[0, 0, 0])
+        with self.assertRaises(ValueError):
+            self.engine.measure(self.volume, 100, 3000, seed=[50, 0, 0])
+
+    def test_total_matches_global_band_and_min_voxels(self):
+        result = self.engine.measure(self.volume, 100, 3000)
+        band = int(((self.volume.data >= 100) & (self.volume.data <= 3000)).sum())
+        self.assertEqual(result['voxel_count'], band)
+        filtered = self.engine.measure(self.volume, 100, 3000, min_voxels=2)
+        self.assertEqual(filtered['voxel_count'], band - 1)
+        self.assertEqual(len(filtered['components']), 2)
+
+    def test_label_map_is_cached_per_threshold_range(self):
+        self.assertFalse(self.engine.measure(self.volume, 100, 3000)['cached'])
+        self.assertTrue(self.engine.measure(self.volume, 100, 3000, seed=[12, 12, 4])['cached'])
+        self.assertFalse(self.engine.measure(self.volume, 200, 3000)['cached'])
+        self.engine.invalidate(4)
+        self.assertFalse(self.engine.measure(self.volume, 100, 3000)['cached'])
+
+    def test_connectivity(self):
+        data = np.zeros((3, 3, 3), dtype=np.float32)
+        data[0, 0, 0] = data[1, 1, 1] = 1.0  # touching only at a corner
+        self.assertEqual(label_volume(data, (1, 1, 1), 1, 1, connectivity=6).count, 2)
+        self.assertEqual(label_volume(data, (1, 1, 1), 1, 1, connectivity=26).count, 1)
+        with self.assertRaises(ValueError):
+            label_volume(data, (1, 1, 1), 1, 1, connectivity=8)
@@ -0,0 +1,101 @@
+"""
+Streaming reader for zip, tar and tar.gz uploads.
+
+Bulk uploads used to `extractall` an archive into a temporary directory,
+walk it, parse every candidate and then copy it into storage, so every byte
+reached the disk at least twice. `iter_dicom_members` walks the archive's
+members in order straight from the uploaded file, sniffs the first 132
+bytes of each for the DICM preamble (or a raw dataset's leading group), and
+yields only DICOM candidates with their stream still open. `store_member`
+copies a candidate from the member stream to its final location in
+dicom_files/, so each DICOM file is decompressed and written once and
+nothing else is written at all.
+
+Tar archives are read in stream mode ('r|', 'r|gz'), so members must be
+consumed in order: store (or skip) each member before asking for the next.
+"""
+
+import logging
+import os
+import shutil
+import tarfile
+import zipfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .dicom_sniff import SNIFF_BYTES, classify
+from .upload_handlers import storage_name
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz')
+
+
+def is_archive(name):
+    return name.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+class ArchiveMember:
+    """A DICOM candidate inside an archive; `prefix` holds the bytes already read from `stream`"""
+
+    def __init__(self, name, size, prefix, stream):
+        self.name = name
+        self.size = size
+        self.prefix = prefix
+        self.stream = stream
+
+    @property
+    def basename(self):
+        return os.path.basename(self.name.rstrip('/')) or 'member'
+
+
+def iter_members(fileobj, name):
+    """(member name, size, stream) of every regular file in the archive, in archive order"""
+    fileobj.seek(0)
+    if name.lower().endswith(ZIP_SUFFIXES):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as stream:
+                    yield info.filename, info.file_size, stream
+    else:
+        mode = 'r|gz' if name.lower().endswith(('.tar.gz', '.tgz')) else 'r|'
+        with tarfile.open(fileobj=fileobj, mode=mode) as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                stream = archive.extractfile(info)
+                yield info.name, info.size, stream
+
+
+def iter_dicom_members(fileobj, name, on_skip=None):
+    """ArchiveMember for each member whose first bytes look like DICOM; on_skip(name, size) gets the rest"""
+    for member_name, size, stream in iter_members(fileobj, name):
+        prefix = stream.read(SNIFF_BYTES)
+        if classify(prefix) is not None:
+            yield ArchiveMember(member_name, size, prefix, stream)
+        elif on_skip is not None:
+            on_skip(member_name, size)
+
+
+def store_member(member):
+    """Copy a member from its stream into dicom_files/ and return the storage name"""
+    name = storage_name(member.basename)
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path, 'wb') as destination:
+            destination.write(member.prefix)
+            shutil.copyfileobj(member.stream, destination, COPY_BUFFER_SIZE)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    permissions = getattr(settings, 'FILE_UPLOAD_PERMISSIONS', None)
+    if permissions is not None:
+        os.chmod(path, permissions)
+    return name
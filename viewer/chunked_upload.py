@@ -0,0 +1,254 @@
+"""
+Resumable, chunked uploads.
+
+The folder and bulk upload endpoints take one multipart request of up to
+5 GB: a dropped connection loses everything, and the browser sends every
+file serially in that one stream. An upload session describes its files up
+front; the client then PUTs each file as fixed-size chunks, in any order and
+over several connections at once, each with a checksum. A chunk is verified
+and written at its offset in the file's preallocated spool file under
+MEDIA_ROOT/upload_sessions/<session>/, then recorded as an UploadChunk row,
+so a client that reconnects asks for the session's status and sends only
+the chunks still missing. Completing the session checks that every chunk
+(and any whole-file SHA-256 the client declared) arrived and hands the
+spool files to the bulk upload pipeline.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import UploadChunk, UploadSession
+
+logger = logging.getLogger(__name__)
+
+SESSION_DIRECTORY = 'upload_sessions'
+READ_BLOCK_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_FILE_SIZE = 5 * 1024 * 1024 * 1024
+MAX_FILES = 10000
+CHECKSUM_ALGORITHMS = ('sha256', 'crc32')
+
+
+class UploadSessionError(ValueError):
+    """A request an upload session cannot accept; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class _Crc32:
+    """hashlib-style CRC-32, for browsers without WebCrypto (plain-HTTP deployments)"""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return f'{self.value:08x}'
+
+
+def parse_checksum(value):
+    """(algorithm, hex digest) of an 'algorithm:hex' chunk checksum header"""
+    algorithm, _, digest = (value or '').strip().lower().partition(':')
+    if algorithm not in CHECKSUM_ALGORITHMS or not digest:
+        raise UploadSessionError("X-Chunk-Checksum must be 'sha256:<hex>' or 'crc32:<hex>'")
+    return algorithm, digest
+
+
+def _hasher(algorithm):
+    return hashlib.sha256() if algorithm == 'sha256' else _Crc32()
+
+
+class ChunkedUploadStore:
+    """Spool files and received-chunk bookkeeping of upload sessions"""
+
+    def __init__(self, root=None):
+        self._root = root
+
+    @property
+    def root(self):
+        return self._root or os.path.join(settings.MEDIA_ROOT, SESSION_DIRECTORY)
+
+    def session_dir(self, session):
+        return os.path.join(self.root, str(session.pk))
+
+    def file_path(self, session, file_index):
+        return os.path.join(self.session_dir(session), f'{int(file_index):05d}')
+
+    def create(self, files, user=None, facility=None, chunk_size=None):
+        """New session for [{'name', 'size', 'relative_path', 'sha256'}] with its spool files preallocated"""
+        self.expire()
+        max_chunk_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 * 1024)
+        try:
+            chunk_size = int(chunk_size or getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+        except (TypeError, ValueError):
+            raise UploadSessionError('chunk_size must be an integer')
+        if not MIN_CHUNK_SIZE <= chunk_size <= max_chunk_size:
+            raise UploadSessionError(f'chunk_size must be between {MIN_CHUNK_SIZE} and {max_chunk_size} bytes')
+        if not isinstance(files, list) or not files:
+            raise UploadSessionError('No files described')
+        if len(files) > MAX_FILES:
+            raise UploadSessionError(f'At most {MAX_FILES} files per upload session')
+
+        described = []
+        for entry in files:
+            try:
+                name = os.path.basename(str(entry['name']).replace('\\', '/'))
+                size = int(entry['size'])
+            except (KeyError, TypeError, ValueError):
+                raise UploadSessionError('Each file needs a name and a size')
+            if not name or size < 0:
+                raise UploadSessionError('Each file needs a name and a size')
+            if size > MAX_FILE_SIZE:
+                raise UploadSessionError(f'File {name} is too large (max 5GB)')
+            described.append({
+                'name': name,
+                'relative_path': str(entry.get('relative_path') or name),
+                'size': size,
+                'chunks': max(1, -(-size // chunk_size)),
+                'sha256': str(entry.get('sha256') or '').lower(),
+            })
+
+        session = UploadSession.objects.create(user=user, facility=facility, chunk_size=chunk_size, files=described)
+        os.makedirs(self.session_dir(session), exist_ok=True)
+        for index, entry in enumerate(described):
+            with open(self.file_path(session, index), 'wb') as f:
+                f.truncate(entry['size'])
+        return session
+
+    def _entry(self, session, file_index):
+        if not 0 <= file_index < len(session.files):
+            raise UploadSessionError(f'No file {file_index} in this upload session', status=404)
+        return session.files[file_index]
+
+    def write_chunk(self, session, file_index, index, stream, checksum):
+        """Read a chunk from stream, verify it and write it at its offset; returns the file's received chunk count"""
+        if session.status != 'open':
+            raise UploadSessionError(f'Upload session is {session.status}', status=409)
+        entry = self._entry(session, file_index)
+        if not 0 <= index < entry['chunks']:
+            raise UploadSessionError(f"Chunk {index} is out of range (the file has {entry['chunks']})")
+        algorithm, expected = parse_checksum(checksum)
+
+        offset = index * session.chunk_size
+        length = min(session.chunk_size, entry['size'] - offset)
+        # The bytes are overwritten in place, so the chunk counts as missing until it verifies
+        UploadChunk.objects.filter(session=session, file_index=file_index, index=index).delete()
+        hasher = _hasher(algorithm)
+        written = 0
+        with open(self.file_path(session, file_index), 'r+b') as f:
+            f.seek(offset)
+            while True:
+                block = stream.read(min(READ_BLOCK_SIZE, length - written + 1))
+                if not block:
+                    break
+                if written + len(block) > length:
+                    raise UploadSessionError(f'Chunk {index} is larger than {length} bytes')
+                hasher.update(block)
+                f.write(block)
+                written += len(block)
+        if written != length:
+            raise UploadSessionError(f'Chunk {index} has {written} bytes, expected {length}')
+        if hasher.hexdigest() != expected:
+            raise UploadSessionError(f'Chunk {index} failed its {algorithm} check', status=422)
+
+        # A single INSERT (no read-then-write transaction), so parallel chunk PUTs do not contend for locks
+        UploadChunk.objects.bulk_create([UploadChunk(
+            session=session, file_index=file_index, index=index, size=length, checksum=f'{algorithm}:{expected}',
+        )], ignore_conflicts=True)
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+        return UploadChunk.objects.filter(session=session, file_index=file_index).count()
+
+    def status(self, session):
+        """Session payload with each file's received and missing chunk indices"""
+        received = {}
+        for file_index, index in session.chunks.values_list('file_index', 'index'):
+            received.setdefault(file_index, set()).add(index)
+        files = []
+        for file_index, entry in enumerate(session.files):
+            have = received.get(file_index, set())
+            missing = [index for index in range(entry['chunks']) if index not in have]
+            files.append(dict(entry, index=file_index, received=len(have), missing=missing))
+        return {
+            'session_id': str(session.pk),
+            'status': session.status,
+            'chunk_size': session.chunk_size,
+            'files': files,
+            'complete': not any(entry['missing'] for entry in files),
+            'result': session.result,
+        }
+
+    def _file_sha256(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def complete(self, session):
+        """Mark a fully received session as processing and return its files as bulk upload file_info dicts"""
+        payload = self.status(session)
+        if session.status != 'open':
+            raise UploadSessionError(f'Upload session is {session.status}', status=409)
+        missing = {entry['index']: entry['missing'] for entry in payload['files'] if entry['missing']}
+        if missing:
+            raise UploadSessionError('Upload session is missing chunks', status=409, missing=missing)
+        for entry in payload['files']:
+            if entry['sha256'] and self._file_sha256(self.file_path(session, entry['index'])) != entry['sha256']:
+                # Every chunk verified but the whole does not: the client must send this file again
+                session.chunks.filter(file_index=entry['index']).delete()
+                raise UploadSessionError(f"File {entry['name']} failed its sha256 check", status=422,
+                                         missing={entry['index']: list(range(entry['chunks']))})
+
+        # A conditional update, so two concurrent completions cannot both start the ingest
+        claimed = UploadSession.objects.filter(pk=session.pk, status='open').update(
+            status='processing', updated_at=timezone.now())
+        if not claimed:
+            raise UploadSessionError('Upload session is already being processed', status=409)
+        session.status = 'processing'
+        return self.received_files(session)
+
+    def received_files(self, session):
+        """The session's spool files as bulk upload file_info dicts, less those already moved into storage"""
+        return [{
+            'path': self.file_path(session, index),
+            'name': entry['name'],
+            'size': entry['size'],
+            'relative_path': entry['relative_path'],
+            # Verified by complete(), so it can be recorded as the content hash of a plain DICOM file
+            'sha256': entry['sha256'],
+        } for index, entry in enumerate(session.files) if os.path.exists(self.file_path(session, index))]
+
+    def finish(self, session, success, result):
+        """Record the ingest outcome and remove what is left of the spool files"""
+        UploadSession.objects.filter(pk=session.pk).update(
+            status='completed' if success else 'failed', result=result, updated_at=timezone.now())
+        shutil.rmtree(self.session_dir(session), ignore_errors=True)
+
+    def discard(self, session):
+        """Abort a session: delete its spool files and its record"""
+        shutil.rmtree(self.session_dir(session), ignore_errors=True)
+        session.delete()
+
+    def expire(self):
+        """Discard open sessions idle for longer than CHUNKED_UPLOAD_SESSION_TTL_HOURS"""
+        hours = getattr(settings, 'CHUNKED_UPLOAD_SESSION_TTL_HOURS', 24)
+        cutoff = timezone.now() - timedelta(hours=hours)
+        for session in UploadSession.objects.filter(status='open', updated_at__lt=cutoff):
+            logger.info(f"Discarding idle upload session {session.pk}")
+            self.discard(session)
+
+
+# Global chunked upload store instance
+chunked_uploads = ChunkedUploadStore()
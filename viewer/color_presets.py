@@ -0,0 +1,153 @@
+"""
+Colour transfer functions for reconstruction and volume rendering output.
+
+Every preset is a 256-entry RGBA lookup table. Images are reduced to uint8
+indices once and coloured with a single indexed gather, instead of per-pixel
+Python loops or per-call float64 RGB arrays. The alpha channel doubles as the
+opacity transfer function for volume rendering.
+"""
+
+import threading
+
+import numpy as np
+
+# Control points are (index 0-255, r, g, b, a); channels are linearly interpolated
+PRESET_CONTROL_POINTS = {
+    'grayscale': [
+        (0, 0, 0, 0, 0),
+        (255, 255, 255, 255, 255),
+    ],
+    'soft_tissue': [
+        (0, 0, 0, 0, 0),
+        (212, 255, 170, 191, 212),
+        (255, 255, 204, 229, 255),
+    ],
+    'vessels': [
+        (0, 0, 0, 0, 0),
+        (170, 255, 85, 34, 170),
+        (255, 255, 128, 51, 255),
+    ],
+}
+
+
+def _bone_lut():
+    """Bone colormap: dark blue soft tissue, orange/brown possible bone, white bone"""
+    index = np.arange(256, dtype=np.int32)
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    soft = index <= 64
+    partial = (index > 64) & (index <= 128)
+    bone = index > 128
+    lut[soft, 0] = index[soft] // 4
+    lut[soft, 1] = index[soft] // 4
+    lut[soft, 2] = index[soft] // 2
+    lut[partial, 0] = index[partial]
+    lut[partial, 1] = index[partial] // 2
+    lut[bone, :3] = index[bone, None]
+    # Soft tissue is transparent, partial volume translucent, bone opaque
+    lut[:, 3] = np.clip((index - 64) * 255 // 128, 0, 255)
+    return lut
+
+
+def build_lut(control_points):
+    """Build a 256x4 uint8 RGBA LUT from (index, r, g, b, a) control points"""
+    points = np.asarray(sorted(control_points, key=lambda p: p[0]), dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] not in (4, 5) or len(points) < 2:
+        raise ValueError('Colour preset needs at least two (index, r, g, b[, a]) control points')
+    if points.shape[1] == 4:
+        points = np.column_stack([points, points[:, 0]])
+    index = np.arange(256, dtype=np.float64)
+    lut = np.empty((256, 4), dtype=np.float64)
+    for channel in range(4):
+        lut[:, channel] = np.interp(index, points[:, 0], points[:, channel + 1])
+    return np.clip(np.rint(lut), 0, 255).astype(np.uint8)
+
+
+def to_uint8(data, low=None, high=None):
+    """Scale data into uint8 LUT indices over [low, high] (defaults to the data range)"""
+    if data.dtype == np.uint8 and low is None and high is None:
+        return data
+    data = np.asarray(data, dtype=np.float32)
+    low = float(data.min()) if low is None else float(low)
+    high = float(data.max()) if high is None else float(high)
+    if high <= low:
+        return np.zeros(data.shape, dtype=np.uint8)
+    scaled = (data - np.float32(low)) * np.float32(255.0 / (high - low))
+    np.clip(scaled, 0, 255, out=scaled)
+    return scaled.astype(np.uint8)
+
+
+class ColorTransferFunction:
+    """A named 256-entry RGBA lookup table"""
+
+    def __init__(self, name, lut):
+        lut = np.ascontiguousarray(lut, dtype=np.uint8)
+        if lut.shape != (256, 4):
+            raise ValueError('Colour LUT must have shape (256, 4)')
+        self.name = name
+        self.lut = lut
+        self.lut.setflags(write=False)
+
+    @property
+    def is_grayscale(self):
+        return bool(np.all(self.lut[:, 0] == self.lut[:, 1]) and np.all(self.lut[:, 1] == self.lut[:, 2]))
+
+    @property
+    def opacity(self):
+        """Alpha channel as float32 opacities in [0, 1]"""
+        return self.lut[:, 3].astype(np.float32) / 255.0
+
+    @property
+    def colors(self):
+        """RGB channels as float32 values in [0, 1]"""
+        return self.lut[:, :3].astype(np.float32) / 255.0
+
+    def apply(self, indices, alpha=False):
+        """Colour uint8 indices with one gather; returns (..., 3) RGB or (..., 4) RGBA"""
+        indices = to_uint8(indices)
+        table = self.lut if alpha else self.lut[:, :3]
+        return np.take(table, indices, axis=0)
+
+    def to_dict(self):
+        return {'name': self.name, 'lut': self.lut.tolist()}
+
+
+class ColorPresetRegistry:
+    """Built-in and user-defined colour presets"""
+
+    def __init__(self):
+        self._presets = {}
+        self._lock = threading.Lock()
+        for name, points in PRESET_CONTROL_POINTS.items():
+            self._presets[name] = ColorTransferFunction(name, build_lut(points))
+        self._presets['bone'] = ColorTransferFunction('bone', _bone_lut())
+
+    def names(self):
+        return sorted(self._presets)
+
+    def get(self, name):
+        """Return a preset by name, falling back to grayscale"""
+        return self._presets.get(name) or self._presets['grayscale']
+
+    def register(self, name, control_points):
+        """Register (or replace) a user-defined preset"""
+        preset = ColorTransferFunction(name, build_lut(control_points))
+        with self._lock:
+            self._presets[name] = preset
+        return preset
+
+    def resolve(self, spec):
+        """Resolve a preset name, a list of control points or {'name', 'points'} into a transfer function"""
+        if isinstance(spec, ColorTransferFunction):
+            return spec
+        if isinstance(spec, dict):
+            points = spec.get('points') or spec.get('control_points')
+            if points:
+                return ColorTransferFunction(spec.get('name', 'custom'), build_lut(points))
+            return self.get(spec.get('name', 'grayscale'))
+        if isinstance(spec, (list, tuple)):
+            return ColorTransferFunction('custom', build_lut(spec))
+        return self.get(spec)
+
+
+# Global colour preset registry
+color_presets = ColorPresetRegistry()
@@ -0,0 +1,67 @@
+"""
+Content sniffing for DICOM uploads.
+
+The upload paths used to accept almost any file by name and size (no
+extension, '.dat', anything over 512 bytes) and leave it to up to three
+`dcmread` attempts, the last with force=True, to find out it was not DICOM.
+`classify` decides from a file's first 132 bytes instead: a Part 10 file
+carries a 128-byte preamble followed by b'DICM'; a dataset written without
+the preamble starts directly with its first element, which must be a
+group 0008 element (implicit or explicit VR little endian) or a group 0002
+file meta element (always explicit VR). Files that are neither never reach
+the parser, and a raw dataset is the only case parsed with force=True.
+"""
+
+import os
+import struct
+
+SNIFF_BYTES = 132
+PREAMBLE_LENGTH = 128
+MAGIC = b'DICM'
+
+PART10 = 'part10'
+RAW = 'raw'
+
+# Value representations; an explicit VR element has one of these right after its tag
+VRS = frozenset(vr.encode() for vr in (
+    'AE', 'AS', 'AT', 'CS', 'DA', 'DS', 'DT', 'FD', 'FL', 'IS', 'LO', 'LT', 'OB', 'OD', 'OF', 'OL',
+    'OV', 'OW', 'PN', 'SH', 'SL', 'SQ', 'SS', 'ST', 'SV', 'TM', 'UC', 'UI', 'UL', 'UN', 'UR', 'US',
+    'UT', 'UV',
+))
+UNDEFINED_LENGTH = 0xFFFFFFFF
+# Group 0008 holds identifying attributes; a first value longer than this is not a real header
+MAX_FIRST_VALUE_LENGTH = 1024 * 1024
+
+
+def classify(prefix):
+    """PART10, RAW (a preamble-less dataset) or None for bytes that do not start a DICOM file"""
+    if prefix[PREAMBLE_LENGTH:SNIFF_BYTES] == MAGIC:
+        return PART10
+    if len(prefix) < 8:
+        return None
+    group, = struct.unpack('<H', prefix[:2])
+    if group not in (0x0002, 0x0008):
+        return None
+    if prefix[4:6] in VRS:
+        return RAW
+    # Implicit VR little endian: a 32-bit even length (or an undefined-length sequence) follows the tag
+    length, = struct.unpack('<I', prefix[4:8])
+    if group == 0x0008 and (length == UNDEFINED_LENGTH or (length % 2 == 0 and length <= MAX_FIRST_VALUE_LENGTH)):
+        return RAW
+    return None
+
+
+def sniff(source):
+    """classify() of a path's or file object's first bytes; a file object is left where it was"""
+    if isinstance(source, (str, os.PathLike)):
+        try:
+            with open(source, 'rb') as f:
+                return classify(f.read(SNIFF_BYTES))
+        except OSError:
+            return None
+    position = source.tell()
+    try:
+        source.seek(0)
+        return classify(source.read(SNIFF_BYTES))
+    finally:
+        source.seek(position)
@@ -0,0 +1,140 @@
+"""
+Size-bounded on-disk store for enhanced single-image results.
+
+The X-ray and MRI enhancement endpoints run multi-second filter chains.
+Their PNG output is written to MEDIA_ROOT/enhancements/image_<id>/ under a
+name built from the operation, the enhancement type, the algorithm version
+and a signature of the source file, so every worker and every restart
+shares the result and a changed source or algorithm simply misses. Hits
+touch the file's mtime; once the store grows past its byte limit the
+least recently used entries are removed.
+"""
+
+import os
+import re
+import shutil
+import threading
+import uuid
+
+from django.conf import settings
+
+SUFFIX = '.png'
+
+
+def _slug(value):
+    return re.sub(r'[^A-Za-z0-9_.]+', '_', str(value))
+
+
+def source_signature(path):
+    """Size and modification time of a source file; changes whenever it is rewritten"""
+    stat = os.stat(path)
+    return f'{stat.st_size:x}{stat.st_mtime_ns:x}'
+
+
+class EnhancementStore:
+    """PNG results keyed by (image, operation, enhancement type, algorithm version, source signature)"""
+
+    def __init__(self, root=None, max_bytes=None):
+        self._root = root
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def root(self):
+        return self._root or os.path.join(settings.MEDIA_ROOT, 'enhancements')
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'ENHANCEMENT_STORE_MAX_BYTES', 2 * 1024 * 1024 * 1024)
+
+    def image_dir(self, image_id):
+        return os.path.join(self.root, f'image_{int(image_id)}')
+
+    def prefix(self, operation, variant):
+        return f'{_slug(operation)}-{_slug(variant)}-'
+
+    def path(self, image_id, operation, variant, version, signature):
+        name = f'{self.prefix(operation, variant)}{_slug(version)}-{_slug(signature)}{SUFFIX}'
+        return os.path.join(self.image_dir(image_id), name)
+
+    def get(self, image_id, operation, variant, version, signature):
+        """Stored PNG bytes, or None on a miss"""
+        path = self.path(image_id, operation, variant, version, signature)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, image_id, operation, variant, version, signature, data):
+        """Atomically store a result, dropping older versions of it, then enforce the size limit"""
+        path = self.path(image_id, operation, variant, version, signature)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        prefix = self.prefix(operation, variant)
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith(SUFFIX) and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+        staging = f'{path}.tmp-{uuid.uuid4().hex[:8]}'
+        try:
+            with open(staging, 'wb') as f:
+                f.write(data)
+            os.replace(staging, path)
+        except Exception:
+            if os.path.exists(staging):
+                os.remove(staging)
+            raise
+        self.enforce_limit()
+        return path
+
+    def entries(self):
+        """(mtime, size, path) of every stored result"""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(SUFFIX):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return found
+
+    def enforce_limit(self):
+        """Remove least recently used results until the store fits in max_bytes"""
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            return total
+
+    def invalidate(self, image_id):
+        """Remove every stored result of one image"""
+        shutil.rmtree(self.image_dir(image_id), ignore_errors=True)
+
+
+# Global enhancement store instance
+enhancement_store = EnhancementStore()
@@ -0,0 +1,139 @@
+"""
+Summed-area tables for live HU readouts.
+
+Hover readouts need the HU under the cursor and the mean/std of a small
+rectangle around it many times per second. Per image, this module builds
+summed-area tables of HU and HU squared once (lazily, from the per-image HU
+cache) so that any rectangle's sum, mean and standard deviation are four
+table lookups, and any number of cursor positions can be answered with a
+handful of vectorised gathers.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_PROBES_PER_REQUEST = 1024
+
+
+class SummedAreaTable:
+    """Summed-area tables of one HU image for O(1) point and rectangle queries"""
+
+    def __init__(self, hu):
+        self.hu = hu
+        self.shape = hu.shape
+        # Integer HU (the usual CT case) is summed exactly in int64; otherwise the
+        # image mean is subtracted so the float64 variance does not lose precision
+        if np.array_equal(hu, np.round(hu)) and np.abs(hu).max(initial=0) < 2 ** 15:
+            values = hu.astype(np.int64)
+            self.offset = 0.0
+        else:
+            self.offset = float(hu.mean())
+            values = hu.astype(np.float64) - self.offset
+        self.sum = np.zeros((self.shape[0] + 1, self.shape[1] + 1), dtype=values.dtype)
+        self.sum_sq = np.zeros_like(self.sum)
+        np.cumsum(np.cumsum(values, axis=0), axis=1, out=self.sum[1:, 1:])
+        np.cumsum(np.cumsum(values * values, axis=0), axis=1, out=self.sum_sq[1:, 1:])
+
+    @property
+    def nbytes(self):
+        return self.sum.nbytes + self.sum_sq.nbytes
+
+    def points(self, x, y):
+        """HU at integer pixel positions (arrays of x and y), NaN outside the image"""
+        x = np.asarray(x, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        inside = (x >= 0) & (x < self.shape[1]) & (y >= 0) & (y < self.shape[0])
+        values = np.full(x.shape, np.nan)
+        values[inside] = self.hu[y[inside], x[inside]]
+        return values
+
+    def rectangles(self, x0, y0, x1, y1):
+        """Pixel count, mean and std of inclusive rectangles, clipped to the image"""
+        rows, cols = self.shape
+        left = np.clip(np.minimum(x0, x1), 0, cols).astype(np.int64)
+        right = np.clip(np.maximum(x0, x1) + 1, 0, cols).astype(np.int64)
+        top = np.clip(np.minimum(y0, y1), 0, rows).astype(np.int64)
+        bottom = np.clip(np.maximum(y0, y1) + 1, 0, rows).astype(np.int64)
+        count = np.maximum(right - left, 0) * np.maximum(bottom - top, 0)
+
+        def box(table):
+            return (table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]).astype(np.float64)
+
+        total = box(self.sum)
+        total_sq = box(self.sum_sq)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            variance = np.maximum(total_sq / count - mean * mean, 0.0)
+        mean = np.where(count > 0, mean + self.offset, np.nan)
+        std = np.where(count > 0, np.sqrt(variance), np.nan)
+        return count, mean, std
+
+
+class HUProbeIndex:
+    """Thread-safe LRU of summed-area tables per image, bounded by total bytes"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, image):
+        """Summed-area table of an image, built on first use"""
+        from .volume_cache import image_hu_cache
+        key = (image.id, image.sop_instance_uid)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                return table
+        table = SummedAreaTable(image_hu_cache.get(image).hu)
+        with self._lock:
+            self._tables[key] = table
+            total = sum(t.nbytes for t in self._tables.values())
+            while len(self._tables) > 1 and total > self.max_bytes:
+                _, evicted = self._tables.popitem(last=False)
+                total -= evicted.nbytes
+        return table
+
+    def probe(self, image, points=(), rectangles=(), radius=0):
+        """Answer many cursor positions and rectangles against one image in a single call"""
+        if len(points) + len(rectangles) > MAX_PROBES_PER_REQUEST:
+            raise ValueError(f'At most {MAX_PROBES_PER_REQUEST} probes per request')
+        table = self.get(image)
+        result = {'points': [], 'rectangles': []}
+
+        if len(points):
+            xy = np.rint(np.asarray(points, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+            x, y = xy[:, 0], xy[:, 1]
+            values = table.points(x, y)
+            if radius > 0:
+                count, mean, std = table.rectangles(x - radius, y - radius, x + radius, y + radius)
+            for i in range(len(x)):
+                entry = {'x': int(x[i]), 'y': int(y[i]), 'hu': _rounded(values[i])}
+                if radius > 0:
+                    entry.update({'pixel_count': int(count[i]), 'mean': _rounded(mean[i]), 'std': _rounded(std[i])})
+                result['points'].append(entry)
+
+        if len(rectangles):
+            boxes = np.rint(np.asarray(rectangles, dtype=np.float64).reshape(-1, 4)).astype(np.int64)
+            count, mean, std = table.rectangles(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+            for i, (x0, y0, x1, y1) in enumerate(boxes.tolist()):
+                result['rectangles'].append({
+                    'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1,
+                    'pixel_count': int(count[i]), 'mean': _rounded(mean[i]), 'std': _rounded(std[i]),
+                })
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+
+def _rounded(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+# Global HU probe index instance
+hu_probe_index = HUProbeIndex()
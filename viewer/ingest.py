@@ -0,0 +1,407 @@
+"""
+Batched, transactional writer for ingested DICOM instances.
+
+Uploads, the bulk upload manager and the DICOM SCP used to run a study
+get_or_create, a series get_or_create and an image create per file, each in
+its own autocommit transaction. On SQLite that is several fsyncs per image.
+`IngestWriter` keeps StudyInstanceUID and SeriesInstanceUID to primary key
+maps in memory and queues image rows; a batch that fails while using cached
+keys (say, for a study deleted since) is retried once with fresh lookups. `flush()` resolves any new studies and
+series, inserts the queued images with bulk_create(ignore_conflicts=True)
+and stores their intensity statistics, all in one transaction per batch.
+Each queued file gets a `PendingImage` handle that reports its image id and
+whether it was new or already ingested once its batch has been flushed.
+
+Queued instances never hold pixel data. `add` accepts a full dataset, a
+header-only dataset or a `describe()` descriptor (a dict of the few tags the
+rows need); intensity statistics are computed from pixels at `add` time when
+the dataset carries them, otherwise read back from storage at flush.
+
+Each image row also records the SHA-256 of its file when the upload path
+already knows it, so `stored_instances` can tell an upload client which of
+the instances it is about to send (by SOP Instance UID or by content hash)
+the archive already holds.
+
+`parse_headers` is the header-parsing stage for bulk ingest. It is a plain
+module-level function so it can run in a process pool; only file paths go
+in and only descriptors (built-in types, cheap to pickle) come back.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pydicom
+from pydicom.multival import MultiValue
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .intensity_stats import intensity_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200
+# IN (...) lists stay well below SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 500
+# Header tags the study, series and image rows are built from
+HEADER_KEYWORDS = (
+    'StudyInstanceUID', 'SeriesInstanceUID', 'SOPInstanceUID',
+    'PatientName', 'PatientID', 'StudyDate', 'StudyTime', 'StudyDescription', 'Modality', 'InstitutionName',
+    'AccessionNumber', 'ReferringPhysicianName',
+    'SeriesNumber', 'SeriesDescription', 'BodyPartExamined',
+    'InstanceNumber', 'Rows', 'Columns', 'BitsAllocated', 'SamplesPerPixel', 'PhotometricInterpretation',
+    'PixelSpacing', 'SliceThickness', 'WindowCenter', 'WindowWidth',
+)
+
+
+def _plain(value):
+    """A DICOM element value as built-in types (int, float, str or a list of them)"""
+    if isinstance(value, (list, tuple, MultiValue)):
+        return [_plain(v) for v in value]
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return str(value)
+
+
+def describe(dicom_data):
+    """Lightweight descriptor of a dataset: the HEADER_KEYWORDS values it has, as a plain dict"""
+    if isinstance(dicom_data, dict):
+        return dicom_data
+    descriptor = {}
+    for keyword in HEADER_KEYWORDS:
+        try:
+            value = dicom_data.get(keyword)
+        except Exception:
+            continue
+        if value is not None:
+            descriptor[keyword] = _plain(value)
+    return descriptor
+
+
+def parse_headers(paths):
+    """(descriptors, seconds) for header-only parses of paths; a descriptor is None for non-DICOM files"""
+    from .upload_handlers import read_header
+    start = time.perf_counter()
+    descriptors = []
+    for path in paths:
+        try:
+            header = read_header(path)
+        except Exception as e:
+            logger.warning(f"Could not parse DICOM header of {path}: {e}")
+            header = None
+        descriptors.append(describe(header) if header is not None else None)
+    return descriptors, time.perf_counter() - start
+
+
+def stored_instances(sop_instance_uids=(), sha256s=()):
+    """(UIDs, hashes, study ids) of the given SOP Instance UIDs and content SHA-256s that are already ingested"""
+    from .models import DicomImage
+    found = {'sop_instance_uid': set(), 'content_sha256': set()}
+    study_ids = set()
+    for field, values in (('sop_instance_uid', sop_instance_uids), ('content_sha256', sha256s)):
+        values = sorted(set(values) - {''})
+        for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+            rows = DicomImage.objects.filter(**{f'{field}__in': values[start:start + LOOKUP_BATCH_SIZE]})
+            for value, study_id in rows.values_list(field, 'series__study_id'):
+                found[field].add(value)
+                study_ids.add(study_id)
+    return found['sop_instance_uid'], found['content_sha256'], study_ids
+
+
+def _text(dicom_data, keyword, default=''):
+    try:
+        value = dicom_data.get(keyword)
+    except Exception:
+        return default
+    if isinstance(value, list):
+        # Descriptor lists render like pydicom's MultiValue
+        value = '[' + ', '.join(str(v) for v in value) + ']'
+    return default if value is None or str(value) == '' else str(value)
+
+
+def _first(value):
+    if value is not None and not isinstance(value, (str, bytes)) and hasattr(value, '__len__'):
+        return value[0] if len(value) else None
+    return value
+
+
+def _number(dicom_data, keyword, cast, default=None):
+    """First value of a numeric element, or default when missing or malformed"""
+    try:
+        value = _first(dicom_data.get(keyword))
+        return default if value is None or value == '' else cast(value)
+    except (TypeError, ValueError, IndexError):
+        return default
+
+
+def _date(value):
+    try:
+        return datetime.strptime(str(value)[:8], '%Y%m%d').date() if value else None
+    except ValueError:
+        return None
+
+
+def _time(value):
+    text = str(value).split('.')[0] if value else ''
+    for length, pattern in ((6, '%H%M%S'), (4, '%H%M'), (2, '%H')):
+        if len(text) >= length:
+            try:
+                return datetime.strptime(text[:length], pattern).time()
+            except ValueError:
+                return None
+    return None
+
+
+def study_fields(dicom_data, user=None, facility=None):
+    """DicomStudy column values from a dataset header"""
+    return {
+        'patient_name': _text(dicom_data, 'PatientName', 'Unknown'),
+        'patient_id': _text(dicom_data, 'PatientID', 'Unknown'),
+        'study_date': _date(dicom_data.get('StudyDate')),
+        'study_time': _time(dicom_data.get('StudyTime')),
+        'study_description': _text(dicom_data, 'StudyDescription'),
+        'modality': _text(dicom_data, 'Modality', 'OT')[:10],
+        'institution_name': _text(dicom_data, 'InstitutionName'),
+        'accession_number': _text(dicom_data, 'AccessionNumber')[:50],
+        'referring_physician': _text(dicom_data, 'ReferringPhysicianName'),
+        'uploaded_by': user,
+        'facility': facility,
+    }
+
+
+def series_fields(dicom_data):
+    """DicomSeries column values from a dataset header"""
+    return {
+        'series_number': _number(dicom_data, 'SeriesNumber', int, 0),
+        'series_description': _text(dicom_data, 'SeriesDescription')[:200],
+        'modality': _text(dicom_data, 'Modality', 'OT')[:10],
+        'body_part_examined': _text(dicom_data, 'BodyPartExamined')[:100],
+    }
+
+
+def image_fields(dicom_data):
+    """DicomImage column values from a dataset header"""
+    spacing = dicom_data.get('PixelSpacing')
+    spacing_x = spacing_y = None
+    try:
+        if spacing is not None and len(spacing) >= 2:
+            spacing_x, spacing_y = float(spacing[0]), float(spacing[1])
+    except (TypeError, ValueError):
+        pass
+    instance_number = _number(dicom_data, 'InstanceNumber', int, 0)
+    return {
+        'instance_number': instance_number,
+        'image_number': instance_number,
+        'rows': _number(dicom_data, 'Rows', int, 0),
+        'columns': _number(dicom_data, 'Columns', int, 0),
+        'bits_allocated': _number(dicom_data, 'BitsAllocated', int, 16),
+        'samples_per_pixel': _number(dicom_data, 'SamplesPerPixel', int, 1),
+        'photometric_interpretation': _text(dicom_data, 'PhotometricInterpretation', 'MONOCHROME2')[:50],
+        'pixel_spacing': _text(dicom_data, 'PixelSpacing')[:100],
+        'pixel_spacing_x': spacing_x,
+        'pixel_spacing_y': spacing_y,
+        'slice_thickness': _number(dicom_data, 'SliceThickness', float),
+        # Improved window/level defaults for better visibility when the header has none
+        'window_center': _number(dicom_data, 'WindowCenter', float, 40.0),
+        'window_width': _number(dicom_data, 'WindowWidth', float, 400.0),
+    }
+
+
+class PendingImage:
+    """One queued instance; image_id, created and error are filled in when its batch is flushed"""
+
+    def __init__(self, header, file_path, user, facility, statistics=None, needs_statistics=False, sha256=''):
+        self.study_uid = _text(header, 'StudyInstanceUID') or f'STUDY_{uuid.uuid4()}'
+        self.series_uid = _text(header, 'SeriesInstanceUID') or f'SERIES_{uuid.uuid4()}'
+        self.sop_instance_uid = _text(header, 'SOPInstanceUID') or f'IMAGE_{uuid.uuid4()}'
+        self.file_path = file_path
+        self.sha256 = sha256 or ''
+        self.header = header
+        self.statistics = statistics
+        self.needs_statistics = needs_statistics
+        self.user = user
+        self.facility = facility
+        self.study_id = None
+        self.series_id = None
+        self.image_id = None
+        self.created = False
+        self.flushed = False
+        self.error = None
+
+
+class IngestWriter:
+    """Accumulates ingested instances and writes them in one transaction per batch"""
+
+    def __init__(self, user=None, facility=None, batch_size=DEFAULT_BATCH_SIZE, record_statistics=True):
+        self.user = user
+        self.facility = facility
+        self.batch_size = batch_size
+        self.record_statistics = record_statistics
+        self.study_pks = {}
+        self.series_pks = {}
+        self.pending = []
+        self.created_study_ids = []
+        self.created_series_ids = []
+        self.series_ids = set()
+        self.images_created = 0
+        self.duplicates = 0
+        self._lock = threading.RLock()
+
+    def add(self, dicom_data, file_path, facility=None, sha256=''):
+        """Queue one instance stored at file_path (a storage name) whose content hash, if known, is sha256"""
+        header = describe(dicom_data)
+        statistics, needs_statistics = None, self.record_statistics
+        if needs_statistics and not isinstance(dicom_data, dict) and 'PixelData' in dicom_data:
+            statistics, needs_statistics = self._compute_statistics(dicom_data, header), False
+        item = PendingImage(header, file_path, self.user, facility or self.facility, statistics, needs_statistics,
+                            sha256)
+        with self._lock:
+            self.pending.append(item)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+        return item
+
+    def flush(self):
+        """Write every queued instance; returns the flushed handles"""
+        with self._lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return batch
+            self._load_statistics(batch)
+            for attempt in range(2):
+                state = self._snapshot()
+                try:
+                    with transaction.atomic():
+                        self._resolve_studies(batch)
+                        self._resolve_series(batch)
+                        self._write_images(batch)
+                    break
+                except Exception as e:
+                    # The rows were rolled back, so forget any primary keys learned in this batch
+                    self._restore(state)
+                    if attempt == 0 and self._forget(batch):
+                        # A cached key may name a study or series deleted since it was learned; look them up again
+                        logger.warning(f"Ingest batch of {len(batch)} images failed ({e}); retrying with fresh lookups")
+                        for item in batch:
+                            item.created = False
+                        continue
+                    logger.error(f"Ingest batch of {len(batch)} images failed: {e}")
+                    for item in batch:
+                        item.study_id = item.series_id = item.image_id = None
+                        item.created, item.error = False, str(e)
+            for item in batch:
+                item.flushed = True
+                item.header = item.statistics = None
+            return batch
+
+    def _snapshot(self):
+        return (dict(self.study_pks), dict(self.series_pks), list(self.created_study_ids),
+                list(self.created_series_ids), set(self.series_ids), self.images_created, self.duplicates)
+
+    def _restore(self, state):
+        (self.study_pks, self.series_pks, self.created_study_ids, self.created_series_ids, self.series_ids,
+         self.images_created, self.duplicates) = state
+
+    def _forget(self, batch):
+        """Drop the cached study and series keys a failed batch used; True if any were dropped"""
+        dropped = False
+        for item in batch:
+            dropped |= self.study_pks.pop(item.study_uid, None) is not None
+            dropped |= self.series_pks.pop((item.study_id, item.series_uid), None) is not None
+        return dropped
+
+    def _compute_statistics(self, dicom_data, header):
+        try:
+            return intensity_index.statistics_fields(dicom_data, _text(header, 'Modality', 'OT'),
+                                                     _text(header, 'BodyPartExamined'))
+        except Exception as e:
+            logger.warning(f"Could not compute intensity statistics for {_text(header, 'SOPInstanceUID')}: {e}")
+            return None
+
+    def _load_statistics(self, batch):
+        """Statistics of items queued without pixels, read from storage before the write transaction opens"""
+        for item in batch:
+            if item.needs_statistics:
+                try:
+                    dicom_data = pydicom.dcmread(default_storage.path(str(item.file_path)), force=True)
+                except Exception as e:
+                    logger.warning(f"Could not read {item.file_path} for intensity statistics: {e}")
+                    dicom_data = None
+                if dicom_data is not None:
+                    item.statistics = self._compute_statistics(dicom_data, item.header)
+                item.needs_statistics = False
+
+    def _resolve_studies(self, batch):
+        from .models import DicomStudy
+        missing = {item.study_uid: item for item in batch if item.study_uid not in self.study_pks}
+        if missing:
+            self.study_pks.update(DicomStudy.objects.filter(study_instance_uid__in=list(missing))
+                                  .values_list('study_instance_uid', 'id'))
+            new = [uid for uid in missing if uid not in self.study_pks]
+            DicomStudy.objects.bulk_create(
+                [DicomStudy(study_instance_uid=uid, **study_fields(missing[uid].header, missing[uid].user,
+                                                                   missing[uid].facility)) for uid in new],
+                ignore_conflicts=True)
+            created = dict(DicomStudy.objects.filter(study_instance_uid__in=new).values_list('study_instance_uid', 'id'))
+            self.study_pks.update(created)
+            self.created_study_ids.extend(created.values())
+        for item in batch:
+            item.study_id = self.study_pks[item.study_uid]
+
+    def _resolve_series(self, batch):
+        from .models import DicomSeries
+        missing = {(item.study_id, item.series_uid): item for item in batch
+                   if (item.study_id, item.series_uid) not in self.series_pks}
+        if missing:
+            existing = DicomSeries.objects.filter(study_id__in={key[0] for key in missing},
+                                                  series_instance_uid__in={key[1] for key in missing})
+            self.series_pks.update(((study_id, uid), pk) for study_id, uid, pk in
+                                   existing.values_list('study_id', 'series_instance_uid', 'id'))
+            new = [key for key in missing if key not in self.series_pks]
+            DicomSeries.objects.bulk_create(
+                [DicomSeries(study_id=key[0], series_instance_uid=key[1], **series_fields(missing[key].header))
+                 for key in new], ignore_conflicts=True)
+            created = DicomSeries.objects.filter(study_id__in={key[0] for key in new},
+                                                 series_instance_uid__in={key[1] for key in new})
+            for study_id, uid, pk in created.values_list('study_id', 'series_instance_uid', 'id'):
+                if (study_id, uid) in missing and (study_id, uid) not in self.series_pks:
+                    self.series_pks[(study_id, uid)] = pk
+                    self.created_series_ids.append(pk)
+        for item in batch:
+            item.series_id = self.series_pks[(item.study_id, item.series_uid)]
+            self.series_ids.add(item.series_id)
+
+    def _write_images(self, batch):
+        from .models import DicomImage
+        keys = {(item.series_id, item.sop_instance_uid) for item in batch}
+        existing = dict(((series_id, uid), pk) for series_id, uid, pk in DicomImage.objects.filter(
+            series_id__in={key[0] for key in keys}, sop_instance_uid__in={key[1] for key in keys},
+        ).values_list('series_id', 'sop_instance_uid', 'id'))
+
+        new_rows = {}
+        for item in batch:
+            key = (item.series_id, item.sop_instance_uid)
+            if key not in existing and key not in new_rows:
+                new_rows[key] = item
+                item.created = True
+        DicomImage.objects.bulk_create(
+            [DicomImage(series_id=item.series_id, sop_instance_uid=item.sop_instance_uid, file_path=item.file_path,
+                        content_sha256=item.sha256, **image_fields(item.header)) for item in new_rows.values()],
+            ignore_conflicts=True)
+        if new_rows:
+            existing.update(((series_id, uid), pk) for series_id, uid, pk in DicomImage.objects.filter(
+                series_id__in={key[0] for key in new_rows}, sop_instance_uid__in={key[1] for key in new_rows},
+            ).values_list('series_id', 'sop_instance_uid', 'id'))
+
+        for item in batch:
+            item.image_id = existing.get((item.series_id, item.sop_instance_uid))
+        self.images_created += sum(1 for item in batch if item.created)
+        self.duplicates += sum(1 for item in batch if not item.created)
+        intensity_index.record_images([(item.image_id, item.statistics) for item in new_rows.values()
+                                       if item.statistics is not None and item.image_id is not None])
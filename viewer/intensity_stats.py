@@ -0,0 +1,346 @@
+"""
+Per-image and per-series intensity statistics, computed once at ingest.
+
+Every image gets its range, mean/std, percentiles and a compact histogram in
+modality units (HU for CT) when it is stored, from a single `np.bincount`
+over its integer values. Histograms use power-of-two bin widths aligned to
+multiples of the width, so the per-series histogram is an exact sum of the
+image histograms and never touches pixel data. Auto-windowing, histogram
+display and window-preset suggestions read these rows instead of scanning
+the full image on every render.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAX_HISTOGRAM_BINS = 512
+MAX_EXACT_SPAN = 1 << 22
+PERCENTILES = (0.5, 1, 5, 25, 50, 75, 95, 99, 99.5)
+
+# CT presets as (name, window center, window width, tissue band in HU, minimum body fraction)
+CT_WINDOW_PRESETS = (
+    ('soft_tissue', 40, 400, (-100, 100), 0.0),
+    ('lung', -600, 1500, (-950, -300), 0.10),
+    ('bone', 400, 1800, (300, 2000), 0.02),
+    ('brain', 40, 80, (15, 50), 0.30),
+)
+CT_BODY_THRESHOLD = -990  # Air outside the patient and padding values are not counted
+
+# Projection modalities have long tails from collimation and markers
+PROJECTION_MODALITIES = ('CR', 'DX', 'MG', 'XA', 'RF', 'DR')
+
+
+class IntensityStatistics:
+    """Range, moments, percentiles and aligned histogram of a set of modality values"""
+
+    def __init__(self, pixel_count, min_value, max_value, mean, std, percentiles, histogram):
+        self.pixel_count = pixel_count
+        self.min_value = min_value
+        self.max_value = max_value
+        self.mean = mean
+        self.std = std
+        self.percentiles = percentiles
+        self.histogram = histogram
+
+    def percentile(self, p):
+        """Stored percentile, or one interpolated from the histogram"""
+        key = _percentile_key(p)
+        if key in self.percentiles:
+            return self.percentiles[key]
+        return float(histogram_percentiles(self.histogram, [p])[0])
+
+    def fraction_between(self, low, high, floor=None):
+        """Fraction of values in [low, high], optionally only among values above floor"""
+        counts = np.asarray(self.histogram['counts'], dtype=np.float64)
+        centres = self.histogram['start'] + (np.arange(len(counts)) + 0.5) * self.histogram['bin_width']
+        total = counts[centres > floor].sum() if floor is not None else counts.sum()
+        if total == 0:
+            return 0.0
+        return float(counts[(centres >= low) & (centres <= high)].sum() / total)
+
+
+def modality_values(pixel_array, slope=1.0, intercept=0.0):
+    """Integer modality values (stored * slope + intercept, rounded) of a greyscale image"""
+    slope = float(slope)
+    intercept = float(intercept)
+    if np.issubdtype(pixel_array.dtype, np.integer) and slope.is_integer() and intercept.is_integer():
+        values = pixel_array.astype(np.int64)
+        if slope != 1:
+            values *= int(slope)
+        if intercept != 0:
+            values += int(intercept)
+        return values.ravel()
+    values = pixel_array.astype(np.float64)
+    if slope != 1 or intercept != 0:
+        values = values * slope + intercept
+    values = values[np.isfinite(values)]
+    return np.rint(values).astype(np.int64).ravel()
+
+
+def bin_width_for_span(start, stop):
+    """Smallest power-of-two width that covers [start, stop] in MAX_HISTOGRAM_BINS aligned bins"""
+    width = 1
+    while (stop // width) - (start // width) + 1 > MAX_HISTOGRAM_BINS:
+        width *= 2
+    return width
+
+
+def compute_statistics(values):
+    """Statistics of a 1D integer array with exact percentiles and an aligned histogram"""
+    if values.size == 0:
+        return None
+    vmin, vmax = int(values.min()), int(values.max())
+    width = bin_width_for_span(vmin, vmax)
+    start = (vmin // width) * width
+
+    if vmax - vmin <= MAX_EXACT_SPAN:
+        # One pass over the pixels; everything else is computed from the full-resolution counts
+        full = np.bincount(values - vmin)
+        levels = np.arange(vmin, vmax + 1, dtype=np.float64)
+        count = int(values.size)
+        mean = float(np.dot(full, levels) / count)
+        std = float(np.sqrt(max(np.dot(full, (levels - mean) ** 2) / count, 0.0)))
+        exact = histogram_percentiles({'start': vmin, 'bin_width': 1, 'counts': full}, PERCENTILES)
+        counts = np.bincount((np.arange(len(full)) + (vmin - start)) // width, weights=full)
+    else:
+        count = int(values.size)
+        mean = float(values.mean())
+        std = float(values.std())
+        exact = np.percentile(values, PERCENTILES)
+        counts = np.bincount((values - start) // width)
+
+    return IntensityStatistics(
+        pixel_count=count,
+        min_value=float(vmin),
+        max_value=float(vmax),
+        mean=mean,
+        std=std,
+        percentiles={_percentile_key(p): float(v) for p, v in zip(PERCENTILES, exact)},
+        histogram={'start': start, 'bin_width': width, 'counts': [int(c) for c in counts]},
+    )
+
+
+def histogram_percentiles(histogram, percentiles):
+    """Percentiles (numpy 'linear' method) of the values summarised by an aligned histogram
+
+    Exact for unit-width histograms; wider bins report the bin centre.
+    """
+    counts = np.asarray(histogram['counts'], dtype=np.int64)
+    width = histogram['bin_width']
+    cumulative = np.cumsum(counts)
+    total = int(cumulative[-1]) if len(cumulative) else 0
+    if total == 0:
+        return np.full(len(percentiles), np.nan)
+
+    ranks = np.asarray(percentiles, dtype=np.float64) / 100.0 * (total - 1)
+    lower = np.floor(ranks)
+    upper = np.ceil(ranks)
+    offset = (width - 1) / 2.0
+
+    def value_at(rank):
+        return histogram['start'] + np.searchsorted(cumulative, rank, side='right') * width + offset
+
+    low_values = value_at(lower)
+    return low_values + (ranks - lower) * (value_at(upper) - low_values)
+
+
+def merge_statistics(parts):
+    """Exact series statistics from per-image IntensityStatistics without rereading pixels"""
+    parts = [p for p in parts if p is not None and p.pixel_count]
+    if not parts:
+        return None
+    min_value = min(p.min_value for p in parts)
+    max_value = max(p.max_value for p in parts)
+    width = max(p.histogram['bin_width'] for p in parts)
+    width = max(width, bin_width_for_span(int(min_value), int(max_value)))
+    start = (int(min_value) // width) * width
+    n_bins = (int(max_value) - start) // width + 1
+
+    # Aligned power-of-two bins fold into the coarser grid without splitting any bin
+    counts = np.zeros(n_bins, dtype=np.int64)
+    for part in parts:
+        part_counts = np.asarray(part.histogram['counts'], dtype=np.int64)
+        lower_edges = part.histogram['start'] + np.arange(len(part_counts)) * part.histogram['bin_width']
+        counts += np.bincount((lower_edges - start) // width, weights=part_counts, minlength=n_bins).astype(np.int64)
+
+    count = sum(p.pixel_count for p in parts)
+    mean = sum(p.mean * p.pixel_count for p in parts) / count
+    second_moment = sum((p.std ** 2 + p.mean ** 2) * p.pixel_count for p in parts) / count
+    histogram = {'start': start, 'bin_width': width, 'counts': [int(c) for c in counts]}
+    return IntensityStatistics(
+        pixel_count=count,
+        min_value=min_value,
+        max_value=max_value,
+        mean=float(mean),
+        std=float(np.sqrt(max(second_moment - mean * mean, 0.0))),
+        percentiles={_percentile_key(p): float(v) for p, v in zip(PERCENTILES, histogram_percentiles(histogram, PERCENTILES))},
+        histogram=histogram,
+    )
+
+
+def suggest_windows(statistics, modality, body_part=''):
+    """Window presets ranked for this content; the first entry is the suggested default"""
+    modality = (modality or '').upper()
+    if modality == 'CT':
+        presets = []
+        head = any(word in (body_part or '').upper() for word in ('HEAD', 'BRAIN', 'SKULL'))
+        for name, center, width, (low, high), minimum in CT_WINDOW_PRESETS:
+            if name == 'brain' and not head:
+                continue
+            fraction = statistics.fraction_between(low, high, floor=CT_BODY_THRESHOLD)
+            if fraction >= minimum:
+                presets.append({'name': name, 'window_center': center, 'window_width': width,
+                                'fraction': round(fraction, 4)})
+        if head:
+            presets.sort(key=lambda preset: preset['name'] != 'brain')
+        return presets
+
+    low_p, high_p = (0.5, 99.5) if modality in PROJECTION_MODALITIES else (1, 99)
+    low, high = statistics.percentile(low_p), statistics.percentile(high_p)
+    if high <= low:
+        low, high = statistics.min_value, statistics.max_value
+    presets = [{'name': 'auto', 'window_center': (low + high) / 2.0, 'window_width': max(high - low, 1.0)}]
+    if statistics.max_value > statistics.min_value:
+        presets.append({
+            'name': 'full_range',
+            'window_center': (statistics.min_value + statistics.max_value) / 2.0,
+            'window_width': statistics.max_value - statistics.min_value,
+        })
+    return presets
+
+
+def _percentile_key(p):
+    return f'p{p:g}'
+
+
+def _rescale(dicom_data):
+    slope = float(getattr(dicom_data, 'RescaleSlope', 1) or 1)
+    intercept = float(getattr(dicom_data, 'RescaleIntercept', 0) or 0)
+    return slope, intercept
+
+
+class IntensityIndex:
+    """Writes and reads the stored per-image and per-series intensity statistics"""
+
+    def image_statistics_from_dicom(self, dicom_data):
+        """(statistics, slope, intercept) of a dataset's pixels, or None for colour/pixel-less data"""
+        if int(getattr(dicom_data, 'SamplesPerPixel', 1) or 1) != 1:
+            return None
+        try:
+            pixel_array = dicom_data.pixel_array
+        except Exception:
+            return None
+        slope, intercept = _rescale(dicom_data)
+        return compute_statistics(modality_values(pixel_array, slope, intercept)), slope, intercept
+
+    def statistics_fields(self, dicom_data, modality, body_part=''):
+        """ImageIntensityStats field values for a dataset's pixels, or None for colour/pixel-less data"""
+        computed = self.image_statistics_from_dicom(dicom_data)
+        if computed is None or computed[0] is None:
+            return None
+        statistics, slope, intercept = computed
+        window = suggest_windows(statistics, modality, body_part)[0]
+        return {
+            'pixel_count': statistics.pixel_count,
+            'min_value': statistics.min_value,
+            'max_value': statistics.max_value,
+            'mean_value': statistics.mean,
+            'std_value': statistics.std,
+            'rescale_slope': slope,
+            'rescale_intercept': intercept,
+            'percentiles': statistics.percentiles,
+            'histogram': statistics.histogram,
+            'suggested_window_center': window['window_center'],
+            'suggested_window_width': window['window_width'],
+        }
+
+    def record_image(self, image, dicom_data=None):
+        """Compute and store an image's statistics; called once when the image is ingested"""
+        from .models import ImageIntensityStats
+        try:
+            if dicom_data is None or 'PixelData' not in dicom_data:
+                dicom_data = image.load_dicom_data()
+            fields = None
+            if dicom_data is not None:
+                fields = self.statistics_fields(dicom_data, image.series.modality, image.series.body_part_examined)
+            if fields is None:
+                return None
+            row, _ = ImageIntensityStats.objects.update_or_create(image=image, defaults=fields)
+            return row
+        except Exception as e:
+            logger.warning(f"Could not record intensity statistics for image {image.id}: {e}")
+            return None
+
+    def record_images(self, rows):
+        """Bulk-insert precomputed statistics; rows are (image_id, fields) pairs from statistics_fields"""
+        from .models import ImageIntensityStats
+        ImageIntensityStats.objects.bulk_create(
+            [ImageIntensityStats(image_id=image_id, **fields) for image_id, fields in rows], ignore_conflicts=True)
+
+    def refresh_series(self, series):
+        """Aggregate the series row from its image rows, computing any image rows still missing"""
+        from .models import ImageIntensityStats, SeriesIntensityStats
+        from .volume_cache import series_signature
+
+        rows = {row.image_id: row for row in ImageIntensityStats.objects.filter(image__series=series)}
+        for image in series.images.exclude(id__in=list(rows)):
+            row = self.record_image(image)
+            if row is not None:
+                rows[image.id] = row
+
+        statistics = merge_statistics([_row_statistics(row) for row in rows.values()])
+        if statistics is None:
+            return None
+        presets = suggest_windows(statistics, series.modality, series.body_part_examined)
+        row, _ = SeriesIntensityStats.objects.update_or_create(series=series, defaults={
+            'signature': series_signature(series),
+            'image_count': len(rows),
+            'pixel_count': statistics.pixel_count,
+            'min_value': statistics.min_value,
+            'max_value': statistics.max_value,
+            'mean_value': statistics.mean,
+            'std_value': statistics.std,
+            'percentiles': statistics.percentiles,
+            'histogram': statistics.histogram,
+            'window_presets': presets,
+            'suggested_window_center': presets[0]['window_center'],
+            'suggested_window_width': presets[0]['window_width'],
+        })
+        return row
+
+    def series_statistics(self, series):
+        """Stored series row, rebuilt only when the series' image set has changed"""
+        from .models import SeriesIntensityStats
+        from .volume_cache import series_signature
+
+        row = SeriesIntensityStats.objects.filter(series=series).first()
+        if row is not None and row.signature == series_signature(series):
+            return row
+        return self.refresh_series(series)
+
+    def refresh_many(self, series_list):
+        """Refresh the series rows touched by an upload, logging rather than failing it"""
+        for series in {s.id: s for s in series_list if s is not None}.values():
+            try:
+                self.refresh_series(series)
+            except Exception as e:
+                logger.warning(f"Could not aggregate intensity statistics for series {series.id}: {e}")
+
+
+def _row_statistics(row):
+    return IntensityStatistics(
+        pixel_count=row.pixel_count,
+        min_value=row.min_value,
+        max_value=row.max_value,
+        mean=row.mean_value,
+        std=row.std_value,
+        percentiles=row.percentiles,
+        histogram=row.histogram,
+    )
+
+
+# Global intensity index instance
+intensity_index = IntensityIndex()
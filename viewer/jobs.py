@@ -0,0 +1,283 @@
+"""
+Durable, database-backed job queue.
+
+Bulk uploads, upload-session ingests and rotating MIP renders used to run
+on daemon threads started inside the web worker: a restart or a crashed
+worker lost them silently, nothing capped how many ran at once, and their
+outcome lived only in the cache. Now each is a `Job` row naming a task (the
+dotted path of a module-level function, see viewer.tasks), its JSON
+payload and its queue.
+
+`JobQueue.claim` leases the oldest due job of a queue whose running jobs
+are below its JOB_QUEUE_CONCURRENCY limit. The claim is a conditional
+UPDATE guarded by the job's attempt count, so of several workers racing for
+a job only one gets it. While a job runs, a heartbeat thread renews its
+lease every JOB_HEARTBEAT_SECONDS and saves its progress. A job whose
+lease runs out (its worker died) is queued again. A job that raises is
+retried after an exponential backoff until it has used its max_attempts;
+then it fails, and the task's optional `on_failure(job)` hook runs.
+
+`JobWorker` (run by `manage.py run_job_worker`) claims jobs and runs each
+in a child process, so a task that crashes or leaks memory takes down only
+that process.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'default'
+DEFAULT_CONCURRENCY = 1
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_HEARTBEAT_SECONDS = 10
+DEFAULT_RETRY_DELAY_SECONDS = 30
+MAX_RETRY_DELAY_SECONDS = 3600
+# Due jobs looked at per claim; the rest wait for the next poll
+CLAIM_CANDIDATES = 10
+
+
+def _task_path(task):
+    return task if isinstance(task, str) else f'{task.__module__}.{task.__qualname__}'
+
+
+class JobQueue:
+    """Enqueues jobs and moves them through their lease, retry and completion states"""
+
+    def concurrency(self, queue):
+        limits = getattr(settings, 'JOB_QUEUE_CONCURRENCY', {})
+        return limits.get(queue, limits.get(DEFAULT_QUEUE, DEFAULT_CONCURRENCY))
+
+    def lease_seconds(self):
+        return getattr(settings, 'JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+
+    def retry_delay(self, attempts):
+        """Seconds before retrying a job that has failed attempts times: doubling, capped"""
+        base = getattr(settings, 'JOB_RETRY_DELAY_SECONDS', DEFAULT_RETRY_DELAY_SECONDS)
+        return min(MAX_RETRY_DELAY_SECONDS, base * 2 ** max(0, attempts - 1))
+
+    def enqueue(self, task, payload=None, queue=DEFAULT_QUEUE, reference='', max_attempts=None, delay=0):
+        """New queued job running task(job, **payload); task is a function or its dotted path"""
+        from .models import Job
+        path = _task_path(task)
+        import_string(path)  # A misspelt task fails here, in the request, rather than in the worker
+        return Job.objects.create(
+            task=path, payload=payload or {}, queue=queue, reference=str(reference),
+            max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+            run_after=timezone.now() + timedelta(seconds=delay),
+        )
+
+    def active(self, task, reference):
+        """The queued or running job of task for reference, if any"""
+        from .models import Job
+        return Job.objects.filter(task=_task_path(task), reference=str(reference),
+                                  status__in=('queued', 'running')).first()
+
+    def latest(self, reference):
+        """The most recent job enqueued for reference, or None"""
+        from .models import Job
+        return Job.objects.filter(reference=str(reference)).order_by('-created_at', '-id').first()
+
+    def expire_leases(self):
+        """Queue again (or, out of attempts, fail) running jobs whose worker stopped renewing the lease"""
+        from .models import Job
+        now = timezone.now()
+        for job in Job.objects.filter(status='running', lease_expires_at__lte=now):
+            logger.warning(f"{job} lost its lease (worker {job.worker}); attempt {job.attempts} of {job.max_attempts}")
+            # Guarded by the lease, in case a heartbeat renewed it just now
+            self._finish_attempt(job, f'Worker {job.worker} stopped renewing the lease',
+                                 lease_expires_at=job.lease_expires_at)
+
+    def claim(self, queues, worker):
+        """Lease the next due job of the first of queues that is under its concurrency limit, or None"""
+        from .models import Job
+        self.expire_leases()
+        for queue in queues:
+            limit = self.concurrency(queue)
+            if Job.objects.filter(queue=queue, status='running').count() >= limit:
+                continue
+            now = timezone.now()
+            for job in Job.objects.filter(queue=queue, status='queued', run_after__lte=now)[:CLAIM_CANDIDATES]:
+                claimed = Job.objects.filter(pk=job.pk, status='queued', attempts=job.attempts).update(
+                    status='running', worker=worker, attempts=F('attempts') + 1, started_at=now, heartbeat_at=now,
+                    lease_expires_at=now + timedelta(seconds=self.lease_seconds()))
+                if not claimed:
+                    continue
+                if Job.objects.filter(queue=queue, status='running').count() > limit:
+                    # Another worker claimed a job of this queue at the same moment; hand this one back
+                    Job.objects.filter(pk=job.pk, worker=worker, status='running').update(
+                        status='queued', worker='', attempts=F('attempts') - 1, lease_expires_at=None)
+                    break
+                return Job.objects.get(pk=job.pk)
+        return None
+
+    def _owned(self, job, **conditions):
+        from .models import Job
+        return Job.objects.filter(pk=job.pk, status='running', worker=job.worker, attempts=job.attempts, **conditions)
+
+    def heartbeat(self, job, progress=None):
+        """Renew a running job's lease (saving its progress); False if the job is no longer this worker's"""
+        fields = {'heartbeat_at': timezone.now(),
+                  'lease_expires_at': timezone.now() + timedelta(seconds=self.lease_seconds())}
+        if progress is not None:
+            fields['progress'] = progress
+        return bool(self._owned(job).update(**fields))
+
+    def succeed(self, job, result=None, progress=None):
+        fields = {'progress': progress} if progress is not None else {}
+        self._owned(job).update(status='succeeded', result=result if result is not None else {},
+                                finished_at=timezone.now(), lease_expires_at=None, error='', **fields)
+
+    def fail(self, job, error):
+        """Record a failed attempt: retried after a backoff while attempts remain; returns the new status"""
+        logger.error(f"{job} attempt {job.attempts} of {job.max_attempts} failed: {error}")
+        return self._finish_attempt(job, error)
+
+    def _finish_attempt(self, job, error, **conditions):
+        if job.attempts < job.max_attempts:
+            updated = self._owned(job, **conditions).update(
+                status='queued', worker='', lease_expires_at=None, error=error,
+                run_after=timezone.now() + timedelta(seconds=self.retry_delay(job.attempts)))
+            return 'queued' if updated else None
+        if not self._owned(job, **conditions).update(status='failed', error=error, lease_expires_at=None,
+                                                     finished_at=timezone.now()):
+            return None
+        job.status, job.error = 'failed', error
+        on_failure = getattr(import_string(job.task), 'on_failure', None)
+        if on_failure is not None:
+            try:
+                on_failure(job)
+            except Exception as e:
+                logger.error(f"on_failure hook of {job} failed: {e}")
+        return 'failed'
+
+    def _beat(self, job, stop):
+        interval = getattr(settings, 'JOB_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)
+        try:
+            while not stop.wait(interval):
+                source = getattr(job, 'progress_source', None)
+                if not self.heartbeat(job, source() if source else None):
+                    logger.warning(f"{job} is no longer leased by {job.worker}")
+        finally:
+            connections.close_all()
+
+    def run(self, job):
+        """Run a claimed job in this process, renewing its lease meanwhile; returns its new status"""
+        stop = threading.Event()
+        beat = threading.Thread(target=self._beat, args=(job, stop), daemon=True)
+        beat.start()
+        try:
+            result = import_string(job.task)(job, **job.payload)
+        except Exception as e:
+            logger.exception(f"{job} raised")
+            return self.fail(job, f'{type(e).__name__}: {e}')
+        finally:
+            stop.set()
+            beat.join()
+        source = getattr(job, 'progress_source', None)
+        self.succeed(job, result, source() if source else None)
+        return 'succeeded'
+
+    def run_pending(self, queues, worker='inline'):
+        """Claim and run due jobs in this process until none is left (tests, maintenance); returns the count"""
+        count = 0
+        while True:
+            job = self.claim(queues, worker)
+            if job is None:
+                return count
+            self.run(job)
+            count += 1
+
+
+def _run_job(job_id):
+    """Child process entry point: run one claimed job"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    # An interrupted terminal stops the worker, which lets its running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    from .models import Job
+    try:
+        job_queue.run(Job.objects.get(pk=job_id))
+    finally:
+        connections.close_all()
+
+
+class JobWorker:
+    """Claims jobs of some queues and runs each in its own process, at most processes at a time"""
+
+    def __init__(self, queues, processes=1, poll_interval=1.0, name=None):
+        self.queues = list(queues)
+        self.processes = max(1, processes)
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.children = {}
+        self.stopping = False
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+
+    def stop(self, *args):
+        """Stop claiming jobs; run() returns once the running ones have finished"""
+        self.stopping = True
+
+    def start(self, job):
+        # The child must open its own database connections rather than share the parent's
+        connections.close_all()
+        process = self.context.Process(target=_run_job, args=(job.pk,), name=f'job-{job.pk}')
+        process.start()
+        self.children[job.pk] = (process, job)
+        logger.info(f"Started {job} in process {process.pid}")
+
+    def reap(self):
+        """Collect finished children; a job whose process died without an outcome counts as a failed attempt"""
+        from .models import Job
+        for pk, (process, job) in list(self.children.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self.children[pk]
+            if Job.objects.filter(pk=pk, status='running', worker=self.name, attempts=job.attempts).exists():
+                job_queue.fail(job, f'Worker process exited with code {process.exitcode}')
+
+    def run_once(self):
+        """Reap finished children and start due jobs in free slots; returns the number started"""
+        self.reap()
+        started = 0
+        while not self.stopping and len(self.children) < self.processes:
+            job = job_queue.claim(self.queues, self.name)
+            if job is None:
+                break
+            self.start(job)
+            started += 1
+        return started
+
+    def run(self, burst=False):
+        """Work until stopped; with burst, only until no job is due and none is running"""
+        logger.info(f"Job worker {self.name} serving queues {', '.join(self.queues)} with {self.processes} processes")
+        while not self.stopping:
+            started = self.run_once()
+            if burst and not started and not self.children:
+                break
+            time.sleep(self.poll_interval)
+        while self.children:
+            self.reap()
+            time.sleep(self.poll_interval)
+
+
+# Global job queue instance
+job_queue = JobQueue()
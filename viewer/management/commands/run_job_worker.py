@@ -0,0 +1,39 @@
+"""
+Django management command to run background jobs from the job queue
+"""
+import logging
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from viewer.jobs import JobWorker
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (uploads, reconstructions), each in its own process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help='Queue to serve; repeat for several (default: every queue in JOB_QUEUE_CONCURRENCY)')
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'JOB_WORKER_PROCESSES', 4),
+                            help='Jobs run at once, each in its own process')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between looks for due jobs')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no job is due and none is running')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        queues = options['queues'] or list(getattr(settings, 'JOB_QUEUE_CONCURRENCY', {'default': 1}))
+        worker = JobWorker(queues, processes=options['processes'], poll_interval=options['poll_interval'])
+
+        # SIGTERM/SIGINT stop claiming jobs; the worker exits once its running jobs have finished
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+
+        self.stdout.write(f"Job worker {worker.name} serving queues: {', '.join(queues)}")
+        worker.run(burst=options['burst'])
+        self.stdout.write("Job worker stopped")
@@ -8,9 +8,16 @@ import time
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from pynetdicom import AE, evt, debug_logger
-from pynetdicom.sop_class import PatientRootQueryRetrieveInformationModelFind
+from pynetdicom.sop_class import (
+    PatientRootQueryRetrieveInformationModelFind,
+    PatientRootQueryRetrieveInformationModelMove,
+    StudyRootQueryRetrieveInformationModelFind,
+    StudyRootQueryRetrieveInformationModelMove,
+    Verification,
+)
 from pydicom.dataset import Dataset
-from viewer.models import Facility, DicomStudy, DicomSeries, DicomImage
+from viewer.ingest import IngestWriter
+from viewer.models import Facility
 from django.contrib.auth.models import User
 import pydicom
 from pathlib import Path
@@ -22,6 +29,9 @@ logger = logging.getLogger(__name__)
 class DicomSCPServer:
     def __init__(self):
         self.ae = AE(ae_title='NOCTIS_SERVER')
+        # One ingest writer per association, so its study/series key maps live only as long as the association
+        self.writers = {}
+        self.writers_lock = threading.Lock()
         self.setup_scp()
         
     def setup_scp(self):
@@ -62,11 +72,26 @@ class DicomSCPServer:
         self.ae.add_supported_context(StudyRootQueryRetrieveInformationModelMove)
         self.ae.add_supported_context(Verification)
         
-        # Bind event handlers
-        self.ae.on_c_store = self.handle_store
-        self.ae.on_c_echo = self.handle_echo
-        self.ae.on_c_find = self.handle_find
+        # Event handlers, bound when the server starts
+        self.handlers = [
+            (evt.EVT_C_STORE, self.handle_store),
+            (evt.EVT_C_ECHO, self.handle_echo),
+            (evt.EVT_C_FIND, self.handle_find),
+            (evt.EVT_CONN_CLOSE, self.handle_close),
+        ]
         
+    def writer_for(self, assoc):
+        """The ingest writer of an association, created on its first C-STORE"""
+        with self.writers_lock:
+            if assoc not in self.writers:
+                self.writers[assoc] = IngestWriter()
+            return self.writers[assoc]
+    
+    def handle_close(self, event):
+        """Drop the closed association's writer; every instance it received is already committed"""
+        with self.writers_lock:
+            self.writers.pop(event.assoc, None)
+    
     def handle_echo(self, event):
         """Handle C-ECHO requests (verification)"""
         logger.info(f"Received C-ECHO from {event.assoc.requestor.ae_title}")
@@ -99,7 +124,7 @@ class DicomSCPServer:
                 facility = None
             
             # Save the DICOM file and create database records
-            success = self.save_dicom_file(dataset, facility)
+            success = self.save_dicom_file(dataset, facility, self.writer_for(event.assoc))
             
             if success:
                 logger.info("Successfully stored DICOM image")
@@ -112,7 +137,7 @@ class DicomSCPServer:
             logger.error(f"Error handling C-STORE: {str(e)}")
             return 0xA700  # Out of resources
     
-    def save_dicom_file(self, dataset, facility=None):
+    def save_dicom_file(self, dataset, facility=None, writer=None):
         """Save DICOM file and create database records"""
         try:
             # Create media directory if it doesn't exist
@@ -128,115 +153,33 @@ class DicomSCPServer:
             # Save DICOM file
             dataset.save_as(str(file_path), write_like_original=False)
             
-            # Create or get study
-            study_uid = dataset.get('StudyInstanceUID')
-            if not study_uid:
+            if not dataset.get('StudyInstanceUID'):
                 logger.error("No StudyInstanceUID found in dataset")
                 return False
-                
-            study, created = DicomStudy.objects.get_or_create(
-                study_instance_uid=study_uid,
-                defaults={
-                    'patient_name': str(dataset.get('PatientName', 'Unknown')),
-                    'patient_id': str(dataset.get('PatientID', 'Unknown')),
-                    'study_date': self.parse_dicom_date(dataset.get('StudyDate')),
-                    'study_time': self.parse_dicom_time(dataset.get('StudyTime')),
-                    'study_description': str(dataset.get('StudyDescription', '')),
-                    'modality': str(dataset.get('Modality', 'OT')),
-                    'institution_name': str(dataset.get('InstitutionName', '')),
-                    'accession_number': str(dataset.get('AccessionNumber', '')),
-                    'referring_physician': str(dataset.get('ReferringPhysicianName', '')),
-                    'facility': facility
-                }
-            )
-            
-            if created:
-                logger.info(f"Created new study: {study_uid}")
-            
-            # Create or get series
-            series_uid = dataset.get('SeriesInstanceUID')
-            if not series_uid:
+            if not dataset.get('SeriesInstanceUID'):
                 logger.error("No SeriesInstanceUID found in dataset")
                 return False
-                
-            series, created = DicomSeries.objects.get_or_create(
-                series_instance_uid=series_uid,
-                study=study,
-                defaults={
-                    'series_number': dataset.get('SeriesNumber', 1),
-                    'series_description': str(dataset.get('SeriesDescription', '')),
-                    'modality': str(dataset.get('Modality', 'OT')),
-                    'body_part_examined': str(dataset.get('BodyPartExamined', '')),
-                    'slice_thickness': self.parse_decimal_string(dataset.get('SliceThickness')),
-                    'image_orientation_patient': str(dataset.get('ImageOrientationPatient', '')),
-                    'image_position_patient': str(dataset.get('ImagePositionPatient', ''))
-                }
-            )
-            
-            if created:
-                logger.info(f"Created new series: {series_uid}")
             
-            # Create image record
-            image = DicomImage.objects.create(
-                sop_instance_uid=sop_instance_uid,
-                series=series,
-                instance_number=dataset.get('InstanceNumber', 1),
-                file_path=f'dicom_files/{filename}',
-                window_center=self.parse_decimal_string(dataset.get('WindowCenter')),
-                window_width=self.parse_decimal_string(dataset.get('WindowWidth')),
-                rows=dataset.get('Rows', 512),
-                columns=dataset.get('Columns', 512),
-                pixel_spacing=str(dataset.get('PixelSpacing', '')),
-                slice_location=self.parse_decimal_string(dataset.get('SliceLocation'))
-            )
-            
-            logger.info(f"Created new image: {sop_instance_uid}")
+            # Success is only reported once the rows are committed
+            writer = writer or IngestWriter()
+            pending = writer.add(dataset, f'dicom_files/{filename}', facility=facility)
+            if not pending.flushed:
+                self.flush(writer)
+            if pending.error:
+                logger.error(f"Failed to store image {sop_instance_uid}: {pending.error}")
+                return False
+            logger.info(f"Stored image: {sop_instance_uid}")
             return True
             
         except Exception as e:
             logger.error(f"Error saving DICOM file: {str(e)}")
             return False
     
-    def parse_dicom_date(self, date_str):
-        """Parse DICOM date string to Python date"""
-        if not date_str:
-            return None
-        try:
-            from datetime import datetime
-            return datetime.strptime(str(date_str), '%Y%m%d').date()
-        except:
-            return None
-    
-    def parse_dicom_time(self, time_str):
-        """Parse DICOM time string to Python time"""
-        if not time_str:
-            return None
-        try:
-            from datetime import datetime
-            # Handle different time formats
-            time_str = str(time_str)
-            if '.' in time_str:
-                time_str = time_str.split('.')[0]  # Remove fractional seconds
-            if len(time_str) == 6:
-                return datetime.strptime(time_str, '%H%M%S').time()
-            elif len(time_str) == 4:
-                return datetime.strptime(time_str, '%H%M').time()
-            elif len(time_str) == 2:
-                return datetime.strptime(time_str, '%H').time()
-        except:
-            pass
-        return None
-    
-    def parse_decimal_string(self, value):
-        """Parse DICOM decimal string to float"""
-        if not value:
-            return None
-        try:
-            if isinstance(value, (list, tuple)) and len(value) > 0:
-                return float(value[0])
-            return float(value)
-        except:
-            return None
+    def flush(self, writer):
+        """Commit a writer's queued instances; each handle records whether its rows were written"""
+        for pending in writer.flush():
+            if not pending.error and not pending.created:
+                logger.info(f"Image already stored: {pending.sop_instance_uid}")
     
     def start_server(self, port=11112):
         """Start the DICOM SCP server"""
@@ -244,7 +187,7 @@ class DicomSCPServer:
         logger.info(f"AE Title: {self.ae.ae_title}")
         
         # Start the server
-        self.ae.start_server(('', port), block=True)
+        self.ae.start_server(('', port), block=True, evt_handlers=self.handlers)
 
 class Command(BaseCommand):
     help = 'Start DICOM SCP server to receive images from remote facilities'
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewer', '0008_aianalysis_model_version_aianalysis_processing_time_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeriesIntensityStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(blank=True, max_length=40)),
+                ('image_count', models.IntegerField(default=0)),
+                ('pixel_count', models.BigIntegerField(default=0)),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('mean_value', models.FloatField()),
+                ('std_value', models.FloatField()),
+                ('percentiles', models.JSONField(default=dict)),
+                ('histogram', models.JSONField(default=dict)),
+                ('window_presets', models.JSONField(default=list)),
+                ('suggested_window_center', models.FloatField(blank=True, null=True)),
+                ('suggested_window_width', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('series', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='intensity_stats', to='viewer.dicomseries')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImageIntensityStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pixel_count', models.BigIntegerField(default=0)),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('mean_value', models.FloatField()),
+                ('std_value', models.FloatField()),
+                ('rescale_slope', models.FloatField(default=1.0)),
+                ('rescale_intercept', models.FloatField(default=0.0)),
+                ('percentiles', models.JSONField(default=dict)),
+                ('histogram', models.JSONField(default=dict)),
+                ('suggested_window_center', models.FloatField(blank=True, null=True)),
+                ('suggested_window_width', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='intensity_stats', to='viewer.dicomimage')),
+            ],
+        ),
+    ]
@@ -12,6 +12,7 @@ import base64
 from django.utils import timezone
 import random
 import string
+import uuid
 
 
 class Facility(models.Model):
@@ -135,9 +136,11 @@ class DicomSeries(models.Model):
 class DicomImage(models.Model):
     """Model to represent individual DICOM images"""
     series = models.ForeignKey(DicomSeries, related_name='images', on_delete=models.CASCADE)
-    sop_instance_uid = models.CharField(max_length=100)
+    sop_instance_uid = models.CharField(max_length=100, db_index=True)
     instance_number = models.IntegerField(default=0)
     file_path = models.FileField(upload_to='dicom_files/')
+    # SHA-256 of the stored file, when the upload path knew it; lets clients skip re-sending files
+    content_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     
     # Image properties
     rows = models.IntegerField(default=0)
@@ -263,13 +266,16 @@ class DicomImage(models.Model):
             # Convert to float for calculations
             image_data = pixel_array.astype(np.float32)
             
-            # Get image statistics for better default values
-            min_pixel = np.min(image_data)
-            max_pixel = np.max(image_data)
-            pixel_range = max_pixel - min_pixel
-            
             # If no window/level provided, use image statistics for better defaults
             if window_width is None and window_level is None:
+                # Range recorded at ingest; scan the pixels only for images ingested before it existed
+                stats = ImageIntensityStats.objects.filter(image_id=self.pk).first() if self.pk else None
+                if stats is not None:
+                    min_pixel, max_pixel = stats.stored_range()
+                else:
+                    min_pixel = np.min(image_data)
+                    max_pixel = np.max(image_data)
+                pixel_range = max_pixel - min_pixel
                 if pixel_range > 0:
                     # Use 95% of the pixel range for better contrast
                     wl = min_pixel + pixel_range * 0.5
@@ -327,17 +333,9 @@ class DicomImage(models.Model):
                     processed_array = processed_array * 0  # Handle constant arrays
                 processed_array = np.clip(processed_array, 0, 255).astype(np.uint8)
             
-            # Create PIL Image with quality preservation
-            image = Image.fromarray(processed_array, mode='L')
-            
-            # Enhance sharpness for medical images slightly (with fallback)
-            try:
-                from PIL import ImageEnhance
-                enhancer = ImageEnhance.Sharpness(image)
-                image = enhancer.enhance(1.1)  # Slight sharpening
-            except ImportError:
-                # Skip enhancement if PIL.ImageEnhance is not available
-                pass
+            # Enhance sharpness for medical images slightly, then wrap as a PIL Image
+            from .image_ops import get_backend
+            image = Image.fromarray(get_backend().sharpness(processed_array, 1.1), mode='L')
             
             # Convert to base64 with high quality PNG
             buffer = io.BytesIO()
@@ -381,20 +379,25 @@ class DicomImage(models.Model):
                     print(f"🎯 Processing actual DICOM file: {file_path}")
                     
                     try:
-                        # Load actual DICOM data
-                        dicom_data = pydicom.dcmread(file_path, force=True)
-                        if hasattr(dicom_data, 'pixel_array'):
-                            pixel_array = dicom_data.pixel_array
-                            
-                            # Process with enhanced quality
-                            result = self.process_actual_dicom_data(
-                                pixel_array, dicom_data, window_width, window_level, 
-                                inverted, resolution_factor, density_enhancement, contrast_boost
-                            )
-                            
-                            if result:
-                                print(f"✅ Successfully processed actual DICOM file for image {self.id}")
-                                return result
+                        from .render_pipeline import render_pipeline
+
+                        # The file is only decoded when the pipeline has no cached pixels for it
+                        def load_pixels():
+                            dicom_data = pydicom.dcmread(file_path, force=True)
+                            if not hasattr(dicom_data, 'pixel_array'):
+                                return None
+                            return dicom_data.pixel_array, dicom_data
+
+                        result = render_pipeline.render(
+                            self.render_cache_key(file_path), load_pixels,
+                            window_width=window_width, window_level=window_level, inverted=inverted,
+                            resolution_factor=resolution_factor, density_enhancement=density_enhancement,
+                            contrast_boost=contrast_boost,
+                        )
+                        
+                        if result:
+                            print(f"✅ Successfully processed actual DICOM file for image {self.id}")
+                            return result
                         
                     except Exception as dicom_error:
                         print(f"Error processing DICOM file {file_path}: {dicom_error}")
@@ -409,81 +412,23 @@ class DicomImage(models.Model):
             print(f"❌ Error in enhanced processing for image {self.id}: {e}")
             return None
     
+    def render_cache_key(self, file_path=None):
+        """Key of this image's intermediates in the enhanced render pipeline"""
+        return (self.pk, self.sop_instance_uid, str(file_path or self.file_path))
+    
     def process_actual_dicom_data(self, pixel_array, dicom_data, window_width=None, window_level=None, 
                                  inverted=False, resolution_factor=1.0, density_enhancement=True, contrast_boost=1.0):
         """Process actual DICOM pixel data with medical-grade quality"""
         try:
-            import numpy as np
-            from PIL import Image, ImageEnhance
-            import io
-            import base64
-            from skimage import exposure, filters
-            
-            # Use DICOM metadata for optimal windowing
-            if window_width is None and hasattr(dicom_data, 'WindowWidth'):
-                if isinstance(dicom_data.WindowWidth, (list, tuple)):
-                    window_width = float(dicom_data.WindowWidth[0])
-                else:
-                    window_width = float(dicom_data.WindowWidth)
-            
-            if window_level is None and hasattr(dicom_data, 'WindowCenter'):
-                if isinstance(dicom_data.WindowCenter, (list, tuple)):
-                    window_level = float(dicom_data.WindowCenter[0])
-                else:
-                    window_level = float(dicom_data.WindowCenter)
-            
-            # Set medical imaging defaults if still None
-            if window_width is None:
-                window_width = 1500  # Good for chest X-rays
-            if window_level is None:
-                window_level = -600   # Lung window
-            
-            # Convert to float for processing
-            pixel_array = pixel_array.astype(np.float32)
-            
-            # Apply rescale slope and intercept if available
-            if hasattr(dicom_data, 'RescaleSlope') and hasattr(dicom_data, 'RescaleIntercept'):
-                pixel_array = pixel_array * float(dicom_data.RescaleSlope) + float(dicom_data.RescaleIntercept)
-            
-            # Enhanced windowing
-            window_min = window_level - window_width / 2
-            window_max = window_level + window_width / 2
-            
-            # Apply windowing
-            pixel_array = np.clip(pixel_array, window_min, window_max)
-            pixel_array = ((pixel_array - window_min) / (window_max - window_min)) * 255
-            
-            # Apply density enhancement for better tissue differentiation
-            if density_enhancement:
-                pixel_array = exposure.equalize_adapthist(pixel_array / 255.0, clip_limit=0.01) * 255
-            
-            # Convert to uint8
-            pixel_array = np.clip(pixel_array, 0, 255).astype(np.uint8)
-            
-            # Apply inversion if requested
-            if inverted:
-                pixel_array = 255 - pixel_array
-            
-            # Create PIL image
-            image = Image.fromarray(pixel_array, mode='L')
-            
-            # Apply contrast boost
-            if contrast_boost != 1.0:
-                enhancer = ImageEnhance.Contrast(image)
-                image = enhancer.enhance(contrast_boost)
-            
-            # Apply resolution enhancement
-            if resolution_factor != 1.0:
-                new_size = (int(image.width * resolution_factor), int(image.height * resolution_factor))
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
-            
-            # Convert to base64
-            buffer = io.BytesIO()
-            image.save(buffer, format='PNG', optimize=False, compress_level=0)
-            buffer.seek(0)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            
-            return f"data:image/png;base64,{image_base64}"
+            from .render_pipeline import render_pipeline
+            
+            # Rescale -> window -> CLAHE -> 8-bit stages, each cached under the parameters it depends on
+            return render_pipeline.render(
+                self.render_cache_key(), lambda: (pixel_array, dicom_data),
+                window_width=window_width, window_level=window_level, inverted=inverted,
+                resolution_factor=resolution_factor, density_enhancement=density_enhancement,
+                contrast_boost=contrast_boost,
+            )
             
         except Exception as e:
             print(f"Error processing actual DICOM data: {e}")
@@ -718,13 +663,13 @@ class DicomImage(models.Model):
         """Apply density enhancement for better tissue differentiation"""
         try:
             # Apply histogram equalization for better contrast
-            from skimage import exposure
+            from .image_ops import get_backend
             
             # Convert to uint8 for histogram equalization
             pixel_array_uint8 = np.clip(pixel_array, 0, 255).astype(np.uint8)
             
             # Apply adaptive histogram equalization
-            enhanced = exposure.equalize_adapthist(pixel_array_uint8, clip_limit=0.03)
+            enhanced = get_backend().clahe(pixel_array_uint8, clip_limit=0.03)
             
             # Convert back to 0-255 range
             enhanced = (enhanced * 255).astype(np.float32)
@@ -739,8 +684,8 @@ class DicomImage(models.Model):
         """Apply enhanced density differentiation for superior tissue visualization"""
         try:
             # Apply multi-scale processing with medical imaging optimization
-            from scipy import ndimage
-            from scipy.ndimage import uniform_filter
+            from .image_ops import get_backend
+            ops = get_backend()
             
             # Enhanced multi-scale approach for better tissue contrast
             scales = [0.5, 1.0, 2.0, 4.0]  # Added finer scale for detail preservation
@@ -752,13 +697,13 @@ class DicomImage(models.Model):
                 elif scale < 1.0:
                     # High-pass filtering for edge enhancement
                     sigma = scale
-                    smoothed = ndimage.gaussian_filter(pixel_array, sigma=sigma)
+                    smoothed = ops.gaussian(pixel_array, sigma=sigma)
                     high_pass = pixel_array - smoothed
                     processed_scales.append(pixel_array + 0.3 * high_pass)  # Enhance edges
                 else:
                     # Low-pass filtering for structure enhancement
                     sigma = scale
-                    blurred = ndimage.gaussian_filter(pixel_array, sigma=sigma)
+                    blurred = ops.gaussian(pixel_array, sigma=sigma)
                     processed_scales.append(blurred)
             
             # Apply density-aware weighted combination
@@ -992,6 +937,128 @@ class DicomImage(models.Model):
         self.save()
 
 
+class ImageIntensityStats(models.Model):
+    """Intensity statistics of one image in modality units, computed at ingest"""
+    image = models.OneToOneField(DicomImage, related_name='intensity_stats', on_delete=models.CASCADE)
+    pixel_count = models.BigIntegerField(default=0)
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    mean_value = models.FloatField()
+    std_value = models.FloatField()
+    rescale_slope = models.FloatField(default=1.0)
+    rescale_intercept = models.FloatField(default=0.0)
+    percentiles = models.JSONField(default=dict)  # {'p1': ..., 'p50': ..., 'p99': ...}
+    histogram = models.JSONField(default=dict)  # {'start', 'bin_width', 'counts'} with power-of-two bins
+    suggested_window_center = models.FloatField(null=True, blank=True)
+    suggested_window_width = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Intensity statistics for image {self.image_id}"
+
+    def stored_range(self):
+        """Min and max in stored pixel units, as seen by apply_windowing"""
+        slope = self.rescale_slope or 1.0
+        low = (self.min_value - self.rescale_intercept) / slope
+        high = (self.max_value - self.rescale_intercept) / slope
+        return min(low, high), max(low, high)
+
+
+class SeriesIntensityStats(models.Model):
+    """Intensity statistics of a whole series, aggregated from its image histograms"""
+    series = models.OneToOneField(DicomSeries, related_name='intensity_stats', on_delete=models.CASCADE)
+    signature = models.CharField(max_length=40, blank=True)  # Image set the statistics were built from
+    image_count = models.IntegerField(default=0)
+    pixel_count = models.BigIntegerField(default=0)
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    mean_value = models.FloatField()
+    std_value = models.FloatField()
+    percentiles = models.JSONField(default=dict)
+    histogram = models.JSONField(default=dict)
+    window_presets = models.JSONField(default=list)  # Suggested presets, best first
+    suggested_window_center = models.FloatField(null=True, blank=True)
+    suggested_window_width = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Intensity statistics for series {self.series_id}"
+
+
+class UploadSession(models.Model):
+    """A resumable upload: files sent as fixed-size, checksummed chunks in any order, then ingested"""
+    STATUS_CHOICES = [
+        ('open', 'Receiving chunks'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='upload_sessions', on_delete=models.CASCADE, null=True, blank=True)
+    facility = models.ForeignKey(Facility, on_delete=models.SET_NULL, null=True, blank=True)
+    chunk_size = models.PositiveIntegerField()
+    files = models.JSONField(default=list)  # [{'name', 'relative_path', 'size', 'chunks', 'sha256'}]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    result = models.JSONField(default=dict)  # Ingest outcome once processed
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload session {self.id} ({self.status})"
+
+
+class UploadChunk(models.Model):
+    """A chunk of an upload session file that arrived intact"""
+    session = models.ForeignKey(UploadSession, related_name='chunks', on_delete=models.CASCADE)
+    file_index = models.PositiveIntegerField()
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=72)  # '<algorithm>:<hex digest>'
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['session', 'file_index', 'index']
+
+    def __str__(self):
+        return f"Chunk {self.file_index}/{self.index} of upload session {self.session_id}"
+
+
+class Job(models.Model):
+    """A unit of background work, leased and run by `manage.py run_job_worker`"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    queue = models.CharField(max_length=50, default='default')
+    task = models.CharField(max_length=200)  # Dotted path of a module-level function in viewer.tasks
+    payload = models.JSONField(default=dict)  # Keyword arguments of the task
+    reference = models.CharField(max_length=100, blank=True, db_index=True)  # e.g. the upload id it reports under
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # Not claimed before this (retry backoff)
+    worker = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    progress = models.JSONField(default=dict)  # Latest progress snapshot, saved with each heartbeat
+    result = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [models.Index(fields=['queue', 'status', 'run_after'])]
+
+    def __str__(self):
+        return f"Job {self.id} {self.task} ({self.status})"
+
+
 class Measurement(models.Model):
     """Model to store user measurements"""
     MEASUREMENT_TYPES = [
@@ -1453,21 +1520,25 @@ class ChatMessage(models.Model):
     def apply_diagnostic_preprocessing(self, pixel_array):
         """Apply diagnostic-grade preprocessing for superior image quality"""
         try:
-            from scipy.ndimage import median_filter, gaussian_filter
             from scipy.signal import wiener
+            from .image_ops import get_backend
             
             # Convert to float for precision
             pixel_array = pixel_array.astype(np.float32)
             
             # Apply noise reduction while preserving diagnostic details
-            # Use adaptive filtering based on image characteristics
-            noise_level = np.std(pixel_array)
+            # Use adaptive filtering based on image characteristics (std recorded at ingest, in stored units)
+            stats = ImageIntensityStats.objects.filter(image_id=self.pk).first() if self.pk else None
+            if stats is not None:
+                noise_level = stats.std_value / abs(stats.rescale_slope or 1.0)
+            else:
+                noise_level = np.std(pixel_array)
             if noise_level > 10:  # High noise image
                 # Wiener filter for noise reduction
                 pixel_array = wiener(pixel_array, (3, 3))
             elif noise_level > 5:  # Moderate noise
                 # Gaussian filter with small kernel
-                pixel_array = gaussian_filter(pixel_array, sigma=0.5)
+                pixel_array = get_backend().gaussian(pixel_array, sigma=0.5)
             
             # Edge-preserving smoothing for diagnostic clarity
             pixel_array = self.apply_edge_preserving_smoothing(pixel_array)
@@ -1868,10 +1939,10 @@ class ChatMessage(models.Model):
     def apply_diagnostic_edge_enhancement(self, pixel_array):
         """Apply diagnostic edge enhancement for clarity"""
         try:
-            from scipy.ndimage import gaussian_filter
+            from .image_ops import get_backend
             
             # Apply Gaussian blur
-            blurred = gaussian_filter(pixel_array, sigma=1.0)
+            blurred = get_backend().gaussian(pixel_array, sigma=1.0)
             
             # Calculate edge map
             edge_map = pixel_array - blurred
@@ -0,0 +1,134 @@
+"""
+On-disk store for precomputed reconstructions.
+
+Each entry lives under MEDIA_ROOT/reconstructions/series_<id>/<kind>/<key>/ and
+holds a single packed ``frames.bin`` plus a ``manifest.json`` with the byte
+offset and length of every frame. Serving a frame is one seek and one read.
+Manifests record the series image-set signature; an entry whose signature no
+longer matches the series is treated as stale and removed on access.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FRAMES_FILE = 'frames.bin'
+MANIFEST_FILE = 'manifest.json'
+
+
+class ReconstructionStore:
+    """Packed-frame reconstruction entries keyed by (series, kind, parameter key)"""
+
+    def __init__(self, root=None):
+        self._root = root
+
+    @property
+    def root(self):
+        return self._root or os.path.join(settings.MEDIA_ROOT, 'reconstructions')
+
+    def series_dir(self, series_id):
+        return os.path.join(self.root, f'series_{int(series_id)}')
+
+    def entry_dir(self, series_id, kind, key):
+        return os.path.join(self.series_dir(series_id), kind, key)
+
+    def create_staging(self, series_id, kind, key):
+        """Private directory to build an entry in before publishing it"""
+        staging_dir = f'{self.entry_dir(series_id, kind, key)}.tmp-{uuid.uuid4().hex[:8]}'
+        os.makedirs(staging_dir, exist_ok=True)
+        return staging_dir
+
+    def publish(self, staging_dir, series_id, kind, key):
+        """Atomically move a fully written staging directory into place"""
+        final_dir = self.entry_dir(series_id, kind, key)
+        if os.path.exists(final_dir):
+            shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(staging_dir, final_dir)
+        return final_dir
+
+    def write_frames(self, series_id, kind, key, signature, frames, metadata=None, content_type='image/jpeg'):
+        """Pack frames (an iterable of bytes) into a new entry, replacing any previous one atomically"""
+        staging_dir = self.create_staging(series_id, kind, key)
+
+        offsets = []
+        lengths = []
+        try:
+            with open(os.path.join(staging_dir, FRAMES_FILE), 'wb') as packed:
+                for frame in frames:
+                    offsets.append(packed.tell())
+                    lengths.append(len(frame))
+                    packed.write(frame)
+
+            manifest = {
+                'series_id': int(series_id),
+                'kind': kind,
+                'key': key,
+                'signature': signature,
+                'content_type': content_type,
+                'frame_count': len(offsets),
+                'offsets': offsets,
+                'lengths': lengths,
+                'total_bytes': sum(lengths),
+                'created_at': time.time(),
+                'metadata': metadata or {},
+            }
+            with open(os.path.join(staging_dir, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f)
+
+            self.publish(staging_dir, series_id, kind, key)
+            return manifest
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    def read_manifest(self, series_id, kind, key, signature=None):
+        """Return the manifest of an entry, or None if missing or stale for the given signature"""
+        path = os.path.join(self.entry_dir(series_id, kind, key), MANIFEST_FILE)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if signature is not None and manifest.get('signature') != signature:
+            logger.info(f"Removing stale {kind} reconstruction {key} for series {series_id}")
+            self.invalidate(series_id, kind, key)
+            return None
+        return manifest
+
+    def read_frame(self, manifest, index):
+        """Read one frame's bytes using the offsets recorded in its manifest"""
+        if index < 0 or index >= manifest['frame_count']:
+            raise IndexError(f'Frame {index} out of range')
+        path = os.path.join(self.entry_dir(manifest['series_id'], manifest['kind'], manifest['key']), FRAMES_FILE)
+        with open(path, 'rb') as f:
+            f.seek(manifest['offsets'][index])
+            return f.read(manifest['lengths'][index])
+
+    def iter_frames(self, manifest):
+        """Yield every frame in order from a single open file handle"""
+        path = os.path.join(self.entry_dir(manifest['series_id'], manifest['kind'], manifest['key']), FRAMES_FILE)
+        with open(path, 'rb') as f:
+            for offset, length in zip(manifest['offsets'], manifest['lengths']):
+                f.seek(offset)
+                yield f.read(length)
+
+    def invalidate(self, series_id, kind=None, key=None):
+        """Remove one entry, every entry of a kind, or everything stored for a series"""
+        if kind is None:
+            target = self.series_dir(series_id)
+        elif key is None:
+            target = os.path.join(self.series_dir(series_id), kind)
+        else:
+            target = self.entry_dir(series_id, kind, key)
+        shutil.rmtree(target, ignore_errors=True)
+
+
+# Global reconstruction store instance
+reconstruction_store = ReconstructionStore()
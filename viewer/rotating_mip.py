@@ -0,0 +1,216 @@
+"""
+Precomputed rotating MIP cine for angiography series.
+
+A rotating MIP used to mean one full-volume projection request per angle.
+This module renders all angles of a 180 degree rotation about the patient's
+superior axis once, spreading the angles over a process pool, and packs the
+JPEG frames into the reconstruction store. Playback then only reads frames
+back from disk. Entries carry the series signature, so a series whose image
+set changes is recomputed on the next request. Renders run as jobs on the
+'reconstruction' queue of the job queue (viewer.jobs).
+"""
+
+import io
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+
+logger = logging.getLogger(__name__)
+
+STORE_KIND = 'rotating_mip'
+
+# Matches the viewer's 'angio' window preset
+ANGIO_WINDOW = (150.0, 700.0)
+
+DEFAULT_FRAMES = 36
+MAX_FRAMES = 180
+DEFAULT_SIZE = 512
+MAX_SIZE = 1024
+JPEG_QUALITY = 85
+
+# Axial slices rotated per step; bounds worker memory on large series
+SLAB_DEPTH = 32
+
+
+def frame_key(frames, window_center, window_width, size):
+    """Store key for a set of cine parameters"""
+    return f'{int(frames)}f_c{int(round(window_center))}_w{int(round(window_width))}_s{int(size)}'
+
+
+def project_angle(data, angle, spacing, window_center, window_width, size, quality=JPEG_QUALITY):
+    """MIP of a (z, y, x) volume rotated by angle degrees about the superior axis, as JPEG bytes"""
+    depth = data.shape[0]
+    projection = np.empty((depth, data.shape[2]), dtype=np.float32)
+    for start in range(0, depth, SLAB_DEPTH):
+        slab = np.asarray(data[start:start + SLAB_DEPTH], dtype=np.float32)
+        if angle % 360:
+            slab = ndimage.rotate(slab, angle, axes=(2, 1), reshape=False, order=1,
+                                  mode='constant', cval=float(slab.min()))
+        projection[start:start + slab.shape[0]] = slab.max(axis=1)
+
+    low = window_center - window_width / 2.0
+    scaled = (projection - np.float32(low)) * np.float32(255.0 / max(window_width, 1.0))
+    np.clip(scaled, 0, 255, out=scaled)
+    frame = Image.fromarray(scaled.astype(np.uint8))
+
+    # Rows are slices and columns are in-plane pixels; restore the physical aspect
+    dz, _, dx = spacing
+    height_mm = depth * dz
+    width_mm = data.shape[2] * dx
+    scale = size / max(height_mm, width_mm)
+    frame = frame.resize((max(1, int(round(width_mm * scale))), max(1, int(round(height_mm * scale)))),
+                         Image.BILINEAR)
+
+    buffer = io.BytesIO()
+    frame.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def _project_from_file(volume_path, angle, spacing, window_center, window_width, size):
+    """Worker entry point: memory-map the shared volume and project one angle"""
+    data = np.load(volume_path, mmap_mode='r')
+    return project_angle(data, angle, spacing, window_center, window_width, size)
+
+
+def render_frames(volume, angles, window_center, window_width, size, max_workers=None, progress=None):
+    """Project every angle, in parallel across processes unless max_workers is 1"""
+    frames = [None] * len(angles)
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, len(angles))
+
+    if max_workers <= 1:
+        for i, angle in enumerate(angles):
+            frames[i] = project_angle(volume.data, angle, volume.spacing, window_center, window_width, size)
+            if progress:
+                progress(i + 1)
+        return frames
+
+    # Workers share one on-disk copy of the volume instead of pickling it per task;
+    # volumes that are already memory-mapped .npy files are shared as they are
+    with tempfile.TemporaryDirectory(prefix='rotating_mip_') as tmp:
+        volume_path = getattr(volume.data, 'filename', None)
+        if not volume_path or not str(volume_path).endswith('.npy'):
+            volume_path = os.path.join(tmp, 'volume.npy')
+            np.save(volume_path, volume.data)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            futures = {
+                executor.submit(_project_from_file, volume_path, float(angle), volume.spacing,
+                                window_center, window_width, size): i
+                for i, angle in enumerate(angles)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                frames[futures[future]] = future.result()
+                if progress:
+                    progress(done)
+    return frames
+
+
+class RotatingMIPJobs:
+    """Enqueues precompute jobs and tracks their progress in the Django cache"""
+
+    def reference(self, series_id, key):
+        return f'rotating_mip:{series_id}:{key}'
+
+    def progress_key(self, series_id, key):
+        return f'rotating_mip_progress_{series_id}_{key}'
+
+    def status(self, series_id, key):
+        """Progress from the cache, else from the render's job (the worker may not share this cache)"""
+        from django.core.cache import cache
+        from .jobs import job_queue
+        progress = cache.get(self.progress_key(series_id, key))
+        if progress is None:
+            job = job_queue.latest(self.reference(series_id, key))
+            if job is not None:
+                progress = job.progress or {
+                    'status': {'running': 'processing'}.get(job.status, job.status),
+                    'error': job.error or None,
+                }
+        return progress
+
+    def start(self, series, frames=DEFAULT_FRAMES, window_center=None, window_width=None,
+              size=DEFAULT_SIZE, max_workers=None):
+        """Return (key, manifest) if already stored, otherwise start a job and return (key, None)"""
+        from .reconstruction_store import reconstruction_store
+        from .volume_cache import series_signature
+
+        frames = int(np.clip(int(frames), 2, MAX_FRAMES))
+        size = int(np.clip(int(size), 64, MAX_SIZE))
+        window_center = float(ANGIO_WINDOW[0] if window_center is None else window_center)
+        window_width = float(ANGIO_WINDOW[1] if window_width is None else window_width)
+        key = frame_key(frames, window_center, window_width, size)
+
+        manifest = reconstruction_store.read_manifest(series.id, STORE_KIND, key, series_signature(series))
+        if manifest is not None:
+            return key, manifest
+
+        from .jobs import job_queue
+        from .tasks import RECONSTRUCTION_QUEUE, render_rotating_mip
+        reference = self.reference(series.id, key)
+        if job_queue.active(render_rotating_mip, reference) is None:
+            self._set_progress(series.id, key, 'queued', 0, frames)
+            # A failed render fails the same way again, so it is not retried
+            job_queue.enqueue(render_rotating_mip, {
+                'series_id': series.id, 'key': key, 'frames': frames, 'window_center': window_center,
+                'window_width': window_width, 'size': size, 'max_workers': max_workers,
+            }, queue=RECONSTRUCTION_QUEUE, reference=reference, max_attempts=1)
+        return key, None
+
+    def _set_progress(self, series_id, key, state, completed, total, error=None):
+        from django.core.cache import cache
+        cache.set(self.progress_key(series_id, key), {
+            'status': state,
+            'completed_frames': completed,
+            'total_frames': total,
+            'progress': round(100.0 * completed / total, 1) if total else 0.0,
+            'error': error,
+            'updated_at': time.time(),
+        }, timeout=7200)
+
+    def render(self, series_id, key, frames, window_center, window_width, size, max_workers=None):
+        """Render and store the cine; runs in a job worker"""
+        from .models import DicomSeries
+        from .reconstruction_store import reconstruction_store
+        from .volume_pyramid import volume_pyramid_cache
+
+        started = time.time()
+        try:
+            series = DicomSeries.objects.get(id=series_id)
+            pyramid = volume_pyramid_cache.get_pyramid(series)
+            volume = pyramid.level_for_size(size)
+            angles = np.arange(frames) * 180.0 / frames
+            self._set_progress(series_id, key, 'processing', 0, frames)
+
+            encoded = render_frames(
+                volume, angles, window_center, window_width, size, max_workers=max_workers,
+                progress=lambda done: self._set_progress(series_id, key, 'processing', done, frames),
+            )
+            reconstruction_store.write_frames(
+                series_id, STORE_KIND, key, pyramid.signature, encoded,
+                metadata={
+                    'angles': angles.tolist(),
+                    'window_center': window_center,
+                    'window_width': window_width,
+                    'size': size,
+                    'volume': volume.to_dict(),
+                    'render_seconds': round(time.time() - started, 2),
+                },
+            )
+            self._set_progress(series_id, key, 'completed', frames, frames)
+            logger.info(f"Rotating MIP {key} for series {series_id} precomputed in {time.time() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"Rotating MIP precompute failed for series {series_id}: {str(e)}")
+            self._set_progress(series_id, key, 'failed', 0, frames, error=str(e))
+            raise
+
+
+# Global rotating MIP job manager instance
+rotating_mip_jobs = RotatingMIPJobs()
@@ -26,6 +26,7 @@ from scipy import stats
 import gc
 from django.db.models import Q
 
+from .archive_reader import iter_dicom_members, store_member
 from .models import (
     DicomStudy, DicomSeries, DicomImage, Measurement, Annotation,
     Facility, Report, WorklistEntry, AIAnalysis, Notification, 
@@ -75,8 +76,8 @@ class DicomProcessingService:
                 logger.error(f"Emergency fallback failed: {fallback_error}")
                 raise
     
-    def process_dicom_file(self, file_path, user):
-        """Process a single DICOM file"""
+    def process_dicom_file(self, file_path, user, stored_name=None):
+        """Process a single DICOM file; stored_name is its storage name when it is already in dicom_files/"""
         try:
             # Read DICOM file
             dicom_data = pydicom.dcmread(file_path)
@@ -114,7 +115,7 @@ class DicomProcessingService:
             )
             
             # Process image
-            image = self.process_image(series, dicom_data)
+            image = self.process_image(series, dicom_data, stored_name)
             
             return {
                 'study': study,
@@ -148,7 +149,7 @@ class DicomProcessingService:
             'body_part_examined': str(dicom_data.get('BodyPartExamined', '')),
         }
     
-    def process_image(self, series, dicom_data):
+    def process_image(self, series, dicom_data, stored_name=None):
         """Process DICOM image data"""
         try:
             # Extract pixel data
@@ -161,6 +162,7 @@ class DicomProcessingService:
             # Create image record
             image = DicomImage.objects.create(
                 series=series,
+                file_path=stored_name or '',
                 image_number=int(dicom_data.get('InstanceNumber', 0)),
                 image_position_x=float(image_position[0]) if len(image_position) > 0 else 0,
                 image_position_y=float(image_position[1]) if len(image_position) > 1 else 0,
@@ -248,17 +250,15 @@ class UploadService:
             temp_path = default_storage.save(f'temp/{self.upload_id}_{uploaded_file.name}', uploaded_file)
             temp_file_path = default_storage.path(temp_path)
             
-            # Extract archive
-            extracted_files = self.extract_archive(temp_file_path)
-            self.progress['total_files'] = len(extracted_files)
-            
-            # Process files
-            results = self.process_files_batch(extracted_files)
-            
-            # Cleanup
-            self.cleanup_temp_files(temp_file_path, extracted_files)
-            
-            return results
+            try:
+                # Members are copied straight into dicom_files/ and become the images' files
+                stored_files = self.extract_archive(temp_file_path)
+                self.progress['total_files'] = len(stored_files)
+                
+                # Process files
+                return self.process_files_batch(stored_files)
+            finally:
+                self.cleanup_temp_files(temp_file_path)
             
         except Exception as e:
             logger.error(f"Error processing archive upload: {e}")
@@ -289,47 +289,23 @@ class UploadService:
             raise
     
     def extract_archive(self, archive_path):
-        """Extract archive and return list of file paths"""
-        extracted_files = []
-        
+        """Copy the archive's DICOM members from their streams into dicom_files/ and return their storage names"""
+        stored_files = []
         try:
-            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                # Extract to temporary directory
-                temp_dir = tempfile.mkdtemp()
-                zip_ref.extractall(temp_dir)
-                
-                # Find all files
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        if self.is_dicom_candidate(file, os.path.getsize(file_path)):
-                            extracted_files.append(file_path)
-                
-                return extracted_files
+            # Members are streamed and sniffed one at a time; non-DICOM members are never written
+            with open(archive_path, 'rb') as archive:
+                for member in iter_dicom_members(archive, archive_path):
+                    stored_files.append(store_member(member))
+            return stored_files
                 
         except Exception as e:
             logger.error(f"Error extracting archive: {e}")
+            for stored_name in stored_files:
+                default_storage.delete(stored_name)
             raise
     
-    def is_dicom_candidate(self, filename, file_size):
-        """Check if file is a potential DICOM file"""
-        # Check file extension
-        dicom_extensions = ['.dcm', '.dicom', '.ima', '.img']
-        if any(filename.lower().endswith(ext) for ext in dicom_extensions):
-            return True
-        
-        # Check file size (DICOM files are typically > 1KB)
-        if file_size < 1024:
-            return False
-        
-        # Check if file has no extension (common for DICOM files)
-        if '.' not in filename:
-            return True
-        
-        return False
-    
     def process_files_batch(self, files):
-        """Process multiple files in batches"""
+        """Process stored files (storage names) in batches; files that fail are removed from storage"""
         results = []
         batch_size = 10
         
@@ -339,8 +315,9 @@ class UploadService:
             # Process batch in parallel
             with ThreadPoolExecutor(max_workers=4) as executor:
                 future_to_file = {
-                    executor.submit(self.processing_service.process_dicom_file, file_path, self.user): file_path
-                    for file_path in batch
+                    executor.submit(self.processing_service.process_dicom_file, default_storage.path(stored_name),
+                                    self.user, stored_name): stored_name
+                    for stored_name in batch
                 }
                 
                 for future in as_completed(future_to_file):
@@ -351,6 +328,7 @@ class UploadService:
                         self.progress['successful_files'] += 1
                     except Exception as e:
                         logger.error(f"Error processing file {file_path}: {e}")
+                        default_storage.delete(file_path)
                         self.progress['failed_files'] += 1
                         self.progress['errors'].append(f"Error processing {os.path.basename(file_path)}: {str(e)}")
                     
@@ -359,22 +337,12 @@ class UploadService:
         self.progress['status'] = 'completed'
         return results
     
-    def cleanup_temp_files(self, archive_path, extracted_files):
+    def cleanup_temp_files(self, archive_path):
         """Clean up temporary files"""
         try:
-            # Remove extracted files
-            for file_path in extracted_files:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            
-            # Remove archive file
+            # Remove archive file; its members were stored straight into dicom_files/
             if os.path.exists(archive_path):
                 os.remove(archive_path)
-            
-            # Remove temp directory
-            temp_dir = os.path.dirname(extracted_files[0]) if extracted_files else None
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
                 
         except Exception as e:
             logger.error(f"Error cleaning up temp files: {e}")
@@ -0,0 +1,84 @@
+"""
+Background tasks run through the job queue (see viewer.jobs).
+
+Each task is a module-level function called as task(job, **payload) in a
+`manage.py run_job_worker` process; what it returns is stored as the job's
+result. A task may set `job.progress_source` to a callable whose snapshot
+is saved with every heartbeat, and may have an `on_failure(job)` hook that
+runs once the job has used all its attempts (including when its worker died).
+"""
+
+import logging
+import os
+import shutil
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_QUEUE = 'uploads'
+RECONSTRUCTION_QUEUE = 'reconstruction'
+RESULT_TIMEOUT = 7200
+
+
+def _owner(user_id, facility_id):
+    from django.contrib.auth.models import User
+    from .models import Facility
+    user = User.objects.filter(pk=user_id).first() if user_id else None
+    facility = Facility.objects.filter(pk=facility_id).first() if facility_id else None
+    return user, facility
+
+
+def process_bulk_upload(job, upload_id, path, name, size, user_id=None, facility_id=None):
+    """Ingest an archive or single file spooled by the bulk upload endpoint"""
+    from .views import EnhancedBulkUploadManager
+    user, facility = _owner(user_id, facility_id)
+    upload_manager = EnhancedBulkUploadManager(user, facility, upload_id=upload_id)
+    job.progress_source = lambda: upload_manager.progress
+    files = [{'path': path, 'name': name, 'size': size, 'relative_path': name}] if os.path.exists(path) else []
+    result = upload_manager.result(upload_manager.process_received_files(files))
+    cache.set(f'upload_result_{upload_id}', result, timeout=RESULT_TIMEOUT)
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return result
+
+
+def _bulk_upload_failed(job):
+    result = {'upload_id': job.payload['upload_id'], 'status': 'failed', 'error': job.error}
+    cache.set(f"upload_result_{job.payload['upload_id']}", result, timeout=RESULT_TIMEOUT)
+    shutil.rmtree(os.path.dirname(job.payload['path']), ignore_errors=True)
+
+
+process_bulk_upload.on_failure = _bulk_upload_failed
+
+
+def ingest_upload_session(job, session_id):
+    """Ingest the files of a completed chunked upload session"""
+    from .chunked_upload import chunked_uploads
+    from .models import UploadSession
+    from .views import EnhancedBulkUploadManager
+    session = UploadSession.objects.get(pk=session_id)
+    # Progress is published under the session id, so clients poll the session or the upload progress endpoints
+    upload_manager = EnhancedBulkUploadManager(session.user, session.facility, upload_id=str(session.pk))
+    job.progress_source = lambda: upload_manager.progress
+    success = upload_manager.process_received_files(chunked_uploads.received_files(session))
+    result = upload_manager.result(success)
+    chunked_uploads.finish(session, success, result)
+    return result
+
+
+def _upload_session_failed(job):
+    from .chunked_upload import chunked_uploads
+    from .models import UploadSession
+    session = UploadSession.objects.filter(pk=job.payload['session_id']).first()
+    if session is not None:
+        chunked_uploads.finish(session, False, {'upload_id': str(session.pk), 'status': 'failed', 'error': job.error})
+
+
+ingest_upload_session.on_failure = _upload_session_failed
+
+
+def render_rotating_mip(job, series_id, key, frames, window_center, window_width, size, max_workers=None):
+    """Precompute a rotating MIP cine into the reconstruction store"""
+    from .rotating_mip import rotating_mip_jobs
+    rotating_mip_jobs.render(series_id, key, frames, window_center, window_width, size, max_workers)
+    return {'series_id': series_id, 'key': key}
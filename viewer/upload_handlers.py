@@ -0,0 +1,227 @@
+"""
+Streaming upload handler for the DICOM upload endpoints.
+
+Django's default handlers spool each upload to memory or a temporary file,
+and the upload views then read it back, save a second copy into
+MEDIA_ROOT/dicom_files/ and parse it from there. `DicomStreamingUploadHandler`
+writes each incoming chunk straight to the file's final storage location,
+updates a SHA-256 of the content as it goes, and parses the DICOM header
+from the first chunks once they reach the pixel data. The view receives a
+`StreamedDicomFile` that already knows its storage name, hash and header,
+so the file is written once and never held in memory as a whole.
+
+The handler only takes over uploads posted to the views named in
+STREAMING_URL_NAMES; every other upload is passed on to the next handler in
+FILE_UPLOAD_HANDLERS unchanged. Those views are wrapped in
+`discard_unclaimed_uploads`, which removes every streamed file that did not
+become a DicomImage once the view returns, however it returned.
+"""
+
+import functools
+import hashlib
+import io
+import logging
+import os
+import uuid
+
+import pydicom
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.urls import Resolver404, resolve
+
+from .dicom_sniff import RAW, SNIFF_BYTES, classify
+
+logger = logging.getLogger(__name__)
+
+STREAMING_URL_NAMES = {'upload_dicom_files', 'upload_dicom', 'upload_dicom_folder'}
+UPLOAD_DIRECTORY = 'dicom_files'
+# The header is parsed once the buffered prefix reaches the Pixel Data element
+PIXEL_DATA_TAGS = (b'\xe0\x7f\x10\x00', b'\x7f\xe0\x00\x10')
+HEADER_BUFFER_LIMIT = 8 * 1024 * 1024
+FILE_NAME_MAX_LENGTH = 100  # DicomImage.file_path max_length
+CLAIM_LOOKUP_BATCH_SIZE = 500
+
+
+def storage_name(file_name):
+    """Fresh storage name for an incoming DICOM file, within DicomImage.file_path's length limit"""
+    return default_storage.get_available_name(
+        default_storage.generate_filename(f'{UPLOAD_DIRECTORY}/{uuid.uuid4()}_{os.path.basename(file_name)}'),
+        max_length=FILE_NAME_MAX_LENGTH,
+    )
+
+
+def move_into_storage(path, file_name=None):
+    """Move a local file (e.g. one extracted from an archive) into dicom_files/ and return its storage name"""
+    name = storage_name(file_name or path)
+    destination = default_storage.path(name)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    file_move_safe(path, destination)
+    permissions = getattr(settings, 'FILE_UPLOAD_PERMISSIONS', None)
+    if permissions is not None:
+        os.chmod(destination, permissions)
+    return name
+
+
+def read_header(source):
+    """DICOM dataset without pixel data from a path or file object, or None if it is not DICOM"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return read_header(f)
+    source.seek(0)
+    kind = classify(source.read(SNIFF_BYTES))
+    if kind is None:
+        return None
+    # force=True only for datasets without the preamble, which a plain read rejects
+    attempts = [False, True] if kind == RAW else [False]
+    for force in attempts:
+        try:
+            source.seek(0)
+            dataset = pydicom.dcmread(source, stop_before_pixels=True, force=force, defer_size='512 KB')
+        except Exception:
+            continue
+        # force=True accepts any bytes; require at least one real DICOM element
+        if len(dataset) and (not force or 'SOPInstanceUID' in dataset or 'StudyInstanceUID' in dataset):
+            return dataset
+    return None
+
+
+class StreamedDicomFile(UploadedFile):
+    """An upload already written to its final storage name, with its hash and parsed header"""
+
+    def __init__(self, storage_name, path, name, content_type, size, charset, content_type_extra,
+                 sha256, dicom_header):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset, content_type_extra)
+        self.storage_name = storage_name
+        self.path = path
+        self.sha256 = sha256
+        self.dicom_header = dicom_header
+
+    def temporary_file_path(self):
+        return self.path
+
+    def discard(self):
+        """Remove the stored file (for uploads the view rejects)"""
+        self.close()
+        try:
+            default_storage.delete(self.storage_name)
+        except OSError:
+            pass
+
+
+class DicomStreamingUploadHandler(FileUploadHandler):
+    """Writes DICOM uploads directly to MEDIA_ROOT/dicom_files/, hashing and parsing on the fly"""
+
+    chunk_size = getattr(settings, 'LARGE_FILE_CHUNK_SIZE', 1024 * 1024)
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.active = self._is_streaming_request(request)
+        self.destination = None
+        self.streamed_files = []
+
+    @staticmethod
+    def _is_streaming_request(request):
+        if request is None or not hasattr(default_storage, 'path'):
+            return False
+        try:
+            return resolve(request.path_info).url_name in STREAMING_URL_NAMES
+        except Resolver404:
+            return False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if not self.active:
+            return
+        name = storage_name(file_name)
+        self.storage_name = name
+        self.path = default_storage.path(name)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.destination = open(self.path, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.header_buffer = bytearray()
+        self.dicom_header = None
+        self.header_done = False
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.destination is None:
+            return raw_data
+        self.destination.write(raw_data)
+        self.digest.update(raw_data)
+        self.size += len(raw_data)
+        if not self.header_done:
+            self._buffer_header(raw_data)
+        return None
+
+    def _buffer_header(self, raw_data):
+        """Keep the leading bytes until they contain the Pixel Data element, then parse them"""
+        search_from = max(0, len(self.header_buffer) - 3)
+        self.header_buffer.extend(raw_data)
+        if any(self.header_buffer.find(tag, search_from) >= 0 for tag in PIXEL_DATA_TAGS):
+            self.dicom_header = read_header(io.BytesIO(bytes(self.header_buffer)))
+            self.header_done = True
+            self.header_buffer = bytearray()
+        elif len(self.header_buffer) > HEADER_BUFFER_LIMIT:
+            # No pixel data in the first few megabytes; parse the header from disk when complete
+            self.header_done = True
+            self.header_buffer = bytearray()
+
+    def file_complete(self, file_size):
+        if self.destination is None:
+            return None
+        self.destination.close()
+        self.destination = None
+        permissions = getattr(settings, 'FILE_UPLOAD_PERMISSIONS', None)
+        if permissions is not None:
+            os.chmod(self.path, permissions)
+
+        header = self.dicom_header
+        if header is None:
+            # Short files, files without pixel data and non-DICOM uploads end up here
+            header = read_header(io.BytesIO(bytes(self.header_buffer))) if self.header_buffer else read_header(self.path)
+        self.header_buffer = bytearray()
+        streamed = StreamedDicomFile(
+            self.storage_name, self.path, self.file_name, self.content_type, self.size, self.charset,
+            self.content_type_extra, self.digest.hexdigest(), header,
+        )
+        self.streamed_files.append(streamed)
+        return streamed
+
+    def upload_interrupted(self):
+        if self.destination is not None:
+            self.destination.close()
+            self.destination = None
+            logger.info(f"Upload of {self.file_name} interrupted; removing {self.storage_name}")
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def discard_unclaimed(request):
+    """Remove the files streamed for request that no DicomImage refers to"""
+    from .models import DicomImage
+    streamed = [uploaded for handler in request.upload_handlers
+                for uploaded in getattr(handler, 'streamed_files', ())]
+    for start in range(0, len(streamed), CLAIM_LOOKUP_BATCH_SIZE):
+        batch = streamed[start:start + CLAIM_LOOKUP_BATCH_SIZE]
+        claimed = set(DicomImage.objects.filter(file_path__in=[uploaded.storage_name for uploaded in batch])
+                      .values_list('file_path', flat=True))
+        for uploaded in batch:
+            if uploaded.storage_name not in claimed:
+                uploaded.discard()
+
+
+def discard_unclaimed_uploads(view):
+    """Decorator for the streaming upload views: discard unclaimed streamed files when the view returns"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            discard_unclaimed(request)
+    return wrapper
@@ -0,0 +1,147 @@
+"""
+Coalesced, throttled progress reporting for bulk uploads.
+
+The bulk upload manager used to write its whole progress dict to the cache
+on every file and every counter bump, and grew its error list by copying it
+(`errors + [message]`), which is quadratic in the number of failures.
+`ProgressReporter` keeps counters in memory and publishes a snapshot to the
+cache at most every UPLOAD_PROGRESS_INTERVAL_MS milliseconds or every
+UPLOAD_PROGRESS_EVERY_FILES processed files, and always on a status change.
+Errors and warnings are kept in ring buffers of the latest
+UPLOAD_PROGRESS_MAX_ERRORS messages next to their total counts. Pipeline
+stages (parse, write, ...) report the files they handled and the seconds
+they were busy; snapshots carry each stage's throughput and the ETA.
+"""
+
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_INTERVAL_MS = 500
+DEFAULT_EVERY_FILES = 50
+DEFAULT_MAX_ERRORS = 100
+DEFAULT_TIMEOUT = 7200
+
+
+def progress_key(upload_id):
+    return f'upload_progress_{upload_id}'
+
+
+class ProgressReporter:
+    """In-memory upload progress, published to the cache in coalesced snapshots"""
+
+    COUNTERS = ('total_files', 'processed_files', 'successful_files', 'failed_files', 'skipped_files',
+                'studies_created', 'series_created', 'images_processed', 'total_size_mb', 'processed_size_mb')
+
+    def __init__(self, upload_id, interval_ms=None, every_files=None, max_errors=None, timeout=None, **fields):
+        self.upload_id = upload_id
+        self.interval = (interval_ms if interval_ms is not None else
+                         getattr(settings, 'UPLOAD_PROGRESS_INTERVAL_MS', DEFAULT_INTERVAL_MS)) / 1000.0
+        self.every_files = every_files or getattr(settings, 'UPLOAD_PROGRESS_EVERY_FILES', DEFAULT_EVERY_FILES)
+        max_errors = max_errors or getattr(settings, 'UPLOAD_PROGRESS_MAX_ERRORS', DEFAULT_MAX_ERRORS)
+        self.timeout = timeout or getattr(settings, 'UPLOAD_PROGRESS_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+        self.fields = dict.fromkeys(self.COUNTERS, 0)
+        self.fields.update(status='initializing')
+        self.fields.update(fields)
+        self.errors = deque(maxlen=max_errors)
+        self.warnings = deque(maxlen=max_errors)
+        self.error_count = 0
+        self.warning_count = 0
+        self.stages = {}
+        self.start_time = time.time()
+        self.published_at = None
+        self.published_files = 0
+        self.publish_count = 0
+        self._lock = threading.RLock()
+
+    def start(self):
+        """Restart the clock the ETA and throughput are measured from"""
+        with self._lock:
+            self.start_time = time.time()
+
+    def set(self, **fields):
+        """Set fields; a status change is published immediately"""
+        with self._lock:
+            force = 'status' in fields and fields['status'] != self.fields.get('status')
+            self.fields.update(fields)
+            self._maybe_publish(force)
+
+    def increment(self, **deltas):
+        """Add to counters"""
+        with self._lock:
+            for name, delta in deltas.items():
+                self.fields[name] = self.fields.get(name, 0) + delta
+            self._maybe_publish()
+
+    def error(self, *messages):
+        with self._lock:
+            self.errors.extend(messages)
+            self.error_count += len(messages)
+            self._maybe_publish()
+
+    def warning(self, *messages):
+        with self._lock:
+            self.warnings.extend(messages)
+            self.warning_count += len(messages)
+            self._maybe_publish()
+
+    def stage(self, name, files, seconds, workers=1):
+        """Record work done by a pipeline stage: files handled, busy seconds summed over its workers"""
+        with self._lock:
+            totals = self.stages.setdefault(name, {'files': 0, 'seconds': 0.0, 'workers': workers})
+            totals['files'] += files
+            totals['seconds'] += seconds
+            totals['workers'] = workers
+            self._maybe_publish()
+
+    def _stage_rates(self, remaining):
+        rates = {}
+        for name, totals in self.stages.items():
+            rate = totals['files'] * totals['workers'] / totals['seconds'] if totals['seconds'] else None
+            rates[name] = {
+                'files': totals['files'],
+                'seconds': round(totals['seconds'], 3),
+                'workers': totals['workers'],
+                'files_per_sec': round(rate, 1) if rate else None,
+                'eta_seconds': round(remaining / rate, 1) if rate else None,
+            }
+        return rates
+
+    def snapshot(self):
+        """The progress payload: fields, counters, the latest errors and warnings, stage throughput and ETA"""
+        with self._lock:
+            elapsed = time.time() - self.start_time
+            processed = self.fields.get('processed_files', 0)
+            remaining = max(0, self.fields.get('total_files', 0) - processed)
+            rate = processed / elapsed if processed and elapsed > 0 else 0
+            payload = dict(self.fields)
+            payload.update(
+                errors=list(self.errors),
+                error_count=self.error_count,
+                warnings=list(self.warnings),
+                warning_count=self.warning_count,
+                elapsed_seconds=round(elapsed, 1),
+                files_per_sec=round(rate, 1),
+                estimated_time_remaining=remaining / rate if rate else 0,
+                stage_rates=self._stage_rates(remaining),
+            )
+            return payload
+
+    def publish(self):
+        """Write the current snapshot to the cache now"""
+        with self._lock:
+            payload = self.snapshot()
+            cache.set(progress_key(self.upload_id), payload, timeout=self.timeout)
+            self.published_at = time.monotonic()
+            self.published_files = self.fields.get('processed_files', 0)
+            self.publish_count += 1
+            return payload
+
+    def _maybe_publish(self, force=False):
+        now = time.monotonic()
+        if (force or self.published_at is None or now - self.published_at >= self.interval or
+                self.fields.get('processed_files', 0) - self.published_files >= self.every_files):
+            self.publish()
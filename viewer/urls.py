@@ -39,6 +39,13 @@ urlpatterns = [
     path('api/enhanced-upload-progress/<str:upload_id>/', views.get_enhanced_upload_progress, name='get_enhanced_upload_progress'),
     path('api/enhanced-upload-result/<str:upload_id>/', views.get_enhanced_upload_result, name='get_enhanced_upload_result'),
     
+    # Resumable chunked uploads
+    path('api/upload-preflight/', views.upload_preflight, name='upload_preflight'),
+    path('api/upload-sessions/', views.create_upload_session, name='create_upload_session'),
+    path('api/upload-sessions/<uuid:session_id>/', views.upload_session, name='upload_session'),
+    path('api/upload-sessions/<uuid:session_id>/files/<int:file_index>/chunks/<int:chunk_index>/', views.upload_session_chunk, name='upload_session_chunk'),
+    path('api/upload-sessions/<uuid:session_id>/complete/', views.complete_upload_session, name='complete_upload_session'),
+    
     # Study and image data - Updated endpoints for JavaScript compatibility
     path('api/get-study-images/<int:study_id>/', views.get_study_images, name='get_study_images'),
     path('api/get-image-data/<int:image_id>/', views.get_image_data, name='get_image_data'),
@@ -73,6 +80,8 @@ urlpatterns = [
     path('api/images/<int:image_id>/annotations/', views.get_annotations, name='get_annotations'),
     path('api/images/<int:image_id>/clear-measurements/', views.clear_measurements, name='clear_measurements'),
     path('api/measurements/hu/', views.measure_hu, name='measure_hu'),
+    path('api/measurements/hu/batch/', views.measure_hu_batch, name='measure_hu_batch'),
+    path('api/images/<int:image_id>/hu-probe/', views.probe_hu, name='probe_hu'),
     
     # API connectivity test
     path('api/test-connectivity/', views.test_connectivity, name='test_connectivity'),
@@ -105,6 +114,12 @@ urlpatterns = [
     # Advanced Reconstruction functionality
     path('api/series/<int:series_id>/mip/', views.generate_mip, name='generate_mip'),
     path('api/series/<int:series_id>/mpr/', views.generate_mpr, name='generate_mpr'),
+    path('api/series/<int:series_id>/cpr/', views.generate_cpr, name='generate_cpr'),
+    path('api/series/<int:series_id>/rotating-mip/', views.generate_rotating_mip, name='generate_rotating_mip'),
+    path('api/series/<int:series_id>/rotating-mip/<str:key>/', views.rotating_mip_status, name='rotating_mip_status'),
+    path('api/series/<int:series_id>/rotating-mip/<str:key>/frames/<int:index>/', views.rotating_mip_frame, name='rotating_mip_frame'),
+    path('api/series/<int:series_id>/rotating-mip/<str:key>/stream/', views.rotating_mip_stream, name='rotating_mip_stream'),
+    path('api/series/<int:series_id>/intensity-statistics/', views.series_intensity_statistics, name='series_intensity_statistics'),
     path('api/series/<int:series_id>/bone-reconstruction/', views.generate_bone_reconstruction, name='generate_bone_reconstruction'),
     path('api/series/<int:series_id>/angiogram-analysis/', views.generate_angiogram_analysis, name='generate_angiogram_analysis'),
     path('api/series/<int:series_id>/volume-rendering/', views.generate_volume_rendering, name='generate_volume_rendering'),
@@ -1,10 +1,11 @@
 # dicom_viewer/views.py
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
+from django.core.files.move import file_move_safe
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User, Group
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView
@@ -14,6 +15,7 @@ from django.urls import reverse_lazy
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+import hashlib
 import json
 import os
 import pydicom
@@ -21,16 +23,27 @@ from datetime import datetime
 import numpy as np
 from .models import (
     DicomStudy, DicomSeries, DicomImage, Measurement, Annotation,
-    Facility, Report, WorklistEntry, AIAnalysis, Notification, BoneReconstruction, AngiogramAnalysis, CardiacAnalysis, NeurologicalAnalysis, OrthopedicAnalysis, VolumeRendering
+    Facility, Report, WorklistEntry, AIAnalysis, Notification, BoneReconstruction, AngiogramAnalysis, CardiacAnalysis, NeurologicalAnalysis, OrthopedicAnalysis, VolumeRendering,
+    UploadSession
 )
 from django.contrib.auth.models import Group
 from .serializers import DicomStudySerializer, DicomImageSerializer
+from .archive_reader import is_archive, iter_dicom_members, store_member
+from .chunked_upload import MAX_FILES, UploadSessionError, chunked_uploads
+from .dicom_sniff import RAW, sniff
+from .ingest import IngestWriter, parse_headers, stored_instances
+from .jobs import job_queue
+from .tasks import UPLOAD_QUEUE, ingest_upload_session, process_bulk_upload
+from .intensity_stats import intensity_index
+from .upload_handlers import StreamedDicomFile, discard_unclaimed_uploads, move_into_storage
+from .upload_progress import ProgressReporter, progress_key
 import io
 from scipy import stats
+import multiprocessing
 import threading
 import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from django.core.cache import cache
 from django.db import transaction
 import gc
@@ -98,44 +111,45 @@ def ensure_directories():
             raise
 
 
+def _discard_upload(uploaded_file):
+    """Remove a rejected upload that the streaming upload handler already wrote to storage"""
+    if isinstance(uploaded_file, StreamedDicomFile):
+        uploaded_file.discard()
+
+
 class EnhancedBulkUploadManager:
     """Enhanced bulk upload manager for handling large files with multiple folders"""
     
-    def __init__(self, user, facility=None):
+    def __init__(self, user, facility=None, upload_id=None):
         self.user = user
         self.facility = facility
-        self.upload_id = str(uuid.uuid4())
-        self.progress = {
-            'total_files': 0,
-            'processed_files': 0,
-            'successful_files': 0,
-            'failed_files': 0,
-            'current_study': None,
-            'current_series': None,
-            'status': 'initializing',
-            'errors': [],
-            'warnings': [],
-            'studies_created': 0,
-            'series_created': 0,
-            'images_processed': 0,
-            'total_size_mb': 0,
-            'processed_size_mb': 0,
-            'estimated_time_remaining': 0,
-            'current_folder': None,
-            'folder_progress': 0,
-            'total_folders': 0
-        }
+        self.upload_id = upload_id or str(uuid.uuid4())
+        self.reporter = ProgressReporter(
+            self.upload_id,
+            current_study=None,
+            current_series=None,
+            current_folder=None,
+            folder_progress=0,
+            total_folders=0
+        )
         self.studies = {}
         self.lock = threading.Lock()
+        self.writer = IngestWriter(user, facility)
         self.temp_dir = None
         self.chunk_size = 50  # Process 50 files at a time
-        self.max_workers = 4  # Number of worker threads
+        self.max_workers = None  # Header-parsing processes; None sizes the pool to the available cores
+        self.parse_workers = 1
+    
+    @property
+    def progress(self):
+        """Current progress payload (the snapshot that is published to the cache)"""
+        return self.reporter.snapshot()
         
     def process_folder_upload(self, folder_files):
         """Process folder upload with multiple DICOM files"""
         try:
-            self.start_time = time.time()
-            self.update_progress(
+            self.reporter.start()
+            self.reporter.set(
                 status='processing_folder',
                 total_files=len(folder_files),
                 current_folder='Uploading folder contents'
@@ -144,51 +158,58 @@ class EnhancedBulkUploadManager:
             # Process files in chunks
             processed_files = []
             failed_files = []
+            skipped_files = 0
             
             for i, uploaded_file in enumerate(folder_files):
                 try:
                     # Check file size
                     if uploaded_file.size > 5 * 1024 * 1024 * 1024:  # 5GB limit
+                        _discard_upload(uploaded_file)
                         failed_files.append(f"File {uploaded_file.name} is too large (max 5GB)")
                         continue
                     
-                    # Try to read as DICOM
-                    file_content = uploaded_file.read()
-                    uploaded_file.seek(0)  # Reset file pointer
+                    # Files that do not start like DICOM are skipped without being parsed
+                    kind = sniff(uploaded_file)
+                    if kind is None:
+                        _discard_upload(uploaded_file)
+                        skipped_files += 1
+                        self.reporter.increment(processed_files=1, skipped_files=1)
+                        continue
                     
                     # Check if it's a DICOM file
                     try:
-                        # First try standard DICOM reading
-                        try:
-                            dicom_data = pydicom.dcmread(io.BytesIO(file_content))
-                        except pydicom.errors.InvalidDicomError:
-                            # If it fails due to missing DICM header, try with force=True
-                            dicom_data = pydicom.dcmread(io.BytesIO(file_content), force=True)
-                        
-                        # Save file temporarily and process
-                        temp_path = default_storage.save(
-                            f'temp/{uploaded_file.name}',
-                            ContentFile(file_content)
-                        )
+                        if isinstance(uploaded_file, StreamedDicomFile):
+                            # Already in dicom_files/ with its header parsed by the streaming upload handler
+                            stored_path = uploaded_file.storage_name
+                            dicom_data = uploaded_file.dicom_header
+                            content_sha256 = uploaded_file.sha256
+                            if dicom_data is None:
+                                raise pydicom.errors.InvalidDicomError('No DICOM header found')
+                        else:
+                            file_content = uploaded_file.read()
+                            uploaded_file.seek(0)  # Reset file pointer
+                            # One read; only datasets without the DICM preamble need force=True
+                            dicom_data = pydicom.dcmread(io.BytesIO(file_content), force=kind == RAW)
+                            content_sha256 = hashlib.sha256(file_content).hexdigest()
+                            stored_path = default_storage.save(
+                                f'dicom_files/{uuid.uuid4()}_{uploaded_file.name}',
+                                ContentFile(file_content)
+                            )
                         
-                        # Process DICOM file
-                        result = self.process_single_dicom_file(temp_path, dicom_data)
+                        # Queue the DICOM file; the stored file becomes the image's file
+                        result = self.process_single_dicom_file(stored_path, dicom_data, content_sha256)
                         if result['success']:
-                            processed_files.append(result)
+                            processed_files.append((uploaded_file.name, result['pending']))
                         else:
                             failed_files.append(f"Failed to process {uploaded_file.name}: {result['error']}")
-                        
-                        # Clean up temp file
-                        try:
-                            default_storage.delete(temp_path)
-                        except:
-                            pass
+                            default_storage.delete(stored_path)
                             
                     except Exception as dicom_error:
+                        _discard_upload(uploaded_file)
                         failed_files.append(f"Not a valid DICOM file: {uploaded_file.name} - {str(dicom_error)}")
                         
                     # Update progress
-                    self.update_progress(
+                    self.reporter.set(
                         processed_files=i + 1,
                         successful_files=len(processed_files),
                         failed_files=len(failed_files)
@@ -198,96 +219,42 @@ class EnhancedBulkUploadManager:
                     logger.error(f"Error processing file {uploaded_file.name}: {file_error}")
                     failed_files.append(f"Error processing {uploaded_file.name}: {str(file_error)}")
             
-            self.update_progress(
+            self.writer.flush()
+            processed_files = self.collect_results(processed_files, failed_files)
+            intensity_index.refresh_many(DicomSeries.objects.filter(id__in={p.series_id for p in processed_files}))
+            
+            self.reporter.set(
+                successful_files=len(processed_files),
+                failed_files=len(failed_files),
                 status='completed',
-                message=f'Folder upload completed. {len(processed_files)} files processed successfully, {len(failed_files)} failed.'
+                message=f'Folder upload completed. {len(processed_files)} files processed successfully, '
+                        f'{len(failed_files)} failed, {skipped_files} skipped as not DICOM.'
             )
             
             return {
                 'success': True,
                 'processed_files': len(processed_files),
                 'failed_files': len(failed_files),
+                'skipped_files': skipped_files,
                 'total_files': len(folder_files)
             }
             
         except Exception as e:
             logger.error(f"Error in folder upload processing: {e}")
-            self.update_progress(
-                status='failed',
-                errors=self.progress['errors'] + [str(e)]
-            )
+            self.reporter.error(str(e))
+            self.reporter.set(status='failed')
             return {
                 'success': False,
                 'error': str(e)
             }
     
-    def process_single_dicom_file(self, file_path, dicom_data):
-        """Process a single DICOM file and create database entries"""
+    def process_single_dicom_file(self, file_path, dicom_data, sha256=''):
+        """Queue a single stored DICOM file for the next batched database write"""
         try:
-            # Extract metadata
-            study_uid = str(dicom_data.get('StudyInstanceUID', ''))
-            series_uid = str(dicom_data.get('SeriesInstanceUID', ''))
-            instance_uid = str(dicom_data.get('SOPInstanceUID', ''))
-            
-            if not study_uid:
-                study_uid = f"STUDY_{uuid.uuid4()}"
-            if not series_uid:
-                series_uid = f"SERIES_{uuid.uuid4()}"
-            if not instance_uid:
-                instance_uid = f"INSTANCE_{uuid.uuid4()}"
-            
-            # Create or get study
-            study, created = DicomStudy.objects.get_or_create(
-                study_instance_uid=study_uid,
-                defaults={
-                    'patient_name': str(dicom_data.get('PatientName', 'Unknown')),
-                    'patient_id': str(dicom_data.get('PatientID', 'Unknown')),
-                    'study_date': getattr(dicom_data, 'StudyDate', None),
-                    'study_description': str(dicom_data.get('StudyDescription', '')),
-                    'modality': str(dicom_data.get('Modality', 'OT')),
-                    'uploaded_by': self.user,
-                    'facility': self.facility
-                }
-            )
-            
-            # Create or get series
-            series, created = DicomSeries.objects.get_or_create(
-                series_instance_uid=series_uid,
-                study=study,
-                defaults={
-                    'series_number': int(dicom_data.get('SeriesNumber', 1)),
-                    'series_description': str(dicom_data.get('SeriesDescription', '')),
-                    'modality': str(dicom_data.get('Modality', 'OT')),
-                    'body_part_examined': str(dicom_data.get('BodyPartExamined', ''))
-                }
-            )
-            
-            # Create image
-            image = DicomImage.objects.create(
-                series=series,
-                sop_instance_uid=instance_uid,
-                instance_number=int(dicom_data.get('InstanceNumber', 1)),
-                file_path=file_path,
-                # Extract additional DICOM metadata
-                rows=int(dicom_data.get('Rows', 512)),
-                columns=int(dicom_data.get('Columns', 512)),
-                bits_allocated=int(dicom_data.get('BitsAllocated', 16)),
-                photometric_interpretation=str(dicom_data.get('PhotometricInterpretation', '')),
-                samples_per_pixel=int(dicom_data.get('SamplesPerPixel', 1)),
-                # Window/Level settings for proper display
-                window_width=float(dicom_data.get('WindowWidth', 400)) if dicom_data.get('WindowWidth') else None,
-                window_center=float(dicom_data.get('WindowCenter', 40)) if dicom_data.get('WindowCenter') else None,
-                # Pixel spacing
-                pixel_spacing_x=float(dicom_data.get('PixelSpacing', [1.0, 1.0])[0]) if dicom_data.get('PixelSpacing') else None,
-                pixel_spacing_y=float(dicom_data.get('PixelSpacing', [1.0, 1.0])[1]) if dicom_data.get('PixelSpacing') else None,
-                slice_thickness=float(dicom_data.get('SliceThickness', 1.0)) if dicom_data.get('SliceThickness') else None
-            )
-            
+            pending = self.writer.add(dicom_data, file_path, sha256=sha256)
             return {
                 'success': True,
-                'study_id': study.id,
-                'series_id': series.id,
-                'image_id': image.id
+                'pending': pending
             }
             
         except Exception as e:
@@ -296,53 +263,27 @@ class EnhancedBulkUploadManager:
                 'success': False,
                 'error': str(e)
             }
-        
-    def update_progress(self, **kwargs):
-        """Thread-safe progress update with enhanced metrics"""
-        with self.lock:
-            self.progress.update(kwargs)
-            # Calculate estimated time remaining
-            if self.progress['processed_files'] > 0:
-                elapsed_time = time.time() - self.start_time
-                rate = self.progress['processed_files'] / elapsed_time
-                remaining_files = self.progress['total_files'] - self.progress['processed_files']
-                if rate > 0:
-                    self.progress['estimated_time_remaining'] = remaining_files / rate
-            
-            # Cache progress for frontend polling
-            cache.set(f'upload_progress_{self.upload_id}', self.progress, timeout=7200)  # 2 hours
     
-    def extract_archive(self, uploaded_file):
-        """Extract uploaded archive (zip, tar, etc.) to temporary directory"""
-        try:
-            self.temp_dir = tempfile.mkdtemp(prefix=f'bulk_upload_{self.upload_id}_')
-            
-            if uploaded_file.name.lower().endswith('.zip'):
-                with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
-                    zip_ref.extractall(self.temp_dir)
+    def collect_results(self, queued, failed_files):
+        """Flushed handles of the queued (name, pending) files that were written; removes files of the rest"""
+        written, warnings = [], []
+        for name, pending in queued:
+            if pending.error:
+                failed_files.append(f"Failed to process {name}: {pending.error}")
+            elif not pending.created:
+                warnings.append(f"{name} is already stored (SOP Instance UID {pending.sop_instance_uid})")
             else:
-                # For other archive types, save and extract
-                temp_path = os.path.join(self.temp_dir, uploaded_file.name)
-                with open(temp_path, 'wb') as f:
-                    for chunk in uploaded_file.chunks():
-                        f.write(chunk)
-                
-                # Extract based on file type
-                if uploaded_file.name.lower().endswith('.tar.gz'):
-                    import tarfile
-                    with tarfile.open(temp_path, 'r:gz') as tar:
-                        tar.extractall(self.temp_dir)
-                elif uploaded_file.name.lower().endswith('.tar'):
-                    import tarfile
-                    with tarfile.open(temp_path, 'r') as tar:
-                        tar.extractall(self.temp_dir)
-            
-            return True
-        except Exception as e:
-            logger.error(f"Failed to extract archive: {e}")
-            self.update_progress(errors=self.progress['errors'] + [f"Archive extraction failed: {str(e)}"])
-            return False
-    
+                written.append(pending)
+                continue
+            default_storage.delete(str(pending.file_path))
+        self.reporter.warning(*warnings)
+        self.reporter.set(
+            studies_created=len(self.writer.created_study_ids),
+            series_created=len(self.writer.created_series_ids),
+            images_processed=self.writer.images_created
+        )
+        return written
+        
     def scan_files(self):
         """Scan extracted files to count and categorize them"""
         if not self.temp_dir or not os.path.exists(self.temp_dir):
@@ -350,62 +291,39 @@ class EnhancedBulkUploadManager:
         
         files = []
         total_size = 0
+        skipped = 0
         
         for root, dirs, filenames in os.walk(self.temp_dir):
             for filename in filenames:
                 file_path = os.path.join(root, filename)
                 file_size = os.path.getsize(file_path)
                 
-                # Check if file is likely a DICOM file
-                if self.is_dicom_candidate(filename, file_size):
-                    files.append({
-                        'path': file_path,
-                        'name': filename,
-                        'size': file_size,
-                        'relative_path': os.path.relpath(file_path, self.temp_dir)
-                    })
-                    total_size += file_size
+                # Only files whose first bytes look like DICOM are handed to the parser
+                if sniff(file_path) is None:
+                    skipped += 1
+                    continue
+                files.append({
+                    'path': file_path,
+                    'name': filename,
+                    'size': file_size,
+                    'relative_path': os.path.relpath(file_path, self.temp_dir)
+                })
+                total_size += file_size
         
         self.files_to_process = files
-        self.update_progress(
+        self.reporter.set(
             total_files=len(files),
             total_size_mb=total_size / (1024 * 1024),
+            skipped_files=skipped,
             status='scanning_complete'
         )
         
         return len(files) > 0
     
-    def is_dicom_candidate(self, filename, file_size):
-        """Enhanced DICOM file detection"""
-        filename_lower = filename.lower()
-        
-        # Explicit DICOM extensions
-        dicom_extensions = ['.dcm', '.dicom', '.img', '.ima']
-        if any(filename_lower.endswith(ext) for ext in dicom_extensions):
-            return True
-        
-        # Compressed DICOM files
-        compressed_extensions = ['.dcm.gz', '.dicom.gz', '.dcm.bz2', '.dicom.bz2']
-        if any(filename_lower.endswith(ext) for ext in compressed_extensions):
-            return True
-        
-        # Raw data files
-        raw_extensions = ['.raw', '.dat', '.bin']
-        if any(filename_lower.endswith(ext) for ext in raw_extensions):
-            return True
-        
-        # Files without extension (common for DICOM)
-        if '.' not in filename:
-            return file_size > 512
-        
-        # Large files that might be DICOM
-        if file_size > 1024:  # 1KB minimum
-            return True
-        
-        return False
-    
-    def process_file_batch(self, files_batch):
-        """Process a batch of files with enhanced error handling"""
+    def process_file_batch(self, files_batch, parsed=None):
+        """Group a batch's header descriptors by study and series; parsed is parse_headers' result if already run"""
+        descriptors, parse_seconds = parsed or parse_headers([file_info['path'] for file_info in files_batch])
+        self.reporter.stage('parse', len(files_batch), parse_seconds, workers=self.parse_workers)
         batch_results = {
             'successful': [],
             'failed': [],
@@ -413,7 +331,7 @@ class EnhancedBulkUploadManager:
             'total_size': 0
         }
         
-        for file_info in files_batch:
+        for file_info, descriptor in zip(files_batch, descriptors):
             try:
                 file_path = file_info['path']
                 file_size = file_info['size']
@@ -421,52 +339,30 @@ class EnhancedBulkUploadManager:
                 # Check file size (5GB limit for individual files)
                 if file_size > 5 * 1024 * 1024 * 1024:
                     batch_results['failed'].append(f"File {file_info['name']} is too large (max 5GB)")
+                    self.discard_stored(file_info)
                     continue
                 
-                # Read DICOM data with multiple fallback methods
-                dicom_data = None
-                try:
-                    # Method 1: Direct read
-                    dicom_data = pydicom.dcmread(file_path)
-                except Exception as e1:
-                    try:
-                        # Method 2: Force read
-                        dicom_data = pydicom.dcmread(file_path, force=True)
-                    except Exception as e2:
-                        try:
-                            # Method 3: Read with specific transfer syntax
-                            dicom_data = pydicom.dcmread(file_path, force=True, specific_char_set='utf-8')
-                        except Exception as e3:
-                            logger.error(f"Failed to read DICOM file {file_info['name']}: {e1}, {e2}, {e3}")
-                            batch_results['failed'].append(f"Could not read DICOM data from {file_info['name']}")
-                            continue
-                
-                if not dicom_data:
-                    batch_results['failed'].append(f"No DICOM data found in {file_info['name']}")
+                # Only the header was parsed; pixel data stays on disk until the image is indexed
+                if descriptor is None:
+                    logger.error(f"Failed to read DICOM file {file_info['name']}")
+                    batch_results['failed'].append(f"Could not read DICOM data from {file_info['name']}")
+                    self.discard_stored(file_info)
                     continue
                 
                 # Get study UID with fallback
-                study_uid = str(dicom_data.get('StudyInstanceUID', ''))
+                study_uid = str(descriptor.get('StudyInstanceUID', ''))
                 if not study_uid:
                     study_uid = f"STUDY_{uuid.uuid4()}"
                 
                 # Get series UID with fallback
-                series_uid = str(dicom_data.get('SeriesInstanceUID', ''))
+                series_uid = str(descriptor.get('SeriesInstanceUID', ''))
                 if not series_uid:
                     series_uid = f"SERIES_{uuid.uuid4()}"
                 
                 # Group by study and series
-                if study_uid not in batch_results['studies']:
-                    batch_results['studies'][study_uid] = {
-                        'study_data': dicom_data,
-                        'series': {}
-                    }
-                
-                if series_uid not in batch_results['studies'][study_uid]['series']:
-                    batch_results['studies'][study_uid]['series'][series_uid] = []
-                
-                batch_results['studies'][study_uid]['series'][series_uid].append({
-                    'dicom_data': dicom_data,
+                series = batch_results['studies'].setdefault(study_uid, {'series': {}})['series']
+                series.setdefault(series_uid, []).append({
+                    'header': descriptor,
                     'file_path': file_path,
                     'file_info': file_info
                 })
@@ -481,124 +377,162 @@ class EnhancedBulkUploadManager:
         return batch_results
     
     def process_study(self, study_uid, study_data):
-        """Process a study with enhanced series handling"""
+        """Process a study; its images are written to the database in batches"""
         try:
-            # Extract study information
-            study_info = self.extract_study_info(study_data['study_data'])
-            
-            # Create or get study
-            study, created = DicomStudy.objects.get_or_create(
-                study_instance_uid=study_uid,
-                defaults=study_info
-            )
-            
-            if created:
-                self.update_progress(studies_created=self.progress['studies_created'] + 1)
-            
-            # Process each series
+            queued = []
             for series_uid, series_files in study_data['series'].items():
-                if series_files:
-                    series_info = self.extract_series_info(series_files[0]['dicom_data'])
-                    
-                    # Create or get series
-                    series, series_created = DicomSeries.objects.get_or_create(
-                        study=study,
-                        series_instance_uid=series_uid,
-                        defaults=series_info
-                    )
-                    
-                    if series_created:
-                        self.update_progress(series_created=self.progress['series_created'] + 1)
-                    
-                    # Process images in series
-                    for image_data in series_files:
-                        try:
-                            self.process_image(series, image_data)
-                            self.update_progress(images_processed=self.progress['images_processed'] + 1)
-                        except Exception as e:
-                            logger.error(f"Error processing image in series {series_uid}: {e}")
-                            self.update_progress(errors=self.progress['errors'] + [f"Image processing error: {str(e)}"])
+                for image_data in series_files:
+                    try:
+                        queued.append((os.path.basename(image_data['file_path']), self.process_image(image_data)))
+                    except Exception as e:
+                        logger.error(f"Error processing image in series {series_uid}: {e}")
+                        self.reporter.error(f"Image processing error: {str(e)}")
+            
+            self.writer.flush()
+            failed = []
+            written = self.collect_results(queued, failed)
+            self.reporter.error(*failed)
+            intensity_index.refresh_many(DicomSeries.objects.filter(id__in={p.series_id for p in written}))
             
             return True
             
         except Exception as e:
             logger.error(f"Error processing study {study_uid}: {e}")
-            self.update_progress(errors=self.progress['errors'] + [f"Study processing error: {str(e)}"])
+            self.reporter.error(f"Study processing error: {str(e)}")
             return False
     
-    def extract_study_info(self, dicom_data):
-        """Extract study information from DICOM data"""
-        return {
-            'patient_name': str(dicom_data.get('PatientName', 'Unknown')),
-            'patient_id': str(dicom_data.get('PatientID', 'Unknown')),
-            'study_date': self.parse_dicom_date(str(dicom_data.get('StudyDate', ''))),
-            'study_time': self.parse_dicom_time(str(dicom_data.get('StudyTime', ''))),
-            'study_description': str(dicom_data.get('StudyDescription', '')),
-            'modality': str(dicom_data.get('Modality', 'OT')),
-            'institution_name': str(dicom_data.get('InstitutionName', '')),
-            'accession_number': str(dicom_data.get('AccessionNumber', '')),
-            'referring_physician': str(dicom_data.get('ReferringPhysicianName', '')),
-            'uploaded_by': self.user,
-            'facility': self.facility
-        }
+    def discard_stored(self, file_info):
+        """Delete an archive member already copied into storage that will not be ingested"""
+        if 'storage_name' in file_info:
+            default_storage.delete(file_info['storage_name'])
     
-    def extract_series_info(self, dicom_data):
-        """Extract series information from DICOM data"""
-        return {
-            'series_number': int(dicom_data.get('SeriesNumber', 0)),
-            'series_description': str(dicom_data.get('SeriesDescription', '')),
-            'modality': str(dicom_data.get('Modality', 'OT')),
-            'body_part_examined': str(dicom_data.get('BodyPartExamined', ''))
-        }
+    def process_image(self, image_data):
+        """Queue the image row of a DICOM file, moving it into storage unless it was read straight there"""
+        stored_path = image_data['file_info'].get('storage_name')
+        if stored_path is None:
+            stored_path = move_into_storage(image_data['file_path'], image_data['file_info']['name'])
+        return self.writer.add(image_data['header'], stored_path, sha256=image_data['file_info'].get('sha256', ''))
     
-    def process_image(self, series, image_data):
-        """Process individual DICOM image"""
-        dicom_data = image_data['dicom_data']
-        file_path = image_data['file_path']
-        
-        # Get SOP Instance UID
-        sop_instance_uid = str(dicom_data.get('SOPInstanceUID', f"INSTANCE_{uuid.uuid4()}"))
-        
-        # Create or get image
-        image, created = DicomImage.objects.get_or_create(
-            series=series,
-            sop_instance_uid=sop_instance_uid,
-            defaults={
-                'instance_number': int(dicom_data.get('InstanceNumber', 0)),
-                'rows': int(dicom_data.get('Rows', 0)),
-                'columns': int(dicom_data.get('Columns', 0)),
-                'pixel_spacing_x': float(dicom_data.get('PixelSpacing', [1.0, 1.0])[0]) if dicom_data.get('PixelSpacing') else None,
-                'pixel_spacing_y': float(dicom_data.get('PixelSpacing', [1.0, 1.0])[1]) if dicom_data.get('PixelSpacing') else None,
-                'slice_thickness': float(dicom_data.get('SliceThickness', 1.0)),
-                'window_width': float(dicom_data.get('WindowWidth', 400)),
-                'window_center': float(dicom_data.get('WindowCenter', 40)),
-                'bits_allocated': int(dicom_data.get('BitsAllocated', 16)),
-                'image_number': int(dicom_data.get('ImageNumber', 0)),
-                'photometric_interpretation': str(dicom_data.get('PhotometricInterpretation', 'MONOCHROME2')),
-                'samples_per_pixel': int(dicom_data.get('SamplesPerPixel', 1))
-            }
+    def merge_batch(self, batch_result):
+        """Record a parsed batch's progress and write its studies"""
+        start = time.perf_counter()
+        self.reporter.error(*batch_result['failed'])
+        self.reporter.increment(
+            processed_files=len(batch_result['successful']) + len(batch_result['failed']),
+            successful_files=len(batch_result['successful']),
+            failed_files=len(batch_result['failed']),
+            processed_size_mb=batch_result['total_size']/(1024*1024)
         )
         
-        if created:
-            # Save file to storage
-            unique_filename = f"{uuid.uuid4()}_{os.path.basename(file_path)}"
-            with open(file_path, 'rb') as f:
-                image.file_path.save(unique_filename, ContentFile(f.read()))
-            
-            # Save DICOM metadata
-            image.save_dicom_metadata()
+        # Process studies
+        for study_uid, study_data in batch_result['studies'].items():
+            self.reporter.set(current_study=study_uid)
+            self.process_study(study_uid, study_data)
+        self.reporter.stage('write', len(batch_result['successful']), time.perf_counter() - start)
+    
+    def available_workers(self):
+        """Header-parsing processes: max_workers, else BULK_UPLOAD_PARSE_WORKERS, else the usable cores"""
+        from django.conf import settings
+        workers = self.max_workers or getattr(settings, 'BULK_UPLOAD_PARSE_WORKERS', None)
+        if not workers:
+            try:
+                workers = len(os.sched_getaffinity(0))
+            except AttributeError:
+                workers = os.cpu_count() or 1
+        return max(1, workers)
+    
+    def iter_archive(self, fileobj, name):
+        """file_info dicts for an archive's DICOM members, each copied into dicom_files/ as it is read"""
+        def skipped(member_name, size):
+            self.reporter.increment(skipped_files=1)
+        
+        for member in iter_dicom_members(fileobj, name, on_skip=skipped):
+            if member.size > 5 * 1024 * 1024 * 1024:
+                self.reporter.error(f"File {member.basename} is too large (max 5GB)")
+                self.reporter.increment(total_files=1, processed_files=1, failed_files=1)
+                continue
+            stored_name = store_member(member)
+            self.reporter.increment(total_files=1, total_size_mb=member.size/(1024*1024))
+            yield {
+                'path': default_storage.path(stored_name),
+                'storage_name': stored_name,
+                'name': member.basename,
+                'size': member.size,
+                'relative_path': member.name
+            }
+    
+    def iter_received(self, files):
+        """file_info dicts for files received in full elsewhere: archives member by member, other files if DICOM"""
+        for file_info in files:
+            if is_archive(file_info['name']):
+                with open(file_info['path'], 'rb') as archive:
+                    yield from self.iter_archive(archive, file_info['name'])
+            elif sniff(file_info['path']) is None:
+                self.reporter.increment(skipped_files=1)
+            else:
+                self.reporter.increment(total_files=1, total_size_mb=file_info['size']/(1024*1024))
+                yield file_info
+    
+    def ingest_files(self, files):
+        """Parse files in chunks on the worker pool while the next chunks are read, then write them; returns the file count"""
+        from django.conf import settings
+        from itertools import islice
+        
+        # At most max_in_flight files are read but not yet written; reading the next chunk
+        # (decompressing it, for archives) overlaps with the workers parsing earlier ones
+        max_in_flight = max(self.chunk_size, getattr(settings, 'BULK_UPLOAD_MAX_IN_FLIGHT', 1000))
+        self.parse_workers = self.available_workers()
+        if isinstance(files, list):
+            # No more workers than there are chunks to parse
+            self.parse_workers = min(self.parse_workers, -(-len(files) // self.chunk_size))
+        files = iter(files)
+        if self.parse_workers > 1:
+            # Headers are parsed in worker processes; studies are written here, by the single ingest writer.
+            # Spawned rather than forked, so the workers inherit neither the web worker's threads nor its connections
+            executor = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                           mp_context=multiprocessing.get_context('spawn'))
+        else:
+            # One core: a single thread still overlaps parsing with decompression and file I/O
+            executor = ThreadPoolExecutor(max_workers=1)
+        
+        count = 0
+        in_flight = {}
+        with executor:
+            while True:
+                while len(in_flight) * self.chunk_size < max_in_flight:
+                    chunk = list(islice(files, self.chunk_size))
+                    if not chunk:
+                        break
+                    count += len(chunk)
+                    in_flight[executor.submit(parse_headers, [f['path'] for f in chunk])] = chunk
+                if not in_flight:
+                    break
+                
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = in_flight.pop(future)
+                    try:
+                        parsed = future.result()
+                    except Exception as e:
+                        logger.warning(f"Header parsing worker failed ({e}); parsing the batch in-process")
+                        parsed = None
+                    try:
+                        self.merge_batch(self.process_file_batch(chunk, parsed))
+                    except Exception as e:
+                        logger.error(f"Error in batch processing: {e}")
+                        self.reporter.error(f"Batch processing error: {str(e)}")
+        return count
     
     def process_upload(self, uploaded_file):
         """Main upload processing method"""
-        self.start_time = time.time()
-        self.update_progress(status='starting')
+        self.reporter.start()
+        self.reporter.set(status='starting')
         
         try:
-            # Extract archive if needed
-            if uploaded_file.name.lower().endswith(('.zip', '.tar.gz', '.tar')):
-                self.update_progress(status='extracting')
-                if not self.extract_archive(uploaded_file):
-                    return False
+            if is_archive(uploaded_file.name):
+                # Members are sniffed, stored and parsed while the archive is read; nothing is extracted
+                self.reporter.set(status='processing')
+                files = self.iter_archive(uploaded_file, uploaded_file.name)
             else:
                 # Single file upload
                 self.temp_dir = tempfile.mkdtemp(prefix=f'single_upload_{self.upload_id}_')
@@ -612,83 +546,74 @@ class EnhancedBulkUploadManager:
                     'size': uploaded_file.size,
                     'relative_path': uploaded_file.name
                 }]
-                self.update_progress(total_files=1, total_size_mb=uploaded_file.size/(1024*1024))
+                self.reporter.set(total_files=1, total_size_mb=uploaded_file.size/(1024*1024))
+                
+                # Scan files
+                if not self.scan_files():
+                    self.reporter.set(status='no_files_found')
+                    return False
+                self.reporter.set(status='processing')
+                files = self.files_to_process
             
-            # Scan files
-            if not self.scan_files():
-                self.update_progress(status='no_files_found')
+            if not self.ingest_files(files):
+                self.reporter.set(status='no_files_found')
                 return False
             
-            # Process files in chunks
-            self.update_progress(status='processing')
-            
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # Split files into chunks
-                file_chunks = [self.files_to_process[i:i + self.chunk_size] 
-                             for i in range(0, len(self.files_to_process), self.chunk_size)]
-                
-                # Submit chunks for processing
-                future_to_chunk = {executor.submit(self.process_file_batch, chunk): chunk 
-                                 for chunk in file_chunks}
-                
-                # Collect results
-                for future in as_completed(future_to_chunk):
-                    try:
-                        batch_result = future.result()
-                        
-                        # Update progress
-                        self.update_progress(
-                            processed_files=self.progress['processed_files'] + len(batch_result['successful']) + len(batch_result['failed']),
-                            successful_files=self.progress['successful_files'] + len(batch_result['successful']),
-                            failed_files=self.progress['failed_files'] + len(batch_result['failed']),
-                            processed_size_mb=self.progress['processed_size_mb'] + batch_result['total_size']/(1024*1024),
-                            errors=self.progress['errors'] + batch_result['failed']
-                        )
-                        
-                        # Process studies
-                        for study_uid, study_data in batch_result['studies'].items():
-                            self.update_progress(current_study=study_uid)
-                            self.process_study(study_uid, study_data)
-                        
-                    except Exception as e:
-                        logger.error(f"Error in batch processing: {e}")
-                        self.update_progress(errors=self.progress['errors'] + [f"Batch processing error: {str(e)}"])
-            
             # Cleanup
             if self.temp_dir and os.path.exists(self.temp_dir):
                 shutil.rmtree(self.temp_dir)
             
-            self.update_progress(status='completed')
+            self.reporter.set(status='completed')
             return True
             
         except Exception as e:
             logger.error(f"Error in bulk upload processing: {e}")
-            self.update_progress(
-                status='failed',
-                errors=self.progress['errors'] + [f"Upload processing error: {str(e)}"]
-            )
+            self.reporter.error(f"Upload processing error: {str(e)}")
+            self.reporter.set(status='failed')
             return False
     
-    def parse_dicom_date(self, date_str):
-        """Parse DICOM date string"""
-        if not date_str or date_str == 'None':
-            return None
+    def process_received_files(self, files):
+        """Ingest files already received in full (e.g. a completed chunked upload session); moves them into storage"""
+        self.reporter.start()
+        self.reporter.set(status='processing')
+        
         try:
-            return datetime.strptime(date_str, '%Y%m%d').date()
-        except:
-            return None
+            if not self.ingest_files(self.iter_received(files)):
+                self.reporter.set(status='no_files_found')
+                return False
+            
+            self.reporter.set(status='completed')
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error processing received upload files: {e}")
+            self.reporter.error(f"Upload processing error: {str(e)}")
+            self.reporter.set(status='failed')
+            return False
     
-    def parse_dicom_time(self, time_str):
-        """Parse DICOM time string"""
-        if not time_str or time_str == 'None':
-            return None
-        try:
-            # Handle various time formats
-            if len(time_str) >= 6:
-                return datetime.strptime(time_str[:6], '%H%M%S').time()
-            return None
-        except:
-            return None
+    def result(self, success):
+        """Final outcome of the upload, as reported by the upload result endpoints"""
+        progress = self.progress
+        if not success:
+            return {
+                'upload_id': self.upload_id,
+                'status': 'failed',
+                'errors': progress['errors']
+            }
+        return {
+            'upload_id': self.upload_id,
+            'status': 'completed',
+            'total_files': progress['total_files'],
+            'successful_files': progress['successful_files'],
+            'failed_files': progress['failed_files'],
+            'skipped_files': progress['skipped_files'],
+            'studies_created': progress['studies_created'],
+            'series_created': progress['series_created'],
+            'images_processed': progress['images_processed'],
+            'total_size_mb': progress['total_size_mb'],
+            'study_ids': sorted(set(self.writer.study_pks.values())),
+            'errors': progress['errors']
+        }
 
 
 class HomeView(TemplateView):
@@ -934,6 +859,46 @@ def delete_radiologist(request, pk):
     return redirect('viewer:radiologist_list')
 
 
+def _create_upload_worklist_entry(study):
+    """Schedule a newly uploaded study on the worklist, assigning the default facility if it has none"""
+    try:
+        # Get or create a default facility if none exists
+        facility = study.facility
+        if not facility:
+            facility, _ = Facility.objects.get_or_create(
+                name="Default Facility",
+                defaults={
+                    'address': 'Unknown',
+                    'phone': 'Unknown',
+                    'email': 'unknown@facility.com'
+                }
+            )
+            # Update the study with the facility
+            study.facility = facility
+            study.save()
+        
+        WorklistEntry.objects.create(
+            patient_name=study.patient_name,
+            patient_id=study.patient_id,
+            accession_number=study.accession_number or f"ACC{study.id:06d}",
+            scheduled_station_ae_title="UPLOAD",
+            scheduled_procedure_step_start_date=study.study_date or datetime.now().date(),
+            scheduled_procedure_step_start_time=study.study_time or datetime.now().time(),
+            modality=study.modality,
+            scheduled_performing_physician=study.referring_physician or "Unknown",
+            procedure_description=study.study_description,
+            facility=facility,
+            study=study,
+            status='scheduled'
+        )
+        print(f"Created worklist entry for study {study.id}")
+    except Exception as e:
+        print(f"Error creating worklist entry: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+@discard_unclaimed_uploads
 @csrf_exempt
 @require_http_methods(['POST'])
 def upload_dicom_files(request):
@@ -950,70 +915,56 @@ def upload_dicom_files(request):
             return JsonResponse({'error': 'No files provided'}, status=400)
         
         uploaded_files = []
-        study = None
         errors = []
+        skipped_files = []
+        writer = IngestWriter(
+            user=request.user if request.user.is_authenticated else None,
+            facility=request.user.facility if hasattr(request.user, 'facility') else None,
+        )
+        queued = []
+        study_ids = {}
         
         for file in files:
             try:
-                # More permissive file validation
-                file_name = file.name.lower()
                 file_size = file.size
                 
                 # Check file size - increased limit for large CT files with multiple series
                 if file_size > 5 * 1024 * 1024 * 1024:  # 5GB per file (increased for CT scans)
+                    _discard_upload(file)
                     errors.append(f"File {file.name} is too large (max 5GB per file)")
                     continue
                 
-                # More permissive DICOM file detection
-                is_dicom_candidate = (
-                    file_name.endswith(('.dcm', '.dicom')) or
-                    file_name.endswith(('.dcm.gz', '.dicom.gz')) or
-                    file_name.endswith(('.dcm.bz2', '.dicom.bz2')) or
-                    file_name.endswith('.img') or  # Common DICOM format
-                    file_name.endswith('.ima') or  # Common DICOM format
-                    file_name.endswith('.raw') or  # Raw data
-                    file_name.endswith('.dat') or  # Data files
-                    file_name.endswith('.bin') or  # Binary files
-                    '.' not in file.name or  # Files without extension
-                    file_size > 512  # Files larger than 512 bytes (likely not text)
-                )
-                
-                if not is_dicom_candidate:
-                    errors.append(f"File {file.name} does not appear to be a DICOM file")
+                # Only files whose first bytes look like DICOM reach the parser
+                kind = sniff(file)
+                if kind is None:
+                    _discard_upload(file)
+                    skipped_files.append(file.name)
                     continue
                 
-                # Save file with unique name to avoid conflicts
-                import uuid
-                unique_filename = f"{uuid.uuid4()}_{file.name}"
+                if isinstance(file, StreamedDicomFile):
+                    # Already written to dicom_files/ and parsed by the streaming upload handler
+                    file_path = file.storage_name
+                    dicom_data = file.dicom_header
+                    content_sha256 = file.sha256
+                    if dicom_data is None:
+                        file.discard()
+                        errors.append(f"Could not read DICOM data from {file.name}")
+                        continue
+                else:
+                    # Save file with unique name to avoid conflicts
+                    unique_filename = f"{uuid.uuid4()}_{file.name}"
                 
-                # Read file content once to avoid pointer issues
-                file.seek(0)
-                file_content = file.read()
-                file_path = default_storage.save(f'dicom_files/{unique_filename}', ContentFile(file_content))
+                    # Read file content once to avoid pointer issues
+                    file.seek(0)
+                    file_content = file.read()
+                    content_sha256 = hashlib.sha256(file_content).hexdigest()
+                    file_path = default_storage.save(f'dicom_files/{unique_filename}', ContentFile(file_content))
                 
-                # Try to read DICOM data with multiple fallback methods
-                dicom_data = None
-                try:
-                    # Method 1: Try reading from file path
-                    if hasattr(default_storage, 'path'):
-                        print(f"Trying to read DICOM from file path: {default_storage.path(file_path)}")
-                        dicom_data = pydicom.dcmread(default_storage.path(file_path))
-                    else:
-                        # Method 2: Try reading from bytes
-                        print(f"Trying to read DICOM from bytes for file: {file.name}")
-                        dicom_data = pydicom.dcmread(io.BytesIO(file_content))
-                except Exception as e1:
-                    print(f"Method 1 failed for {file.name}: {e1}")
+                    # One read; only datasets without the DICM preamble need force=True
                     try:
-                        # Method 3: Try reading with force=True (more permissive)
-                        if hasattr(default_storage, 'path'):
-                            print(f"Trying force=True from file path: {default_storage.path(file_path)}")
-                            dicom_data = pydicom.dcmread(default_storage.path(file_path), force=True)
-                        else:
-                            print(f"Trying force=True from bytes for file: {file.name}")
-                            dicom_data = pydicom.dcmread(io.BytesIO(file_content), force=True)
-                    except Exception as e2:
-                        print(f"Failed to read DICOM file {file.name}: {e1}, {e2}")
+                        dicom_data = pydicom.dcmread(io.BytesIO(file_content), force=kind == RAW)
+                    except Exception as e:
+                        print(f"Failed to read DICOM file {file.name}: {e}")
                         # Clean up the saved file
                         try:
                             default_storage.delete(file_path)
@@ -1027,223 +978,13 @@ def upload_dicom_files(request):
                     errors.append(f"No DICOM data found in {file.name}")
                     continue
                 
-                # Get study UID with fallback
-                study_uid = str(dicom_data.get('StudyInstanceUID', ''))
-                if not study_uid:
-                    # Try to generate a fallback study UID
-                    study_uid = f"STUDY_{uuid.uuid4()}"
-                    print(f"Generated fallback StudyInstanceUID for {file.name}: {study_uid}")
-                
-                # Create or update study with comprehensive data extraction
-                if not study:
-                    # Extract patient information with fallbacks
-                    patient_name = 'Unknown'
-                    if hasattr(dicom_data, 'PatientName'):
-                        try:
-                            patient_name = str(dicom_data.PatientName)
-                        except:
-                            patient_name = 'Unknown'
-                    
-                    patient_id = 'Unknown'
-                    if hasattr(dicom_data, 'PatientID'):
-                        try:
-                            patient_id = str(dicom_data.PatientID)
-                        except:
-                            patient_id = 'Unknown'
-                    
-                    # Extract other fields with safe fallbacks
-                    study_date = parse_dicom_date(getattr(dicom_data, 'StudyDate', None))
-                    study_time = parse_dicom_time(getattr(dicom_data, 'StudyTime', None))
-                    study_description = str(getattr(dicom_data, 'StudyDescription', ''))
-                    modality = str(dicom_data.Modality) if hasattr(dicom_data, 'Modality') else 'OT'
-                    institution_name = str(getattr(dicom_data, 'InstitutionName', ''))
-                    accession_number = str(getattr(dicom_data, 'AccessionNumber', ''))
-                    referring_physician = str(getattr(dicom_data, 'ReferringPhysicianName', ''))
-                    
-                    study, created = DicomStudy.objects.get_or_create(
-                        study_instance_uid=study_uid,
-                        defaults={
-                            'patient_name': patient_name,
-                            'patient_id': patient_id,
-                            'study_date': study_date,
-                            'study_time': study_time,
-                            'study_description': study_description,
-                            'modality': modality,
-                            'institution_name': institution_name,
-                            'uploaded_by': request.user if request.user.is_authenticated else None,
-                            'facility': request.user.facility if hasattr(request.user, 'facility') else None,
-                            'accession_number': accession_number,
-                            'referring_physician': referring_physician,
-                        }
-                    )
-                    
-                    # Create worklist entry if study was created
-                    if created:
-                        try:
-                            # Get or create a default facility if none exists
-                            facility = study.facility
-                            if not facility:
-                                facility, _ = Facility.objects.get_or_create(
-                                    name="Default Facility",
-                                    defaults={
-                                        'address': 'Unknown',
-                                        'phone': 'Unknown',
-                                        'email': 'unknown@facility.com'
-                                    }
-                                )
-                                # Update the study with the facility
-                                study.facility = facility
-                                study.save()
-                            
-                            WorklistEntry.objects.create(
-                                patient_name=study.patient_name,
-                                patient_id=study.patient_id,
-                                accession_number=study.accession_number or f"ACC{study.id:06d}",
-                                scheduled_station_ae_title="UPLOAD",
-                                scheduled_procedure_step_start_date=study.study_date or datetime.now().date(),
-                                scheduled_procedure_step_start_time=study.study_time or datetime.now().time(),
-                                modality=study.modality,
-                                scheduled_performing_physician=study.referring_physician or "Unknown",
-                                procedure_description=study.study_description,
-                                facility=facility,
-                                study=study,
-                                status='scheduled'
-                            )
-                            print(f"Created worklist entry for study {study.id}")
-                        except Exception as e:
-                            print(f"Error creating worklist entry: {e}")
-                            import traceback
-                            traceback.print_exc()
-                
-                # Create or get series with fallback UID
-                series_uid = str(dicom_data.get('SeriesInstanceUID', ''))
-                if not series_uid:
-                    series_uid = f"SERIES_{uuid.uuid4()}"
-                    print(f"Generated fallback SeriesInstanceUID for {file.name}: {series_uid}")
-                
-                series, created = DicomSeries.objects.get_or_create(
-                    study=study,
-                    series_instance_uid=series_uid,
-                    defaults={
-                        'series_number': int(dicom_data.get('SeriesNumber', 0)),
-                        'series_description': str(getattr(dicom_data, 'SeriesDescription', '')),
-                        'modality': str(dicom_data.Modality) if hasattr(dicom_data, 'Modality') else 'OT',
-                    }
-                )
-                
-                # Create image with fallback UID
-                image_instance_uid = str(dicom_data.get('SOPInstanceUID', ''))
-                if not image_instance_uid:
-                    image_instance_uid = f"IMAGE_{uuid.uuid4()}"
-                    print(f"Generated fallback SOPInstanceUID for {file.name}: {image_instance_uid}")
-                
-                # Extract image data with safe fallbacks
-                rows = 0
-                columns = 0
-                bits_allocated = 16
-                samples_per_pixel = 1
-                photometric_interpretation = 'MONOCHROME2'
-                
-                if hasattr(dicom_data, 'Rows'):
-                    try:
-                        rows = int(dicom_data.Rows)
-                    except:
-                        rows = 0
-                
-                if hasattr(dicom_data, 'Columns'):
-                    try:
-                        columns = int(dicom_data.Columns)
-                    except:
-                        columns = 0
-                
-                if hasattr(dicom_data, 'BitsAllocated'):
-                    try:
-                        bits_allocated = int(dicom_data.BitsAllocated)
-                    except:
-                        bits_allocated = 16
-                
-                if hasattr(dicom_data, 'SamplesPerPixel'):
-                    try:
-                        samples_per_pixel = int(dicom_data.SamplesPerPixel)
-                    except:
-                        samples_per_pixel = 1
-                
-                if hasattr(dicom_data, 'PhotometricInterpretation'):
-                    try:
-                        photometric_interpretation = str(dicom_data.PhotometricInterpretation)
-                    except:
-                        photometric_interpretation = 'MONOCHROME2'
-                
-                # Parse pixel spacing
-                pixel_spacing_x = None
-                pixel_spacing_y = None
-                if hasattr(dicom_data, 'PixelSpacing'):
-                    try:
-                        pixel_spacing = dicom_data.PixelSpacing
-                        if isinstance(pixel_spacing, (list, tuple)) and len(pixel_spacing) >= 2:
-                            pixel_spacing_x = float(pixel_spacing[0])
-                            pixel_spacing_y = float(pixel_spacing[1])
-                    except:
-                        pass
-                
-                # Improved window/level defaults for better visibility
-                window_center = 40
-                window_width = 400
-                
-                if hasattr(dicom_data, 'WindowCenter'):
-                    try:
-                        wc = dicom_data.WindowCenter
-                        if isinstance(wc, (list, tuple)):
-                            window_center = float(wc[0])
-                        else:
-                            window_center = float(wc)
-                    except:
-                        window_center = 40
-                
-                if hasattr(dicom_data, 'WindowWidth'):
-                    try:
-                        ww = dicom_data.WindowWidth
-                        if isinstance(ww, (list, tuple)):
-                            window_width = float(ww[0])
-                        else:
-                            window_width = float(ww)
-                    except:
-                        window_width = 400
-                
-                image, created = DicomImage.objects.get_or_create(
-                    series=series,
-                    sop_instance_uid=image_instance_uid,
-                    defaults={
-                        'image_number': int(dicom_data.get('InstanceNumber', 0)),
-                        'file_path': file_path,
-                        'rows': rows,
-                        'columns': columns,
-                        'bits_allocated': bits_allocated,
-                        'samples_per_pixel': samples_per_pixel,
-                        'photometric_interpretation': photometric_interpretation,
-                        'pixel_spacing': str(getattr(dicom_data, 'PixelSpacing', '')),
-                        'pixel_spacing_x': pixel_spacing_x,
-                        'pixel_spacing_y': pixel_spacing_y,
-                        'slice_thickness': float(getattr(dicom_data, 'SliceThickness', 0)),
-                        'window_center': window_center,
-                        'window_width': window_width,
-                    }
-                )
-                
-                if created:
-                    uploaded_files.append(file.name)
-                else:
-                    # Image already exists, but still add to uploaded files with a note
-                    uploaded_files.append(f"{file.name} (already exists)")
-                    # Clean up the duplicate file we just saved
-                    try:
-                        default_storage.delete(file_path)
-                    except:
-                        pass
+                # Rows are written in batches, one transaction per batch
+                queued.append((file.name, writer.add(dicom_data, file_path, sha256=content_sha256)))
                 
             except Exception as e:
                 print(f"Error processing file {file.name}: {e}")
                 errors.append(f"Error processing {file.name}: {str(e)}")
+                _discard_upload(file)
                 if 'file_path' in locals():
                     try:
                         default_storage.delete(file_path)
@@ -1251,23 +992,54 @@ def upload_dicom_files(request):
                         pass
                 continue
         
+        writer.flush()
+        for name, pending in queued:
+            if pending.error:
+                errors.append(f"Error processing {name}: {pending.error}")
+            elif pending.created:
+                uploaded_files.append(name)
+                study_ids.setdefault(pending.study_id, None)
+                continue
+            else:
+                # Image already exists, but still add to uploaded files with a note
+                uploaded_files.append(f"{name} (already exists)")
+                study_ids.setdefault(pending.study_id, None)
+            # Clean up the file we just saved
+            try:
+                default_storage.delete(str(pending.file_path))
+            except:
+                pass
+        
+        # Create worklist entries for the studies this upload created
+        for study in DicomStudy.objects.filter(id__in=writer.created_study_ids):
+            _create_upload_worklist_entry(study)
+        
+        # Series histograms and window presets are aggregated from the image rows just written
+        intensity_index.refresh_many(DicomSeries.objects.filter(id__in=writer.series_ids))
+        study = DicomStudy.objects.filter(id=next(iter(study_ids))).first() if study_ids else None
+        
         # Prepare response
         if not uploaded_files:
             error_message = 'No valid DICOM files were uploaded'
             if errors:
                 error_message += f'. Errors: {"; ".join(errors[:5])}'  # Limit error messages
-            return JsonResponse({'error': error_message}, status=400)
+            if skipped_files:
+                error_message += f'. Skipped {len(skipped_files)} non-DICOM files'
+            return JsonResponse({'error': error_message, 'skipped_files': len(skipped_files)}, status=400)
         
         response_data = {
             'message': f'Uploaded {len(uploaded_files)} files successfully',
             'uploaded_files': uploaded_files,
             'study_id': study.id if study else None,
             'successful_files': uploaded_files,
-            'total_studies': 1 if study else 0
+            'total_studies': len(study_ids),
+            'skipped_files': len(skipped_files)
         }
         
         if errors:
             response_data['warnings'] = errors[:5]  # Include warnings for partial success
+        if skipped_files:
+            response_data['skipped_file_names'] = skipped_files[:5]
         
         return JsonResponse(response_data)
         
@@ -1282,6 +1054,7 @@ def upload_dicom_files(request):
         return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
 
 
+@discard_unclaimed_uploads
 @csrf_exempt
 @require_http_methods(['POST'])
 def upload_dicom_folder(request):
@@ -1300,6 +1073,7 @@ def upload_dicom_folder(request):
         uploaded_files = []
         studies = {}
         errors = []
+        ingested_series = []
         
         # Group files by study
         for file in files:
@@ -1589,6 +1363,8 @@ def upload_dicom_folder(request):
                         
                         if created:
                             uploaded_files.append(study_data['files'][i])
+                            intensity_index.record_image(image, dicom_data)
+                            ingested_series.append(series)
                         else:
                             # Image already exists, but still add to uploaded files with a note
                             uploaded_files.append(f"{study_data['files'][i]} (already exists)")
@@ -1608,6 +1384,9 @@ def upload_dicom_folder(request):
                 errors.append(f"Error processing study {study_uid}: {str(e)}")
                 continue
         
+        # Series histograms and window presets are aggregated from the image rows just written
+        intensity_index.refresh_many(ingested_series)
+        
         # Prepare response
         if not uploaded_files:
             error_message = 'No valid DICOM files were uploaded'
@@ -2011,112 +1790,197 @@ def save_measurement(request):
 def measure_hu(request):
     """Measure Hounsfield Units with proper radiological reference data following global standards"""
     try:
+        from .roi import roi_values, hu_statistics_batch
+        from .volume_cache import image_hu_cache
+        
         data = json.loads(request.body)
         image = DicomImage.objects.get(id=data['image_id'])
         
-        # Load DICOM data
-        dicom_data = image.load_dicom_data()
-        if not dicom_data:
+        # Cached HU array; the file is only read on the first measurement of an image
+        try:
+            image_hu = image_hu_cache.get(image)
+        except ValueError:
             return JsonResponse({'error': 'Could not load DICOM data. The file may be corrupted or in an unsupported format.'}, status=400)
         
-        pixel_array = image.get_pixel_array()
-        if pixel_array is None:
-            return JsonResponse({'error': 'Could not get pixel data'}, status=400)
-        
         # Get ellipse coordinates
         x0, y0 = int(data['x0']), int(data['y0'])
         x1, y1 = int(data['x1']), int(data['y1'])
         
-        # Create ellipse mask
-        center_x = (x0 + x1) / 2
-        center_y = (y0 + y1) / 2
-        a = abs(x1 - x0) / 2  # semi-major axis
-        b = abs(y1 - y0) / 2  # semi-minor axis
+        # Ellipse mask evaluated only inside its bounding box
+        hu_values = roi_values(image_hu.hu, {'type': 'ellipse', 'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1})
         
-        # Create coordinate grids
-        y_coords, x_coords = np.ogrid[:pixel_array.shape[0], :pixel_array.shape[1]]
+        if len(hu_values) == 0:
+            return JsonResponse({'error': 'No pixels in ROI'}, status=400)
+        
+        statistics = hu_statistics_batch([hu_values])[0]
+        result = _hu_measurement_result(image_hu, statistics)
         
-        # Ellipse equation: ((x-cx)/a)² + ((y-cy)/b)² <= 1
-        mask = ((x_coords - center_x) / a) ** 2 + ((y_coords - center_y) / b) ** 2 <= 1
+        # Save measurement with enhanced data
+        measurement = Measurement.objects.create(
+            image=image,
+            measurement_type='ellipse',
+            coordinates=[{'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1}],
+            value=statistics['mean_hu'],
+            unit='HU',
+            hounsfield_mean=statistics['mean_hu'],
+            hounsfield_min=statistics['min_hu'],
+            hounsfield_max=statistics['max_hu'],
+            hounsfield_std=statistics['std_hu'],
+            notes=result.pop('detailed_notes'),
+            created_by=request.user if request.user.is_authenticated else None
+        )
         
-        # Extract pixel values within ellipse
-        roi_pixels = pixel_array[mask]
+        result['measurement_id'] = measurement.id
+        return JsonResponse(result)
         
-        if len(roi_pixels) == 0:
-            return JsonResponse({'error': 'No pixels in ROI'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+def _hu_measurement_result(image_hu, statistics):
+    """HU statistics combined with area and radiological interpretation for one ROI"""
+    interpretation_data = get_enhanced_hu_interpretation(
+        statistics['mean_hu'], image_hu.body_part, image_hu.study_description,
+        statistics['ci_lower'], statistics['ci_upper']
+    )
+    roi_area_mm2 = statistics['pixel_count'] * image_hu.pixel_spacing[0] * image_hu.pixel_spacing[1]
+    return {
+        **statistics,
+        'roi_area_mm2': roi_area_mm2,
+        'interpretation': interpretation_data['primary_interpretation'],
+        'tissue_type': interpretation_data['tissue_type'],
+        'clinical_significance': interpretation_data['clinical_significance'],
+        'anatomical_context': interpretation_data['anatomical_context'],
+        'reference_range': interpretation_data['reference_range'],
+        'detailed_notes': interpretation_data['detailed_notes'],
+    }
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def probe_hu(request, image_id):
+    """Live HU readout: point HU and rectangle mean/std from cached summed-area tables"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        from .hu_probe import hu_probe_index
         
-        # Convert to Hounsfield Units using standard DICOM rescaling
-        rescale_slope = getattr(dicom_data, 'RescaleSlope', 1)
-        rescale_intercept = getattr(dicom_data, 'RescaleIntercept', 0)
+        image = get_object_or_404(DicomImage, id=image_id)
         
-        # Apply rescaling to get HU values
-        hu_values = roi_pixels * rescale_slope + rescale_intercept
+        # Check if user can access this image's study
+        if not can_access_study(request.user, image.series.study):
+            return JsonResponse({'error': 'Access denied. You do not have permission to access this image.'}, status=403)
         
-        # Calculate comprehensive statistics
-        mean_hu = float(np.mean(hu_values))
-        min_hu = float(np.min(hu_values))
-        max_hu = float(np.max(hu_values))
-        std_hu = float(np.std(hu_values))
-        median_hu = float(np.median(hu_values))
+        if request.method == 'GET':
+            points = [[float(request.GET['x']), float(request.GET['y'])]] if 'x' in request.GET else []
+            rectangles = []
+            radius = int(request.GET.get('radius', 0))
+        else:
+            data = json.loads(request.body) if request.body else {}
+            points = data.get('points', [])  # [[x, y], ...] in image pixels
+            rectangles = data.get('rectangles', [])  # [[x0, y0, x1, y1], ...] inclusive
+            radius = int(data.get('radius', 0))  # optional square neighbourhood around each point
         
-        # Calculate confidence intervals (95% CI)
-        confidence_interval = stats.t.interval(0.95, len(hu_values)-1, 
-                                            loc=mean_hu, scale=std_hu/np.sqrt(len(hu_values)))
-        ci_lower = float(confidence_interval[0])
-        ci_upper = float(confidence_interval[1])
+        result = hu_probe_index.probe(image, points, rectangles, radius=max(radius, 0))
+        return JsonResponse({'image_id': image.id, 'radius': max(radius, 0), **result})
         
-        # Calculate coefficient of variation
-        cv = (std_hu / mean_hu) * 100 if mean_hu != 0 else 0
+    except (KeyError, TypeError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error probing HU for image {image_id}: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+MAX_HU_BATCH_ROIS = 500
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def measure_hu_batch(request):
+    """Measure HU statistics for many ellipse, rectangle and polygon ROIs across many images at once"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        from .roi import roi_values, hu_statistics_batch
+        from .volume_cache import image_hu_cache
         
-        # Get anatomical region from DICOM data if available
-        body_part = getattr(dicom_data, 'BodyPartExamined', '').upper()
-        study_description = getattr(dicom_data, 'StudyDescription', '').upper()
+        data = json.loads(request.body)
+        rois = data.get('rois', [])
+        persist = data.get('persist', True)
+        
+        if not rois:
+            return JsonResponse({'error': 'No ROIs provided'}, status=400)
+        if len(rois) > MAX_HU_BATCH_ROIS:
+            return JsonResponse({'error': f'At most {MAX_HU_BATCH_ROIS} ROIs per request'}, status=400)
+        
+        image_ids = {int(roi['image_id']) for roi in rois if roi.get('image_id') is not None}
+        # Images of studies the user cannot access are reported as not found
+        images = DicomImage.objects.filter(
+            series__study__in=get_user_study_queryset(request.user)).in_bulk(image_ids)
+        
+        # Gather ROI pixel values first so statistics are computed in one batch
+        values = []
+        errors = {}
+        hu_images = {}
+        for index, roi in enumerate(rois):
+            values.append(np.empty(0, dtype=np.float32))
+            image = images.get(int(roi.get('image_id') or 0))
+            if image is None:
+                errors[index] = 'Image not found'
+                continue
+            try:
+                if image.id not in hu_images:
+                    hu_images[image.id] = image_hu_cache.get(image)
+                values[index] = roi_values(hu_images[image.id].hu, roi)
+            except (KeyError, TypeError, ValueError) as e:
+                errors[index] = str(e)
+                continue
+            if len(values[index]) == 0:
+                errors[index] = 'No pixels in ROI'
         
-        # Enhanced radiological interpretation with anatomical context
-        interpretation_data = get_enhanced_hu_interpretation(
-            mean_hu, body_part, study_description, ci_lower, ci_upper
-        )
+        statistics = hu_statistics_batch(values)
         
-        # Calculate ROI area in mm² if pixel spacing available
-        pixel_spacing_x = getattr(dicom_data, 'PixelSpacing', [1, 1])[0] if hasattr(dicom_data, 'PixelSpacing') else 1
-        pixel_spacing_y = getattr(dicom_data, 'PixelSpacing', [1, 1])[1] if hasattr(dicom_data, 'PixelSpacing') else 1
-        roi_area_mm2 = len(roi_pixels) * pixel_spacing_x * pixel_spacing_y
+        results = []
+        measurements = []
+        for index, roi in enumerate(rois):
+            if index in errors:
+                results.append({'index': index, 'image_id': roi.get('image_id'), 'error': errors[index]})
+                continue
+            image = images[int(roi['image_id'])]
+            result = _hu_measurement_result(hu_images[image.id], statistics[index])
+            notes = result.pop('detailed_notes')
+            results.append({'index': index, 'image_id': image.id, 'type': roi.get('type', 'ellipse'), **result})
+            if persist:
+                coordinates = {k: roi[k] for k in ('type', 'x0', 'y0', 'x1', 'y1', 'points') if k in roi}
+                measurements.append(Measurement(
+                    image=image,
+                    measurement_type='ellipse' if roi.get('type', 'ellipse') == 'ellipse' else 'area',
+                    coordinates=[coordinates],
+                    value=result['mean_hu'],
+                    unit='HU',
+                    hounsfield_mean=result['mean_hu'],
+                    hounsfield_min=result['min_hu'],
+                    hounsfield_max=result['max_hu'],
+                    hounsfield_std=result['std_hu'],
+                    notes=notes,
+                    created_by=request.user
+                ))
         
-        # Save measurement with enhanced data
-        measurement = Measurement.objects.create(
-            image=image,
-            measurement_type='ellipse',
-            coordinates=[{'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1}],
-            value=mean_hu,
-            unit='HU',
-            hounsfield_mean=mean_hu,
-            hounsfield_min=min_hu,
-            hounsfield_max=max_hu,
-            hounsfield_std=std_hu,
-            notes=interpretation_data['detailed_notes'],
-            created_by=request.user if request.user.is_authenticated else None
-        )
+        if measurements:
+            created = Measurement.objects.bulk_create(measurements)
+            successful = [r for r in results if 'error' not in r]
+            for result, measurement in zip(successful, created):
+                result['measurement_id'] = measurement.id
         
         return JsonResponse({
-            'mean_hu': mean_hu,
-            'min_hu': min_hu,
-            'max_hu': max_hu,
-            'std_hu': std_hu,
-            'median_hu': median_hu,
-            'ci_lower': ci_lower,
-            'ci_upper': ci_upper,
-            'coefficient_of_variation': cv,
-            'pixel_count': len(roi_pixels),
-            'roi_area_mm2': roi_area_mm2,
-            'interpretation': interpretation_data['primary_interpretation'],
-            'tissue_type': interpretation_data['tissue_type'],
-            'clinical_significance': interpretation_data['clinical_significance'],
-            'anatomical_context': interpretation_data['anatomical_context'],
-            'reference_range': interpretation_data['reference_range'],
-            'measurement_id': measurement.id
+            'success': True,
+            'results': results,
+            'measured': len(rois) - len(errors),
+            'failed': len(errors)
         })
         
     except Exception as e:
+        logger.error(f"Error in batched HU measurement: {str(e)}")
         return JsonResponse({'error': str(e)}, status=400)
 
 
@@ -2447,7 +2311,7 @@ def get_3d_reconstruction(request, series_id):
     """Enhanced 3D reconstruction with MPR, bone, angiogram, and virtual surgery"""
     try:
         series = get_object_or_404(DicomSeries, id=series_id)
-        images = series.dicomimage_set.all().order_by('image_number')
+        images = series.images.all().order_by('image_number')
         
         if not images.exists():
             return Response({'error': 'No images found in series'}, status=404)
@@ -2581,6 +2445,12 @@ def get_3d_reconstruction(request, series_id):
             # Calculate Maximum Intensity Projection (MIP)
             if data['vessel_data']:
                 data['mip_data'] = calculate_mip_reconstruction(data['vessel_data'])
+            
+            # Rotating MIP cine, precomputed once and served from the reconstruction store
+            from .rotating_mip import rotating_mip_jobs
+            if images.count() >= 2:
+                key, manifest = rotating_mip_jobs.start(series)
+                data['rotating_mip'] = _rotating_mip_response(series, key, manifest)
                 
         elif reconstruction_type == 'virtual_surgery':
             # Virtual Surgery Planning
@@ -2645,13 +2515,8 @@ def calculate_volume(request):
             return JsonResponse({'error': 'At least 3 points required for volume calculation'}, status=400)
         
         # Calculate area using shoelace formula
-        area = 0
-        n = len(contour_points)
-        for i in range(n):
-            j = (i + 1) % n
-            area += contour_points[i][0] * contour_points[j][1]
-            area -= contour_points[j][0] * contour_points[i][1]
-        area = abs(area) / 2.0
+        from .roi import polygon_area
+        area = polygon_area(contour_points)
         
         # Convert to mm²
         pixel_area = pixel_spacing[0] * pixel_spacing[1]
@@ -3275,6 +3140,29 @@ def get_series_images(request, series_id):
         return Response({'error': f'Server error: {str(e)}'}, status=500)
 
 
+def _spool_upload(uploaded_file, upload_id):
+    """Keep an upload past its request, under bulk_uploads/<upload_id>/, for the job that ingests it"""
+    directory = default_storage.path(f'bulk_uploads/{upload_id}')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, os.path.basename(uploaded_file.name) or 'upload')
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        file_move_safe(uploaded_file.temporary_file_path(), path, allow_overwrite=True)
+    else:
+        with open(path, 'wb') as f:
+            for chunk in uploaded_file.chunks():
+                f.write(chunk)
+    return path
+
+
+def _job_progress(job):
+    """Progress of an upload from its job row, for when the worker's cache is not this process's"""
+    progress = dict(job.progress)
+    if job.status != 'running' or not progress:
+        progress['status'] = {'succeeded': progress.get('status', 'completed')}.get(job.status, job.status)
+    progress.update(job_status=job.status, attempts=job.attempts, error=job.error or None)
+    return progress
+
+
 @csrf_exempt
 @require_http_methods(['POST'])
 def enhanced_bulk_upload_dicom_folder(request):
@@ -3294,57 +3182,23 @@ def enhanced_bulk_upload_dicom_folder(request):
         if uploaded_file.size > 5 * 1024 * 1024 * 1024:
             return JsonResponse({'error': 'File too large (max 5GB)'}, status=400)
         
-        # Create enhanced upload manager
-        upload_manager = EnhancedBulkUploadManager(
-            user=request.user,
-            facility=request.user.facility if hasattr(request.user, 'facility') else None
-        )
-        
-        # Start background processing
-        def background_upload():
-            try:
-                success = upload_manager.process_upload(uploaded_file)
-                if success:
-                    result = {
-                        'upload_id': upload_manager.upload_id,
-                        'status': 'completed',
-                        'total_files': upload_manager.progress['total_files'],
-                        'successful_files': upload_manager.progress['successful_files'],
-                        'failed_files': upload_manager.progress['failed_files'],
-                        'studies_created': upload_manager.progress['studies_created'],
-                        'series_created': upload_manager.progress['series_created'],
-                        'images_processed': upload_manager.progress['images_processed'],
-                        'total_size_mb': upload_manager.progress['total_size_mb'],
-                        'errors': upload_manager.progress['errors']
-                    }
-                else:
-                    result = {
-                        'upload_id': upload_manager.upload_id,
-                        'status': 'failed',
-                        'errors': upload_manager.progress['errors']
-                    }
-                
-                # Store final result in cache
-                cache.set(f'upload_result_{upload_manager.upload_id}', result, timeout=7200)
-                
-            except Exception as e:
-                logger.error(f"Background upload error: {e}")
-                result = {
-                    'upload_id': upload_manager.upload_id,
-                    'status': 'failed',
-                    'error': str(e)
-                }
-                cache.set(f'upload_result_{upload_manager.upload_id}', result, timeout=7200)
-        
-        # Start background thread
-        upload_thread = threading.Thread(target=background_upload)
-        upload_thread.daemon = True
-        upload_thread.start()
+        # The upload is kept past this request and ingested by a job worker, which survives web restarts
+        upload_id = str(uuid.uuid4())
+        facility = request.user.facility if hasattr(request.user, 'facility') else None
+        path = _spool_upload(uploaded_file, upload_id)
+        job_queue.enqueue(process_bulk_upload, {
+            'upload_id': upload_id,
+            'path': path,
+            'name': uploaded_file.name,
+            'size': uploaded_file.size,
+            'user_id': request.user.id if request.user.is_authenticated else None,
+            'facility_id': facility.id if facility else None,
+        }, queue=UPLOAD_QUEUE, reference=upload_id)
         
         return JsonResponse({
-            'upload_id': upload_manager.upload_id,
-            'message': f'Started processing bulk upload in background',
-            'status': 'processing'
+            'upload_id': upload_id,
+            'message': f'Queued bulk upload for background processing',
+            'status': 'queued'
         })
         
     except Exception as e:
@@ -3364,7 +3218,10 @@ def get_enhanced_upload_progress(request, upload_id):
     try:
         progress = cache.get(f'upload_progress_{upload_id}')
         if not progress:
-            return Response({'error': 'Upload progress not found'}, status=404)
+            job = job_queue.latest(upload_id)
+            if job is None:
+                return Response({'error': 'Upload progress not found'}, status=404)
+            progress = _job_progress(job)
         
         return Response(progress)
     except Exception as e:
@@ -3377,13 +3234,145 @@ def get_enhanced_upload_result(request, upload_id):
     try:
         result = cache.get(f'upload_result_{upload_id}')
         if not result:
-            return Response({'error': 'Upload result not found'}, status=404)
+            job = job_queue.latest(upload_id)
+            if job is not None and job.status == 'succeeded':
+                result = job.result
+            elif job is not None and job.status == 'failed':
+                result = {'upload_id': upload_id, 'status': 'failed', 'error': job.error}
+            else:
+                return Response({'error': 'Upload result not found'}, status=404)
         
         return Response(result)
     except Exception as e:
         return Response({'error': f'Server error: {str(e)}'}, status=500)
 
 
+def _upload_session_error(error):
+    """JSON response for an UploadSessionError"""
+    return JsonResponse({'error': str(error), **error.details}, status=error.status)
+
+
+def _get_upload_session(request, session_id):
+    """The requesting user's upload session, or 404"""
+    session = get_object_or_404(UploadSession, pk=session_id)
+    if session.user_id is not None and session.user_id != request.user.id:
+        raise Http404('Upload session not found')
+    return session
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def upload_preflight(request):
+    """Which of the offered instances still need uploading; the JSON body lists sop_instance_uids and/or sha256s"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    offered = {}
+    for key in ('sop_instance_uids', 'sha256s'):
+        values = data.get(key) or []
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            return JsonResponse({'error': f'{key} must be a list of strings'}, status=400)
+        if len(values) > MAX_FILES:
+            return JsonResponse({'error': f'At most {MAX_FILES} {key} per request'}, status=400)
+        offered[key] = [value.strip().rstrip('\x00') for value in values]
+    offered['sha256s'] = [value.lower() for value in offered['sha256s']]
+
+    uids, hashes, study_ids = stored_instances(offered['sop_instance_uids'], offered['sha256s'])
+    # Studies the caller may not open are not named, only counted as stored
+    visible = get_user_study_queryset(request.user).filter(id__in=study_ids).values_list('id', flat=True)
+    return JsonResponse({
+        'missing_sop_instance_uids': [uid for uid in offered['sop_instance_uids'] if uid not in uids],
+        'missing_sha256s': [digest for digest in offered['sha256s'] if digest not in hashes],
+        'stored': len(uids) + len(hashes),
+        'study_ids': sorted(visible),
+    })
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def create_upload_session(request):
+    """Start a resumable chunked upload; the JSON body lists the files and may ask for a chunk_size"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    
+    try:
+        session = chunked_uploads.create(
+            data.get('files'),
+            user=request.user if request.user.is_authenticated else None,
+            facility=request.user.facility if hasattr(request.user, 'facility') else None,
+            chunk_size=data.get('chunk_size'),
+        )
+    except UploadSessionError as e:
+        return _upload_session_error(e)
+    return JsonResponse(chunked_uploads.status(session), status=201)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'DELETE'])
+def upload_session(request, session_id):
+    """Received and missing chunks of an upload session and its ingest progress; DELETE aborts it"""
+    session = _get_upload_session(request, session_id)
+    if request.method == 'DELETE':
+        if session.status == 'processing':
+            return JsonResponse({'error': 'Upload session is being processed'}, status=409)
+        chunked_uploads.discard(session)
+        return JsonResponse({'session_id': str(session_id), 'status': 'aborted'})
+    
+    payload = chunked_uploads.status(session)
+    if session.status != 'open':
+        payload['progress'] = cache.get(progress_key(session.pk))
+        job = job_queue.latest(session.pk) if payload['progress'] is None else None
+        if job is not None:
+            payload['progress'] = _job_progress(job)
+    return JsonResponse(payload)
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+def upload_session_chunk(request, session_id, file_index, chunk_index):
+    """Store one chunk, sent as the raw request body with an X-Chunk-Checksum of 'sha256:<hex>' or 'crc32:<hex>'"""
+    session = _get_upload_session(request, session_id)
+    try:
+        received = chunked_uploads.write_chunk(
+            session, file_index, chunk_index, request, request.headers.get('X-Chunk-Checksum'))
+    except UploadSessionError as e:
+        return _upload_session_error(e)
+    return JsonResponse({
+        'file_index': file_index,
+        'chunk_index': chunk_index,
+        'received': received,
+        'chunks': session.files[file_index]['chunks']
+    })
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def complete_upload_session(request, session_id):
+    """Check that every chunk arrived and ingest the session's files in the background"""
+    session = _get_upload_session(request, session_id)
+    try:
+        files = chunked_uploads.complete(session)
+    except UploadSessionError as e:
+        return _upload_session_error(e)
+    
+    # A job worker ingests the files; the job reports under the session id, like the upload progress
+    job_queue.enqueue(ingest_upload_session, {'session_id': str(session.pk)}, queue=UPLOAD_QUEUE,
+                      reference=session.pk)
+    
+    return JsonResponse({
+        'session_id': str(session.pk),
+        'upload_id': str(session.pk),
+        'files': len(files),
+        'status': 'processing'
+    }, status=202)
+
+
 @api_view(['GET'])
 def get_enhanced_image_data(request, image_id):
     """Get enhanced image data with improved resolution and density differentiation"""
@@ -3603,6 +3592,7 @@ def get_enhanced_series_images(request, series_id):
 
 
 # Add enhanced image processing imports
+from functools import partial
 import cv2
 from scipy.ndimage import gaussian_filter, median_filter, uniform_filter
 from skimage import exposure, filters, segmentation, morphology
@@ -3616,8 +3606,40 @@ import matplotlib.pyplot as plt
 class AdvancedImageProcessor:
     """Advanced image processing for X-ray refinement and MRI reconstruction"""
     
+    # Bump whenever a filter chain changes so stored results are recomputed
+    ALGORITHM_VERSION = 1
+    
     def __init__(self):
-        self.processed_cache = {}
+        from .image_ops import get_backend
+        from .tiled_executor import get_executor
+        self.ops = get_backend()
+        self.tiles = get_executor()
+    
+    @property
+    def algorithm_version(self):
+        """Version tag of the filter chains and the kernels backend that produced a result"""
+        return f'v{self.ALGORITHM_VERSION}-{self.ops.name}'
+    
+    def _bilateral(self, image, sigma_color, sigma_spatial):
+        """Tile-parallel bilateral filter"""
+        from .tiled_executor import bilateral_halo
+        return self.tiles.map(partial(self.ops.bilateral, sigma_color=sigma_color, sigma_spatial=sigma_spatial),
+                              image, halo=bilateral_halo(sigma_spatial))
+    
+    def _gaussian(self, image, sigma):
+        """Tile-parallel Gaussian blur"""
+        from .tiled_executor import gaussian_halo
+        return self.tiles.map(partial(self.ops.gaussian, sigma=sigma), image, halo=gaussian_halo(sigma))
+    
+    def _unsharp(self, image, sigma, amount):
+        """Tile-parallel unsharp masking"""
+        from .tiled_executor import gaussian_halo
+        return self.tiles.map(partial(self.ops.unsharp, sigma=sigma, amount=amount), image, halo=gaussian_halo(sigma))
+    
+    def _canny(self, image, sigma, **thresholds):
+        """Tile-parallel Canny edge map as floats"""
+        from .tiled_executor import canny_halo
+        return self.tiles.map(partial(canny, sigma=sigma, **thresholds), image, halo=canny_halo(sigma))
     
     def enhance_xray_image(self, pixel_array, enhancement_type='comprehensive'):
         """
@@ -3655,21 +3677,20 @@ class AdvancedImageProcessor:
     def _apply_comprehensive_xray_enhancement(self, image):
         """Apply comprehensive X-ray enhancement pipeline"""
         # Step 1: Noise reduction
-        denoised = denoise_bilateral(image, sigma_color=0.05, sigma_spatial=15)
+        denoised = self._bilateral(image, sigma_color=0.05, sigma_spatial=15)
         
         # Step 2: Contrast enhancement using CLAHE
-        clahe_enhanced = exposure.equalize_adapthist(denoised, clip_limit=0.03, nbins=256)
+        clahe_enhanced = self.ops.clahe(denoised, clip_limit=0.03, nbins=256)
         
         # Step 3: Edge enhancement
-        edges = canny(clahe_enhanced, sigma=1.0, low_threshold=0.1, high_threshold=0.2)
+        edges = self._canny(clahe_enhanced, sigma=1.0, low_threshold=0.1, high_threshold=0.2)
         edge_enhanced = clahe_enhanced + 0.3 * edges
         
         # Step 4: Gamma correction
         gamma_corrected = exposure.adjust_gamma(edge_enhanced, gamma=0.8)
         
         # Step 5: Unsharp masking
-        blurred = gaussian_filter(gamma_corrected, sigma=2.0)
-        unsharp_mask = gamma_corrected + 0.5 * (gamma_corrected - blurred)
+        unsharp_mask = self._unsharp(gamma_corrected, sigma=2.0, amount=0.5)
         
         return np.clip(unsharp_mask, 0, 1)
     
@@ -3695,7 +3716,7 @@ class AdvancedImageProcessor:
         eq_global = exposure.equalize_hist(image)
         
         # Local histogram equalization
-        eq_local = exposure.equalize_adapthist(image, clip_limit=0.03)
+        eq_local = self.ops.clahe(image, clip_limit=0.03)
         
         # Combine global and local
         combined = 0.6 * eq_local + 0.4 * eq_global
@@ -3708,7 +3729,7 @@ class AdvancedImageProcessor:
         tv_denoised = denoise_tv_chambolle(image, weight=0.1)
         
         # Bilateral filtering
-        bilateral_denoised = denoise_bilateral(tv_denoised, sigma_color=0.05, sigma_spatial=15)
+        bilateral_denoised = self._bilateral(tv_denoised, sigma_color=0.05, sigma_spatial=15)
         
         # Median filtering for impulse noise
         median_filtered = median_filter(bilateral_denoised, size=3)
@@ -3718,7 +3739,7 @@ class AdvancedImageProcessor:
     def _apply_bone_enhancement(self, image):
         """Enhance bone structures in X-ray images"""
         # High-pass filtering to enhance bone edges
-        low_pass = gaussian_filter(image, sigma=3)
+        low_pass = self._gaussian(image, sigma=3)
         high_pass = image - low_pass
         
         # Enhance high-frequency components
@@ -3733,10 +3754,10 @@ class AdvancedImageProcessor:
     def _apply_soft_tissue_enhancement(self, image):
         """Enhance soft tissue contrast in X-ray images"""
         # Low-pass filtering to enhance soft tissue
-        soft_tissue = gaussian_filter(image, sigma=1.5)
+        soft_tissue = self._gaussian(image, sigma=1.5)
         
         # Adaptive histogram equalization for better soft tissue contrast
-        enhanced = exposure.equalize_adapthist(soft_tissue, clip_limit=0.02, nbins=256)
+        enhanced = self.ops.clahe(soft_tissue, clip_limit=0.02, nbins=256)
         
         # Gamma correction for soft tissue
         enhanced = exposure.adjust_gamma(enhanced, gamma=1.2)
@@ -3777,19 +3798,19 @@ class AdvancedImageProcessor:
     def _reconstruct_t1_weighted(self, image):
         """Reconstruct T1-weighted MRI with enhanced tissue contrast"""
         # Noise reduction while preserving edges
-        denoised = denoise_bilateral(image, sigma_color=0.03, sigma_spatial=10)
+        denoised = self._bilateral(image, sigma_color=0.03, sigma_spatial=10)
         
         # Enhance white matter/gray matter contrast
         # T1 images: CSF is dark, white matter is bright, gray matter is intermediate
         
         # Apply contrast enhancement
-        enhanced = exposure.equalize_adapthist(denoised, clip_limit=0.02)
+        enhanced = self.ops.clahe(denoised, clip_limit=0.02)
         
         # Gamma correction optimized for T1
         gamma_corrected = exposure.adjust_gamma(enhanced, gamma=0.9)
         
         # Sharpen for better anatomical detail
-        sharpened = filters.unsharp_mask(gamma_corrected, radius=1, amount=0.5)
+        sharpened = np.clip(self._unsharp(gamma_corrected, sigma=1, amount=0.5), 0, 1)
         
         return sharpened
     
@@ -3801,13 +3822,13 @@ class AdvancedImageProcessor:
         denoised = denoise_tv_chambolle(image, weight=0.05)
         
         # Enhance fluid structures
-        enhanced = exposure.equalize_adapthist(denoised, clip_limit=0.025)
+        enhanced = self.ops.clahe(denoised, clip_limit=0.025)
         
         # Gamma correction for T2
         gamma_corrected = exposure.adjust_gamma(enhanced, gamma=1.1)
         
         # Edge preservation
-        edge_preserved = denoise_bilateral(gamma_corrected, sigma_color=0.02, sigma_spatial=8)
+        edge_preserved = self._bilateral(gamma_corrected, sigma_color=0.02, sigma_spatial=8)
         
         return edge_preserved
     
@@ -3816,16 +3837,16 @@ class AdvancedImageProcessor:
         # FLAIR suppresses CSF signal, enhances lesions
         
         # Strong noise reduction
-        denoised = denoise_bilateral(image, sigma_color=0.02, sigma_spatial=12)
+        denoised = self._bilateral(image, sigma_color=0.02, sigma_spatial=12)
         
         # Enhance lesion contrast
-        enhanced = exposure.equalize_adapthist(denoised, clip_limit=0.015)
+        enhanced = self.ops.clahe(denoised, clip_limit=0.015)
         
         # Apply specific gamma for FLAIR
         gamma_corrected = exposure.adjust_gamma(enhanced, gamma=0.85)
         
         # Unsharp masking for lesion enhancement
-        unsharp = filters.unsharp_mask(gamma_corrected, radius=2, amount=0.8)
+        unsharp = np.clip(self._unsharp(gamma_corrected, sigma=2, amount=0.8), 0, 1)
         
         return unsharp
     
@@ -3850,10 +3871,10 @@ class AdvancedImageProcessor:
         # Perfusion imaging shows blood flow
         
         # Noise reduction
-        denoised = gaussian_filter(image, sigma=0.8)
+        denoised = self._gaussian(image, sigma=0.8)
         
         # Enhance vascular structures
-        enhanced = exposure.equalize_adapthist(denoised, clip_limit=0.03)
+        enhanced = self.ops.clahe(denoised, clip_limit=0.03)
         
         # Apply gamma correction
         gamma_corrected = exposure.adjust_gamma(enhanced, gamma=1.2)
@@ -3865,13 +3886,13 @@ class AdvancedImageProcessor:
         # General purpose MRI enhancement
         
         # Noise reduction
-        denoised = denoise_bilateral(image, sigma_color=0.04, sigma_spatial=10)
+        denoised = self._bilateral(image, sigma_color=0.04, sigma_spatial=10)
         
         # Contrast enhancement
-        enhanced = exposure.equalize_adapthist(denoised, clip_limit=0.02)
+        enhanced = self.ops.clahe(denoised, clip_limit=0.02)
         
         # Edge enhancement
-        sharpened = filters.unsharp_mask(enhanced, radius=1.5, amount=0.6)
+        sharpened = np.clip(self._unsharp(enhanced, sigma=1.5, amount=0.6), 0, 1)
         
         return sharpened
     
@@ -3907,26 +3928,26 @@ class AdvancedImageProcessor:
     def _apply_comprehensive_mri_enhancement(self, image):
         """Apply comprehensive MRI enhancement pipeline"""
         # Step 1: Noise reduction with edge preservation
-        denoised = denoise_bilateral(image, sigma_color=0.03, sigma_spatial=12)
+        denoised = self._bilateral(image, sigma_color=0.03, sigma_spatial=12)
         
         # Step 2: Contrast enhancement
-        contrast_enhanced = exposure.equalize_adapthist(denoised, clip_limit=0.02)
+        contrast_enhanced = self.ops.clahe(denoised, clip_limit=0.02)
         
         # Step 3: Gamma correction
         gamma_corrected = exposure.adjust_gamma(contrast_enhanced, gamma=0.9)
         
         # Step 4: Sharpening
-        sharpened = filters.unsharp_mask(gamma_corrected, radius=1.5, amount=0.7)
+        sharpened = np.clip(self._unsharp(gamma_corrected, sigma=1.5, amount=0.7), 0, 1)
         
         return sharpened
     
     def _apply_brain_enhancement(self, image):
         """Enhance brain structures in MRI"""
         # Brain-specific enhancement
-        denoised = denoise_bilateral(image, sigma_color=0.02, sigma_spatial=8)
+        denoised = self._bilateral(image, sigma_color=0.02, sigma_spatial=8)
         
         # Enhance gray matter/white matter contrast
-        enhanced = exposure.equalize_adapthist(denoised, clip_limit=0.015)
+        enhanced = self.ops.clahe(denoised, clip_limit=0.015)
         
         # Apply brain-optimized gamma
         gamma_corrected = exposure.adjust_gamma(enhanced, gamma=0.85)
@@ -3942,7 +3963,7 @@ class AdvancedImageProcessor:
         enhanced = exposure.rescale_intensity(denoised)
         
         # Edge enhancement for spinal anatomy
-        edges = canny(enhanced, sigma=1.0)
+        edges = self._canny(enhanced, sigma=1.0)
         edge_enhanced = enhanced + 0.2 * edges
         
         return np.clip(edge_enhanced, 0, 1)
@@ -3959,44 +3980,59 @@ class AdvancedImageProcessor:
         enhanced = image + 0.3 * vessels
         
         # Apply contrast enhancement
-        contrast_enhanced = exposure.equalize_adapthist(enhanced, clip_limit=0.03)
+        contrast_enhanced = self.ops.clahe(enhanced, clip_limit=0.03)
         
         return contrast_enhanced
 
 # Initialize the advanced processor
 advanced_processor = AdvancedImageProcessor()
 
+def _enhanced_image_response(request, image_id, operation, type_param, default_type, process, result_key, label):
+    """Serve an enhancement result from the store, computing and storing it on a miss"""
+    from .enhancement_store import enhancement_store, source_signature
+
+    dicom_image = get_object_or_404(DicomImage, id=image_id)
+    params = request.data if request.method == 'POST' else request.query_params
+    variant = params.get(type_param, default_type)
+
+    dicom_path = dicom_image.file_path.path
+    key = (dicom_image.id, operation, variant, advanced_processor.algorithm_version, source_signature(dicom_path))
+    png = enhancement_store.get(*key)
+    cached = png is not None
+    if not cached:
+        dicom_data = pydicom.dcmread(dicom_path)
+        pixel_array = dicom_data.pixel_array.astype(np.float32)
+        buffer = io.BytesIO()
+        Image.fromarray(process(pixel_array, variant)).save(buffer, format='PNG')
+        png = buffer.getvalue()
+        enhancement_store.put(*key, png)
+
+    if str(params.get('binary', '')).lower() in ('1', 'true', 'yes'):
+        response = HttpResponse(png, content_type='image/png')
+        response['Cache-Control'] = 'private, max-age=3600'
+        response['X-Enhancement-Cache'] = 'hit' if cached else 'miss'
+        return response
+
+    return Response({
+        'success': True,
+        result_key: f"data:image/png;base64,{base64.b64encode(png).decode()}",
+        type_param: variant,
+        'cached': cached,
+        'message': f'{label} using {variant} algorithm'
+    })
+
 @csrf_exempt
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 def enhance_xray_image_api(request, image_id):
     """
     API endpoint to enhance X-ray images with advanced algorithms
     """
     try:
-        dicom_image = get_object_or_404(DicomImage, id=image_id)
-        enhancement_type = request.data.get('enhancement_type', 'comprehensive')
-        
-        # Load the DICOM image
-        dicom_path = dicom_image.dicom_file.path
-        dicom_data = pydicom.dcmread(dicom_path)
-        pixel_array = dicom_data.pixel_array.astype(np.float32)
-        
-        # Apply X-ray enhancement
-        enhanced_array = advanced_processor.enhance_xray_image(pixel_array, enhancement_type)
-        
-        # Convert to base64 for transmission
-        enhanced_pil = Image.fromarray(enhanced_array)
-        buffer = io.BytesIO()
-        enhanced_pil.save(buffer, format='PNG')
-        enhanced_base64 = base64.b64encode(buffer.getvalue()).decode()
-        
-        return Response({
-            'success': True,
-            'enhanced_image': f"data:image/png;base64,{enhanced_base64}",
-            'enhancement_type': enhancement_type,
-            'message': f'X-ray image enhanced using {enhancement_type} algorithm'
-        })
-        
+        return _enhanced_image_response(request, image_id, 'enhance_xray', 'enhancement_type', 'comprehensive',
+                                        advanced_processor.enhance_xray_image, 'enhanced_image',
+                                        'X-ray image enhanced')
+    except Http404:
+        raise
     except Exception as e:
         logger.error(f"Error enhancing X-ray image: {e}")
         return Response({
@@ -4005,36 +4041,17 @@ def enhance_xray_image_api(request, image_id):
         }, status=500)
 
 @csrf_exempt
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 def reconstruct_mri_image_api(request, image_id):
     """
     API endpoint to reconstruct MRI images with advanced algorithms
     """
     try:
-        dicom_image = get_object_or_404(DicomImage, id=image_id)
-        reconstruction_type = request.data.get('reconstruction_type', 't1_weighted')
-        
-        # Load the DICOM image
-        dicom_path = dicom_image.dicom_file.path
-        dicom_data = pydicom.dcmread(dicom_path)
-        pixel_array = dicom_data.pixel_array.astype(np.float32)
-        
-        # Apply MRI reconstruction
-        reconstructed_array = advanced_processor.reconstruct_mri_image(pixel_array, reconstruction_type)
-        
-        # Convert to base64 for transmission
-        reconstructed_pil = Image.fromarray(reconstructed_array)
-        buffer = io.BytesIO()
-        reconstructed_pil.save(buffer, format='PNG')
-        reconstructed_base64 = base64.b64encode(buffer.getvalue()).decode()
-        
-        return Response({
-            'success': True,
-            'reconstructed_image': f"data:image/png;base64,{reconstructed_base64}",
-            'reconstruction_type': reconstruction_type,
-            'message': f'MRI image reconstructed using {reconstruction_type} algorithm'
-        })
-        
+        return _enhanced_image_response(request, image_id, 'reconstruct_mri', 'reconstruction_type', 't1_weighted',
+                                        advanced_processor.reconstruct_mri_image, 'reconstructed_image',
+                                        'MRI image reconstructed')
+    except Http404:
+        raise
     except Exception as e:
         logger.error(f"Error reconstructing MRI image: {e}")
         return Response({
@@ -4043,36 +4060,17 @@ def reconstruct_mri_image_api(request, image_id):
         }, status=500)
 
 @csrf_exempt
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 def enhance_mri_image_api(request, image_id):
     """
     API endpoint to enhance MRI images with advanced algorithms
     """
     try:
-        dicom_image = get_object_or_404(DicomImage, id=image_id)
-        enhancement_type = request.data.get('enhancement_type', 'comprehensive')
-        
-        # Load the DICOM image
-        dicom_path = dicom_image.dicom_file.path
-        dicom_data = pydicom.dcmread(dicom_path)
-        pixel_array = dicom_data.pixel_array.astype(np.float32)
-        
-        # Apply MRI enhancement
-        enhanced_array = advanced_processor.enhance_mri_image(pixel_array, enhancement_type)
-        
-        # Convert to base64 for transmission
-        enhanced_pil = Image.fromarray(enhanced_array)
-        buffer = io.BytesIO()
-        enhanced_pil.save(buffer, format='PNG')
-        enhanced_base64 = base64.b64encode(buffer.getvalue()).decode()
-        
-        return Response({
-            'success': True,
-            'enhanced_image': f"data:image/png;base64,{enhanced_base64}",
-            'enhancement_type': enhancement_type,
-            'message': f'MRI image enhanced using {enhancement_type} algorithm'
-        })
-        
+        return _enhanced_image_response(request, image_id, 'enhance_mri', 'enhancement_type', 'comprehensive',
+                                        advanced_processor.enhance_mri_image, 'enhanced_image',
+                                        'MRI image enhanced')
+    except Http404:
+        raise
     except Exception as e:
         logger.error(f"Error enhancing MRI image: {e}")
         return Response({
@@ -4080,6 +4078,7 @@ def enhance_mri_image_api(request, image_id):
             'error': str(e)
         }, status=500)
 
+@discard_unclaimed_uploads
 @csrf_exempt
 @api_view(['POST'])
 def upload_dicom_folder(request):
@@ -5103,27 +5102,16 @@ def generate_mip(request, series_id):
         
         data = json.loads(request.body) if request.body else {}
         projection_axis = data.get('axis', 'axial')  # axial, sagittal, coronal
+        output_size = int(data.get('output_size', 512))
         
-        images = series.images.all().order_by('instance_number')
-        if len(images) < 2:
+        if series.images.count() < 2:
             return JsonResponse({'error': 'MIP requires at least 2 images'}, status=400)
         
-        # Load all DICOM data
-        dicom_arrays = []
-        for image in images:
-            try:
-                dicom_data = image.load_dicom_data()
-                if dicom_data and hasattr(dicom_data, 'pixel_array'):
-                    pixel_array = dicom_data.pixel_array.astype(np.float32)
-                    dicom_arrays.append(pixel_array)
-            except Exception as e:
-                logger.warning(f"Could not load image {image.id} for MIP: {e}")
-        
-        if len(dicom_arrays) < 2:
-            return JsonResponse({'error': 'Not enough valid images for MIP'}, status=400)
-        
-        # Create 3D volume from arrays
-        volume = np.stack(dicom_arrays, axis=0)
+        # Coarsest isotropic pyramid level that still covers the requested output size
+        from .volume_pyramid import volume_pyramid_cache
+        pyramid = volume_pyramid_cache.get_pyramid(series)
+        level = pyramid.level_index_for_size(output_size)
+        volume = pyramid.levels[level]
         
         # Generate MIP based on projection axis
         if projection_axis == 'axial':
@@ -5136,10 +5124,11 @@ def generate_mip(request, series_id):
             return JsonResponse({'error': 'Invalid projection axis'}, status=400)
         
         # Normalize to 8-bit for display
-        mip_array = ((mip_array - mip_array.min()) / (mip_array.max() - mip_array.min()) * 255).astype(np.uint8)
+        value_range = float(mip_array.max() - mip_array.min()) or 1.0
+        mip_array = ((mip_array - mip_array.min()) / value_range * 255).astype(np.uint8)
         
         # Convert to PIL Image and then to base64
-        pil_image = PILImage.fromarray(mip_array)
+        pil_image = Image.fromarray(mip_array)
         buffer = io.BytesIO()
         pil_image.save(buffer, format='PNG')
         image_data = base64.b64encode(buffer.getvalue()).decode()
@@ -5148,6 +5137,8 @@ def generate_mip(request, series_id):
             'success': True,
             'mip_data': f'data:image/png;base64,{image_data}',
             'projection_axis': projection_axis,
+            'pyramid_level': level,
+            'spacing': pyramid.spacings[level],
             'dimensions': {
                 'width': mip_array.shape[1],
                 'height': mip_array.shape[0]
@@ -5174,38 +5165,17 @@ def generate_mpr(request, series_id):
         
         data = json.loads(request.body) if request.body else {}
         slice_position = data.get('slice_position', 0.5)  # 0.0 to 1.0
+        output_size = int(data.get('output_size', 512))
         
-        images = series.images.all().order_by('instance_number')
-        if len(images) < 3:
+        if series.images.count() < 3:
             return JsonResponse({'error': 'MPR requires at least 3 images'}, status=400)
         
-        # Load all DICOM data
-        dicom_arrays = []
-        spacing = [1.0, 1.0, 1.0]  # Default spacing
-        
-        for image in images:
-            try:
-                dicom_data = image.load_dicom_data()
-                if dicom_data and hasattr(dicom_data, 'pixel_array'):
-                    pixel_array = dicom_data.pixel_array.astype(np.float32)
-                    dicom_arrays.append(pixel_array)
-                    
-                    # Get spacing information from first image
-                    if len(dicom_arrays) == 1:
-                        if hasattr(dicom_data, 'PixelSpacing'):
-                            spacing[0] = float(dicom_data.PixelSpacing[0])
-                            spacing[1] = float(dicom_data.PixelSpacing[1])
-                        if hasattr(dicom_data, 'SliceThickness'):
-                            spacing[2] = float(dicom_data.SliceThickness)
-                            
-            except Exception as e:
-                logger.warning(f"Could not load image {image.id} for MPR: {e}")
-        
-        if len(dicom_arrays) < 3:
-            return JsonResponse({'error': 'Not enough valid images for MPR'}, status=400)
-        
-        # Create 3D volume
-        volume = np.stack(dicom_arrays, axis=0)
+        # Isotropic pyramid level, so sagittal and coronal views keep their true aspect
+        from .volume_pyramid import volume_pyramid_cache
+        pyramid = volume_pyramid_cache.get_pyramid(series)
+        level = pyramid.level_index_for_size(output_size)
+        volume = pyramid.levels[level]
+        spacing = [pyramid.spacings[level]] * 3
         
         # Generate the three orthogonal views
         axial_slice = int(slice_position * (volume.shape[0] - 1))
@@ -5221,10 +5191,11 @@ def generate_mpr(request, series_id):
         mpr_views = {}
         for view_name, view_data in [('axial', axial_view), ('sagittal', sagittal_view), ('coronal', coronal_view)]:
             # Normalize
-            normalized = ((view_data - view_data.min()) / (view_data.max() - view_data.min()) * 255).astype(np.uint8)
+            value_range = float(view_data.max() - view_data.min()) or 1.0
+            normalized = ((view_data - view_data.min()) / value_range * 255).astype(np.uint8)
             
             # Convert to PIL and base64
-            pil_image = PILImage.fromarray(normalized)
+            pil_image = Image.fromarray(normalized)
             buffer = io.BytesIO()
             pil_image.save(buffer, format='PNG')
             image_data = base64.b64encode(buffer.getvalue()).decode()
@@ -5242,6 +5213,7 @@ def generate_mpr(request, series_id):
             'mpr_views': mpr_views,
             'slice_position': slice_position,
             'spacing': spacing,
+            'pyramid_level': level,
             'volume_dimensions': {
                 'depth': volume.shape[0],
                 'height': volume.shape[1],
@@ -5256,9 +5228,13 @@ def generate_mpr(request, series_id):
 
 @login_required
 @require_http_methods(['POST'])
-def generate_bone_reconstruction(request, series_id):
-    """Generate bone-enhanced 3D reconstruction"""
+def generate_cpr(request, series_id):
+    """Generate a curved planar reformation along a user-drawn centreline"""
     try:
+        from .volume_cache import volume_cache
+        from .cpr import cpr_engine
+        from .models import MPRReconstruction
+        
         series = get_object_or_404(DicomSeries, id=series_id)
         
         # Check permissions
@@ -5268,76 +5244,315 @@ def generate_bone_reconstruction(request, series_id):
             return JsonResponse({'error': 'Permission denied'}, status=403)
         
         data = json.loads(request.body) if request.body else {}
-        bone_threshold = data.get('bone_threshold', 200)  # HU threshold for bone
-        enhancement_factor = data.get('enhancement_factor', 2.0)
+        centreline = data.get('centreline') or data.get('centerline') or []  # [[x, y, z], ...] in voxels
+        width_mm = float(data.get('width_mm', 40.0))
+        step_mm = data.get('step_mm')
+        rotation_frames = int(data.get('rotation_frames', 0))
         
-        images = series.images.all().order_by('instance_number')
-        if len(images) < 5:
-            return JsonResponse({'error': 'Bone reconstruction requires at least 5 images'}, status=400)
+        if len(centreline) < 2:
+            return JsonResponse({'error': 'CPR requires a centreline with at least 2 points'}, status=400)
         
-        # Load all DICOM data and apply bone enhancement
-        enhanced_arrays = []
+        volume = volume_cache.get_volume(series)
+        if volume.shape[0] < 2:
+            return JsonResponse({'error': 'CPR requires at least 2 images'}, status=400)
         
-        for image in images:
-            try:
-                dicom_data = image.load_dicom_data()
-                if dicom_data and hasattr(dicom_data, 'pixel_array'):
-                    pixel_array = dicom_data.pixel_array.astype(np.float32)
-                    
-                    # Convert to Hounsfield Units if possible
-                    if hasattr(dicom_data, 'RescaleSlope') and hasattr(dicom_data, 'RescaleIntercept'):
-                        slope = float(dicom_data.RescaleSlope)
-                        intercept = float(dicom_data.RescaleIntercept)
-                        hu_array = pixel_array * slope + intercept
-                    else:
-                        # Estimate HU values
-                        hu_array = pixel_array - 1024
-                    
-                    # Apply bone enhancement
-                    bone_mask = hu_array > bone_threshold
-                    enhanced_array = hu_array.copy()
-                    enhanced_array[bone_mask] *= enhancement_factor
-                    
-                    # Apply additional bone-specific filters
-                    from scipy import ndimage
-                    # Sharpen bone edges
-                    kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
-                    enhanced_array = ndimage.convolve(enhanced_array, kernel, mode='reflect')
-                    
-                    enhanced_arrays.append(enhanced_array)
-                    
-            except Exception as e:
-                logger.warning(f"Could not process image {image.id} for bone reconstruction: {e}")
+        window_center = data.get('window_center', volume.window_center if volume.window_center is not None else 40)
+        window_width = data.get('window_width', volume.window_width if volume.window_width else 400)
         
-        if len(enhanced_arrays) < 5:
-            return JsonResponse({'error': 'Not enough valid images for bone reconstruction'}, status=400)
+        result = cpr_engine.reformat(
+            volume, centreline, width_mm=width_mm,
+            step_mm=float(step_mm) if step_mm else None,
+            rotation_frames=rotation_frames
+        )
         
-        # Create 3D volume
-        volume = np.stack(enhanced_arrays, axis=0)
+        encoded_frames = []
+        for frame in result.images:
+            windowed = apply_window_level(frame, float(window_center), float(window_width))
+            buffer = io.BytesIO()
+            Image.fromarray(windowed).save(buffer, format='PNG')
+            encoded_frames.append(f'data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}')
+        
+        parameters = {
+            'width_mm': width_mm,
+            'step_mm': float(step_mm) if step_mm else None,
+            'rotation_frames': len(encoded_frames) if rotation_frames else 0,
+            'window_center': window_center,
+            'window_width': window_width,
+            'centreline': centreline,
+        }
+        MPRReconstruction.objects.update_or_create(
+            series=series,
+            reconstruction_type='curved',
+            slice_position=0.0,
+            defaults={
+                'slice_thickness': volume.spacing[0],
+                'reconstruction_data': parameters,
+                'image_data': encoded_frames[0],
+                'window_width': window_width,
+                'window_level': window_center,
+            }
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'cpr_image': encoded_frames[0],
+            'cine_frames': encoded_frames if rotation_frames else [],
+            'cine_angles': result.angles.tolist() if rotation_frames else [],
+            'centreline': {
+                'length_mm': round(result.length_mm, 2),
+                'samples': result.centreline_xyz.round(2).tolist(),
+            },
+            'parameters': parameters,
+            'cache': {
+                'segments_reused': result.segments_reused,
+                'segments_computed': result.segments_computed,
+            },
+            'dimensions': {
+                'width': result.straightened.shape[1],
+                'height': result.straightened.shape[0]
+            },
+            'volume': volume.to_dict()
+        })
+        
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error generating CPR for series {series_id}: {str(e)}")
+        return JsonResponse({'error': f'CPR generation failed: {str(e)}'}, status=500)
+
+
+def _can_view_series(user, series):
+    """Whether user may see reconstructions of series: staff groups, or the series' own facility"""
+    return (user.is_superuser or
+            user.groups.filter(name__in=['Radiologists', 'Technicians', 'Administrators']).exists() or
+            (hasattr(user, 'facility') and user.facility == series.study.facility))
+
+
+def _rotating_mip_manifest(series, key):
+    """Stored rotating MIP manifest for the series' current image set, or None"""
+    from .reconstruction_store import reconstruction_store
+    from .rotating_mip import STORE_KIND
+    from .volume_cache import series_signature
+    return reconstruction_store.read_manifest(series.id, STORE_KIND, key, series_signature(series))
+
+
+def _rotating_mip_response(series, key, manifest):
+    """Describe a rotating MIP cine, ready or in progress"""
+    from .rotating_mip import rotating_mip_jobs
+    if manifest is None:
+        progress = rotating_mip_jobs.status(series.id, key) or {'status': 'not_started'}
+        return {'series_id': series.id, 'key': key, 'ready': False, **progress}
+    base_url = f'/viewer/api/series/{series.id}/rotating-mip/{key}'
+    return {
+        'series_id': series.id,
+        'key': key,
+        'ready': True,
+        'status': 'completed',
+        'frame_count': manifest['frame_count'],
+        'content_type': manifest['content_type'],
+        'total_bytes': manifest['total_bytes'],
+        'angles': manifest['metadata'].get('angles', []),
+        'frame_urls': [f'{base_url}/frames/{i}/' for i in range(manifest['frame_count'])],
+        'stream_url': f'{base_url}/stream/',
+        'parameters': {k: manifest['metadata'].get(k) for k in ('window_center', 'window_width', 'size')},
+    }
+
+
+@login_required
+@require_http_methods(['POST'])
+def generate_rotating_mip(request, series_id):
+    """Start (or return) a precomputed rotating MIP cine for a series"""
+    try:
+        from .rotating_mip import rotating_mip_jobs, DEFAULT_FRAMES, DEFAULT_SIZE
+
+        series = get_object_or_404(DicomSeries, id=series_id)
+
+        # Check permissions
+        if not _can_view_series(request.user, series):
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+
+        if series.images.count() < 2:
+            return JsonResponse({'error': 'Rotating MIP requires at least 2 images'}, status=400)
+
+        data = json.loads(request.body) if request.body else {}
+        key, manifest = rotating_mip_jobs.start(
+            series,
+            frames=data.get('frames', DEFAULT_FRAMES),
+            window_center=data.get('window_center'),
+            window_width=data.get('window_width'),
+            size=data.get('size', DEFAULT_SIZE),
+        )
+        response = _rotating_mip_response(series, key, manifest)
+        return JsonResponse({'success': True, **response}, status=200 if manifest else 202)
+
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error starting rotating MIP for series {series_id}: {str(e)}")
+        return JsonResponse({'error': f'Rotating MIP failed: {str(e)}'}, status=500)
+
+
+@login_required
+@require_http_methods(['GET'])
+def rotating_mip_status(request, series_id, key):
+    """Progress of a rotating MIP job, or its frame manifest once complete"""
+    try:
+        series = get_object_or_404(DicomSeries, id=series_id)
+        if not _can_view_series(request.user, series):
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+        manifest = _rotating_mip_manifest(series, key)
+        return JsonResponse(_rotating_mip_response(series, key, manifest))
+    except Exception as e:
+        logger.error(f"Error reading rotating MIP status for series {series_id}: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@login_required
+@require_http_methods(['GET'])
+def rotating_mip_frame(request, series_id, key, index):
+    """Serve a single precomputed rotating MIP frame straight from the store"""
+    from .reconstruction_store import reconstruction_store
+
+    series = get_object_or_404(DicomSeries, id=series_id)
+    if not _can_view_series(request.user, series):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    manifest = _rotating_mip_manifest(series, key)
+    if manifest is None:
+        return JsonResponse({'error': 'Rotating MIP not available'}, status=404)
+    try:
+        frame = reconstruction_store.read_frame(manifest, index)
+    except IndexError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+
+    response = HttpResponse(frame, content_type=manifest['content_type'])
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+@login_required
+@require_http_methods(['GET'])
+def rotating_mip_stream(request, series_id, key):
+    """Play a precomputed rotating MIP as a multipart MJPEG cine stream"""
+    from django.http import StreamingHttpResponse
+    from .reconstruction_store import reconstruction_store
+
+    series = get_object_or_404(DicomSeries, id=series_id)
+    if not _can_view_series(request.user, series):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    manifest = _rotating_mip_manifest(series, key)
+    if manifest is None:
+        return JsonResponse({'error': 'Rotating MIP not available'}, status=404)
+
+    try:
+        fps = min(max(float(request.GET.get('fps', 12)), 1.0), 60.0)
+        loops = min(max(int(request.GET.get('loops', 1)), 1), 20)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid fps or loops'}, status=400)
+    boundary = 'rotatingmipframe'
+
+    def stream():
+        for loop in range(loops):
+            # Rock forward and back across the 180 degree sweep
+            order = list(range(manifest['frame_count']))
+            order += order[-2:0:-1]
+            for index in order:
+                frame = reconstruction_store.read_frame(manifest, index)
+                yield (f'--{boundary}\r\nContent-Type: {manifest["content_type"]}\r\n'
+                       f'Content-Length: {len(frame)}\r\n\r\n').encode() + frame + b'\r\n'
+                time.sleep(1.0 / fps)
+
+    return StreamingHttpResponse(stream(), content_type=f'multipart/x-mixed-replace; boundary={boundary}')
+
+
+@login_required
+@require_http_methods(['GET'])
+def series_intensity_statistics(request, series_id):
+    """Stored histogram, percentiles and suggested window presets of a series"""
+    try:
+        series = get_object_or_404(DicomSeries, id=series_id)
+        if not _can_view_series(request.user, series):
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+        stats_row = intensity_index.series_statistics(series)
+        if stats_row is None:
+            return JsonResponse({'error': 'No greyscale pixel data in this series'}, status=404)
+
+        data = {
+            'series_id': series.id,
+            'modality': series.modality,
+            'image_count': stats_row.image_count,
+            'pixel_count': stats_row.pixel_count,
+            'min': stats_row.min_value,
+            'max': stats_row.max_value,
+            'mean': round(stats_row.mean_value, 2),
+            'std': round(stats_row.std_value, 2),
+            'percentiles': stats_row.percentiles,
+            'histogram': stats_row.histogram,
+            'window_presets': stats_row.window_presets,
+            'suggested_window': {
+                'window_center': stats_row.suggested_window_center,
+                'window_width': stats_row.suggested_window_width,
+            },
+        }
+        if request.GET.get('images') in ('1', 'true'):
+            rows = series.images.filter(intensity_stats__isnull=False).order_by('instance_number').values_list(
+                'id', 'intensity_stats__min_value', 'intensity_stats__max_value',
+                'intensity_stats__suggested_window_center', 'intensity_stats__suggested_window_width',
+            )
+            data['images'] = [
+                {'image_id': image_id, 'min': low, 'max': high, 'window_center': center, 'window_width': width}
+                for image_id, low, high, center, width in rows
+            ]
+        return JsonResponse(data)
+    except Exception as e:
+        logger.error(f"Error reading intensity statistics for series {series_id}: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@login_required
+@require_http_methods(['POST'])
+def generate_bone_reconstruction(request, series_id):
+    """Generate bone-enhanced 3D reconstruction"""
+    try:
+        series = get_object_or_404(DicomSeries, id=series_id)
+        
+        # Check permissions
+        if not (request.user.is_superuser or 
+                request.user.groups.filter(name__in=['Radiologists', 'Technicians', 'Administrators']).exists() or
+                (hasattr(request.user, 'facility') and request.user.facility == series.study.facility)):
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+        
+        data = json.loads(request.body) if request.body else {}
+        bone_threshold = data.get('bone_threshold', 200)  # HU threshold for bone
+        enhancement_factor = data.get('enhancement_factor', 2.0)
         
-        # Generate volume rendering with bone emphasis
-        # Use maximum intensity projection for bone structures
-        bone_mip = np.max(volume, axis=0)
+        from .volume_cache import volume_cache
+        from .color_presets import color_presets, to_uint8
+        from scipy import ndimage
         
-        # Apply bone-specific colormap (white for high-density structures)
-        bone_mip_normalized = ((bone_mip - bone_mip.min()) / (bone_mip.max() - bone_mip.min()) * 255).astype(np.uint8)
+        volume = volume_cache.get_volume(series)
+        if volume.shape[0] < 5:
+            return JsonResponse({'error': 'Bone reconstruction requires at least 5 images'}, status=400)
+        
+        # Bone enhancement scales HU above the threshold. For a non-negative threshold
+        # and factor >= 1 that is monotonic, so the MIP can be taken before enhancing
+        bone_threshold = float(bone_threshold)
+        enhancement_factor = float(enhancement_factor)
+        if bone_threshold >= 0 and enhancement_factor >= 1:
+            bone_mip = volume.data.max(axis=0)
+            bone_mip = np.where(bone_mip > bone_threshold, bone_mip * np.float32(enhancement_factor), bone_mip)
+        else:
+            bone_mip = np.where(volume.data > bone_threshold, volume.data * np.float32(enhancement_factor),
+                                volume.data).max(axis=0)
         
-        # Create bone-enhanced visualization
-        bone_colored = np.zeros((*bone_mip_normalized.shape, 3), dtype=np.uint8)
+        # Sharpen bone edges once on the projection rather than on every slice
+        kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+        bone_mip = ndimage.convolve(bone_mip, kernel, mode='reflect')
         
-        # Bone colormap: darker values = red/brown, brighter = white/yellow
-        for i in range(bone_mip_normalized.shape[0]):
-            for j in range(bone_mip_normalized.shape[1]):
-                intensity = bone_mip_normalized[i, j]
-                if intensity > 128:  # High intensity = bone
-                    bone_colored[i, j] = [intensity, intensity, intensity]  # White/gray
-                elif intensity > 64:  # Medium intensity = possible bone
-                    bone_colored[i, j] = [intensity, intensity // 2, 0]  # Orange/brown
-                else:  # Low intensity = soft tissue
-                    bone_colored[i, j] = [intensity // 4, intensity // 4, intensity // 2]  # Dark blue
+        # Bone colormap LUT: darker values = blue/brown, brighter = white
+        bone_colored = color_presets.get('bone').apply(to_uint8(bone_mip))
         
         # Convert to PIL and base64
-        pil_image = PILImage.fromarray(bone_colored)
+        pil_image = Image.fromarray(bone_colored)
         buffer = io.BytesIO()
         pil_image.save(buffer, format='PNG')
         image_data = base64.b64encode(buffer.getvalue()).decode()
@@ -5374,7 +5589,7 @@ def generate_volume_rendering(request, series_id):
             return JsonResponse({'error': 'Permission denied'}, status=403)
         
         data = json.loads(request.body) if request.body else {}
-        rendering_mode = data.get('mode', 'composite')  # composite, mip, average
+        rendering_mode = data.get('mode', 'composite')  # composite (ray cast), mip, average
         opacity_threshold = data.get('opacity_threshold', 0.1)
         color_preset = data.get('color_preset', 'grayscale')  # grayscale, bone, soft_tissue, vessels
         
@@ -5382,6 +5597,52 @@ def generate_volume_rendering(request, series_id):
         if len(images) < 10:
             return JsonResponse({'error': 'Volume rendering requires at least 10 images'}, status=400)
         
+        if rendering_mode == 'composite':
+            # Ray-cast the cached HU volume from the requested camera
+            from .volume_pyramid import volume_pyramid_cache
+            from .volume_renderer import volume_renderer
+            
+            quality = data.get('quality', 'full')  # interactive while rotating, full once stopped
+            size = min(int(data.get('size', 512)), 1024)
+            volume = volume_pyramid_cache.get_level(series, size)
+            rendered = volume_renderer.render(
+                volume,
+                azimuth=float(data.get('azimuth', 0.0)),
+                elevation=float(data.get('elevation', 0.0)),
+                roll=float(data.get('roll', 0.0)),
+                zoom=float(data.get('zoom', 1.0)),
+                size=size,
+                quality=quality,
+                preset=color_preset,
+                window_center=data.get('window_center'),
+                window_width=data.get('window_width'),
+                opacity_scale=float(data.get('opacity_scale', 1.0)),
+            )
+            
+            buffer = io.BytesIO()
+            Image.fromarray(rendered.rgb).save(buffer, format='PNG' if rendered.quality == 'full' else 'JPEG')
+            mime_type = 'image/png' if rendered.quality == 'full' else 'image/jpeg'
+            image_data = base64.b64encode(buffer.getvalue()).decode()
+            
+            return JsonResponse({
+                'success': True,
+                'volume_rendering': f'data:{mime_type};base64,{image_data}',
+                'parameters': {
+                    'rendering_mode': rendering_mode,
+                    'opacity_threshold': opacity_threshold,
+                    'color_preset': color_preset,
+                    'azimuth': float(data.get('azimuth', 0.0)),
+                    'elevation': float(data.get('elevation', 0.0)),
+                    'roll': float(data.get('roll', 0.0)),
+                    'quality': rendered.quality
+                },
+                'render_stats': rendered.stats(),
+                'dimensions': {
+                    'width': rendered.rgb.shape[1],
+                    'height': rendered.rgb.shape[0]
+                }
+            })
+        
         # Load all DICOM data
         dicom_arrays = []
         
@@ -5408,34 +5669,15 @@ def generate_volume_rendering(request, series_id):
         if rendering_mode == 'mip':
             # Maximum Intensity Projection
             rendered_volume = np.max(volume, axis=0)
-        elif rendering_mode == 'average':
+        else:  # average
             # Average Intensity Projection
             rendered_volume = np.mean(volume, axis=0)
-        else:  # composite
-            # Composite volume rendering with opacity
-            rendered_volume = np.zeros_like(volume[0])
-            accumulated_opacity = np.zeros_like(volume[0])
-            
-            for slice_data in volume:
-                # Calculate opacity based on intensity
-                opacity = np.clip(slice_data - opacity_threshold, 0, 1)
-                
-                # Composite rendering equation
-                rendered_volume += slice_data * opacity * (1 - accumulated_opacity)
-                accumulated_opacity += opacity * (1 - accumulated_opacity)
-                accumulated_opacity = np.clip(accumulated_opacity, 0, 1)
-        
-        # Apply color preset
-        rendered_colored = apply_color_preset(rendered_volume, color_preset)
         
-        # Convert to 8-bit
-        rendered_8bit = (rendered_colored * 255).astype(np.uint8)
+        # Apply color preset (uint8 LUT gather)
+        rendered_8bit = apply_color_preset(rendered_volume, color_preset)
         
         # Convert to PIL and base64
-        if len(rendered_8bit.shape) == 2:  # Grayscale
-            pil_image = PILImage.fromarray(rendered_8bit)
-        else:  # RGB
-            pil_image = PILImage.fromarray(rendered_8bit)
+        pil_image = Image.fromarray(rendered_8bit)
         
         buffer = io.BytesIO()
         pil_image.save(buffer, format='PNG')
@@ -5461,32 +5703,14 @@ def generate_volume_rendering(request, series_id):
 
 
 def apply_color_preset(volume_data, preset):
-    """Apply color preset to volume data"""
-    if preset == 'grayscale':
-        return volume_data
-    elif preset == 'bone':
-        # Bone colormap: white for high density
-        colored = np.zeros((*volume_data.shape, 3))
-        colored[:, :, 0] = volume_data  # Red
-        colored[:, :, 1] = volume_data  # Green
-        colored[:, :, 2] = volume_data  # Blue
-        return colored
-    elif preset == 'soft_tissue':
-        # Soft tissue colormap: pink/red tones
-        colored = np.zeros((*volume_data.shape, 3))
-        colored[:, :, 0] = volume_data * 1.2  # Enhanced red
-        colored[:, :, 1] = volume_data * 0.8  # Reduced green
-        colored[:, :, 2] = volume_data * 0.9  # Slightly reduced blue
-        return np.clip(colored, 0, 1)
-    elif preset == 'vessels':
-        # Vessel colormap: red/orange for contrast
-        colored = np.zeros((*volume_data.shape, 3))
-        colored[:, :, 0] = volume_data * 1.5  # Strong red
-        colored[:, :, 1] = volume_data * 0.5  # Some green
-        colored[:, :, 2] = volume_data * 0.2  # Minimal blue
-        return np.clip(colored, 0, 1)
-    else:
-        return volume_data
+    """Apply a colour preset LUT to [0, 1] volume data, returning uint8 gray or RGB"""
+    from .color_presets import color_presets, to_uint8
+    
+    indices = to_uint8(volume_data, 0.0, 1.0)
+    transfer_function = color_presets.resolve(preset)
+    if transfer_function.is_grayscale:
+        return np.take(transfer_function.lut[:, 0], indices)
+    return transfer_function.apply(indices)
 
 
 @login_required
@@ -5504,9 +5728,10 @@ def calculate_volume_measurement(request, series_id):
         
         data = json.loads(request.body) if request.body else {}
         roi_coordinates = data.get('roi_coordinates', [])  # List of [x, y] coordinates for each slice
+        contours = data.get('contours', [])  # [{'image_id' or 'slice_index', 'points': [[x, y], ...]}, ...]
         measurement_type = data.get('measurement_type', 'manual')  # manual, threshold, ai_segmentation
         
-        if not roi_coordinates and measurement_type == 'manual':
+        if not roi_coordinates and not contours and measurement_type == 'manual':
             return JsonResponse({'error': 'ROI coordinates required for manual volume calculation'}, status=400)
         
         images = series.images.all().order_by('instance_number')
@@ -5540,54 +5765,52 @@ def calculate_volume_measurement(request, series_id):
         
         total_volume = 0.0
         slice_areas = []
+        volumetry = None
+        roi_statistics = None
         
         if measurement_type == 'manual':
-            # Calculate volume from manual ROI coordinates
-            for i, coords in enumerate(roi_coordinates):
-                if i < len(images) and coords:
-                    # Calculate area using shoelace formula
-                    area_pixels = calculate_polygon_area(coords)
-                    # Convert to real units (mm²)
-                    area_mm2 = area_pixels * spacing[0] * spacing[1]
-                    slice_areas.append(area_mm2)
+            # Rasterise the contours on the cached volume; areas, volume and HU statistics in one pass
+            from .volume_cache import volume_cache
+            from .roi import roi_engine
             
-            # Calculate volume using trapezoidal rule
-            if len(slice_areas) > 1:
-                for i in range(len(slice_areas) - 1):
-                    slice_volume = (slice_areas[i] + slice_areas[i + 1]) / 2 * spacing[2]
-                    total_volume += slice_volume
-            elif len(slice_areas) == 1:
-                total_volume = slice_areas[0] * spacing[2]
+            if not contours:
+                # Legacy format: one polygon per image, in instance order
+                image_ids = list(images.values_list('id', flat=True))
+                contours = [
+                    {'image_id': image_ids[i], 'points': coords}
+                    for i, coords in enumerate(roi_coordinates) if i < len(image_ids) and coords
+                ]
+            
+            volume = volume_cache.get_volume(series)
+            spacing = [volume.spacing[1], volume.spacing[2], volume.spacing[0]]
+            try:
+                roi_statistics = roi_engine.measure(volume, contours)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            slice_areas = [entry['area_mm2'] for entry in roi_statistics['slices']]
+            total_volume = roi_statistics['volume_mm3']
         
         elif measurement_type == 'threshold':
-            # Calculate volume using intensity thresholding
-            threshold_min = data.get('threshold_min', 100)
-            threshold_max = data.get('threshold_max', 3000)
+            # Threshold the cached HU volume and label its connected components
+            from .volume_cache import volume_cache
+            from .volumetry import volumetry_engine
             
-            voxel_volume = spacing[0] * spacing[1] * spacing[2]  # mm³ per voxel
+            threshold_min = float(data.get('threshold_min', 100))
+            threshold_max = float(data.get('threshold_max', 3000))
+            seed_point = data.get('seed_point')  # [x, y, z] voxel; z is the slice index
             
-            for image in images:
-                try:
-                    dicom_data = image.load_dicom_data()
-                    if dicom_data and hasattr(dicom_data, 'pixel_array'):
-                        pixel_array = dicom_data.pixel_array
-                        
-                        # Convert to HU if possible
-                        if hasattr(dicom_data, 'RescaleSlope') and hasattr(dicom_data, 'RescaleIntercept'):
-                            slope = float(dicom_data.RescaleSlope)
-                            intercept = float(dicom_data.RescaleIntercept)
-                            hu_array = pixel_array * slope + intercept
-                        else:
-                            hu_array = pixel_array
-                        
-                        # Count voxels within threshold
-                        mask = (hu_array >= threshold_min) & (hu_array <= threshold_max)
-                        voxel_count = np.sum(mask)
-                        slice_volume = voxel_count * voxel_volume
-                        total_volume += slice_volume
-                        
-                except Exception as e:
-                    logger.warning(f"Could not process image {image.id} for volume calculation: {e}")
+            volume = volume_cache.get_volume(series)
+            spacing = [volume.spacing[1], volume.spacing[2], volume.spacing[0]]
+            try:
+                volumetry = volumetry_engine.measure(
+                    volume, threshold_min, threshold_max,
+                    seed=seed_point,
+                    min_voxels=int(data.get('min_voxels', 0)),
+                    connectivity=int(data.get('connectivity', 6)),
+                )
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            total_volume = volumetry['volume_mm3']
         
         # Convert to different units
         volume_ml = total_volume / 1000  # mm³ to ml
@@ -5603,7 +5826,9 @@ def calculate_volume_measurement(request, series_id):
                 'spacing': spacing,
                 'measurement_type': measurement_type,
                 'num_slices': len(slice_areas) if measurement_type == 'manual' else len(images)
-            }
+            },
+            'volumetry': volumetry,
+            'roi_statistics': roi_statistics
         })
         
     except Exception as e:
@@ -5613,18 +5838,8 @@ def calculate_volume_measurement(request, series_id):
 
 def calculate_polygon_area(coordinates):
     """Calculate area of polygon using shoelace formula"""
-    if len(coordinates) < 3:
-        return 0.0
-    
-    area = 0.0
-    n = len(coordinates)
-    
-    for i in range(n):
-        j = (i + 1) % n
-        area += coordinates[i][0] * coordinates[j][1]
-        area -= coordinates[j][0] * coordinates[i][1]
-    
-    return abs(area) / 2.0
+    from .roi import polygon_area
+    return polygon_area(coordinates)
 
 # Enhanced AI Analysis Functions
 def generate_enhanced_chest_xray_analysis(image, modality):
@@ -5822,68 +6037,16 @@ def generate_fallback_analysis(image, modality, analysis_type):
         'model_version': 'fallback-v1.0'
     }
 
-# Bone Reconstruction Endpoints
-@api_view(['POST'])
-def generate_bone_reconstruction(request, series_id):
-    """Generate advanced 3D bone reconstruction"""
-    try:
-        from viewer.models import DicomSeries, BoneReconstruction
-        import numpy as np
-        
-        series = DicomSeries.objects.get(id=series_id)
-        images = series.dicomimage_set.all().order_by('instance_number')
-        
-        if len(images) < 5:
-            return Response({'error': 'Need at least 5 images for bone reconstruction'}, status=400)
-        
-        # Get reconstruction parameters
-        data = request.data
-        bone_type = data.get('bone_type', 'general')
-        hu_threshold = data.get('hu_threshold', 150)  # Bone threshold in Hounsfield Units
-        
-        print(f"Generating bone reconstruction for series {series_id}, type: {bone_type}")
-        
-        # Simulate bone reconstruction processing
-        reconstruction_data = {
-            'volume_dimensions': [512, 512, len(images)],
-            'voxel_spacing': [0.5, 0.5, 1.0],
-            'hu_threshold': hu_threshold,
-            'bone_density_map': True,
-            'surface_mesh': True
-        }
-        
-        # Create bone reconstruction record
-        bone_recon = BoneReconstruction.objects.create(
-            series=series,
-            bone_type=bone_type,
-            reconstruction_data="base64_encoded_bone_data_here",
-            hounsfield_thresholds={'bone': hu_threshold, 'soft_tissue': 50},
-            bone_density_analysis={'average_density': 800, 'min_density': 150, 'max_density': 1500}
-        )
-        
-        return Response({
-            'success': True,
-            'reconstruction_id': bone_recon.id,
-            'bone_type': bone_type,
-            'volume_data': 'base64_encoded_volume_data',
-            'parameters': reconstruction_data,
-            'message': f'3D bone reconstruction completed for {bone_type}'
-        })
-        
-    except DicomSeries.DoesNotExist:
-        return Response({'error': 'Series not found'}, status=404)
-    except Exception as e:
-        print(f"Error generating bone reconstruction: {e}")
-        return Response({'error': f'Bone reconstruction failed: {str(e)}'}, status=500)
-
 @api_view(['POST'])
 def generate_angiogram_analysis(request, series_id):
     """Generate angiogram analysis with vessel tracking"""
     try:
         from viewer.models import DicomSeries, AngiogramAnalysis
         
+        from viewer.rotating_mip import rotating_mip_jobs
+        
         series = DicomSeries.objects.get(id=series_id)
-        images = series.dicomimage_set.all().order_by('instance_number')
+        images = series.images.all().order_by('instance_number')
         
         if not images.exists():
             return Response({'error': 'No images found in series'}, status=400)
@@ -5893,6 +6056,12 @@ def generate_angiogram_analysis(request, series_id):
         vessel_type = data.get('vessel_type', 'general')
         contrast_phase = data.get('contrast_phase', 'arterial')
         
+        # Precompute the rotating MIP cine in the background so playback is file reads only
+        rotating_mip = None
+        if images.count() >= 2:
+            key, manifest = rotating_mip_jobs.start(series)
+            rotating_mip = _rotating_mip_response(series, key, manifest)
+        
         print(f"Generating angiogram analysis for series {series_id}, vessel type: {vessel_type}")
         
         # Simulate vessel analysis
@@ -5921,6 +6090,7 @@ def generate_angiogram_analysis(request, series_id):
             'measurements': vessel_measurements,
             'stenosis_detected': False,
             'confidence_score': 0.89,
+            'rotating_mip': rotating_mip,
             'message': f'Angiogram analysis completed for {vessel_type} vessels'
         })
         
@@ -6113,11 +6283,15 @@ def generate_dental_reconstruction(request, series_id):
         from viewer.models import DicomSeries, VolumeRendering
         
         series = DicomSeries.objects.get(id=series_id)
-        images = series.dicomimage_set.all().order_by('instance_number')
+        images = series.images.all().order_by('instance_number')
         
         if not images.exists():
             return Response({'error': 'No images found in series'}, status=400)
         
+        # Optional dental arch centreline [[x, y, z], ...] for the panoramic reformat
+        data = request.data
+        arch_points = data.get('arch_points') or []
+        
         print(f"Generating dental reconstruction for series {series_id}")
         
         # Simulate dental reconstruction parameters
@@ -6129,6 +6303,24 @@ def generate_dental_reconstruction(request, series_id):
             'reconstruction_type': 'high_resolution'
         }
         
+        # Panoramic reformat along the dental arch
+        panoramic_image = None
+        if len(arch_points) >= 2:
+            from .volume_cache import volume_cache
+            from .cpr import cpr_engine
+            
+            volume = volume_cache.get_volume(series)
+            panoramic = cpr_engine.reformat(volume, arch_points, width_mm=float(data.get('slab_height_mm', 60.0)))
+            windowed = apply_window_level(panoramic.straightened, float(data.get('window_center', 500)),
+                                          float(data.get('window_width', 3000)))
+            buffer = io.BytesIO()
+            Image.fromarray(windowed).save(buffer, format='PNG')
+            panoramic_image = f'data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}'
+            rendering_parameters['panoramic'] = {
+                'arch_points': arch_points,
+                'arch_length_mm': round(panoramic.length_mm, 2)
+            }
+        
         # Create dental volume rendering record
         dental_rendering = VolumeRendering.objects.create(
             series=series,
@@ -6148,6 +6340,7 @@ def generate_dental_reconstruction(request, series_id):
             'reconstruction_id': dental_rendering.id,
             'rendering_type': 'dental',
             'volume_data': 'base64_encoded_dental_volume',
+            'panoramic_image': panoramic_image,
             'parameters': rendering_parameters,
             'dental_structures': {
                 'teeth_detected': 28,
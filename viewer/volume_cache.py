@@ -0,0 +1,280 @@
+"""
+Series volume cache for 3D reconstruction.
+
+Reconstruction endpoints used to re-read every DICOM file of a series on each
+request. This module stacks a series once into a Hounsfield-unit volume,
+ordered along the slice normal with real spacing, and keeps a small number of
+recent volumes in memory. Entries are keyed by the series' image set so that
+adding or removing images transparently rebuilds the volume. Single images
+measured outside of 3D work (e.g. HU ROIs) are kept in a separate per-image
+HU cache.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SeriesVolume:
+    """A stacked series volume in HU with (z, y, x) voxel spacing in mm"""
+
+    def __init__(self, series_id, signature, data, spacing, image_ids, slice_positions,
+                 window_center=None, window_width=None, modality=''):
+        self.series_id = series_id
+        self.signature = signature
+        self.data = data
+        self.spacing = tuple(float(s) for s in spacing)
+        self.image_ids = list(image_ids)
+        self.slice_positions = np.asarray(slice_positions, dtype=np.float64)
+        self.window_center = window_center
+        self.window_width = window_width
+        self.modality = modality
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def to_dict(self):
+        """Describe the volume for API responses"""
+        return {
+            'series_id': self.series_id,
+            'depth': self.data.shape[0],
+            'height': self.data.shape[1],
+            'width': self.data.shape[2],
+            'spacing': list(self.spacing),
+        }
+
+
+def series_signature(series):
+    """Hash of the series' current image set, used to detect stale volumes"""
+    rows = series.images.order_by('id').values_list('id', 'sop_instance_uid')
+    digest = hashlib.sha1()
+    for image_id, sop_uid in rows:
+        digest.update(f'{image_id}:{sop_uid};'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _slice_normal(dicom_data):
+    """Slice normal from ImageOrientationPatient, or None if unavailable"""
+    try:
+        orientation = [float(v) for v in dicom_data.ImageOrientationPatient]
+        normal = np.cross(orientation[:3], orientation[3:])
+        norm = np.linalg.norm(normal)
+        return normal / norm if norm > 0 else None
+    except Exception:
+        return None
+
+
+def load_series_volume(series, signature=None):
+    """Read every image of a series into a float32 HU volume ordered along the slice normal"""
+    slices = []
+    normal = None
+    pixel_spacing = None
+    slice_thickness = None
+    window_center = None
+    window_width = None
+
+    for image in series.images.all().order_by('instance_number'):
+        try:
+            dicom_data = image.load_dicom_data()
+            if dicom_data is None or not hasattr(dicom_data, 'pixel_array'):
+                continue
+            pixel_array = dicom_data.pixel_array
+            if pixel_array.ndim != 2:
+                continue
+
+            slope = float(getattr(dicom_data, 'RescaleSlope', 1) or 1)
+            intercept = float(getattr(dicom_data, 'RescaleIntercept', 0) or 0)
+            hu = pixel_array.astype(np.float32)
+            if slope != 1 or intercept != 0:
+                hu = hu * np.float32(slope) + np.float32(intercept)
+
+            if normal is None:
+                normal = _slice_normal(dicom_data)
+            if pixel_spacing is None and hasattr(dicom_data, 'PixelSpacing'):
+                pixel_spacing = [float(dicom_data.PixelSpacing[0]), float(dicom_data.PixelSpacing[1])]
+            if slice_thickness is None and getattr(dicom_data, 'SliceThickness', None):
+                slice_thickness = float(dicom_data.SliceThickness)
+            if window_center is None:
+                window_center = image.window_center
+                window_width = image.window_width
+
+            position = None
+            if hasattr(dicom_data, 'ImagePositionPatient'):
+                position = np.array([float(v) for v in dicom_data.ImagePositionPatient])
+
+            slices.append((image.id, image.instance_number, position, hu))
+        except Exception as e:
+            logger.warning(f"Could not load image {image.id} into volume for series {series.id}: {e}")
+
+    if not slices:
+        raise ValueError(f'No pixel data available for series {series.id}')
+
+    # Keep only slices matching the dominant in-plane shape
+    shapes = [s[3].shape for s in slices]
+    dominant_shape = max(set(shapes), key=shapes.count)
+    slices = [s for s in slices if s[3].shape == dominant_shape]
+
+    if normal is not None and all(s[2] is not None for s in slices):
+        locations = [float(np.dot(s[2], normal)) for s in slices]
+    else:
+        locations = [float(s[1]) * (slice_thickness or 1.0) for s in slices]
+    order = np.argsort(locations, kind='stable')
+    slices = [slices[i] for i in order]
+    locations = np.asarray(locations, dtype=np.float64)[order]
+
+    dz = slice_thickness or 1.0
+    if len(locations) > 1:
+        gaps = np.abs(np.diff(locations))
+        gaps = gaps[gaps > 1e-4]
+        if gaps.size:
+            dz = float(np.median(gaps))
+    dy, dx = pixel_spacing or (1.0, 1.0)
+
+    data = np.empty((len(slices),) + dominant_shape, dtype=np.float32)
+    for index, entry in enumerate(slices):
+        data[index] = entry[3]
+
+    return SeriesVolume(
+        series_id=series.id,
+        signature=signature or series_signature(series),
+        data=data,
+        spacing=(dz, dy, dx),
+        image_ids=[s[0] for s in slices],
+        slice_positions=locations,
+        window_center=window_center,
+        window_width=window_width,
+        modality=series.modality,
+    )
+
+
+class VolumeCache:
+    """Thread-safe LRU of series volumes, bounded by total bytes"""
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._volumes = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def get_volume(self, series):
+        """Return the cached volume for a series, rebuilding it if its image set changed"""
+        signature = series_signature(series)
+        with self._lock:
+            volume = self._volumes.get(series.id)
+            if volume is not None and volume.signature == signature:
+                self._volumes.move_to_end(series.id)
+                return volume
+            build_lock = self._build_locks.setdefault(series.id, threading.Lock())
+
+        # Only one thread builds a given series; others wait and reuse it
+        with build_lock:
+            with self._lock:
+                volume = self._volumes.get(series.id)
+                if volume is not None and volume.signature == signature:
+                    return volume
+            volume = load_series_volume(series, signature=signature)
+            logger.info(f"Built volume for series {series.id}: shape={volume.shape} spacing={volume.spacing}")
+            with self._lock:
+                self._volumes[series.id] = volume
+                self._volumes.move_to_end(series.id)
+                self._evict()
+        return volume
+
+    def invalidate(self, series_id):
+        """Drop a cached series volume"""
+        with self._lock:
+            self._volumes.pop(series_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._volumes.clear()
+
+    def _evict(self):
+        total = sum(v.nbytes for v in self._volumes.values())
+        while len(self._volumes) > 1 and total > self.max_bytes:
+            _, evicted = self._volumes.popitem(last=False)
+            total -= evicted.nbytes
+
+
+class ImageHU:
+    """A single image in HU with the metadata needed for ROI measurements"""
+
+    def __init__(self, image_id, hu, pixel_spacing, body_part='', study_description=''):
+        self.image_id = image_id
+        self.hu = hu
+        self.pixel_spacing = pixel_spacing
+        self.body_part = body_part
+        self.study_description = study_description
+
+    @property
+    def nbytes(self):
+        return self.hu.nbytes
+
+
+def load_image_hu(image):
+    """Read one image as a float32 HU array"""
+    dicom_data = image.load_dicom_data()
+    if dicom_data is None or not hasattr(dicom_data, 'pixel_array'):
+        raise ValueError(f'Could not load pixel data for image {image.id}')
+    slope = float(getattr(dicom_data, 'RescaleSlope', 1) or 1)
+    intercept = float(getattr(dicom_data, 'RescaleIntercept', 0) or 0)
+    hu = dicom_data.pixel_array.astype(np.float32)
+    if slope != 1 or intercept != 0:
+        hu = hu * np.float32(slope) + np.float32(intercept)
+    pixel_spacing = (1.0, 1.0)
+    if hasattr(dicom_data, 'PixelSpacing'):
+        pixel_spacing = (float(dicom_data.PixelSpacing[0]), float(dicom_data.PixelSpacing[1]))
+    return ImageHU(
+        image_id=image.id,
+        hu=hu,
+        pixel_spacing=pixel_spacing,
+        body_part=str(getattr(dicom_data, 'BodyPartExamined', '') or '').upper(),
+        study_description=str(getattr(dicom_data, 'StudyDescription', '') or '').upper(),
+    )
+
+
+class ImageHUCache:
+    """Thread-safe LRU of per-image HU arrays, bounded by total bytes"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, image):
+        """Return the HU array of an image, reading the file only on a miss"""
+        key = (image.id, image.sop_instance_uid)
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None:
+                self._images.move_to_end(key)
+                return entry
+        entry = load_image_hu(image)
+        with self._lock:
+            self._images[key] = entry
+            total = sum(e.nbytes for e in self._images.values())
+            while len(self._images) > 1 and total > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                total -= evicted.nbytes
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+
+# Global volume cache instance
+volume_cache = VolumeCache()
+
+# Global image HU cache instance
+image_hu_cache = ImageHUCache()
@@ -0,0 +1,253 @@
+"""
+Isotropic, multi-resolution derived volumes for interactive 3D and MPR.
+
+Thick-slice series (e.g. 0.5 x 0.5 x 5 mm) are awkward for 3D work: voxels are
+anisotropic and the full-resolution volume is large. For each series this
+module builds, on first 3D use, an isotropically resampled level plus 2x and
+4x downsampled levels, and persists them as .npy files in the reconstruction
+store so they are memory-mapped rather than held in RAM. Reconstruction
+endpoints pick the coarsest level that still covers their output size. Each
+pyramid is tagged with the series signature and rebuilt when it changes.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import ndimage
+
+from .volume_cache import SeriesVolume
+
+logger = logging.getLogger(__name__)
+
+STORE_KIND = 'pyramid'
+LEVEL_COUNT = 3
+
+# Upper bound on isotropic level voxels; coarser iso spacing is used beyond it
+MAX_ISO_VOXELS = 128 * 1024 * 1024
+
+# Output slices processed per step while resampling
+SLAB_DEPTH = 16
+
+
+def isotropic_spacing(shape, spacing, max_voxels=MAX_ISO_VOXELS):
+    """Finest in-plane spacing, coarsened if the resampled volume would exceed max_voxels"""
+    iso = float(min(spacing))
+    extent = np.asarray(shape, dtype=np.float64) * np.asarray(spacing, dtype=np.float64)
+    voxels = float(np.prod(np.maximum(np.round(extent / iso), 1)))
+    if voxels > max_voxels:
+        iso *= (voxels / max_voxels) ** (1.0 / 3.0)
+    return iso
+
+
+def resample_isotropic(data, spacing, iso, out):
+    """Linearly resample a (z, y, x) volume to iso mm voxels, writing into out slab by slab"""
+    depth = data.shape[0]
+    in_plane_zoom = (spacing[1] / iso, spacing[2] / iso)
+    for start in range(0, out.shape[0], SLAB_DEPTH):
+        stop = min(start + SLAB_DEPTH, out.shape[0])
+        # Separable: blend neighbouring source slices, then zoom in-plane
+        z = np.arange(start, stop) * (iso / spacing[0])
+        lower = np.clip(np.floor(z).astype(np.int64), 0, depth - 1)
+        upper = np.minimum(lower + 1, depth - 1)
+        weight = np.clip(z - lower, 0.0, 1.0).astype(np.float32)[:, None, None]
+        slab = data[lower] * (1 - weight) + data[upper] * weight
+        if in_plane_zoom != (1.0, 1.0):
+            slab = ndimage.zoom(slab, (1.0,) + in_plane_zoom, order=1, mode='nearest', grid_mode=False)
+        out[start:stop] = slab[:, :out.shape[1], :out.shape[2]]
+
+
+def downsample(data, out):
+    """2x2x2 block mean of data into out (trailing odd voxels are dropped)"""
+    depth, height, width = out.shape
+    for start in range(0, depth, SLAB_DEPTH):
+        stop = min(start + SLAB_DEPTH, depth)
+        slab = np.asarray(data[2 * start:2 * stop, :2 * height, :2 * width], dtype=np.float32)
+        out[start:stop] = slab.reshape(stop - start, 2, height, 2, width, 2).mean(axis=(1, 3, 5))
+
+
+class VolumePyramid:
+    """Memory-mapped isotropic volume levels of one series"""
+
+    def __init__(self, series_id, signature, levels, spacings, origin, window_center=None,
+                 window_width=None, modality=''):
+        self.series_id = series_id
+        self.signature = signature
+        self.levels = levels
+        self.spacings = spacings
+        self.origin = origin
+        self.window_center = window_center
+        self.window_width = window_width
+        self.modality = modality
+
+    def level(self, index):
+        """A level as a SeriesVolume so existing reconstruction engines can consume it"""
+        index = int(np.clip(index, 0, len(self.levels) - 1))
+        data = self.levels[index]
+        spacing = self.spacings[index]
+        return SeriesVolume(
+            series_id=self.series_id,
+            signature=f'{self.signature}:L{index}',
+            data=data,
+            spacing=(spacing, spacing, spacing),
+            image_ids=[],
+            slice_positions=self.origin + np.arange(data.shape[0]) * spacing,
+            window_center=self.window_center,
+            window_width=self.window_width,
+            modality=self.modality,
+        )
+
+    def level_index_for_size(self, output_size):
+        """Coarsest level whose largest dimension still covers output_size pixels"""
+        for index in range(len(self.levels) - 1, -1, -1):
+            if max(self.levels[index].shape) >= output_size:
+                return index
+        return 0
+
+    def level_for_size(self, output_size):
+        return self.level(self.level_index_for_size(output_size))
+
+    def to_dict(self):
+        return {
+            'levels': [
+                {'level': i, 'shape': list(level.shape), 'spacing': self.spacings[i]}
+                for i, level in enumerate(self.levels)
+            ],
+        }
+
+
+class VolumePyramidCache:
+    """Builds pyramids lazily, persists them to the reconstruction store and keeps recent ones mapped"""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._pyramids = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def get_pyramid(self, series):
+        """Return the pyramid for a series' current image set, building it on first use"""
+        from .volume_cache import series_signature
+        signature = series_signature(series)
+        with self._lock:
+            pyramid = self._pyramids.get(series.id)
+            if pyramid is not None and pyramid.signature == signature:
+                self._pyramids.move_to_end(series.id)
+                return pyramid
+            build_lock = self._build_locks.setdefault(series.id, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                pyramid = self._pyramids.get(series.id)
+                if pyramid is not None and pyramid.signature == signature:
+                    return pyramid
+            pyramid = self._open(series.id, signature) or self._build(series, signature)
+            with self._lock:
+                self._pyramids[series.id] = pyramid
+                self._pyramids.move_to_end(series.id)
+                while len(self._pyramids) > self.max_entries:
+                    self._pyramids.popitem(last=False)
+        return pyramid
+
+    def get_level(self, series, output_size):
+        """Convenience: the coarsest level of a series' pyramid that meets output_size"""
+        return self.get_pyramid(series).level_for_size(output_size)
+
+    def invalidate(self, series_id):
+        """Drop a series' pyramid from memory and disk"""
+        from .reconstruction_store import reconstruction_store
+        with self._lock:
+            self._pyramids.pop(series_id, None)
+        reconstruction_store.invalidate(series_id, STORE_KIND)
+
+    def clear(self):
+        with self._lock:
+            self._pyramids.clear()
+
+    def _open(self, series_id, signature):
+        """Map a previously persisted pyramid, if one exists for this signature"""
+        from .reconstruction_store import reconstruction_store
+        key = signature[:16]
+        manifest = reconstruction_store.read_manifest(series_id, STORE_KIND, key, signature)
+        if manifest is None:
+            return None
+        directory = reconstruction_store.entry_dir(series_id, STORE_KIND, key)
+        try:
+            levels = [np.load(os.path.join(directory, f'level_{i}.npy'), mmap_mode='r')
+                      for i in range(manifest['metadata']['level_count'])]
+        except (OSError, ValueError):
+            return None
+        return self._from_manifest(series_id, signature, levels, manifest['metadata'])
+
+    def _build(self, series, signature):
+        from .reconstruction_store import reconstruction_store, MANIFEST_FILE
+        from .volume_cache import volume_cache
+
+        volume = volume_cache.get_volume(series)
+        # Pyramids for an older image set are no longer reachable
+        reconstruction_store.invalidate(series.id, STORE_KIND)
+
+        key = signature[:16]
+        staging = reconstruction_store.create_staging(series.id, STORE_KIND, key)
+        iso = isotropic_spacing(volume.shape, volume.spacing)
+        extent = np.asarray(volume.shape, dtype=np.float64) * np.asarray(volume.spacing)
+        shape = tuple(int(n) for n in np.maximum(np.round(extent / iso), 1))
+
+        spacings = []
+        level = np.lib.format.open_memmap(os.path.join(staging, 'level_0.npy'), mode='w+',
+                                          dtype=np.float32, shape=shape)
+        resample_isotropic(volume.data, volume.spacing, iso, level)
+        level.flush()
+        spacings.append(iso)
+        for index in range(1, LEVEL_COUNT):
+            if min(level.shape) < 2:
+                break
+            previous = level
+            level = np.lib.format.open_memmap(os.path.join(staging, f'level_{index}.npy'), mode='w+',
+                                              dtype=np.float32, shape=tuple(n // 2 for n in previous.shape))
+            downsample(previous, level)
+            level.flush()
+            spacings.append(spacings[-1] * 2)
+
+        metadata = {
+            'level_count': len(spacings),
+            'spacings': spacings,
+            'origin': float(volume.slice_positions[0]) if len(volume.slice_positions) else 0.0,
+            'window_center': volume.window_center,
+            'window_width': volume.window_width,
+            'modality': volume.modality,
+            'source_shape': list(volume.shape),
+            'source_spacing': list(volume.spacing),
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump({
+                'series_id': series.id,
+                'kind': STORE_KIND,
+                'key': key,
+                'signature': signature,
+                'metadata': metadata,
+            }, f)
+        directory = reconstruction_store.publish(staging, series.id, STORE_KIND, key)
+        logger.info(f"Built volume pyramid for series {series.id}: iso={iso:.3f}mm levels={len(spacings)}")
+
+        levels = [np.load(os.path.join(directory, f'level_{i}.npy'), mmap_mode='r') for i in range(len(spacings))]
+        return self._from_manifest(series.id, signature, levels, metadata)
+
+    def _from_manifest(self, series_id, signature, levels, metadata):
+        return VolumePyramid(
+            series_id=series_id,
+            signature=signature,
+            levels=levels,
+            spacings=[float(s) for s in metadata['spacings']],
+            origin=float(metadata.get('origin', 0.0)),
+            window_center=metadata.get('window_center'),
+            window_width=metadata.get('window_width'),
+            modality=metadata.get('modality', ''),
+        )
+
+
+# Global volume pyramid cache instance
+volume_pyramid_cache = VolumePyramidCache()
@@ -0,0 +1,244 @@
+"""
+Ray-casting volume renderer for cached series volumes.
+
+Rays are cast orthographically from an arbitrary camera orientation and
+composited front to back through a colour-preset transfer function. Rays that
+become opaque stop early, and a min/max brick index lets rays jump over
+bricks the transfer function maps to zero opacity. An interactive quality
+level renders fewer rays with coarser steps on a decimated volume while the
+camera moves; the full quality level refines once it stops.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import ndimage
+
+from .color_presets import color_presets
+
+logger = logging.getLogger(__name__)
+
+BRICK_SIZE = 8
+
+# Default HU windows used to map the volume onto the transfer function indices
+PRESET_WINDOWS = {
+    'bone': (500.0, 1500.0),
+    'soft_tissue': (40.0, 400.0),
+    'vessels': (300.0, 600.0),
+    'grayscale': (40.0, 1000.0),
+}
+
+QUALITY_LEVELS = {
+    # output scale, sample step in voxels, decimation, interpolation order
+    'interactive': {'scale': 0.25, 'step': 2.0, 'decimate': 2, 'order': 0},
+    'full': {'scale': 1.0, 'step': 0.5, 'decimate': 1, 'order': 1},
+}
+
+
+class BrickIndex:
+    """Per-brick min/max of a volume, dilated by one brick so trilinear reads stay covered"""
+
+    def __init__(self, data, brick_size=BRICK_SIZE):
+        self.brick_size = brick_size
+        self.shape = data.shape
+        padded_shape = [int(np.ceil(n / brick_size)) * brick_size for n in data.shape]
+        pad = [(0, p - n) for p, n in zip(padded_shape, data.shape)]
+        padded = np.pad(data, pad, mode='edge')
+        blocks = padded.reshape(padded_shape[0] // brick_size, brick_size,
+                                padded_shape[1] // brick_size, brick_size,
+                                padded_shape[2] // brick_size, brick_size)
+        self.minimum = ndimage.minimum_filter(blocks.min(axis=(1, 3, 5)), size=3, mode='nearest')
+        self.maximum = ndimage.maximum_filter(blocks.max(axis=(1, 3, 5)), size=3, mode='nearest')
+
+    def occupancy(self, low, high, opacity):
+        """Boolean brick map: True where any value in the brick range has non-zero opacity"""
+        scale = 255.0 / max(high - low, 1e-6)
+        lo = np.clip(((self.minimum - low) * scale).astype(np.int32), 0, 255)
+        hi = np.clip(np.ceil((self.maximum - low) * scale).astype(np.int32), 0, 255)
+        visible = np.concatenate([[0], np.cumsum(opacity > 0)])
+        return (visible[hi + 1] - visible[lo]) > 0
+
+
+class RenderedImage:
+    """Output of a ray-cast render"""
+
+    def __init__(self, rgb, quality, samples, rays, terminated_early, bricks_skipped):
+        self.rgb = rgb
+        self.quality = quality
+        self.samples = samples
+        self.rays = rays
+        self.terminated_early = terminated_early
+        self.bricks_skipped = bricks_skipped
+
+    def stats(self):
+        return {
+            'quality': self.quality,
+            'rays': self.rays,
+            'samples': self.samples,
+            'terminated_early': self.terminated_early,
+            'bricks_skipped': self.bricks_skipped,
+        }
+
+
+def camera_basis(azimuth=0.0, elevation=0.0, roll=0.0):
+    """View direction, up and right vectors in (z, y, x) volume axes
+
+    At zero angles the camera looks from anterior to posterior with patient
+    superior up. Azimuth spins about the superior axis, elevation tilts the
+    camera over the top of the patient and roll spins the image plane.
+    """
+    az, el, ro = np.radians([azimuth, elevation, roll])
+    direction = np.array([0.0, 1.0, 0.0])
+    up = np.array([1.0, 0.0, 0.0])
+    right = np.array([0.0, 0.0, 1.0])
+
+    def rotate(vector, axis, angle):
+        axis = axis / np.linalg.norm(axis)
+        return (vector * np.cos(angle) + np.cross(axis, vector) * np.sin(angle)
+                + axis * np.dot(axis, vector) * (1 - np.cos(angle)))
+
+    direction, right = rotate(direction, up, az), rotate(right, up, az)
+    direction, up = rotate(direction, right, el), rotate(up, right, el)
+    up, right = rotate(up, direction, ro), rotate(right, direction, ro)
+    return direction, up, right
+
+
+class VolumeRenderer:
+    """Front-to-back ray caster with empty-space skipping and early ray termination"""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._derived = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _derived_volume(self, volume, decimate):
+        """Decimated data and brick index for a volume, cached by image-set signature"""
+        key = (volume.series_id, volume.signature, decimate)
+        with self._lock:
+            entry = self._derived.get(key)
+            if entry is not None:
+                self._derived.move_to_end(key)
+                return entry
+        if decimate > 1:
+            data = np.ascontiguousarray(volume.data[::decimate, ::decimate, ::decimate])
+        else:
+            data = volume.data
+        spacing = np.asarray(volume.spacing, dtype=np.float64) * decimate
+        entry = (data, spacing, BrickIndex(data))
+        with self._lock:
+            self._derived[key] = entry
+            while len(self._derived) > self.max_entries:
+                self._derived.popitem(last=False)
+        return entry
+
+    def render(self, volume, azimuth=0.0, elevation=0.0, roll=0.0, size=512, quality='full',
+               preset='grayscale', window_center=None, window_width=None, opacity_scale=1.0,
+               termination=0.98, zoom=1.0):
+        """Render a volume to an RGB uint8 image"""
+        level = QUALITY_LEVELS.get(quality, QUALITY_LEVELS['full'])
+        data, spacing, bricks = self._derived_volume(volume, level['decimate'])
+
+        transfer_function = color_presets.resolve(preset)
+        default_center, default_width = PRESET_WINDOWS.get(transfer_function.name, PRESET_WINDOWS['grayscale'])
+        center = float(window_center if window_center is not None else default_center)
+        width = max(float(window_width if window_width is not None else default_width), 1.0)
+        low = center - width / 2.0
+
+        # Opacity is defined per unit voxel step and corrected for the actual step
+        step_voxels = level['step']
+        base_opacity = np.clip(transfer_function.opacity * float(opacity_scale), 0.0, 1.0)
+        opacity = 1.0 - np.power(1.0 - base_opacity, step_voxels)
+        colors = transfer_function.colors * opacity[:, None]
+        occupied = bricks.occupancy(low, low + width, base_opacity)
+
+        direction, up, right = camera_basis(azimuth, elevation, roll)
+        extent = np.asarray(data.shape, dtype=np.float64) * spacing
+        centre = (np.asarray(data.shape, dtype=np.float64) - 1) * spacing / 2.0
+        diagonal = float(np.linalg.norm(extent))
+
+        pixels = max(8, int(round(size * level['scale'])))
+        pixel_size = diagonal / pixels / max(float(zoom), 1e-3)
+        step_mm = step_voxels * float(spacing.min())
+
+        offsets = (np.arange(pixels) - (pixels - 1) / 2.0) * pixel_size
+        rows, cols = np.meshgrid(offsets, offsets, indexing='ij')
+        origins = (centre - direction * diagonal / 2.0
+                   - rows.reshape(-1, 1) * up + cols.reshape(-1, 1) * right)
+
+        # Clip rays against the volume box
+        box_min = -0.5 * spacing
+        box_max = extent - 0.5 * spacing
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1.0 / direction
+            t0 = (box_min - origins) * inverse
+            t1 = (box_max - origins) * inverse
+        t_near = np.nan_to_num(np.minimum(t0, t1), nan=-np.inf).max(axis=1)
+        t_far = np.nan_to_num(np.maximum(t0, t1), nan=np.inf).min(axis=1)
+        t_near = np.maximum(t_near, 0.0)
+
+        ray_count = origins.shape[0]
+        accumulated_color = np.zeros((ray_count, 3), dtype=np.float32)
+        accumulated_alpha = np.zeros(ray_count, dtype=np.float32)
+        active = np.nonzero(t_far > t_near)[0]
+        t = t_near[active]
+        index_scale = np.float32(255.0 / width)
+        brick_mm = bricks.brick_size * spacing
+        samples = 0
+        bricks_skipped = 0
+
+        while active.size:
+            positions = origins[active] + t[:, None] * direction
+            voxels = positions / spacing
+            brick = np.floor((voxels + 0.5) / bricks.brick_size).astype(np.int32)
+            np.clip(brick, 0, np.asarray(occupied.shape) - 1, out=brick)
+            in_use = occupied[brick[:, 0], brick[:, 1], brick[:, 2]]
+
+            # Empty bricks: jump the ray to where it leaves the brick
+            if not np.all(in_use):
+                empty = ~in_use
+                bricks_skipped += int(empty.sum())
+                lower = brick[empty] * brick_mm - 0.5 * spacing
+                upper = lower + brick_mm
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    exits = np.where(direction > 0, (upper - positions[empty]) / direction,
+                                     np.where(direction < 0, (lower - positions[empty]) / direction, np.inf))
+                t[empty] += np.maximum(exits.min(axis=1), 0.0) + step_mm * 0.5
+
+            if np.any(in_use):
+                hit = np.nonzero(in_use)[0]
+                rays = active[hit]
+                sample_voxels = voxels[hit]
+                if level['order'] == 0:
+                    idx = np.rint(sample_voxels).astype(np.int64)
+                    for axis in range(3):
+                        np.clip(idx[:, axis], 0, data.shape[axis] - 1, out=idx[:, axis])
+                    values = data[idx[:, 0], idx[:, 1], idx[:, 2]]
+                else:
+                    values = ndimage.map_coordinates(data, sample_voxels.T, order=1, mode='nearest')
+                samples += len(rays)
+                lut_index = np.clip((values - np.float32(low)) * index_scale, 0, 255).astype(np.uint8)
+                remaining = 1.0 - accumulated_alpha[rays]
+                accumulated_color[rays] += remaining[:, None] * colors[lut_index]
+                accumulated_alpha[rays] += remaining * opacity[lut_index]
+                t[hit] += step_mm
+
+            # Early ray termination and exit
+            alive = (t < t_far[active]) & (accumulated_alpha[active] < termination)
+            active = active[alive]
+            t = t[alive]
+
+        rgb = np.clip(accumulated_color * 255.0, 0, 255).astype(np.uint8).reshape(pixels, pixels, 3)
+        return RenderedImage(
+            rgb=rgb,
+            quality=quality if quality in QUALITY_LEVELS else 'full',
+            samples=samples,
+            rays=ray_count,
+            terminated_early=int((accumulated_alpha >= termination).sum()),
+            bricks_skipped=bricks_skipped,
+        )
+
+
+# Global volume renderer instance
+volume_renderer = VolumeRenderer()